@@ -0,0 +1,179 @@
+# accounts.py runs the per account endpoints (balances/positions, orders, transactions) for every account at once.
+# Account hashes are resolved once (Trader.account_hashes) and indexed by account number, each account draws from
+# its own request budget so one busy account can not starve the others, and the results come back merged.
+# Imports
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+from rate_limiter import RequestScheduler
+from order_book import format_time
+from range_fetcher import TRANSACTION_TYPES
+
+
+def _time(value: dt.datetime | str) -> str:
+    return format_time(value) if isinstance(value, dt.datetime) else value
+
+
+class AccountSet:
+    """
+    Every account (or a chosen few) of the logged in user, queried in parallel.
+
+        accounts = AccountSet(trader)
+        positions = accounts.positions()                    # one list, each position tagged with its accountNumber
+        orders = accounts.orders(start, end, status='WORKING')
+        by_account = accounts.map(lambda account_hash: trader.get_orders(account_hash, start, end))
+
+    Requests still go through the trader's rate limiter and executor, the per account budget sits in front of them.
+    """
+    def __init__(self, trader, accounts: list[str | int] | None = None, rate_per_minute: float | None = 60,
+                 burst: int | None = None, max_workers: int = 8):
+        """
+        :param trader: Trader used for every request.
+        :type trader: Trader
+        :param accounts: Account numbers to work on, None is every account of the user.
+        :type accounts: list[str | int] | None
+        :param rate_per_minute: Requests per minute each account may make through this set, None is unlimited.
+        :type rate_per_minute: float | None
+        :param burst: Requests an account may make back to back, defaults to 10 seconds worth.
+        :type burst: int | None
+        :param max_workers: Accounts queried at the same time.
+        :type max_workers: int
+        """
+        self.trader = trader
+        self.log = trader.log
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self.max_workers = max_workers
+        self._selected = None if accounts is None else [str(account) for account in accounts]
+        self.hashes = {}
+        self.budget = None
+        self.refresh()
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def __iter__(self):
+        return iter(self.hashes)
+
+    def __repr__(self):
+        return f"AccountSet({list(self.hashes)})"
+
+    def refresh(self):
+        """
+        Resolve the account hashes again (e.g. after opening an account) and rebuild the budgets.
+        """
+        hashes = self.trader.account_hashes(refresh=bool(self.hashes))
+        if self._selected is not None:
+            unknown = [account for account in self._selected if account not in hashes]
+            if unknown:
+                raise ValueError(f"Unknown account numbers {unknown}, accounts are {list(hashes)}.")
+            hashes = {account: hashes[account] for account in self._selected}
+        self.hashes = dict(hashes)
+        if self.rate_per_minute is not None:
+            self.budget = RequestScheduler({account: self.rate_per_minute for account in self.hashes},
+                                           {account: self.burst for account in self.hashes} if self.burst else None)
+
+    def map(self, fetch, accounts: list[str | int] | None = None) -> dict:
+        """
+        Run fetch(account_hash) for every account concurrently, each call takes a token from its account's budget.
+        A call that raises is logged and comes back as None.
+        :param fetch: Callable taking the account hash, usually a Trader method.
+        :param accounts: Account numbers, None is every account in the set.
+        :type accounts: list[str | int] | None
+        :return: dictonary of account number -> result.
+        :rtype: dict
+        """
+        accounts = list(self.hashes) if accounts is None else [str(account) for account in accounts]
+
+        def run(account):
+            if self.budget is not None:
+                self.budget.acquire(account)
+            return fetch(self.hashes[account])
+
+        results = {account: None for account in accounts}
+        if not accounts:
+            return results
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(accounts))) as pool:
+            futures = {account: pool.submit(run, account) for account in accounts}
+            for account, future in futures.items():
+                try:
+                    results[account] = future.result()
+                except Exception as e:
+                    self.log.error(f"Account {account}: {e!r}")
+        return results
+
+# ---------- Merged Views ---------- #
+# One call per account, merged into a single list. Records keep (or get) the accountNumber they belong to.
+
+    def balances(self, fields: str | None = None) -> dict:
+        """
+        get_account_accountNumber() for every account.
+        :param fields: 'positions' to include positions.
+        :type fields: str | None
+        :return: dictonary of account number -> securitiesAccount (None for accounts that failed).
+        :rtype: dict
+        """
+        accounts = self.map(lambda account_hash: self.trader.get_account_accountNumber(fields, account=account_hash))
+        return {account: data.get('securitiesAccount') if data else None for account, data in accounts.items()}
+
+    def positions(self) -> list[dict]:
+        """
+        Positions of every account in one list, each tagged with its accountNumber.
+        :rtype: list[dict]
+        """
+        positions = []
+        for account, data in self.balances('positions').items():
+            for position in (data or {}).get('positions') or ():
+                positions.append({**position, 'accountNumber': account})
+        return positions
+
+    def orders(self, fromEnteredTime: dt.datetime | str, toEnteredTime: dt.datetime | str,
+               maxResults: int | None = None, status: str | None = None) -> list[dict]:
+        """
+        Orders of every account, newest first. Each account gets its own 3000 result cap, unlike get_all_orders().
+        :param fromEnteredTime: Datetime or yyyy-MM-dd'T'HH:mm:ss.SSSZ string, see Trader.get_orders.
+        :param toEnteredTime: Datetime or yyyy-MM-dd'T'HH:mm:ss.SSSZ string.
+        :param maxResults: Max orders per account.
+        :type maxResults: int | None
+        :param status: Only orders with this status e.g. WORKING.
+        :type status: str | None
+        :rtype: list[dict]
+        """
+        start, end = _time(fromEnteredTime), _time(toEnteredTime)
+        results = self.map(lambda account_hash: self.trader.get_orders(account_hash, start, end, maxResults, status))
+        return self._merge(results, 'enteredTime')
+
+    def transactions(self, startDate: dt.datetime | str, endDate: dt.datetime | str, symbol: str | None = None,
+                     types: str = TRANSACTION_TYPES) -> list[dict]:
+        """
+        Transactions of every account, newest first. For spans over a year see range_fetcher.RangeFetcher.
+        :param startDate: Datetime or yyyy-MM-dd'T'HH:mm:ss.SSSZ string.
+        :param endDate: Datetime or yyyy-MM-dd'T'HH:mm:ss.SSSZ string.
+        :param symbol: Only transactions for this symbol.
+        :type symbol: str | None
+        :param types: Comma separated transaction types, defaults to all of them.
+        :type types: str
+        :rtype: list[dict]
+        """
+        start, end = _time(startDate), _time(endDate)
+        results = self.map(lambda account_hash: self.trader.get_all_transactions(account_hash, start, end, symbol,
+                                                                                 types))
+        return self._merge(results, 'time')
+
+    def _merge(self, results: dict, time_key: str) -> list[dict]:
+        merged = []
+        for account, records in results.items():
+            for record in records or ():
+                if 'accountNumber' not in record:
+                    record['accountNumber'] = account
+                merged.append(record)
+        merged.sort(key=lambda record: record.get(time_key) or '', reverse=True)
+        return merged
+
+    def stats(self) -> dict:
+        """
+        Budget metrics per account (granted, wait_seconds, max_queue_depth...), empty when unlimited.
+        :rtype: dict
+        """
+        if self.budget is None:
+            return {}
+        return {account: metrics for account, metrics in self.budget.stats().items() if account in self.hashes}
@@ -0,0 +1,405 @@
+# async_trader.py is the asyncio counterpart of trader.py, same endpoints but awaitable.
+# Use it when you need to fan out lots of market data requests (300 option chains, a watchlist of price history...).
+# Imports
+import asyncio
+import datetime as dt
+from localutils.log_obj import Log
+from trader import Trader, JSON_HEADERS, is_account_number, load_tokens
+from rate_limiter import RequestScheduler, endpoint_family, parse_retry_after
+from json_codec import JsonDecoder
+from token_refresher import TokenRefresher
+from metrics import route
+from resilience import RequestExecutor, transport_errors
+
+class AsyncTrader:
+
+    # Reuse the (sync) helpers from Trader, they don't touch the network.
+    _params_parser = Trader._params_parser
+    time_parser = Trader.time_parser
+
+    def __init__(self, args, tokens=None, max_concurrency: int = 16, http2: bool = False,
+                 keep_alive_expiry: float = 60.0, rate_limit: bool = True, scheduler: RequestScheduler | None = None,
+                 max_throttle_retries: int = 3, json_backend: str = 'auto',
+                 token_refresher: TokenRefresher | None = None, resilient: bool = True,
+                 executor: RequestExecutor | None = None, token_agent: bool | str = True):
+        """
+        :param args: commandline args passed through to Tokens.
+        :param tokens: An already built Tokens object, skips building Tokens(args).
+        :param max_concurrency: Max number of requests in flight at once, also the size of the connection pool.
+        :type max_concurrency: int
+        :param http2: Use HTTP/2 (needs httpx[http2]).
+        :type http2: bool
+        :param keep_alive_expiry: Seconds an idle connection is kept open.
+        :type keep_alive_expiry: float
+        :param rate_limit: Pass every request through a RequestScheduler, see Trader.
+        :type rate_limit: bool
+        :param scheduler: Scheduler to use, pass the sync Trader's scheduler to share one budget. Built if None.
+        :type scheduler: RequestScheduler | None
+        :param max_throttle_retries: How many times a request answered with 429 is retried after backing off.
+        :type max_throttle_retries: int
+        :param json_backend: JSON decoder for response bodies, see Trader.
+        :type json_backend: str
+        :param token_refresher: Refresh + resend once on 401, pass the sync Trader's token_refresher to share it.
+        :type token_refresher: TokenRefresher | None
+        :param resilient: Timeouts, retries, hedging and circuit breakers, see Trader.
+        :type resilient: bool
+        :param executor: Executor to use, pass the sync Trader's executor to share breakers and latencies.
+        :type executor: RequestExecutor | None
+        :param token_agent: Take the tokens from a running token agent when tokens is None, see Trader.
+        :type token_agent: bool | str
+        """
+        self.tokens = tokens if tokens is not None else load_tokens(args, token_agent)
+        self.log = Log()
+        self.timeout = 5
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError("AsyncTrader needs httpx, pip install httpx (httpx[http2] for http2=True).") from None
+        limits = httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency,
+                              keepalive_expiry=keep_alive_expiry)
+        self.client = httpx.AsyncClient(http2=http2, limits=limits, timeout=self.timeout)
+        self.scheduler = (scheduler or RequestScheduler()) if rate_limit else None
+        self.max_throttle_retries = max_throttle_retries
+        self.decoder = JsonDecoder(json_backend)
+        self.token_refresher = token_refresher
+        self.executor = (executor or RequestExecutor()) if resilient else None
+        self._owns_executor = resilient and executor is None
+        self._account_hashes = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        """
+        Close the client and every connection it holds.
+        """
+        await self.client.aclose()
+        if self._owns_executor:
+            self.executor.close()
+
+    async def _request(self, method: str, path: str, params: dict | None = None, json: dict | None = None,
+                       headers: dict | None = None, timeout: float | None = None):
+        """
+        Every endpoint method sends its request through here, at most max_concurrency in flight at a time
+        and under the rate limiter. Same arguments as Trader._request. Backoffs (429, retries) are waited out
+        without holding a concurrency slot, so a throttled family does not stall requests to the others.
+        :return: The http response.
+        :rtype: httpx.Response
+        """
+        token = self.tokens.access_token
+        request_headers = {'Authorization': f'Bearer {token}'}
+        if headers:
+            request_headers.update(headers)
+        url = f'{self.tokens.base_url}{path}'
+        params = self._params_parser(params) if params else None
+        family = endpoint_family(path)
+        executor = self.executor
+        label = route(method, path) if executor is not None else None
+        if timeout is None:
+            timeout = self.timeout if executor is None else executor.timeout(label, self.timeout)
+        breaker = executor.breaker(family) if executor is not None else None
+        retry = executor.retry if executor is not None and executor.retry.retryable(method) else None
+        hedged = executor is not None and executor.hedged(method, label)
+
+        def send():
+            return self.client.request(method, url, params=params, json=json, headers=request_headers,
+                                       timeout=timeout)
+
+        def spare_token():
+            return self.scheduler is None or self.scheduler.try_acquire(family)
+
+        attempt = 0
+        retries = 0
+        reauthorized = False
+        while True:
+            if breaker is not None:
+                breaker.before()
+            if self.scheduler is not None:
+                await self.scheduler.acquire_async(family, self.scheduler.lane_for(method))
+            try:
+                async with self._semaphore:
+                    response = await (executor.hedge_async(label, send, spare_token) if hedged else send())
+            except transport_errors() as exc:
+                if breaker is None:
+                    raise
+                breaker.failure()
+                executor.count('transport_errors')
+                if retry is None or retries >= retry.retries:
+                    raise
+                delay = retry.delay(retries)
+                retries += 1
+                executor.count('retries')
+                self.log.error(f"{type(exc).__name__} on {path}, retrying in {delay:.2f}s "
+                               f"(retry {retries}/{retry.retries}).")
+                await asyncio.sleep(delay)
+                continue
+            if breaker is not None:
+                if response.status_code >= 500:
+                    breaker.failure()
+                else:
+                    breaker.success()
+            if response.status_code == 401 and self.token_refresher is not None and not reauthorized:
+                reauthorized = True
+                # The refresh blocks (single flight lock + http call), keep it off the event loop.
+                token = await asyncio.to_thread(self.token_refresher.refresh, token)
+                if token is not None:
+                    request_headers = {**request_headers, 'Authorization': f'Bearer {token}'}
+                    continue
+            if retry is not None and response.status_code in retry.statuses and retries < retry.retries:
+                delay = retry.delay(retries)
+                retries += 1
+                executor.count('retries')
+                self.log.error(f"{response.status_code} on {path}, retrying in {delay:.2f}s "
+                               f"(retry {retries}/{retry.retries}).")
+                await asyncio.sleep(delay)
+                continue
+            if response.status_code != 429 or self.scheduler is None or attempt >= self.max_throttle_retries:
+                return response
+
+            delay = parse_retry_after(response.headers.get('Retry-After'))
+            if delay is None:
+                delay = 2.0 ** attempt
+            attempt += 1
+            self.log.error(f"429 Too Many Requests on {path}, backing off {delay:.1f}s "
+                           f"(retry {attempt}/{self.max_throttle_retries}).")
+            self.scheduler.backoff(family, delay)
+
+    def _json_or_log(self, response):
+        if response.status_code == 200:
+            return self.decoder.decode(response.content)
+        self.log.error(response)
+
+    async def _fan_out(self, keys: list, fetch, timeout: float | None = None) -> dict:
+        """
+        Run fetch(key) for every key concurrently (bounded by max_concurrency).
+        Whatever is still running after timeout seconds gets cancelled and comes back as None.
+        :param keys: list of keys to fetch e.g. symbols.
+        :type keys: list
+        :param fetch: coroutine function taking a single key.
+        :param timeout: Seconds to wait for the whole batch, None waits forever.
+        :type timeout: float | None
+        :return: dictonary of key -> result.
+        :rtype: dict
+        """
+        tasks = {asyncio.ensure_future(fetch(key)): key for key in keys}
+        if not tasks:
+            return {}
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            self.log.error(f"Timed out after {timeout}s, cancelled {len(pending)} of {len(tasks)} requests.")
+
+        results = {key: None for key in keys}
+        for task in done:
+            if task.exception() is not None:
+                self.log.error(f"{tasks[task]}: {task.exception()!r}")
+            else:
+                results[tasks[task]] = task.result()
+        return results
+
+# ---------- Bulk Methods ---------- #
+# Fan out one request per symbol, concurrently.
+
+    async def fetch_chains(self, symbols: list[str], timeout: float | None = None, **kwargs) -> dict:
+        """
+        Get option chains for many symbols at once.
+        :param symbols: list of stocks/etf/etc ("$SPX", "AAPL", etc).
+        :type symbols: list[str]
+        :param timeout: Seconds to wait for all chains, unfinished requests are cancelled and return None.
+        :type timeout: float | None
+        :param kwargs: Any get_option_chains() arg, applied to every symbol.
+        :return: dictonary of symbol -> chain.
+        :rtype: dict
+        """
+        return await self._fan_out(symbols, lambda symbol: self.get_option_chains(symbol, **kwargs), timeout)
+
+    async def fetch_price_histories(self, symbols: list[str], timeout: float | None = None, **kwargs) -> dict:
+        """
+        Get price history for many symbols at once.
+        :param symbols: list of symbols.
+        :type symbols: list[str]
+        :param timeout: Seconds to wait for all of them, unfinished requests are cancelled and return None.
+        :type timeout: float | None
+        :param kwargs: Any get_price_history() arg, applied to every symbol.
+        :return: dictonary of symbol -> price history.
+        :rtype: dict
+        """
+        return await self._fan_out(symbols, lambda symbol: self.get_price_history(symbol, **kwargs), timeout)
+
+    async def fetch_quotes(self, symbols: list[str], timeout: float | None = None) -> dict:
+        """
+        Get single quotes for many symbols at once.
+        :return: dictonary of symbol -> quote.
+        :rtype: dict
+        """
+        return await self._fan_out(symbols, self.get_single_quote, timeout)
+
+    async def fetch_accounts(self, method, accounts: list[str] | None = None, timeout: float | None = None,
+                             **kwargs) -> dict:
+        """
+        Run a per account method for every account at once e.g.
+        await trader.fetch_accounts(trader.get_orders, fromEnteredTime=start, toEnteredTime=end).
+        :param method: AsyncTrader method taking the account hash as its first argument.
+        :param accounts: Account numbers, None is every account.
+        :type accounts: list[str] | None
+        :param timeout: Seconds to wait for all accounts, unfinished requests are cancelled and return None.
+        :type timeout: float | None
+        :param kwargs: Passed to method for every account.
+        :return: dictonary of account number -> result.
+        :rtype: dict
+        """
+        hashes = await self.account_hashes()
+        accounts = list(hashes) if accounts is None else [str(account) for account in accounts]
+        return await self._fan_out(accounts, lambda account: method(hashes.get(account, account), **kwargs), timeout)
+
+# ---------- Account Methods ---------- #
+# See trader.py for the full docs on every method below.
+
+    async def get_account(self, fields: str | None = None):
+        return self._json_or_log(await self._request('GET', '/trader/v1/accounts/', params={'fields': fields}))
+
+    async def get_account_number(self):
+        return self._json_or_log(await self._request('GET', '/trader/v1/accounts/accountNumbers'))
+
+    async def account_hashes(self, refresh: bool = False) -> dict[str, str]:
+        if self._account_hashes is None or refresh:
+            numbers = await self.get_account_number() or getattr(self.tokens, 'account_hash', None) or []
+            hashes = {str(entry['accountNumber']): entry['hashValue'] for entry in numbers}
+            if not hashes:
+                return {}
+            self._account_hashes = hashes
+        return self._account_hashes
+
+    async def account_hash(self, account: str | int | None = None) -> str:
+        if account is not None and not is_account_number(account):
+            return account
+        hashes = await self.account_hashes()
+        if not hashes:
+            raise ValueError("No account numbers, get_account_number() failed.")
+        if account is None:
+            return next(iter(hashes.values()))
+        try:
+            return hashes[str(account)]
+        except KeyError:
+            raise ValueError(f"Unknown account number {account}, accounts are {list(hashes)}.") from None
+
+    async def get_account_accountNumber(self, fields: str | None = None, account: str | int | None = None):
+        return self._json_or_log(await self._request('GET', f'/trader/v1/accounts/{await self.account_hash(account)}',
+                                                     params={'fields': fields}))
+
+# ---------- Info Methods ----------- #
+
+    async def get_single_quote(self, ticker):
+        response = await self._request('GET', f'/marketdata/v1/{ticker}/quotes')
+        if response.status_code == 200:
+            return self.decoder.decode(response.content)
+        return None
+
+    async def get_quotes(self, tickers: str | list[str], fields=None, indicative: bool = False) -> dict:
+        return self._json_or_log(await self._request('GET', '/marketdata/v1/quotes',
+                                                     params={'symbols': tickers, 'fields': fields,
+                                                             'indicative': indicative}))
+
+    async def get_movers(self, exchange: str, sort: str = None, frequency: any = None) -> dict:
+        return self._json_or_log(await self._request('GET', f'/marketdata/v1/movers/{exchange}',
+                                                     params={'sort': sort, 'frequency': frequency}))
+
+    async def get_instruments(self, symbol: str, projection: str) -> dict:
+        return self._json_or_log(await self._request('GET', '/marketdata/v1/instruments',
+                                                     params={'symbol': symbol, 'projection': projection}))
+
+    async def get_instrument_cusip(self, cusip_id: str | int) -> dict:
+        return self._json_or_log(await self._request('GET', f'/marketdata/v1/instruments/{cusip_id}'))
+
+    async def get_market_hours(self, symbols: list[str], date: dt.datetime | str = None) -> dict:
+        return self._json_or_log(await self._request('GET', '/marketdata/v1/markets',
+                                                     params={'markets': symbols, 'date': date}))
+
+    async def get_market_hours_by_id(self, market_id: str, date: dt.datetime):
+        return self._json_or_log(await self._request('GET', f'/marketdata/v1/markets/{market_id}',
+                                                     params={'date': date}))
+
+    async def get_option_chains(self, symbols: list[str], contractType: str | None=None, strikeCount: int | None=None,
+                                includeUnderlyingQuote: bool | None=None, strategy: str | None=None, interval: int | None=None,
+                                strike: int | None=None, range: str | None=None, toDate: dt.datetime | None=None,
+                                fromDate: dt.datetime | None=None, volatility: int | None=None, underlyingPrice: int | None=None,
+                                interestRate: int | None=None, daysToExpiration: int | None=None,
+                                expirationMonth: str | None=None, optionType: str | None=None, entitlement: str | None=None) -> dict:
+        return self._json_or_log(await self._request('GET', '/marketdata/v1/chains',
+                                 params={'symbol': symbols, 'contractType': contractType, 'StrikeCount': strikeCount,
+                                         'inculdeUnderlyingQuotes': includeUnderlyingQuote, 'strategy': strategy, 'interval': interval,
+                                         'strike': strike, 'range': range, 'toDate': toDate, 'fromDate': fromDate, 'volatility': volatility,
+                                         'underlyingPrice': underlyingPrice, 'interestRate': interestRate, 'datsToExpiration': daysToExpiration,
+                                         'expirationMonth': expirationMonth,'optionType': optionType, 'entitlement': entitlement}))
+
+    async def get_expiration_option_chain(self, symbol):
+        return self._json_or_log(await self._request('GET', '/marketdata/v1/expirationchain', params={'symbol': symbol}))
+
+    async def get_price_history(self, symbol = str, periodType: str | None=None, period: int | None=None, frequencyType: str | None=None,
+                                frequency: int | None=None, startDate: int | None=None, endDate: int | None=None,
+                                needExtendedHoursData: bool | None=None, needPreviousClose: bool | None = None):
+        return self._json_or_log(await self._request('GET', '/marketdata/v1/pricehistory',
+                                 params={'symbol': symbol, 'periodType': periodType, 'period': period, 'frequencyType':frequencyType,
+                                         'frequency':frequency, 'startDate': startDate, 'endDate':endDate, 'needExtendedHoursData':
+                                         needExtendedHoursData, 'needPreviousClose': needPreviousClose}))
+
+  # ---------- Trade Methods ---------- #
+  # [WARNING] -- This section contains functions that execute stock trades, use caution when calling.
+
+    async def get_orders(self, accountHash: str, fromEnteredTime: dt.datetime, toEnteredTime: dt.datetime, maxResults: int | None=None,
+                         status: str | None=None):
+        accountHash = await self.account_hash(accountHash)
+        return self._json_or_log(await self._request('GET', f'/trader/v1/accounts/{accountHash}/orders',
+                                                     params={'maxResults': maxResults, 'fromEnteredTime': fromEnteredTime,
+                                                             'toEnteredTime': toEnteredTime, 'status': status}))
+
+    async def post_orders(self, accountHash: str, orderForm: dict):
+        accountHash = await self.account_hash(accountHash)
+        return await self._request('POST', f'/trader/v1/accounts/{accountHash}/orders',
+                                   headers=JSON_HEADERS, json=orderForm)
+
+    async def get_order_by_id(self, accountHash: str, orderId: int):
+        accountHash = await self.account_hash(accountHash)
+        return self._json_or_log(await self._request('GET', f'/trader/v1/accounts/{accountHash}/orders/{orderId}'))
+
+    async def delete_order(self, accountHash: str, orderId: int):
+        accountHash = await self.account_hash(accountHash)
+        return await self._request('DELETE', f'/trader/v1/accounts/{accountHash}/orders/{orderId}',
+                                   headers=JSON_HEADERS)
+
+    async def change_order(self, accountHash: str, orderId: str, orderForm: dict):
+        accountHash = await self.account_hash(accountHash)
+        return await self._request('PUT', f'/trader/v1/accounts/{accountHash}/orders/{orderId}',
+                                   headers=JSON_HEADERS, json=orderForm)
+
+    async def get_all_orders(self, fromEnteredTime: str, toEnteredTime: str, maxResults: int | None=None, status: str | None=None):
+        return self._json_or_log(await self._request('GET', '/trader/v1/orders',
+                                                     params={'maxResults':maxResults, 'fromEnteredTime':fromEnteredTime,
+                                                             'toEnteredTime':toEnteredTime, 'status':status}))
+
+# -------------Transactions and Util Methods---------- #
+
+    async def get_all_transactions(self, accountHash:str, startDate: str, endDate: str, symbol: str | None=None,
+                                   types: str | None=None):
+        accountHash = await self.account_hash(accountHash)
+        return self._json_or_log(await self._request('GET', f'/trader/v1/accounts/{accountHash}/transactions',
+                                                     params={'startDate':startDate, 'endDate':endDate,
+                                                             'symbol':symbol, 'types':types}))
+
+    async def get_transaction_by_id(self, accountHash: str, transactionId: int):
+        accountHash = await self.account_hash(accountHash)
+        return self._json_or_log(await self._request('GET', f'/trader/v1/accounts/{accountHash}/transactions/{transactionId}'))
+
+    async def get_user_preferences(self):
+        return self._json_or_log(await self._request('GET', '/trader/v1/userPreference'))
+
+# ----------- Trade Orders ---------- #
+
+    buy_stock = Trader.buy_stock
@@ -0,0 +1,544 @@
+# backtest.py runs strategies over candles kept in the history store instead of the live account.
+# Two ways in: run() is vectorized, a strategy turns the price panel into a matrix of target positions and the
+# whole backtest is a handful of numpy operations (years of minute bars over hundreds of symbols in seconds).
+# BacktestTrader serves get_quotes/get_price_history/get_option_chains/post_orders like Trader does, bar by bar,
+# so a strategy written against Trader runs unchanged (slower, one bar at a time).
+# Imports
+import datetime as dt
+import functools
+import itertools
+import json
+import math
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from history_store import CANDLE_DTYPE, HistoryStore, to_epoch_ms
+from order_book import format_time
+
+# Bars in a trading year per frequencyType (minute bars are divided by the frequency).
+BARS_PER_YEAR = {'minute': 252 * 390, 'daily': 252, 'weekly': 52, 'monthly': 12}
+
+PANEL_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+class Panel:
+    """
+    Candles of many symbols on one time axis: times (int64 ms) and one float64 (bars x symbols) matrix per field.
+    A symbol with no bar at some time carries its last close over (open/high/low = that close, volume 0),
+    before its first bar everything is NaN.
+    """
+    __slots__ = ('symbols', 'times', 'open', 'high', 'low', 'close', 'volume', 'frequencyType', 'frequency')
+
+    def __init__(self, symbols: list[str], times: np.ndarray, open: np.ndarray, high: np.ndarray, low: np.ndarray,
+                 close: np.ndarray, volume: np.ndarray, frequencyType: str = 'minute', frequency: int = 1):
+        self.symbols = list(symbols)
+        self.times = times
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+        self.frequencyType = frequencyType
+        self.frequency = frequency
+
+    def __len__(self):
+        return len(self.times)
+
+    def __repr__(self):
+        return f'Panel({len(self.symbols)} symbols, {len(self)} bars, {self.frequencyType}{self.frequency})'
+
+    @property
+    def bars_per_year(self) -> float:
+        return BARS_PER_YEAR.get(self.frequencyType, 252) / (self.frequency if self.frequencyType == 'minute' else 1)
+
+    def column(self, symbol: str) -> int:
+        return self.symbols.index(symbol)
+
+    @classmethod
+    def from_candles(cls, candles: dict[str, np.ndarray], frequencyType: str = 'minute', frequency: int = 1) -> 'Panel':
+        """
+        Align structured candle arrays (history_store.CANDLE_DTYPE) keyed by symbol on the union of their times.
+        """
+        symbols = list(candles)
+        times = np.unique(np.concatenate([candles[symbol]['datetime'] for symbol in symbols])) if symbols \
+            else np.empty(0, dtype=np.int64)
+        shape = (len(times), len(symbols))
+        fields = {name: np.full(shape, np.nan) for name in PANEL_FIELDS}
+        for column, symbol in enumerate(symbols):
+            records = candles[symbol]
+            rows = np.searchsorted(times, records['datetime'])
+            for name in PANEL_FIELDS:
+                fields[name][rows, column] = records[name]
+        close = fields['close']
+        missing = np.isnan(close)
+        index = np.where(missing, 0, np.arange(len(times))[:, None])
+        np.maximum.accumulate(index, axis=0, out=index)
+        close = close[index, np.arange(len(symbols))]
+        for name in ('open', 'high', 'low'):
+            fields[name] = np.where(missing, close, fields[name])
+        fields['volume'][missing] = 0.0
+        return cls(symbols, times, fields['open'], fields['high'], fields['low'], close, fields['volume'],
+                   frequencyType, frequency)
+
+    @classmethod
+    def from_store(cls, store: HistoryStore, symbols: list[str], startDate, endDate, frequencyType: str = 'minute',
+                   frequency: int = 1, extended: bool = False) -> 'Panel':
+        """
+        Panel straight from what is on disk, nothing is fetched (fill the store with Trader.get_candles() first).
+        """
+        return cls.from_candles({symbol: store.read(symbol, frequencyType, frequency, startDate, endDate, extended)
+                                 for symbol in symbols}, frequencyType, frequency)
+
+
+class FillModel:
+    """
+    How orders turn into executions. Decisions made on bar t fill delay bars later at that bar's open (or close),
+    moved against the order by slippage_bps, plus a flat and a per share commission.
+    """
+    def __init__(self, slippage_bps: float = 1.0, commission: float = 0.0, commission_per_share: float = 0.0,
+                 price: str = 'open', delay: int = 1):
+        """
+        :param slippage_bps: Basis points the execution price moves against the order.
+        :type slippage_bps: float
+        :param commission: Per order commission.
+        :type commission: float
+        :param commission_per_share: Commission per share/contract.
+        :type commission_per_share: float
+        :param price: Bar price market orders fill at, 'open' or 'close'.
+        :type price: str
+        :param delay: Bars between a decision and its fill, at least 1 (no trading on the bar the signal came from).
+        :type delay: int
+        """
+        if price not in ('open', 'close'):
+            raise ValueError(f"price must be 'open' or 'close', not {price!r}.")
+        self.slippage = slippage_bps / 10000.0
+        self.commission = commission
+        self.commission_per_share = commission_per_share
+        self.price = price
+        self.delay = max(1, delay)
+
+    def execution_price(self, price, quantity):
+        """
+        price moved against the order, quantity > 0 buys (scalars or arrays).
+        """
+        return price * (1.0 + np.sign(quantity) * self.slippage)
+
+    def fees(self, quantity):
+        """
+        Commission for trading quantity shares (0 when nothing traded), scalars or arrays.
+        """
+        return (quantity != 0) * self.commission + np.abs(quantity) * self.commission_per_share
+
+
+class BacktestResult:
+    """
+    Per bar equity, cash and held positions of a run, plus the trades (bars x symbols, signed shares).
+    """
+    __slots__ = ('times', 'symbols', 'equity', 'cash', 'positions', 'trades', 'fees', 'bars_per_year')
+
+    def __init__(self, times: np.ndarray, symbols: list[str], equity: np.ndarray, cash: np.ndarray,
+                 positions: np.ndarray, trades: np.ndarray, fees: np.ndarray, bars_per_year: float):
+        self.times = times
+        self.symbols = symbols
+        self.equity = equity
+        self.cash = cash
+        self.positions = positions
+        self.trades = trades
+        self.fees = fees
+        self.bars_per_year = bars_per_year
+
+    def __repr__(self):
+        return f'BacktestResult({self.stats()})'
+
+    def stats(self) -> dict:
+        """
+        total_return, annualized sharpe (per bar returns), max_drawdown (fraction), number of fills and fees paid.
+        """
+        equity = self.equity
+        if len(equity) < 2:
+            return {'total_return': 0.0, 'sharpe': 0.0, 'max_drawdown': 0.0, 'fills': 0, 'fees': 0.0}
+        returns = np.diff(equity) / equity[:-1]
+        deviation = returns.std()
+        peak = np.maximum.accumulate(equity)
+        return {'total_return': float(equity[-1] / equity[0] - 1.0),
+                'sharpe': float(returns.mean() / deviation * math.sqrt(self.bars_per_year)) if deviation else 0.0,
+                'max_drawdown': float(((peak - equity) / peak).max()),
+                'fills': int(np.count_nonzero(self.trades)),
+                'fees': float(self.fees.sum())}
+
+
+def run(panel: Panel, targets: np.ndarray, fill_model: FillModel | None = None,
+        initial_cash: float = 100000.0) -> BacktestResult:
+    """
+    Vectorized backtest. targets[t, i] is the position (shares, short < 0) wanted in symbol i once bar t closed,
+    it is traded fill_model.delay bars later. Targets on bars where the symbol has no price yet are ignored.
+    :param panel: Prices, see Panel.
+    :type panel: Panel
+    :param targets: (bars x symbols) array, NaN means flat.
+    :type targets: np.ndarray
+    :param fill_model: Execution prices and fees, FillModel() if None.
+    :type fill_model: FillModel | None
+    :param initial_cash: Cash at the first bar.
+    :type initial_cash: float
+    :rtype: BacktestResult
+    """
+    fill_model = fill_model or FillModel()
+    targets = np.asarray(targets, dtype=np.float64)
+    if targets.shape != panel.close.shape:
+        raise ValueError(f"targets shape {targets.shape} does not match the panel {panel.close.shape}.")
+    delay = fill_model.delay
+    targets = np.where(np.isnan(panel.close) | np.isnan(targets), 0.0, targets)
+    held = np.zeros_like(targets)
+    held[delay:] = targets[:-delay]
+    trades = np.diff(held, axis=0, prepend=0.0)
+    prices = getattr(panel, fill_model.price)
+    flows = np.nan_to_num(trades * fill_model.execution_price(prices, trades))
+    fees = fill_model.fees(trades)
+    cash = initial_cash - np.cumsum(flows.sum(axis=1) + fees.sum(axis=1))
+    equity = cash + np.nansum(held * panel.close, axis=1)
+    return BacktestResult(panel.times, panel.symbols, equity, cash, held, trades, fees.sum(axis=1), panel.bars_per_year)
+
+
+# ---------- Parameter Sweeps ---------- #
+
+_sweep_panel = None
+
+
+def _init_sweep(panel: Panel):
+    # Each worker process gets the panel once, not once per parameter set.
+    global _sweep_panel
+    _sweep_panel = panel
+
+
+def _sweep_one(strategy, fill_model: FillModel, initial_cash: float, params: dict) -> tuple[dict, dict]:
+    targets = strategy(_sweep_panel, **params)
+    return params, run(_sweep_panel, targets, fill_model, initial_cash).stats()
+
+
+def sweep(strategy, panel: Panel, grid: dict[str, list], fill_model: FillModel | None = None,
+          initial_cash: float = 100000.0, processes: int | None = None) -> list[tuple[dict, dict]]:
+    """
+    Run strategy(panel, **params) -> targets for every combination in grid on a process pool.
+
+        results = sweep(moving_average_cross, panel, {'fast': [10, 20], 'slow': [50, 100, 200]})
+        best = max(results, key=lambda item: item[1]['sharpe'])
+
+    :param strategy: Module level function (it is pickled to the workers).
+    :param grid: Parameter name -> values to try.
+    :type grid: dict[str, list]
+    :param processes: Worker processes, os.cpu_count() if None.
+    :type processes: int | None
+    :return: (params, stats) per combination, in grid order.
+    :rtype: list[tuple[dict, dict]]
+    """
+    fill_model = fill_model or FillModel()
+    combinations = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+    task = functools.partial(_sweep_one, strategy, fill_model, initial_cash)
+    with ProcessPoolExecutor(processes, initializer=_init_sweep, initargs=(panel,)) as pool:
+        return list(pool.map(task, combinations))
+
+
+# ---------- Trader Surface ---------- #
+
+class _Response:
+    # Just enough of requests.Response for code that looks at post_orders()/delete_order() results.
+    __slots__ = ('status_code', 'headers', 'content')
+
+    def __init__(self, status_code: int, headers: dict | None = None, body=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = json.dumps(body).encode() if body is not None else b''
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class BacktestTrader:
+    """
+    Stands in for Trader while stepping through a Panel. Market data calls only see bars up to the current one,
+    orders placed with post_orders() are filled by the fill model on the following bars.
+
+        trader = BacktestTrader(panel)
+        result = trader.run(lambda trader: my_strategy.on_bar(trader))
+
+    Fill rules on a bar: MARKET at the fill model price, LIMIT once the bar trades through the limit (at the
+    better of open and limit), STOP once the bar reaches the stop (at the worse of open and stop), STOP_LIMIT once
+    the bar reaches the stop and also trades at the limit (like STOP, capped at the limit). Orders stay working
+    until filled or cancelled.
+    """
+    def __init__(self, panel: Panel, fill_model: FillModel | None = None, initial_cash: float = 100000.0,
+                 account_hash: str = 'BACKTEST', chains: dict[str, list[tuple[int, dict]]] | None = None, log=None):
+        """
+        :param panel: Prices replayed.
+        :type panel: Panel
+        :param fill_model: Execution prices and fees, FillModel() if None.
+        :type fill_model: FillModel | None
+        :param initial_cash: Cash at the first bar.
+        :type initial_cash: float
+        :param account_hash: Hash the account answers to.
+        :type account_hash: str
+        :param chains: Recorded get_option_chains responses per symbol as (ms since the epoch, chain), get_option_chains
+                       serves the newest one at or before the current bar.
+        :type chains: dict[str, list[tuple[int, dict]]] | None
+        :param log: Logger, localutils Log() if None.
+        """
+        if log is None:
+            from localutils.log_obj import Log
+            log = Log()
+        self.log = log
+        self.panel = panel
+        self.fill_model = fill_model or FillModel()
+        self.account_hash = account_hash
+        self.tokens = None
+        self.chains = {symbol: sorted(snapshots, key=lambda item: item[0]) for symbol, snapshots in (chains or {}).items()}
+        self.t = 0
+        self.cash = initial_cash
+        self.initial_cash = initial_cash
+        self.positions = np.zeros(len(panel.symbols))
+        self.average_prices = np.zeros(len(panel.symbols))
+        self.orders: dict[int, dict] = {}
+        self._working: list[int] = []
+        self._entered: dict[int, int] = {}   # order id -> bar it was placed on
+        self._order_ids = itertools.count(1)
+        self._equity = np.full(len(panel), np.nan)
+        self._cash = np.full(len(panel), np.nan)
+        self._trades = np.zeros((len(panel), len(panel.symbols)))
+        self._fees = np.zeros(len(panel))
+
+    @property
+    def now(self) -> int:
+        return int(self.panel.times[self.t])
+
+    def _time_text(self) -> str:
+        # enteredTime/closeTime/execution times the way Schwab sends them, so OrderBook & co. can parse them.
+        return format_time(dt.datetime.fromtimestamp(self.now / 1000, tz=dt.timezone.utc))
+
+    def _bar(self, column: int, t: int | None = None) -> tuple[float, float, float, float, float]:
+        t = self.t if t is None else t
+        panel = self.panel
+        return (panel.open[t, column], panel.high[t, column], panel.low[t, column], panel.close[t, column],
+                panel.volume[t, column])
+
+# ---------- Market Data ---------- #
+
+    def get_single_quote(self, ticker, typed: bool = False):
+        return self.get_quotes(ticker).get(ticker)
+
+    def get_quotes(self, tickers: str | list[str], fields=None, indicative: bool = False, typed: bool = False) -> dict:
+        if isinstance(tickers, str):
+            tickers = tickers.split(',')
+        quotes = {}
+        for symbol in tickers:
+            symbol = symbol.strip()
+            if symbol not in self.panel.symbols:
+                continue
+            open_, high, low, close, volume = (float(value) for value in self._bar(self.panel.column(symbol)))
+            if close != close:
+                continue
+            quotes[symbol] = {'assetMainType': 'EQUITY', 'symbol': symbol, 'realtime': True,
+                              'quote': {'lastPrice': close, 'bidPrice': close, 'askPrice': close, 'mark': close,
+                                        'openPrice': open_, 'highPrice': high, 'lowPrice': low, 'closePrice': close,
+                                        'totalVolume': int(volume), 'quoteTime': self.now, 'tradeTime': self.now}}
+        return quotes
+
+    def get_candles(self, symbol: str, startDate, endDate, frequencyType: str = 'minute', frequency: int = 1,
+                    needExtendedHoursData: bool = False) -> np.ndarray:
+        """
+        Bars of the panel between startDate and min(endDate, now), as history_store.CANDLE_DTYPE records.
+        """
+        panel = self.panel
+        column = panel.column(symbol)
+        start, end = to_epoch_ms(startDate), min(to_epoch_ms(endDate, end=True), self.now)
+        lo, hi = np.searchsorted(panel.times, start, 'left'), np.searchsorted(panel.times, end, 'right')
+        records = np.empty(hi - lo, dtype=CANDLE_DTYPE)
+        records['datetime'] = panel.times[lo:hi]
+        for name in PANEL_FIELDS:
+            records[name] = getattr(panel, name)[lo:hi, column]
+        return records[~np.isnan(records['close'])]
+
+    def get_price_history(self, symbol=str, periodType: str | None = None, period: int | None = None,
+                          frequencyType: str | None = None, frequency: int | None = None, startDate: int | None = None,
+                          endDate: int | None = None, needExtendedHoursData: bool | None = None,
+                          needPreviousClose: bool | None = None, as_arrays: bool = False, typed: bool = False):
+        """
+        Panel bars up to now, whatever frequency was asked for (the panel has one). period/periodType are ignored,
+        startDate defaults to the first bar.
+        """
+        if symbol not in self.panel.symbols:
+            self.log.error(f"Backtest has no data for {symbol}.")
+            return None
+        records = self.get_candles(symbol, startDate if startDate is not None else int(self.panel.times[0]),
+                                   endDate if endDate is not None else self.now)
+        if as_arrays:
+            from market_arrays import Candles
+            return Candles.from_records(records, symbol)
+        return {'symbol': symbol, 'empty': not len(records),
+                'candles': [{'datetime': int(row['datetime']), 'open': float(row['open']), 'high': float(row['high']),
+                             'low': float(row['low']), 'close': float(row['close']), 'volume': int(row['volume'])}
+                            for row in records]}
+
+    def get_option_chains(self, symbols, *args, **kwargs):
+        """
+        Newest recorded chain at or before now (see the chains argument), None if there is none.
+        """
+        symbol = symbols if isinstance(symbols, str) else symbols[0]
+        snapshots = self.chains.get(symbol) or ()
+        index = np.searchsorted([time for time, _ in snapshots], self.now, 'right') - 1 if snapshots else -1
+        if index < 0:
+            self.log.error(f"Backtest has no option chain for {symbol} at {self.now}.")
+            return None
+        return snapshots[index][1]
+
+# ---------- Orders ---------- #
+
+    def post_orders(self, accountHash: str, orderForm: dict | bytes):
+        if isinstance(orderForm, bytes):
+            orderForm = json.loads(orderForm)
+        legs = orderForm.get('orderLegCollection') or ()
+        if len(legs) != 1 or legs[0]['instrument']['symbol'] not in self.panel.symbols:
+            return _Response(400, body={'message': 'Backtest orders need one leg on a symbol in the panel.'})
+        order_id = next(self._order_ids)
+        quantity = float(legs[0]['quantity'])
+        self.orders[order_id] = {**orderForm, 'orderId': order_id, 'accountNumber': self.account_hash,
+                                 'status': 'WORKING', 'enteredTime': self._time_text(), 'filledQuantity': 0.0,
+                                 'remainingQuantity': quantity, 'orderActivityCollection': []}
+        self._working.append(order_id)
+        self._entered[order_id] = self.t
+        return _Response(201, {'Location': f'/trader/v1/accounts/{accountHash}/orders/{order_id}'})
+
+    def get_order_by_id(self, accountHash: str, orderId: int):
+        return self.orders.get(int(orderId))
+
+    def get_orders(self, accountHash: str, fromEnteredTime=None, toEnteredTime=None, maxResults: int | None = None,
+                   status: str | None = None) -> list[dict]:
+        orders = [order for order in self.orders.values() if status is None or order['status'] == status]
+        return orders[-maxResults:] if maxResults else orders
+
+    def get_all_orders(self, fromEnteredTime=None, toEnteredTime=None, maxResults: int | None = None,
+                       status: str | None = None) -> list[dict]:
+        return self.get_orders(self.account_hash, fromEnteredTime, toEnteredTime, maxResults, status)
+
+    def delete_order(self, accountHash: str, orderId: int):
+        order = self.orders.get(int(orderId))
+        if order is None or order['status'] != 'WORKING':
+            return _Response(404 if order is None else 400)
+        order['status'] = 'CANCELED'
+        self._working.remove(order['orderId'])
+        return _Response(200)
+
+    def get_account_accountNumber(self, fields: str | None = None, account: str | int | None = None):
+        positions = []
+        for column in np.flatnonzero(self.positions):
+            close = float(self.panel.close[self.t, column])
+            quantity = float(self.positions[column])
+            positions.append({'longQuantity': max(quantity, 0.0), 'shortQuantity': max(-quantity, 0.0),
+                              'averagePrice': float(self.average_prices[column]), 'marketValue': quantity * close,
+                              'instrument': {'assetType': 'EQUITY', 'symbol': self.panel.symbols[column]}})
+        return {'securitiesAccount': {'type': 'MARGIN', 'accountNumber': self.account_hash, 'positions': positions,
+                                      'currentBalances': {'cashBalance': self.cash, 'buyingPower': self.cash,
+                                                          'liquidationValue': self.equity()}}}
+
+    def get_account(self, fields: str | None = None):
+        return [self.get_account_accountNumber(fields)]
+
+    def buy_stock(self, symbol: str, price: int, quantity: int):
+        from trader import Trader
+        return Trader.buy_stock(self, symbol, price, quantity)
+
+# ---------- Stepping ---------- #
+
+    def equity(self) -> float:
+        return self.cash + float(np.nansum(self.positions * self.panel.close[self.t]))
+
+    def _fill_price(self, order: dict, column: int) -> float | None:
+        open_, high, low, close, _ = self._bar(column)
+        if close != close:
+            return None
+        buy = order['orderLegCollection'][0]['instruction'].startswith('BUY')
+        kind = order.get('orderType', 'MARKET')
+        model = self.fill_model
+        if kind == 'MARKET':
+            return model.execution_price(open_ if model.price == 'open' else close, 1 if buy else -1)
+        if kind == 'LIMIT':
+            limit = float(order['price'])
+            if buy and low <= limit:
+                return min(open_, limit)
+            if not buy and high >= limit:
+                return max(open_, limit)
+            return None
+        if kind == 'STOP':
+            stop = float(order['stopPrice'])
+            if buy and high >= stop:
+                return model.execution_price(max(open_, stop), 1)
+            if not buy and low <= stop:
+                return model.execution_price(min(open_, stop), -1)
+            return None
+        if kind == 'STOP_LIMIT':
+            # The stop turns it into a limit order, it fills only if the bar also trades at the limit or better
+            # and never at a worse price than the limit (a gap through both leaves it working).
+            stop, limit = float(order['stopPrice']), float(order['price'])
+            if buy and high >= stop and low <= limit:
+                return min(model.execution_price(max(open_, stop), 1), limit)
+            if not buy and low <= stop and high >= limit:
+                return max(model.execution_price(min(open_, stop), -1), limit)
+            return None
+        return None
+
+    def _fill_working(self):
+        for order_id in list(self._working):
+            order = self.orders[order_id]
+            if self.t - self._entered[order_id] < self.fill_model.delay:
+                continue
+            leg = order['orderLegCollection'][0]
+            column = self.panel.column(leg['instrument']['symbol'])
+            price = self._fill_price(order, column)
+            if price is None:
+                continue
+            quantity = order['remainingQuantity'] * (1 if leg['instruction'].startswith('BUY') else -1)
+            fees = self.fill_model.fees(quantity)
+            held = self.positions[column]
+            if held == 0 or (held > 0) == (quantity > 0):
+                self.average_prices[column] = (self.average_prices[column] * abs(held) + price * abs(quantity)) / \
+                    (abs(held) + abs(quantity))
+            elif abs(quantity) > abs(held):
+                self.average_prices[column] = price
+            elif abs(quantity) == abs(held):
+                self.average_prices[column] = 0.0
+            self.positions[column] += quantity
+            self.cash -= quantity * price + fees
+            self._trades[self.t, column] += quantity
+            self._fees[self.t] += fees
+            order.update(status='FILLED', filledQuantity=order['filledQuantity'] + abs(quantity), remainingQuantity=0.0,
+                         closeTime=self._time_text())
+            order['orderActivityCollection'].append({'activityType': 'EXECUTION', 'executionType': 'FILL',
+                                                     'quantity': abs(quantity),
+                                                     'executionLegs': [{'price': float(price), 'time': self._time_text(),
+                                                                        'quantity': abs(quantity)}]})
+            self._working.remove(order_id)
+
+    def step(self) -> bool:
+        """
+        Move to the next bar and fill what can be filled on it.
+        :return: False once the panel is exhausted.
+        """
+        if self.t + 1 >= len(self.panel):
+            return False
+        self.t += 1
+        self._fill_working()
+        self._equity[self.t] = self.equity()
+        self._cash[self.t] = self.cash
+        return True
+
+    def run(self, on_bar, start: int = 0) -> BacktestResult:
+        """
+        Call on_bar(self) after every bar from start on, then step. Returns the equity/positions of every bar.
+        """
+        self.t = start
+        self._equity[:start + 1] = self.equity()
+        self._cash[:start + 1] = self.cash
+        while True:
+            on_bar(self)
+            if not self.step():
+                break
+        held = np.cumsum(self._trades, axis=0)
+        return BacktestResult(self.panel.times, self.panel.symbols, self._equity, self._cash, held, self._trades,
+                              self._fees, self.panel.bars_per_year)
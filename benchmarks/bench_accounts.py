@@ -0,0 +1,55 @@
+# Multi account refresh (positions, working orders, today's transactions) one account after the other vs
+# AccountSet fanning the same calls out over every account, against a mock server with per request latency.
+# Usage: python3 benchmarks/bench_accounts.py [--accounts 1 2 4 8] [--latency 0.05] [--rounds 10]
+import argparse
+import datetime as dt
+import time
+
+from common import report
+from accounts import AccountSet
+from mock_server import MockServer, StubTokens
+from trader import Trader
+
+
+def sequential(trader: Trader, start: dt.datetime, end: dt.datetime) -> int:
+    records = 0
+    for account_hash in trader.account_hashes().values():
+        account = trader.get_account_accountNumber('positions', account=account_hash)
+        records += len(account['securitiesAccount']['positions'])
+        records += len(trader.get_orders(account_hash, start, end, status='WORKING'))
+        records += len(trader.get_all_transactions(account_hash, start, end, types='TRADE'))
+    return records
+
+
+def fanned_out(accounts: AccountSet, start: dt.datetime, end: dt.datetime) -> int:
+    return (len(accounts.positions()) + len(accounts.orders(start, end, status='WORKING'))
+            + len(accounts.transactions(start, end, types='TRADE')))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--accounts', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds every request takes')
+    parser.add_argument('--rounds', type=int, default=10)
+    args = parser.parse_args()
+    end = dt.datetime.now(dt.timezone.utc)
+    start = end - dt.timedelta(days=1)
+
+    for count in args.accounts:
+        with MockServer(latency=args.latency, accounts=count) as server:
+            with Trader(None, tokens=StubTokens(server.base_url), rate_limit=False) as trader:
+                accounts = AccountSet(trader, rate_per_minute=None)
+                for name, refresh in (('one by one', lambda: sequential(trader, start, end)),
+                                      ('AccountSet', lambda: fanned_out(accounts, start, end))):
+                    latencies, records = [], set()
+                    wall = time.perf_counter()
+                    for _ in range(args.rounds):
+                        t0 = time.perf_counter()
+                        records.add(refresh())
+                        latencies.append(time.perf_counter() - t0)
+                    report(f'{count} accounts, {name}', latencies, time.perf_counter() - wall)
+                    print(f'    {records.pop()} records per refresh')
+
+
+if __name__ == '__main__':
+    main()
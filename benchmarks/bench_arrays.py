@@ -0,0 +1,59 @@
+# Parse time and memory of the dict form vs market_arrays for a big option chain and a long minute history.
+# Usage: python3 benchmarks/bench_arrays.py [--expirations 40] [--strikes 250] [--candles 100000]
+import argparse
+import json
+import time
+import tracemalloc
+
+import common  # noqa: F401 (puts the repo root on sys.path)
+from market_arrays import Candles, OptionChainTable
+from mock_server import _candles, _chain
+
+
+def measure(name: str, build, repeat: int = 3):
+    # Best wall time, then the memory still held by the result (tracemalloc, python + numpy allocations).
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        build()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    result = build()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{name:<34} {best * 1000:>9.2f} ms  {retained / 1e6:>9.2f} MB retained')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--expirations', type=int, default=40)
+    parser.add_argument('--strikes', type=int, default=250)
+    parser.add_argument('--candles', type=int, default=100000)
+    args = parser.parse_args()
+
+    chain_payload = json.dumps(_chain('$SPX', strikes=args.strikes, expirations=args.expirations))
+    candle_payload = json.dumps(_candles('AAPL', count=args.candles))
+    print(f'chain payload {len(chain_payload) / 1e6:.1f} MB, candle payload {len(candle_payload) / 1e6:.1f} MB')
+
+    chain = measure('chain: json.loads (dict)', lambda: json.loads(chain_payload))
+    table = measure('chain: json.loads + table', lambda: OptionChainTable.from_json(json.loads(chain_payload)))
+    measure('chain: table from decoded dict', lambda: OptionChainTable.from_json(chain))
+    print(f'{"":<34} {len(table)} contracts, columns {table.nbytes / 1e6:.2f} MB')
+
+    history = measure('candles: json.loads (dict)', lambda: json.loads(candle_payload))
+    candles = measure('candles: json.loads + arrays', lambda: Candles.from_json(json.loads(candle_payload)))
+    measure('candles: arrays from decoded dict', lambda: Candles.from_json(history))
+    print(f'{"":<34} {len(candles)} candles, columns {candles.nbytes / 1e6:.2f} MB')
+
+    # What an indicator pays per call, walking dicts vs one numpy reduction.
+    start = time.perf_counter()
+    sum(candle['close'] for candle in history['candles']) / len(history['candles'])
+    dict_mean = time.perf_counter() - start
+    start = time.perf_counter()
+    candles.close.mean()
+    print(f'{"mean close: dict walk vs numpy":<34} {dict_mean * 1000:>9.3f} ms vs {(time.perf_counter() - start) * 1000:.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+# Wall time for pulling option chains for N symbols, sync Trader (one at a time) vs AsyncTrader.fetch_chains.
+# Usage: python3 benchmarks/bench_async.py [--symbols 300] [--latency 0.05] [--concurrency 16]
+import argparse
+import asyncio
+import time
+
+from common import report
+from mock_server import MockServer, StubTokens
+from trader import Trader
+from async_trader import AsyncTrader
+
+
+async def run_async(tokens, symbols: list[str], concurrency: int) -> float:
+    async with AsyncTrader(None, tokens=tokens, max_concurrency=concurrency, rate_limit=False) as trader:
+        start = time.perf_counter()
+        chains = await trader.fetch_chains(symbols)
+        wall = time.perf_counter() - start
+    assert all(chains.values())
+    return wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--symbols', type=int, default=300)
+    parser.add_argument('--latency', type=float, default=0.05, help='mock server time per request (seconds)')
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+    symbols = [f'SYM{i}' for i in range(args.symbols)]
+
+    with MockServer(latency=args.latency) as server:
+        tokens = StubTokens(server.base_url)
+        with Trader(None, tokens=tokens, rate_limit=False) as trader:
+            latencies = []
+            start = time.perf_counter()
+            for symbol in symbols:
+                t0 = time.perf_counter()
+                trader.get_option_chains(symbol)
+                latencies.append(time.perf_counter() - t0)
+            report('sync Trader', latencies, time.perf_counter() - start)
+
+        wall = asyncio.run(run_async(tokens, symbols, args.concurrency))
+        print(f'{"AsyncTrader.fetch_chains":<28} {len(symbols):>6} req  {len(symbols) / wall:>9.1f} req/s  '
+              f'wall {wall:.3f} s (concurrency {args.concurrency})')
+
+
+if __name__ == '__main__':
+    main()
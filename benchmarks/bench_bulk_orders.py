@@ -0,0 +1,73 @@
+# Time to flat for a batch of working orders: delete_order() one order after the other vs OrderActions cancelling
+# them concurrently under the order budget, then OrderActions repricing a fresh batch with change_order().
+# Usage: python3 benchmarks/bench_bulk_orders.py [--orders 80] [--latency 0.1] [--order-limit 1200]
+import argparse
+import datetime as dt
+import time
+
+import common  # noqa: F401 (puts the repo root on sys.path)
+from mock_server import MockServer, StubTokens
+from order_actions import OrderActions
+from order_book import format_time
+from order_pipeline import limit_form
+from rate_limiter import RequestScheduler
+from trader import Trader
+
+SYMBOLS = ('AAPL', 'MSFT', 'NVDA', 'AMZN', 'META', 'TSLA', 'AMD', 'SPY')
+
+
+def place(trader: Trader, orders: int):
+    # Working limit orders spread over two accounts, buys below and sells above the market.
+    for i in range(orders):
+        side = 'BUY' if i % 2 else 'SELL'
+        form = {**limit_form(SYMBOLS[i % len(SYMBOLS)], side), 'price': 100.0 + (1 if side == 'SELL' else -1)}
+        form['orderLegCollection'][0]['quantity'] = 10
+        trader.post_orders(['MOCKHASH', 'MOCKHASH1'][i % 2], form)
+
+
+def one_by_one(trader: Trader) -> tuple[float, int]:
+    start = time.perf_counter()
+    now = dt.datetime.now(dt.timezone.utc)
+    window = format_time(now - dt.timedelta(days=60)), format_time(now + dt.timedelta(minutes=1))
+    working = [order for order in trader.get_all_orders(*window) if order['status'] == 'WORKING']
+    for order in working:
+        trader.delete_order(str(order['accountNumber']), order['orderId'])
+    left = [order for order in trader.get_all_orders(*window) if order['status'] == 'WORKING']
+    return time.perf_counter() - start, len(working) - len(left)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--orders', type=int, default=80)
+    parser.add_argument('--latency', type=float, default=0.1, help='seconds every request takes')
+    parser.add_argument('--order-limit', type=float, default=1200, help='order requests per minute')
+    parser.add_argument('--workers', type=int, default=16)
+    args = parser.parse_args()
+    scheduler = RequestScheduler({'orders': args.order_limit})
+
+    with MockServer(latency=args.latency, accounts=2) as server:
+        tokens = StubTokens(server.base_url)
+        with Trader(None, tokens=tokens, rate_limit=False) as placer, \
+                Trader(None, tokens=tokens, scheduler=scheduler) as trader:
+            place(placer, args.orders)
+            flat, cancelled = one_by_one(trader)
+            print(f'{"delete_order one by one":<28} {cancelled:>4} cancelled  flat after {flat * 1000:>8.1f} ms')
+
+            actions = OrderActions(trader, max_workers=args.workers, poll_interval=0.05)
+            place(placer, args.orders)
+            result = actions.cancel_all()
+            print(f'{"OrderActions.cancel_all":<28} {len(result):>4} cancelled  flat after '
+                  f'{result.time_to_flat * 1000:>8.1f} ms  (answered after {result.time_to_answered * 1000:.1f} ms)')
+            print(f'    {result.counts()}, {actions.stats["snapshots"]} status snapshots')
+
+            place(placer, args.orders)
+            result = actions.reprice(0.05, aggressive=True)
+            print(f'{"OrderActions.reprice":<28} {len(result):>4} replaced   done after '
+                  f'{result.time_to_flat * 1000:>8.1f} ms  (answered after {result.time_to_answered * 1000:.1f} ms)')
+            prices = sorted({order['price'] for order in actions.working()})
+            print(f'    {result.counts()}, working prices now {prices}')
+            print(f'    order lane: {scheduler.stats()["orders"]["max_wait_seconds"] * 1000:.1f} ms longest budget wait')
+
+
+if __name__ == '__main__':
+    main()
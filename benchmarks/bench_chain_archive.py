@@ -0,0 +1,160 @@
+# A trading day of one minute option chain snapshots stored as JSON lines (what a plain snapshot loop writes) vs
+# ChainArchive: write throughput, size on disk, rebuilding the chain at a random past minute and replaying a day.
+# The chains are repriced every minute from a random walk of the underlying with Schwab's rounding (cents for
+# quotes, 3 decimals for greeks) so the share of fields that really change between snapshots is realistic.
+# Usage: python3 benchmarks/bench_chain_archive.py [--underlyings 5] [--minutes 390] [--strikes 30] [--expirations 4]
+import argparse
+import datetime as dt
+import gzip
+import json
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from common import report
+from chain_archive import ChainArchive
+from market_arrays import OptionChainTable
+from market_calendar import MARKET_TZ
+from mock_server import _chain
+from option_analytics import greeks, price
+
+SYMBOLS = ('SPY', 'QQQ', 'AAPL', 'MSFT', 'NVDA', 'AMZN', 'META', 'TSLA', 'AMD', 'IWM')
+
+
+class SyntheticChain:
+    # get_option_chains response of one underlying, repriced in place every minute.
+
+    def __init__(self, symbol: str, strikes: int, expirations: int, seed: int):
+        self.data = _chain(symbol, strikes, expirations)
+        self.contracts = [contracts[0] for exp_map in (self.data['callExpDateMap'], self.data['putExpDateMap'])
+                          for strikes_map in exp_map.values() for contracts in strikes_map.values()]
+        self.strike = np.array([c['strikePrice'] for c in self.contracts])
+        self.years = np.array([c['daysToExpiration'] for c in self.contracts]) / 365.0
+        self.is_call = np.array([c['putCall'] == 'CALL' for c in self.contracts])
+        self.spot = float(self.strike.mean())
+        self.vol = 0.25 + 0.1 * np.abs(np.log(self.strike / self.spot))
+        self.volume = np.zeros(len(self.contracts), dtype=np.int64)
+        self.rng = np.random.default_rng(seed)
+
+    def step(self) -> dict:
+        rng = self.rng
+        self.spot *= float(np.exp(rng.normal(0.0, 0.0008)))
+        self.vol = np.maximum(0.05, self.vol + rng.normal(0.0, 0.0005, len(self.vol)))
+        fair = price(self.spot, self.strike, self.years, 0.045, 0.0, self.vol, self.is_call)
+        g = greeks(self.spot, self.strike, self.years, 0.045, 0.0, self.vol, self.is_call)
+        half = np.maximum(0.01, np.round(fair * 0.01, 2))
+        bid = np.maximum(0.0, np.round(fair - half, 2))
+        ask = np.round(fair + half, 2)
+        traded = rng.random(len(fair)) < 0.15
+        self.volume += traded * rng.integers(1, 20, len(fair))
+        columns = {'bid': bid, 'ask': ask, 'mark': np.round((bid + ask) / 2, 2),
+                   'theoreticalOptionValue': np.round(fair, 3), 'volatility': np.round(self.vol * 100, 3),
+                   **{name: np.round(g[name], 3) for name in ('delta', 'gamma', 'theta', 'vega', 'rho')},
+                   'bidSize': rng.integers(1, 50, len(fair)), 'askSize': rng.integers(1, 50, len(fair)),
+                   'totalVolume': self.volume}
+        keys = list(columns)
+        rows = zip(*(column.tolist() for column in columns.values()))
+        for contract, row, last in zip(self.contracts, rows, np.round(fair, 2).tolist()):
+            contract.update(zip(keys, row))
+            if contract['totalVolume']:
+                contract['last'] = last if contract['last'] == 1.05 or rng.random() < 0.15 else contract['last']
+        self.data['underlyingPrice'] = round(self.spot, 2)
+        return self.data
+
+
+def directory_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(folder, name)) for folder, _, names in os.walk(path) for name in names)
+
+
+def json_lookup(path: str, when: int) -> OptionChainTable | None:
+    # Best case for the JSON lines file: the timestamp is the line prefix, only the matching line gets parsed.
+    found = None
+    with open(path, 'rb') as f:
+        for line in f:
+            timestamp, _, body = line.partition(b'\t')
+            if int(timestamp) > when:
+                break
+            found = body
+    return OptionChainTable.from_json(json.loads(found)) if found is not None else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--underlyings', type=int, default=5)
+    parser.add_argument('--minutes', type=int, default=390)
+    parser.add_argument('--strikes', type=int, default=30, help='strikes per expiration')
+    parser.add_argument('--expirations', type=int, default=4)
+    parser.add_argument('--keyframe-interval', type=int, default=30)
+    parser.add_argument('--lookups', type=int, default=200)
+    args = parser.parse_args()
+    symbols = [SYMBOLS[i % len(SYMBOLS)] + ('' if i < len(SYMBOLS) else str(i)) for i in range(args.underlyings)]
+    chains = {symbol: SyntheticChain(symbol, args.strikes, args.expirations, seed) for seed, symbol in enumerate(symbols)}
+    open_ms = int(dt.datetime(2025, 1, 15, 9, 30, tzinfo=MARKET_TZ).timestamp() * 1000)
+
+    with tempfile.TemporaryDirectory() as directory:
+        raw_root = os.path.join(directory, 'json')
+        os.makedirs(raw_root)
+        raw_files = {symbol: open(os.path.join(raw_root, f'{symbol}.jsonl'), 'wb') for symbol in symbols}
+        archive = ChainArchive(os.path.join(directory, 'archive'), keyframe_interval=args.keyframe_interval)
+        json_seconds = archive_seconds = 0.0
+        for minute in range(args.minutes):
+            for symbol in symbols:
+                data = chains[symbol].step()
+                timestamp = open_ms + minute * 60_000
+                start = time.perf_counter()
+                raw_files[symbol].write(f'{timestamp}\t'.encode() + json.dumps(data).encode() + b'\n')
+                json_seconds += time.perf_counter() - start
+                start = time.perf_counter()
+                archive.append(data, timestamp)
+                archive_seconds += time.perf_counter() - start
+        for f in raw_files.values():
+            f.close()
+        archive.close()
+
+        snapshots, contracts = archive.stats['snapshots'], archive.stats['contracts']
+        raw_bytes = directory_size(raw_root)
+        gzip_bytes = sum(len(gzip.compress(open(os.path.join(raw_root, name), 'rb').read()))
+                         for name in os.listdir(raw_root))
+        archive_bytes = directory_size(archive.root)
+        print(f'{snapshots} snapshots, {contracts / snapshots:.0f} contracts each, '
+              f'{archive.stats["fields_changed"] / (contracts * 18):.1%} of the fields changed between snapshots')
+        print(f'{"write JSON lines":<28} {snapshots / json_seconds:>9.1f} snapshots/s')
+        print(f'{"write ChainArchive":<28} {snapshots / archive_seconds:>9.1f} snapshots/s  '
+              f'({contracts / archive_seconds:,.0f} contracts/s, normalizing included)')
+        for name, size in (('JSON lines', raw_bytes), ('JSON lines, gzipped', gzip_bytes), ('ChainArchive', archive_bytes)):
+            print(f'{name:<28} {size / 1e6:>9.2f} MB  {size / snapshots / 1e3:>7.1f} kB/snapshot  '
+                  f'{raw_bytes / size:>6.1f}x smaller than JSON')
+
+        reader = ChainArchive(archive.root)
+        rng = random.Random(7)
+        queries = [(rng.choice(symbols), open_ms + rng.randrange(args.minutes * 60_000)) for _ in range(args.lookups)]
+        for name, lookup, count in (
+                ('at() ChainArchive', lambda symbol, when: reader.at(symbol, when), len(queries)),
+                ('at() scanning JSON lines', lambda symbol, when: json_lookup(os.path.join(raw_root, f'{symbol}.jsonl'),
+                                                                               when), max(1, len(queries) // 10))):
+            latencies = []
+            wall = time.perf_counter()
+            for symbol, when in queries[:count]:
+                t0 = time.perf_counter()
+                chain = lookup(symbol, when)
+                latencies.append(time.perf_counter() - t0)
+                assert chain is not None and len(chain) == contracts // snapshots
+            report(name, latencies, time.perf_counter() - wall)
+
+        symbol = symbols[0]
+        start = time.perf_counter()
+        replayed = sum(1 for _ in reader.replay(symbol, open_ms, open_ms + args.minutes * 60_000))
+        replay = time.perf_counter() - start
+        start = time.perf_counter()
+        with open(os.path.join(raw_root, f'{symbol}.jsonl'), 'rb') as f:
+            parsed = sum(1 for line in f if OptionChainTable.from_json(json.loads(line.partition(b'\t')[2])))
+        reload = time.perf_counter() - start
+        print(f'{"replay a day, ChainArchive":<28} {replayed:>6} snapshots  {replay * 1000:>8.1f} ms')
+        print(f'{"reload a day, JSON lines":<28} {parsed:>6} snapshots  {reload * 1000:>8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+# Many threads each asking get_single_quote for their own symbols, with and without the quote coalescer.
+# Reports quotes/sec, p50/p99 per quote and how many round trips actually hit the server.
+# Usage: python3 benchmarks/bench_coalesce.py [--threads 50] [--quotes 20] [--window 0.01] [--latency 0.02]
+import argparse
+import threading
+import time
+
+from common import report
+from mock_server import MockServer, StubTokens
+from trader import Trader
+
+
+def run(trader: Trader, threads: int, quotes: int) -> tuple[list[float], float]:
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(n: int):
+        mine = []
+        for i in range(quotes):
+            t0 = time.perf_counter()
+            assert trader.get_single_quote(f'SYM{n}_{i % 5}')
+            mine.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(mine)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for worker_thread in workers:
+        worker_thread.start()
+    for worker_thread in workers:
+        worker_thread.join()
+    return latencies, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=50)
+    parser.add_argument('--quotes', type=int, default=20, help='quotes per thread')
+    parser.add_argument('--window', type=float, default=0.01, help='coalescing window (seconds)')
+    parser.add_argument('--latency', type=float, default=0.02, help='mock server time per request (seconds)')
+    args = parser.parse_args()
+
+    with MockServer(latency=args.latency) as server:
+        tokens = StubTokens(server.base_url)
+        for coalesce in (False, True):
+            with Trader(None, tokens=tokens, rate_limit=False, pool_maxsize=args.threads) as trader:
+                if coalesce:
+                    trader.enable_quote_coalescing(window=args.window)
+                hits = server.hits
+                name = f'coalesced ({args.window * 1000:.0f} ms)' if coalesce else 'per-symbol'
+                report(name, *run(trader, args.threads, args.quotes))
+                print(f'{"":<28} round trips: {server.hits - hits}')
+
+
+if __name__ == '__main__':
+    main()
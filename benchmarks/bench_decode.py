@@ -0,0 +1,62 @@
+# Decode time of each json backend (and msgspec typed structs) over quote, chain and candle payloads.
+# Usage: python3 benchmarks/bench_decode.py [--expirations 40] [--strikes 250] [--candles 100000] [--fixture chain=path.json]
+# Backends that are not installed are skipped. --fixture swaps a generated payload for a recorded response body.
+import argparse
+import json
+import time
+
+import common  # noqa: F401 (puts the repo root on sys.path)
+from json_codec import BACKENDS, JsonDecoder
+from mock_server import _candles, _chain, _quote
+
+
+def best_of(decode, body: bytes, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        decode(body)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--expirations', type=int, default=40)
+    parser.add_argument('--strikes', type=int, default=250)
+    parser.add_argument('--candles', type=int, default=100000)
+    parser.add_argument('--quotes', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--fixture', action='append', default=[], metavar='SCHEMA=PATH',
+                        help='recorded response body for quotes, chain or candles')
+    args = parser.parse_args()
+
+    payloads = {
+        'quotes': json.dumps({f'SYM{i}': _quote(f'SYM{i}') for i in range(args.quotes)}).encode(),
+        'chain': json.dumps(_chain('$SPX', strikes=args.strikes, expirations=args.expirations)).encode(),
+        'candles': json.dumps(_candles('AAPL', count=args.candles)).encode(),
+    }
+    for fixture in args.fixture:
+        schema, path = fixture.split('=', 1)
+        with open(path, 'rb') as f:
+            payloads[schema] = f.read()
+
+    decoders = []
+    for name in BACKENDS:
+        try:
+            decoders.append(JsonDecoder(name))
+        except ImportError:
+            print(f'{name} not installed, skipped')
+
+    for schema, body in payloads.items():
+        print(f'{schema}: {len(body) / 1e6:.2f} MB')
+        baseline = best_of(json.loads, body, args.repeat)
+        for decoder in decoders:
+            elapsed = best_of(decoder.decode, body, args.repeat)
+            print(f'  {decoder.backend:<16} {elapsed * 1000:>9.2f} ms  {baseline / elapsed:>5.1f}x')
+        if any(decoder.backend == 'msgspec' for decoder in decoders):
+            elapsed = best_of(lambda b: decoders[0].decode(b, schema=schema), body, args.repeat)
+            print(f'  {"msgspec typed":<16} {elapsed * 1000:>9.2f} ms  {baseline / elapsed:>5.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# Local chain analytics: implied volatility + greeks for every contract of a big chain, then a spot x vol x time grid.
+# Usage: python3 benchmarks/bench_greeks.py [--expirations 20] [--strikes 100] [--model european|american]
+# The mock chain is repriced at a known volatility first, so the implied volatilities can be checked against it.
+import argparse
+import time
+
+import numpy as np
+
+import common  # noqa: F401 (puts the repo root on sys.path)
+from market_arrays import OptionChainTable
+from mock_server import _chain
+from option_analytics import MODELS, ChainAnalytics, price
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--expirations', type=int, default=20)
+    parser.add_argument('--strikes', type=int, default=100)
+    parser.add_argument('--model', choices=MODELS, default='european')
+    parser.add_argument('--vol', type=float, default=0.3, help='volatility the mock chain is priced at')
+    args = parser.parse_args()
+
+    data = _chain('AAPL', args.strikes, args.expirations)
+    data['underlyingPrice'] = 100.0 + args.strikes * 2.5  # middle of the strikes
+    chain = OptionChainTable.from_json(data)
+    fair = price(chain.underlying_price, chain.strike, chain.days_to_expiration / 365.0, 0.045, 0.0, args.vol,
+                 chain.is_call, args.model)
+    chain.bid, chain.ask = fair - 0.001, fair + 0.001
+
+    start = time.perf_counter()
+    analytics = ChainAnalytics(chain, rate=0.045, model=args.model)
+    elapsed = time.perf_counter() - start
+    priced = ~np.isnan(analytics.iv)
+    # Contracts worth less than the spread have no real bid, their mid is not the fair price.
+    checked = priced & (fair > 0.01)
+    error = np.abs(analytics.iv[checked] - args.vol)
+    print(f'{analytics!r}: iv + greeks in {elapsed * 1000:.1f} ms, {priced.sum()} implied '
+          f'(max error {error.max():.2e} over {checked.sum()} with a bid), {len(chain) - priced.sum()} priced outside '
+          f'any volatility')
+
+    spots = np.linspace(analytics.spot * 0.8, analytics.spot * 1.2, 21)
+    vol_shifts = np.linspace(-0.1, 0.1, 5)
+    days = [0, 1, 7]
+    start = time.perf_counter()
+    grid = analytics.scenarios(spots, vol_shifts, days)
+    elapsed = time.perf_counter() - start
+    print(f'scenario grid {grid.shape} ({grid.size / 1e6:.1f}M values) in {elapsed * 1000:.1f} ms, '
+          f'{elapsed / (grid.size / len(chain)) * 1000:.2f} ms per whole-chain scenario')
+
+    quantities = np.zeros(len(chain))
+    quantities[::97] = 1
+    start = time.perf_counter()
+    pnl = analytics.position_scenarios(quantities, spots, vol_shifts, days)
+    elapsed = time.perf_counter() - start
+    print(f'position P&L grid {pnl.shape} for {int(quantities.sum())} contracts in {elapsed * 1000:.1f} ms, '
+          f'worst {pnl.min():.2f} best {pnl.max():.2f}')
+
+
+if __name__ == '__main__':
+    main()
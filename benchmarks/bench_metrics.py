@@ -0,0 +1,50 @@
+# What the request instrumentation costs: get_quotes without metrics, with metrics, and with every request traced.
+# Usage: python3 benchmarks/bench_metrics.py [--requests 2000] [--prometheus]
+# Ends with the per phase breakdown the metrics saw, --prometheus prints the full export instead.
+import argparse
+import time
+
+from common import report
+from metrics import Metrics
+from mock_server import MockServer, StubTokens
+from trader import Trader
+
+
+def run(trader: Trader, requests: int) -> tuple[list[float], float]:
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(requests):
+        t0 = time.perf_counter()
+        trader.get_quotes('AAPL,MSFT,NVDA')
+        latencies.append(time.perf_counter() - t0)
+    return latencies, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--prometheus', action='store_true', help='print the Prometheus export at the end')
+    args = parser.parse_args()
+
+    with MockServer() as server:
+        tokens = StubTokens(server.base_url)
+        metrics = None
+        for name, sample_rate in (('no metrics', None), ('metrics', 0.0), ('metrics, 100% traced', 1.0)):
+            metrics = Metrics(trace_sample_rate=sample_rate) if sample_rate is not None else None
+            with Trader(None, tokens=tokens, rate_limit=False, metrics=metrics) as trader:
+                run(trader, 20)  # warm up
+                report(name, *run(trader, args.requests))
+
+        if args.prometheus:
+            print(metrics.prometheus())
+            return
+        for label, endpoint in metrics.snapshot()['endpoints'].items():
+            print(label, endpoint['status'])
+            for phase, stats in endpoint['phases'].items():
+                print(f'    {phase:<10} {stats["count"]:>6}  mean {stats["sum"] / stats["count"] * 1e6:>9.1f} us  '
+                      f'p99 <= {stats["p99"] * 1e3:g} ms')
+            print(f'    traces kept: {len(metrics.traces)}, last: {metrics.traces[-1]}')
+
+
+if __name__ == '__main__':
+    main()
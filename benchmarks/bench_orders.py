@@ -0,0 +1,59 @@
+# Decision-to-wire cost of an order: buy_stock() + post_orders() vs a compiled OrderTemplate through OrderPipeline.
+# Usage: python3 benchmarks/bench_orders.py [--orders 2000]
+# Prints the build+encode cost on its own, then the round trip against the mock server with per-stage latency.
+import argparse
+import json
+import time
+
+from common import report
+from mock_server import MockServer, StubTokens
+from order_pipeline import OrderPipeline, OrderTemplate, bracket_form, limit_form
+from trader import Trader
+
+
+def encode_only(orders: int):
+    trader = Trader.__new__(Trader)  # buy_stock does not touch any state
+    template = OrderTemplate(limit_form('AAPL', 'BUY'))
+    for name, build in (('buy_stock + json.dumps', lambda i: json.dumps(trader.buy_stock('AAPL', 187.5 + i % 7, 10)).encode()),
+                        ('template.render', lambda i: template.render(price=187.5 + i % 7, quantity=10))):
+        start = time.perf_counter()
+        for i in range(orders):
+            build(i)
+        print(f'{name:<28} {(time.perf_counter() - start) / orders * 1e6:>8.2f} us/order')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--orders', type=int, default=2000)
+    args = parser.parse_args()
+
+    encode_only(args.orders * 50)
+
+    with MockServer() as server:
+        with Trader(None, tokens=StubTokens(server.base_url), rate_limit=False) as trader:
+            latencies = []
+            start = time.perf_counter()
+            for i in range(args.orders):
+                t0 = time.perf_counter()
+                trader.post_orders('MOCKHASH', trader.buy_stock('AAPL', 187.5 + i % 7, 10))
+                latencies.append(time.perf_counter() - t0)
+            report('post_orders(buy_stock)', latencies, time.perf_counter() - start)
+
+            with OrderPipeline(trader, 'MOCKHASH', keep_warm=None) as pipeline:
+                pipeline.add('limit', OrderTemplate(limit_form('AAPL', 'BUY')))
+                pipeline.add('bracket', OrderTemplate(bracket_form('AAPL')))
+                for name, values in (('limit', {'price': 187.5, 'quantity': 10}),
+                                     ('bracket', {'price': 187.5, 'take_profit': 195.0, 'stop_loss': 180.0,
+                                                  'quantity': 10})):
+                    pipeline.submissions.clear()
+                    latencies = []
+                    start = time.perf_counter()
+                    for _ in range(args.orders):
+                        latencies.append(pipeline.submit(name, **values).durations()['total'])
+                    report(f'pipeline {name}', latencies, time.perf_counter() - start)
+                    for stage, stats in pipeline.latency_report().items():
+                        print(f'{"":<28} {stage:<10} p50 {stats["p50"] * 1e6:>9.1f} us  p99 {stats["p99"] * 1e6:>9.1f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+# Compare Trader with the pooled session on and off against the local mock server.
+# Usage: python3 benchmarks/bench_pool.py [--requests 2000]
+# The mock server is plain http on localhost, against the real (TLS) Schwab url the gap is a lot bigger.
+import argparse
+import time
+
+from common import report
+from mock_server import MockServer, StubTokens
+from trader import Trader
+
+
+def run(trader: Trader, requests: int) -> tuple[list[float], float]:
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(requests):
+        t0 = time.perf_counter()
+        trader.get_quotes('AAPL,MSFT,NVDA')
+        latencies.append(time.perf_counter() - t0)
+    return latencies, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    with MockServer() as server:
+        tokens = StubTokens(server.base_url)
+        for name, kwargs in (('unpooled', {'pooled': False}),
+                             ('pooled', {'pooled': True}),
+                             ('pooled, keep_alive=False', {'pooled': True, 'keep_alive': False})):
+            with Trader(None, tokens=tokens, rate_limit=False, **kwargs) as trader:
+                run(trader, 20)  # warm up
+                report(name, *run(trader, args.requests))
+
+
+if __name__ == '__main__':
+    main()
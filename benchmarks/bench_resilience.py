@@ -0,0 +1,69 @@
+# The request executor against a misbehaving mock server: hedged quote reads on a latency tail (what the hedges
+# cost, a blocking call still waits for its own slow answer, AsyncTrader takes whichever answers first), retried
+# GETs when a share of requests fail with 503, and the circuit breaker during an outage (every request 503).
+# Usage: python3 benchmarks/bench_resilience.py [--requests 500] [--slow-rate 0.02] [--error-rate 0.2]
+import argparse
+import time
+
+from common import report
+from mock_server import MockServer, StubTokens
+from resilience import CircuitOpenError, RequestExecutor, RetryPolicy
+from trader import Trader
+
+
+def run(trader: Trader, requests: int) -> tuple[list[float], float, int]:
+    latencies, failed = [], 0
+    start = time.perf_counter()
+    for _ in range(requests):
+        t0 = time.perf_counter()
+        try:
+            failed += trader.get_single_quote('AAPL') is None
+        except CircuitOpenError:
+            failed += 1
+        latencies.append(time.perf_counter() - t0)
+    return latencies, time.perf_counter() - start, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--slow-rate', type=float, default=0.02, help='share of requests that take 200 ms more')
+    parser.add_argument('--error-rate', type=float, default=0.2, help='share of requests answered 503')
+    args = parser.parse_args()
+
+    with MockServer(latency=0.002, jitter=0.002, slow_rate=args.slow_rate, slow_latency=0.2, seed=1) as server:
+        tokens = StubTokens(server.base_url)
+        for name, resilient in (('single attempt', False), ('hedged', True)):
+            with Trader(None, tokens=tokens, rate_limit=False, resilient=resilient) as trader:
+                run(trader, 50)  # warm up, the executor learns the endpoint's p95 here
+                latencies, wall, _ = run(trader, args.requests)
+                report(name, latencies, wall)
+                if trader.executor is not None:
+                    stats = trader.executor.stats()
+                    print(f'    {stats["hedges"]} hedges sent ({stats["hedges_skipped"]} over budget), '
+                          f'{stats["hedge_wins"]} answers used')
+
+    with MockServer(latency=0.001, error_rate=args.error_rate, seed=1) as server:
+        tokens = StubTokens(server.base_url)
+        retry = RetryPolicy(retries=3, base_delay=0.01)
+        for name, resilient in (('single attempt', False), ('retried', True)):
+            executor = RequestExecutor(retry=retry, failure_threshold=10 ** 6)
+            with Trader(None, tokens=tokens, rate_limit=False, resilient=resilient, executor=executor) as trader:
+                latencies, wall, failed = run(trader, args.requests)
+                report(f'{args.error_rate:.0%} 503, {name}', latencies, wall)
+                print(f'    {failed} of {args.requests} calls came back empty')
+
+    with MockServer(latency=0.05, error_rate=1.0) as server:
+        tokens = StubTokens(server.base_url)
+        retry = RetryPolicy(retries=0)
+        for name, threshold in (('no breaker', 10 ** 6), ('breaker', 5)):
+            executor = RequestExecutor(retry=retry, failure_threshold=threshold)
+            with Trader(None, tokens=tokens, rate_limit=False, executor=executor) as trader:
+                latencies, wall, failed = run(trader, 100)
+                report(f'outage, {name}', latencies, wall)
+                print(f'    {server.hits} requests reached the server, {executor.stats()["breakers"]}')
+            server.httpd.hits = 0
+
+
+if __name__ == '__main__':
+    main()
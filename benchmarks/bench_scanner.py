@@ -0,0 +1,87 @@
+# Scanner: one new minute bar for every symbol of a big universe then a filter, incremental indicators vs
+# recomputing SMA/EMA/RSI/VWAP from the full window each cycle (what a get_price_history screening loop does).
+# Usage: python3 benchmarks/bench_scanner.py [--symbols 5000] [--bars 390] [--cycles 50]
+import argparse
+import time
+
+import numpy as np
+
+import common  # noqa: F401 (puts the repo root on sys.path)
+from history_store import CANDLE_DTYPE
+from scanner import Scanner
+
+FILTER = 'close > sma_50 and ema_12 > ema_26 and rsi_14 < 70 and close > vwap'
+
+
+def random_candles(symbols: int, bars: int, seed: int = 1) -> dict[str, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    close = 100.0 * np.exp(np.cumsum(rng.normal(0, 0.001, (bars, symbols)), axis=0))
+    candles = {}
+    for column in range(symbols):
+        data = np.zeros(bars, dtype=CANDLE_DTYPE)
+        data['datetime'] = 1704205800000 + np.arange(bars, dtype=np.int64) * 60000
+        data['open'] = data['close'] = close[:, column]
+        data['high'], data['low'] = close[:, column] * 1.001, close[:, column] * 0.999
+        data['volume'] = 1000
+        candles[f'SYM{column}'] = data
+    return candles
+
+
+def recompute(close: np.ndarray, typical: np.ndarray, volume: np.ndarray) -> np.ndarray:
+    # The from-scratch version over a (bars x symbols) window: every indicator walks every bar again.
+    sma = close[-50:].mean(axis=0)
+    ema12, ema26 = close[0].copy(), close[0].copy()
+    for row in close[1:]:
+        ema12 += 2.0 / 13 * (row - ema12)
+        ema26 += 2.0 / 27 * (row - ema26)
+    change = np.diff(close, axis=0)
+    gains, losses = np.maximum(change, 0.0), np.maximum(-change, 0.0)
+    average_gain, average_loss = gains[:14].mean(axis=0), losses[:14].mean(axis=0)
+    for gain, loss in zip(gains[14:], losses[14:]):
+        average_gain = (average_gain * 13 + gain) / 14
+        average_loss = (average_loss * 13 + loss) / 14
+    rsi = 100.0 * average_gain / (average_gain + average_loss)
+    vwap = (typical * volume).sum(axis=0) / volume.sum(axis=0)
+    return (close[-1] > sma) & (ema12 > ema26) & (rsi < 70) & (close[-1] > vwap)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--symbols', type=int, default=5000)
+    parser.add_argument('--bars', type=int, default=390, help='history bars seeded per symbol')
+    parser.add_argument('--cycles', type=int, default=50, help='new bars streamed in after seeding')
+    args = parser.parse_args()
+
+    candles = random_candles(args.symbols, args.bars + args.cycles)
+    symbols = list(candles)
+    scanner = Scanner(sma=(20, 50), ema=(12, 26), rsi=(14,))
+    start = time.perf_counter()
+    scanner.seed({symbol: data[:args.bars] for symbol, data in candles.items()})
+    print(f'{scanner!r}: seeded {args.bars} bars in {time.perf_counter() - start:.2f} s')
+
+    updates, scans = [], []
+    for step in range(args.bars, args.bars + args.cycles):
+        bar = [np.array([candles[symbol][step][name] for symbol in symbols]) for name in
+               ('datetime', 'open', 'high', 'low', 'close', 'volume')]
+        start = time.perf_counter()
+        scanner.update_many(symbols, *bar)
+        updates.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        matches = scanner.scan(FILTER, sort='rsi_14')
+        scans.append(time.perf_counter() - start)
+    print(f'incremental: update {np.median(updates) * 1000:.2f} ms + scan {np.median(scans) * 1000:.2f} ms per cycle, '
+          f'{len(matches)} matches')
+
+    close = np.column_stack([candles[symbol]['close'] for symbol in symbols])
+    volume = np.column_stack([candles[symbol]['volume'] for symbol in symbols]).astype(np.float64)
+    typical = np.column_stack([(candles[symbol]['high'] + candles[symbol]['low'] + candles[symbol]['close']) / 3
+                               for symbol in symbols])
+    start = time.perf_counter()
+    expected = recompute(close, typical, volume)
+    elapsed = time.perf_counter() - start
+    print(f'recompute:   {elapsed * 1000:.2f} ms per cycle, {int(expected.sum())} matches '
+          f'(same symbols: {set(np.array(symbols)[expected]) == set(matches)})')
+
+
+if __name__ == '__main__':
+    main()
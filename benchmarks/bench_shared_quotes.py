@@ -0,0 +1,128 @@
+# Shared memory quotes: read latency from a SharedQuoteTable while a writer keeps publishing into it, then the
+# requests reaching the (mock) Schwab server when N strategy processes each poll with their own Trader vs one
+# QuotePublisher polling for all of them.
+# Usage: python3 benchmarks/bench_shared_quotes.py [--symbols 200] [--seconds 2] [--processes 1 2 4 8]
+import argparse
+import multiprocessing
+import time
+
+import numpy as np
+
+import common  # noqa: F401 (puts the repo root on sys.path)
+from common import report
+from mock_server import MockServer, StubTokens
+from shared_quotes import QuotePublisher, SharedQuoteTable
+from trader import Trader
+
+TABLE = 'bench-shared-quotes'
+INTERVAL = 0.05  # every strategy wants quotes at least this fresh
+
+
+def quote_response(symbols: list[str], tick: int) -> dict:
+    return {symbol: {'quote': {'bidPrice': 100.0 + tick, 'askPrice': 100.05 + tick, 'lastPrice': 100.02 + tick}}
+            for symbol in symbols}
+
+
+def writer(symbols: list[str], ready, stop):
+    # The one publisher process, owns the table and writes as fast as it can so reads race writes.
+    table = SharedQuoteTable(TABLE, create=True, capacity=len(symbols))
+    table.publish_quotes(quote_response(symbols, 0))
+    ready.set()
+    tick = 1
+    while not stop.is_set():
+        table.publish_quotes(quote_response(symbols, tick))
+        tick += 1
+    table.close()
+
+
+def polling_strategy(base_url: str, symbols: list[str], seconds: float, start):
+    # What every strategy process does today: its own Trader polling get_quotes.
+    with Trader(None, tokens=StubTokens(base_url), rate_limit=False) as trader:
+        start.wait()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            trader.get_quotes(symbols)
+            time.sleep(INTERVAL)
+
+
+def shared_strategy(symbols: list[str], seconds: float, start):
+    table = SharedQuoteTable(TABLE)
+    start.wait()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        table.read(symbols, ('bid', 'ask', 'last'))
+        time.sleep(INTERVAL)
+    table.close()
+
+
+def read_latency(symbols: list[str], reads: int):
+    context = multiprocessing.get_context('spawn')
+    ready, stop = context.Event(), context.Event()
+    process = context.Process(target=writer, args=(symbols, ready, stop))
+    process.start()
+    try:
+        ready.wait()
+        reader = SharedQuoteTable(TABLE)
+        for name, read in (('get(symbol)', lambda: reader.get(symbols[0])),
+                           (f'read({len(symbols)} symbols)', lambda: reader.read(symbols, ('bid', 'ask', 'last')))):
+            latencies = []
+            start = time.perf_counter()
+            for _ in range(reads):
+                t0 = time.perf_counter()
+                read()
+                latencies.append(time.perf_counter() - t0)
+            report(name, latencies, time.perf_counter() - start)
+        print(f'    {reader.stats["retries"]} of {reader.stats["reads"]} seqlock reads raced the writer and retried')
+        bid, ask = reader.read(symbols, ('bid', 'ask')).T
+        print(f'    every row consistent: {bool(np.allclose(ask - bid, 0.05))}')
+        reader.close()
+    finally:
+        stop.set()
+        process.join()
+
+
+def run_workers(server: MockServer, target, args: tuple, processes: int) -> int:
+    """
+    Start the strategy processes, count only the requests made while all of them are polling
+    (spawning a process and importing numpy takes longer than the run itself).
+    """
+    context = multiprocessing.get_context('spawn')
+    start = context.Barrier(processes + 1)
+    workers = [context.Process(target=target, args=(*args, start)) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    start.wait()
+    server.httpd.hits = 0
+    for worker in workers:
+        worker.join()
+    return server.hits
+
+
+def api_calls(symbols: list[str], processes: int, seconds: float) -> tuple[int, int]:
+    with MockServer() as server:
+        independent = run_workers(server, polling_strategy, (server.base_url, symbols, seconds), processes)
+        with Trader(None, tokens=StubTokens(server.base_url), rate_limit=False) as trader:
+            with QuotePublisher(trader, name=TABLE, quote_interval=INTERVAL) as publisher:
+                publisher.watch(symbols)
+                shared = run_workers(server, shared_strategy, (symbols, seconds), processes)
+        return independent, shared
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--symbols', type=int, default=200)
+    parser.add_argument('--seconds', type=float, default=2.0)
+    parser.add_argument('--reads', type=int, default=20000)
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+    symbols = [f'SYM{i}' for i in range(args.symbols)]
+
+    read_latency(symbols, args.reads)
+    print(f'{"processes":>9}  {"own Trader":>10}  {"publisher":>9}  requests saved')
+    for processes in args.processes:
+        independent, shared = api_calls(symbols, processes, args.seconds)
+        print(f'{processes:>9}  {independent:>10}  {shared:>9}  {1 - shared / independent:>6.0%}')
+
+
+if __name__ == '__main__':
+    main()
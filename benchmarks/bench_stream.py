@@ -0,0 +1,81 @@
+# Replay LEVELONE_EQUITIES frames through Streamer against the local mock streamer.
+# Usage: python3 benchmarks/bench_stream.py [--symbols 500] [--frames 20000] [--record frames.txt]
+# First run measures throughput, the second drops the socket every --drop-after frames and checks that the
+# streamer reconnects, resubscribes and ends up with the same quote table.
+import argparse
+import json
+import time
+
+import common  # noqa: F401 (puts the repo root on sys.path)
+from mock_server import MockServer, StubTokens
+from mock_streamer import MockStreamer, level_one_frames
+from streamer import LEVELONE_EQUITIES, SERVICE_FIELDS, QuoteTable, Streamer
+from trader import Trader
+
+
+def expected_table(frames: list[str]) -> tuple[QuoteTable, int]:
+    # What the streamer should end up with, and the number of updates it takes to get there.
+    table = QuoteTable(SERVICE_FIELDS[LEVELONE_EQUITIES])
+    updates = 0
+    for frame in frames:
+        for data in json.loads(frame).get('data', ()):
+            for content in data['content']:
+                table.apply(content)
+                updates += 1
+    return table, updates
+
+
+def replay(frames: list[str], symbols: list[str], updates: int, drop_after: int | None,
+           timeout: float) -> tuple[Streamer, MockStreamer, float]:
+    with MockStreamer(frames, drop_after=drop_after) as mock, MockServer(streamer_url=mock.url) as server:
+        with Trader(None, tokens=StubTokens(server.base_url), rate_limit=False) as trader:
+            streamer = Streamer(trader)
+            callbacks = [0]
+            streamer.on(LEVELONE_EQUITIES, lambda service, symbol, table: callbacks.__setitem__(0, callbacks[0] + 1))
+            streamer.subscribe(LEVELONE_EQUITIES, symbols)
+            start = time.perf_counter()
+            streamer.start()
+            deadline = time.monotonic() + timeout
+            while streamer.stats['updates'] < updates and time.monotonic() < deadline:
+                time.sleep(0.001)
+            wall = time.perf_counter() - start
+            streamer.stop()
+            streamer.stats['callbacks'] = callbacks[0]
+    return streamer, mock, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--symbols', type=int, default=500)
+    parser.add_argument('--frames', type=int, default=20000)
+    parser.add_argument('--per-frame', type=int, default=10)
+    parser.add_argument('--drop-after', type=int, default=5000)
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--record', help='file of recorded streamer frames, one JSON message per line')
+    args = parser.parse_args()
+
+    if args.record:
+        with open(args.record) as f:
+            frames = [line.strip() for line in f if line.strip()]
+        symbols = sorted({content['key'] for frame in frames for data in json.loads(frame).get('data', ())
+                          for content in data['content']})
+    else:
+        symbols = [f'SYM{i}' for i in range(args.symbols)]
+        frames = level_one_frames(symbols, args.frames, args.per_frame)
+    expected, updates = expected_table(frames)
+
+    for name, drop_after in (('no drops', None), (f'drop every {args.drop_after}', args.drop_after)):
+        streamer, mock, wall = replay(frames, symbols, updates, drop_after, args.timeout)
+        stats = streamer.stats
+        table = streamer.tables[LEVELONE_EQUITIES]
+        # Compared as text so fields never sent (NaN) count as equal.
+        matches = all(str(table.get(symbol)) == str(expected.get(symbol)) for symbol in expected.symbols())
+        resubscribed = all(keys.get(LEVELONE_EQUITIES) == set(symbols) for keys in mock.subscriptions)
+        print(f'{name:<18} {len(frames):>7} frames {len(frames) / wall:>10.0f} frames/s '
+              f'{stats["updates"] / wall:>10.0f} updates/s  callbacks {stats["callbacks"]}  '
+              f'logins {mock.logins}  reconnects {stats["reconnects"]}')
+        print(f'{"":<18} table matches replay: {matches}, every connection resubscribed: {resubscribed}')
+
+
+if __name__ == '__main__':
+    main()
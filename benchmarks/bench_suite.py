@@ -0,0 +1,139 @@
+# End to end Trader benchmarks against the mock server: quotes, option chains, price history and order round trips.
+# Usage: python3 benchmarks/bench_suite.py [--requests 500] [--latency 0.005] [--jitter 0.005] [--throttle 0.01]
+#                                          [--fixtures fixtures.json] [--save-baseline] [--baseline NAME] [--check]
+# Reports req/s and p50/p99 per scenario. With a stored baseline (benchmarks/baselines/NAME.json) every scenario
+# is compared against it and the script exits 1 when one got slower than --tolerance allows. With --check a missing
+# baseline, or one recorded with other mock settings, exits 2 instead of skipping the comparison.
+# baselines/default.json is the reference run with the default settings, re-record it on the machine that runs
+# the checks (--save-baseline), req/s and latencies only compare on the same hardware.
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+from common import percentile, report
+from mock_server import MockServer, StubTokens
+from rate_limiter import MARKET_DATA, ORDERS, RequestScheduler
+from trader import Trader
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+# Arguments that change what is measured, a baseline only compares against runs with the same values.
+MOCK_SETTINGS = ('requests', 'latency', 'jitter', 'throttle', 'strikes', 'expirations', 'candles', 'fixtures', 'seed')
+
+
+def order_round_trip(trader: Trader):
+    response = trader.post_orders('MOCKHASH', trader.buy_stock('AAPL', 187.5, 10))
+    order_id = response.headers['Location'].rsplit('/', 1)[-1]
+    return trader.get_order_by_id('MOCKHASH', order_id)
+
+
+SCENARIOS = {
+    'quotes': lambda trader: trader.get_quotes('AAPL,MSFT,NVDA,AMZN,GOOG'),
+    'single_quote': lambda trader: trader.get_single_quote('AAPL'),
+    'chain': lambda trader: trader.get_option_chains('AAPL'),
+    'history': lambda trader: trader.get_price_history('AAPL', periodType='day', period=1, frequencyType='minute',
+                                                       frequency=1),
+    'order_round_trip': order_round_trip,
+}
+
+
+def run(trader: Trader, call, requests: int) -> tuple[list[float], float]:
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(requests):
+        t0 = time.perf_counter()
+        assert call(trader) is not None
+        latencies.append(time.perf_counter() - t0)
+    return latencies, time.perf_counter() - start
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Scenarios whose throughput dropped or p50/p99 grew by more than tolerance (a fraction) vs the baseline.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['rps'] < base['rps'] * (1 - tolerance):
+            regressions.append(f"{name}: {result['rps']:.1f} req/s vs {base['rps']:.1f} baseline")
+        for stat in ('p50', 'p99'):
+            if result[stat] > base[stat] * (1 + tolerance):
+                regressions.append(f"{name}: {stat} {result[stat] * 1000:.3f} ms vs {base[stat] * 1000:.3f} ms baseline")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=500, help='requests per scenario')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help='only these (repeatable)')
+    parser.add_argument('--latency', type=float, default=0.0, help='mock server time per request (seconds)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random time per request, up to (seconds)')
+    parser.add_argument('--throttle', type=float, default=0.0, help='share of requests answered 429')
+    parser.add_argument('--strikes', type=int, default=20, help='strikes per expiration in generated chains')
+    parser.add_argument('--expirations', type=int, default=1, help='expirations in generated chains')
+    parser.add_argument('--candles', type=int, default=390, help='candles in generated price histories')
+    parser.add_argument('--fixtures', help='recorded responses to replay (record_fixtures.py)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--baseline', default='default', help='baseline name under benchmarks/baselines/')
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown vs the baseline (fraction)')
+    parser.add_argument('--check', action='store_true',
+                        help='fail (exit 2) when there is no baseline to compare to or its mock settings differ')
+    args = parser.parse_args()
+
+    # 429s are only retried with a scheduler, give it limits that never hold a request back.
+    scheduler = RequestScheduler(limits={MARKET_DATA: 1e9, ORDERS: 1e9})
+    results = {}
+    with MockServer(latency=args.latency, jitter=args.jitter, throttle_rate=args.throttle, fixtures=args.fixtures,
+                    chain_strikes=args.strikes, chain_expirations=args.expirations, candle_count=args.candles,
+                    seed=args.seed) as server:
+        with Trader(None, tokens=StubTokens(server.base_url), scheduler=scheduler) as trader:
+            for name in args.scenario or SCENARIOS:
+                call = SCENARIOS[name]
+                run(trader, call, min(20, args.requests))  # warm up
+                latencies, wall = run(trader, call, args.requests)
+                report(name, latencies, wall)
+                results[name] = {'rps': len(latencies) / wall, 'p50': percentile(latencies, 50),
+                                 'p99': percentile(latencies, 99)}
+        if server.httpd.throttled:
+            print(f'{server.httpd.throttled} requests answered 429 and retried')
+
+    path = os.path.join(BASELINE_DIR, f'{args.baseline}.json')
+    settings = {name: getattr(args, name) for name in MOCK_SETTINGS}
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        machine = {'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count()}
+        with open(path, 'w') as f:
+            json.dump({'args': settings, 'machine': machine, 'results': results}, f, indent=2)
+            f.write('\n')
+        print(f'baseline saved to {path}')
+        return
+    if not os.path.exists(path):
+        print(f'no baseline at {path}, run with --save-baseline to store one')
+        if args.check:
+            sys.exit(2)
+        return
+    with open(path) as f:
+        baseline = json.load(f)
+    differ = {name: (baseline['args'].get(name), value) for name, value in settings.items()
+              if baseline['args'].get(name) != value}
+    if differ:
+        print('baseline recorded with other settings: ' +
+              ', '.join(f'{name} {old} vs {new}' for name, (old, new) in differ.items()))
+        if args.check:
+            sys.exit(2)
+    regressions = compare(results, baseline['results'], args.tolerance)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    if regressions:
+        sys.exit(1)
+    print(f'no regressions vs {path} (tolerance {args.tolerance:.0%})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# Startup cost of a short script: what importing trader.py pulls in, how fast the token agent hands out a token,
+# and a whole `python -c "Trader(None).get_single_quote('AAPL')"` run against the mock server with the tokens
+# coming from a token agent (minus the bare interpreter startup of this machine), sent through requests and
+# through stdlib_http (Trader(None, stdlib_http=True)). The target for the script is well under 100 ms.
+# Usage: python3 benchmarks/bench_token_agent.py [--requests 5000] [--runs 5]
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import report
+from mock_server import MockServer, StubTokens
+from token_agent import TokenAgent, connect_agent
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ('requests', 'urllib3', 'asyncio', 'httpx', 'tokens', 'cryptography', 'yaml', 'numpy')
+
+
+class RefreshingTokens(StubTokens):
+    # StubTokens plus a refresh that takes as long as a round trip to Schwab.
+    def refresh_access_token(self):
+        time.sleep(0.2)
+        self.access_token = f'mock-access-token-{time.time()}'
+
+
+def run_python(code: str, env: dict | None = None) -> tuple[float, str]:
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, '-c', code], cwd=REPO, env=env, capture_output=True, text=True, check=True)
+    return time.perf_counter() - start, out.stdout.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    _, loaded = run_python(f'import sys, trader; print(",".join(m for m in {HEAVY!r} if m in sys.modules))')
+    print(f'import trader loads: {loaded or "none of " + ", ".join(HEAVY)}')
+    interpreter = statistics.median(run_python('pass')[0] for _ in range(args.runs))
+    imported = statistics.median(run_python('import trader')[0] for _ in range(args.runs))
+    print(f'import trader: {(imported - interpreter) * 1000:.1f} ms on top of a {interpreter * 1000:.1f} ms interpreter start')
+
+    with MockServer() as server, tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'agent.sock')
+        with TokenAgent(RefreshingTokens(server.base_url), path):
+            start = time.perf_counter()
+            tokens = connect_agent(path)
+            print(f'connect to agent + first token: {(time.perf_counter() - start) * 1e6:.0f} us')
+
+            latencies = []
+            start = time.perf_counter()
+            for _ in range(args.requests):
+                t0 = time.perf_counter()
+                tokens.call('token')
+                latencies.append(time.perf_counter() - t0)
+            report('agent round trip', latencies, time.perf_counter() - start)
+            start = time.perf_counter()
+            for _ in range(args.requests):
+                tokens.access_token
+            print(f'cached access_token read: {(time.perf_counter() - start) / args.requests * 1e9:.0f} ns')
+
+            env = {**os.environ, 'SCHWAB_TOKEN_AGENT': path}
+            for name, options in (('requests', ''), ('stdlib_http', 'stdlib_http=True')):
+                code = f"from trader import Trader; print(Trader(None, {options}).get_single_quote('AAPL') is not None)"
+                runs = [run_python(code, env) for _ in range(args.runs)]
+                assert all(out == 'True' for _, out in runs), runs
+                wall = statistics.median(elapsed for elapsed, _ in runs)
+                print(f'quote lookup script, {name:<12} {(wall - interpreter) * 1000:6.1f} ms on top of the '
+                      f'interpreter start ({wall * 1000:.1f} ms wall)')
+            print(f'    agent served {tokens.call("stats")["connections"]} connections, no password prompt')
+
+
+if __name__ == '__main__':
+    main()
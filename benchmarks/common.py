@@ -0,0 +1,26 @@
+# Shared helpers for the benchmark scripts.
+import os
+import sys
+
+# Let the benchmarks import trader.py etc. from the repo root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """
+    Nearest-rank percentile, good enough for latency reporting.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def report(name: str, latencies: list[float], wall: float):
+    """
+    Print requests/sec and p50/p99 latency (ms) for one benchmark run.
+    """
+    rps = len(latencies) / wall if wall else 0.0
+    print(f'{name:<28} {len(latencies):>6} req  {rps:>9.1f} req/s  '
+          f'p50 {percentile(latencies, 50) * 1000:>7.3f} ms  p99 {percentile(latencies, 99) * 1000:>7.3f} ms')
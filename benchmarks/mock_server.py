@@ -0,0 +1,458 @@
+# Local stand-in for the Schwab API used by the benchmarks. Nothing in here talks to Schwab.
+# Covers the /marketdata/v1/* and /trader/v1/* routes trader.py calls, answering with generated payloads or
+# replaying fixtures recorded by record_fixtures.py, with optional latency, jitter and 429s on top.
+import datetime as dt
+import itertools
+import json
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import common  # noqa: F401 (puts the repo root on sys.path)
+from metrics import route
+
+
+class StubTokens:
+    """
+    Minimal stand-in for tokens.Tokens so Trader can be built without credentials.
+    Pass it as Trader(None, tokens=StubTokens(server.base_url)).
+    """
+    def __init__(self, base_url: str, access_token: str = 'mock-access-token'):
+        self.base_url = base_url
+        self.access_token = access_token
+        self.account_hash = [{'accountNumber': '12345678', 'hashValue': 'MOCKHASH'}]
+
+
+def _quote(symbol: str) -> dict:
+    return {'assetMainType': 'EQUITY', 'symbol': symbol,
+            'quote': {'bidPrice': 100.0, 'askPrice': 100.05, 'lastPrice': 100.02, 'totalVolume': 1000000}}
+
+
+def _contract(symbol: str, put_call: str, expiration: str, dte: int, strike: float) -> dict:
+    return {'putCall': put_call, 'symbol': f'{symbol:<6}{expiration[2:4]}{expiration[5:7]}{expiration[8:10]}'
+                                           f'{put_call[0]}{int(strike * 1000):08d}',
+            'bid': 1.0, 'ask': 1.1, 'last': 1.05, 'mark': 1.05, 'bidSize': 10, 'askSize': 12, 'totalVolume': 150,
+            'volatility': 22.5, 'delta': 0.5 if put_call == 'CALL' else -0.5, 'gamma': 0.02, 'theta': -0.05,
+            'vega': 0.1, 'rho': 0.01, 'openInterest': 100, 'timeValue': 1.0, 'theoreticalOptionValue': 1.05,
+            'strikePrice': strike, 'expirationDate': f'{expiration}T20:00:00.000+00:00', 'daysToExpiration': dte,
+            'multiplier': 100.0, 'inTheMoney': False}
+
+
+def _chain(symbol: str, strikes: int = 20, expirations: int = 1) -> dict:
+    def contracts(put_call):
+        exp_map = {}
+        for e in range(expirations):
+            expiration = (dt.date(2025, 1, 17) + dt.timedelta(weeks=e)).isoformat()
+            exp_map[f'{expiration}:{30 + 7 * e}'] = {
+                f'{100 + i * 5:.1f}': [_contract(symbol, put_call, expiration, 30 + 7 * e, 100 + i * 5)]
+                for i in range(strikes)}
+        return exp_map
+    return {'symbol': symbol, 'status': 'SUCCESS', 'underlyingPrice': 100.0,
+            'callExpDateMap': contracts('CALL'), 'putExpDateMap': contracts('PUT')}
+
+
+def _candles(symbol: str, count: int = 390) -> dict:
+    start = 1704205800000
+    return {'symbol': symbol, 'empty': False,
+            'candles': [{'open': 100.0, 'high': 101.0, 'low': 99.0, 'close': 100.5, 'volume': 1000,
+                         'datetime': start + i * 60000} for i in range(count)]}
+
+
+def _expirations(count: int) -> dict:
+    return {'expirationList': [{'expirationDate': (dt.date(2025, 1, 17) + dt.timedelta(weeks=e)).isoformat(),
+                                'daysToExpiration': 30 + 7 * e, 'expirationType': 'S', 'standard': True}
+                               for e in range(count)]}
+
+
+def _market_hours(market: str, date: str | None) -> dict:
+    date = date or dt.date.today().isoformat()
+    return {'marketType': market.upper(), 'product': market[:2].upper(), 'date': date, 'isOpen': True,
+            'sessionHours': {'regularMarket': [{'start': f'{date}T09:30:00-05:00', 'end': f'{date}T16:00:00-05:00'}]}}
+
+
+def _instrument(symbol: str = 'AAPL', cusip: str = '037833100') -> dict:
+    return {'cusip': cusip, 'symbol': symbol, 'description': f'{symbol} Inc', 'exchange': 'NASDAQ',
+            'assetType': 'EQUITY'}
+
+
+def _account_numbers(count: int) -> list[dict]:
+    # The first one matches StubTokens.account_hash.
+    return [{'accountNumber': str(12345678 + i), 'hashValue': f'MOCKHASH{i}' if i else 'MOCKHASH'}
+            for i in range(count)]
+
+
+def _account_number(server, account_hash: str) -> str:
+    return next((entry['accountNumber'] for entry in server.account_numbers if entry['hashValue'] == account_hash),
+                '12345678')
+
+
+def _account(positions: bool, number: str = '12345678') -> dict:
+    account = {'type': 'MARGIN', 'accountNumber': number, 'roundTrips': 0, 'isDayTrader': False,
+               'currentBalances': {'cashBalance': 100000.0, 'buyingPower': 200000.0, 'availableFunds': 100000.0,
+                                   'liquidationValue': 120000.0}}
+    if positions:
+        account['positions'] = [
+            {'longQuantity': 100.0, 'shortQuantity': 0.0, 'averagePrice': 95.0, 'marketValue': 10002.0,
+             'instrument': {'assetType': 'EQUITY', 'symbol': 'AAPL', 'cusip': '037833100'}},
+            {'longQuantity': 50.0, 'shortQuantity': 0.0, 'averagePrice': 101.0, 'marketValue': 5001.0,
+             'instrument': {'assetType': 'EQUITY', 'symbol': 'MSFT', 'cusip': '594918104'}}]
+    return {'securitiesAccount': account}
+
+
+def _transaction(activity_id: int, number: str = '12345678') -> dict:
+    return {'activityId': activity_id, 'time': '2024-01-02T15:04:05+0000', 'type': 'TRADE', 'status': 'VALID',
+            'accountNumber': number, 'netAmount': -1000.2,
+            'transferItems': [{'instrument': {'assetType': 'EQUITY', 'symbol': 'AAPL'}, 'amount': 10.0,
+                               'price': 100.02, 'cost': -1000.2}]}
+
+
+def _now() -> str:
+    return dt.datetime.now(dt.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S%z')
+
+
+# ---------- Routes ---------- #
+# One function per route label (metrics.route()), called as handler(server, parts, query, body)
+# with parts = the path split on '/'. They return (status, payload, headers), a None payload sends no body.
+
+def _arg(query: dict, name: str, default=None):
+    return query.get(name, [default])[0]
+
+
+def quotes(server, parts, query, body):
+    symbols = ','.join(query.get('symbols', [])).split(',')
+    return 200, {symbol: _quote(symbol) for symbol in symbols if symbol}, None
+
+
+def single_quote(server, parts, query, body):
+    return 200, {parts[3]: _quote(parts[3])}, None
+
+
+def chains(server, parts, query, body):
+    strikes = int(_arg(query, 'strikeCount', server.chain_strikes))
+    return 200, _chain(_arg(query, 'symbol', ''), strikes, server.chain_expirations), None
+
+
+def expiration_chain(server, parts, query, body):
+    return 200, _expirations(server.chain_expirations), None
+
+
+def price_history(server, parts, query, body):
+    return 200, _candles(_arg(query, 'symbol', ''), server.candle_count), None
+
+
+def movers(server, parts, query, body):
+    return 200, {'screeners': [{'symbol': f'MOV{i}', 'description': f'Mover {i}', 'lastPrice': 100.0 + i,
+                                'netChange': 1.0 + i, 'netPercentChange': 0.01 * (i + 1), 'volume': 10 ** 6}
+                               for i in range(10)]}, None
+
+
+def market_hours(server, parts, query, body):
+    markets = ','.join(query.get('markets', ['equity'])).split(',')
+    return 200, {market: {market[:2].upper(): _market_hours(market, _arg(query, 'date'))} for market in markets}, None
+
+
+def market_hours_by_id(server, parts, query, body):
+    return 200, {parts[4]: {parts[4][:2].upper(): _market_hours(parts[4], _arg(query, 'date'))}}, None
+
+
+def instruments(server, parts, query, body):
+    return 200, {'instruments': [_instrument(_arg(query, 'symbol', 'AAPL'))]}, None
+
+
+def instrument_by_cusip(server, parts, query, body):
+    return 200, {'instruments': [_instrument(cusip=parts[4])]}, None
+
+
+def account_numbers(server, parts, query, body):
+    return 200, server.account_numbers, None
+
+
+def accounts(server, parts, query, body):
+    positions = _arg(query, 'fields') == 'positions'
+    return 200, [_account(positions, entry['accountNumber']) for entry in server.account_numbers], None
+
+
+def account(server, parts, query, body):
+    return 200, _account(_arg(query, 'fields') == 'positions', _account_number(server, parts[4])), None
+
+
+def list_orders(server, parts, query, body):
+    status = _arg(query, 'status')
+    limit = int(_arg(query, 'maxResults', 3000))
+    # /trader/v1/accounts/{accountHash}/orders lists one account, /trader/v1/orders all of them.
+    number = int(_account_number(server, parts[4])) if parts[3] == 'accounts' else None
+    with server.lock:
+        orders = [order for order in server.orders.values() if (status is None or order['status'] == status)
+                  and (number is None or order['accountNumber'] == number)]
+    return 200, orders[-limit:], None
+
+
+def place_order(server, parts, query, body):
+    try:
+        order = json.loads(body or b'{}')
+    except ValueError:
+        return 400, {'message': 'Invalid order body', 'errors': ['body is not JSON']}, None
+    quantity = sum(leg.get('quantity', 0) for leg in order.get('orderLegCollection') or ())
+    with server.lock:
+        server.order_ids += 1
+        order_id = server.order_ids
+        server.orders[order_id] = {**order, 'orderId': order_id,
+                                   'accountNumber': int(_account_number(server, parts[4])), 'status': 'WORKING',
+                                   'enteredTime': _now(), 'filledQuantity': 0.0, 'remainingQuantity': quantity,
+                                   'cancelable': True, 'editable': True}
+    return 201, None, {'Location': f'{"/".join(parts[:6])}/{order_id}'}
+
+
+def get_order(server, parts, query, body):
+    with server.lock:
+        order = server.orders.get(int(parts[6]) if parts[6].isdigit() else None)
+    if order is None:
+        return 404, {'message': 'Order not found', 'errors': [f'order {parts[6]} not found']}, None
+    return 200, order, None
+
+
+def replace_order(server, parts, query, body):
+    status, payload, headers = cancel_order(server, parts, query, body)
+    if status != 200:
+        return status, payload, headers
+    with server.lock:
+        server.orders[int(parts[6])]['status'] = 'REPLACED'
+    return place_order(server, parts[:6], query, body)
+
+
+def cancel_order(server, parts, query, body):
+    with server.lock:
+        order = server.orders.get(int(parts[6]) if parts[6].isdigit() else None)
+        if order is None:
+            return 404, {'message': 'Order not found', 'errors': [f'order {parts[6]} not found']}, None
+        if order['status'] != 'WORKING':
+            return 400, {'message': f'Order is {order["status"]}', 'errors': ['order can not be changed']}, None
+        order['status'] = 'CANCELED'
+    return 200, None, None
+
+
+def transactions(server, parts, query, body):
+    number = _account_number(server, parts[4])
+    return 200, [_transaction(i, number) for i in range(server.transaction_count)], None
+
+
+def transaction(server, parts, query, body):
+    return 200, _transaction(int(parts[6]) if parts[6].isdigit() else 0), None
+
+
+def user_preference(server, parts, query, body):
+    if server.streamer_url:
+        from mock_streamer import user_preferences
+        return 200, user_preferences(server.streamer_url), None
+    return 200, {'accounts': [], 'offers': [], 'streamerInfo': []}, None
+
+
+ROUTES = {
+    'GET /marketdata/v1/quotes': quotes,
+    'GET /marketdata/v1/{symbol_id}/quotes': single_quote,
+    'GET /marketdata/v1/chains': chains,
+    'GET /marketdata/v1/expirationchain': expiration_chain,
+    'GET /marketdata/v1/pricehistory': price_history,
+    'GET /marketdata/v1/movers/{symbol_id}': movers,
+    'GET /marketdata/v1/markets': market_hours,
+    'GET /marketdata/v1/markets/{market_id}': market_hours_by_id,
+    'GET /marketdata/v1/instruments': instruments,
+    'GET /marketdata/v1/instruments/{cusip_id}': instrument_by_cusip,
+    'GET /trader/v1/accounts/accountNumbers': account_numbers,
+    'GET /trader/v1/accounts': accounts,
+    'GET /trader/v1/accounts/{accountHash}': account,
+    'GET /trader/v1/accounts/{accountHash}/orders': list_orders,
+    'POST /trader/v1/accounts/{accountHash}/orders': place_order,
+    'GET /trader/v1/accounts/{accountHash}/orders/{orderId}': get_order,
+    'PUT /trader/v1/accounts/{accountHash}/orders/{orderId}': replace_order,
+    'DELETE /trader/v1/accounts/{accountHash}/orders/{orderId}': cancel_order,
+    'GET /trader/v1/orders': list_orders,
+    'GET /trader/v1/accounts/{accountHash}/transactions': transactions,
+    'GET /trader/v1/accounts/{accountHash}/transactions/{transactionId}': transaction,
+    'GET /trader/v1/userPreference': user_preference,
+}
+
+
+def load_fixtures(path: str) -> dict:
+    """
+    Read a fixture file written by record_fixtures.py: {route label: [{'status', 'headers', 'body'}, ...]}.
+    """
+    with open(path) as f:
+        fixtures = json.load(f)
+    return {label: responses if isinstance(responses, list) else [responses] for label, responses in fixtures.items()}
+
+
+class MockSchwabHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep the connection alive between requests.
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes, with Nagle on the body waits for the client's delayed ACK (~40ms).
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes = b'', headers: dict | None = None):
+        self.send_response(status)
+        if body:
+            self.send_header('Content-Type', 'application/json')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        if self.close_connection:
+            # The client asked for Connection: close, say so or it will try to reuse the socket.
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _send_json(self, payload, status: int = 200, headers: dict | None = None):
+        self._send(status, json.dumps(payload).encode() if payload is not None else b'', headers)
+
+    def _handle(self, method: str):
+        server = self.server
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length else b''
+        delay, throttled, failed = server.next_request()
+        if delay:
+            time.sleep(delay)
+        if throttled:
+            self._send_json({'message': 'Too Many Requests', 'errors': ['throttled by the mock server']}, 429,
+                            {'Retry-After': f'{server.retry_after:g}'})
+            return
+        if failed:
+            self._send_json({'message': 'Service Unavailable', 'errors': ['failed by the mock server']}, 503)
+            return
+
+        url = urllib.parse.urlparse(self.path)
+        label = route(method, url.path)
+        fixture = server.fixture(label)
+        if fixture is not None:
+            self._send(fixture.get('status', 200), fixture['body'], fixture.get('headers'))
+            return
+        handler = ROUTES.get(label)
+        if handler is None:
+            self._send_json({'message': f'No route for {label}', 'errors': []}, 404)
+            return
+        status, payload, headers = handler(server, url.path.rstrip('/').split('/'), urllib.parse.parse_qs(url.query),
+                                           body)
+        self._send_json(payload, status, headers)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+
+class MockServer:
+    """
+    Runs MockSchwabHandler on a background thread.
+
+        with MockServer(latency=0.02, jitter=0.01, throttle_rate=0.01) as server:
+            trader = Trader(None, tokens=StubTokens(server.base_url))
+
+    :param latency: Seconds every request sleeps before answering, stands in for Schwab server time.
+    :param jitter: Up to this many seconds more, uniformly random per request.
+    :param throttle_rate: Share of requests (0-1) answered 429 Too Many Requests.
+    :param error_rate: Share of requests (0-1) answered 503 Service Unavailable (1.0 is an outage).
+    :param slow_rate: Share of requests (0-1) that take slow_latency seconds more, a latency tail.
+    :param slow_latency: Extra seconds of a slow request.
+    :param retry_after: Retry-After seconds sent with the 429s.
+    :param fixtures: Recorded responses (a record_fixtures.py file or the dict load_fixtures() returns), replayed
+                     in a round robin per route. Routes without fixtures get generated payloads.
+    :param chain_strikes: Strikes per expiration in generated option chains (strikeCount overrides it).
+    :param chain_expirations: Expirations in generated option chains.
+    :param candle_count: Candles in generated price histories.
+    :param transaction_count: Transactions in generated transaction lists.
+    :param seed: Seed for the jitter/429 draws, the same seed gives the same sequence.
+    :param streamer_url: Socket url get_user_preferences() hands out (a MockStreamer url).
+    :param accounts: Accounts get_account_number() lists (12345678 -> MOCKHASH, 12345679 -> MOCKHASH1, ...).
+    """
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, handler=MockSchwabHandler, latency: float = 0.0,
+                 jitter: float = 0.0, throttle_rate: float = 0.0, retry_after: float = 0.0, error_rate: float = 0.0,
+                 slow_rate: float = 0.0, slow_latency: float = 0.0, fixtures: str | dict | None = None, chain_strikes: int = 20, chain_expirations: int = 1,
+                 candle_count: int = 390, transaction_count: int = 10, seed: int | None = None,
+                 streamer_url: str | None = None, accounts: int = 1):
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.httpd.request_queue_size = 128
+        self.httpd.latency = latency
+        self.httpd.jitter = jitter
+        self.httpd.throttle_rate = throttle_rate
+        self.httpd.retry_after = retry_after
+        self.httpd.error_rate = error_rate
+        self.httpd.slow_rate = slow_rate
+        self.httpd.slow_latency = slow_latency
+        self.httpd.chain_strikes = chain_strikes
+        self.httpd.chain_expirations = chain_expirations
+        self.httpd.candle_count = candle_count
+        self.httpd.transaction_count = transaction_count
+        self.httpd.account_numbers = _account_numbers(accounts)
+        self.httpd.streamer_url = streamer_url
+        self.httpd.lock = threading.Lock()
+        self.httpd.random = random.Random(seed)
+        self.httpd.hits = 0
+        self.httpd.throttled = 0
+        self.httpd.failed = 0
+        self.httpd.replayed = 0
+        self.httpd.order_ids = 1000
+        self.httpd.orders = {}
+        if isinstance(fixtures, str):
+            fixtures = load_fixtures(fixtures)
+        # Bodies are encoded once up front, replaying is a dict lookup.
+        self.httpd.fixtures = {label: itertools.cycle([
+            {**response, 'body': json.dumps(response['body']).encode() if response.get('body') is not None else b''}
+            for response in responses]) for label, responses in (fixtures or {}).items()}
+        self.httpd.next_request = self._next_request
+        self.httpd.fixture = self._fixture
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def _next_request(self) -> tuple[float, bool, bool]:
+        # Counts the request and draws its (delay, throttled, failed).
+        httpd = self.httpd
+        with httpd.lock:
+            httpd.hits += 1
+            delay = httpd.latency + (httpd.random.uniform(0, httpd.jitter) if httpd.jitter else 0.0)
+            if httpd.slow_rate and httpd.random.random() < httpd.slow_rate:
+                delay += httpd.slow_latency
+            throttled = bool(httpd.throttle_rate) and httpd.random.random() < httpd.throttle_rate
+            failed = not throttled and bool(httpd.error_rate) and httpd.random.random() < httpd.error_rate
+            httpd.throttled += throttled
+            httpd.failed += failed
+        return delay, throttled, failed
+
+    def _fixture(self, label: str) -> dict | None:
+        responses = self.httpd.fixtures.get(label)
+        if responses is None:
+            return None
+        with self.httpd.lock:
+            self.httpd.replayed += 1
+            return next(responses)
+
+    @property
+    def hits(self) -> int:
+        """
+        Number of requests the server has answered.
+        """
+        return self.httpd.hits
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,134 @@
+# Local stand-in for the Schwab streamer (WebSocket) used by bench_stream.py. Nothing in here talks to Schwab.
+# Answers LOGIN/SUBS/ADD/UNSUBS/LOGOUT and replays market data frames (recorded or generated) once something is subscribed.
+import asyncio
+import json
+import random
+import threading
+
+import websockets
+
+
+def user_preferences(socket_url: str) -> dict:
+    # Shape of get_user_preferences(), only streamerInfo matters to the streamer.
+    return {'accounts': [], 'offers': [], 'streamerInfo': [{
+        'streamerSocketUrl': socket_url, 'schwabClientCustomerId': 'mock-customer',
+        'schwabClientCorrelId': 'mock-correl', 'schwabClientChannel': 'N9', 'schwabClientFunctionId': 'APIAPP'}]}
+
+
+def level_one_frames(symbols: list[str], count: int, per_frame: int = 10, seed: int = 1) -> list[str]:
+    """
+    LEVELONE_EQUITIES data frames the way Schwab sends them: the first update of a symbol carries every field,
+    later ones only the fields that changed.
+    """
+    rng = random.Random(seed)
+    seen = set()
+    frames = []
+    for i in range(count):
+        content = []
+        for symbol in rng.sample(symbols, min(per_frame, len(symbols))):
+            bid = round(rng.uniform(10, 500), 2)
+            fields = {'1': bid, '2': round(bid + 0.05, 2), '3': round(bid + 0.02, 2), '4': rng.randint(1, 50),
+                      '5': rng.randint(1, 50), '8': rng.randint(0, 10 ** 7), '33': round(bid + 0.025, 3)}
+            if symbol in seen:
+                fields = dict(rng.sample(sorted(fields.items()), rng.randint(1, len(fields))))
+            seen.add(symbol)
+            content.append({'key': symbol, 'delayed': False, **fields})
+        frames.append(json.dumps({'data': [{'service': 'LEVELONE_EQUITIES', 'timestamp': 1704205800000 + i,
+                                            'command': 'SUBS', 'content': content}]}))
+    return frames
+
+
+class MockStreamer:
+    """
+    Runs a websockets server on a background thread.
+
+        with MockStreamer(frames) as streamer_server:
+            trader -> get_user_preferences() returning user_preferences(streamer_server.url)
+
+    :param frames: Raw data frames (str) replayed in order. The position carries over reconnects,
+                   so every frame is delivered exactly once across connections.
+    :param rate: Frames per second, 0 sends as fast as the socket takes them.
+    :param drop_after: Close the connection after this many frames (per connection) to exercise reconnects.
+    """
+    def __init__(self, frames: list[str], rate: float = 0.0, drop_after: int | None = None, host: str = '127.0.0.1'):
+        self.frames = frames
+        self.rate = rate
+        self.drop_after = drop_after
+        self.host = host
+        self.port = None
+        self.position = 0
+        self.logins = 0
+        self.subscriptions: list[dict] = []  # {service: keys} per connection, newest last
+        self.done = threading.Event()
+        self._ready = threading.Event()
+        self._loop = None
+        self._stop = None
+        self._thread = threading.Thread(target=asyncio.run, args=(self._serve(),), daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f'ws://{self.host}:{self.port}'
+
+    def __enter__(self):
+        self._thread.start()
+        self._ready.wait(5)
+        return self
+
+    def __exit__(self, *exc):
+        self._loop.call_soon_threadsafe(self._stop.set_result, None)
+        self._thread.join(5)
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop = self._loop.create_future()
+        async with websockets.serve(self._handler, self.host, 0, max_size=None) as server:
+            self.port = server.sockets[0].getsockname()[1]
+            self._ready.set()
+            await self._stop
+
+    @staticmethod
+    def _response(request: dict, code: int = 0, msg: str = 'ok') -> str:
+        return json.dumps({'response': [{'service': request['service'], 'command': request['command'],
+                                         'requestid': request['requestid'], 'content': {'code': code, 'msg': msg}}]})
+
+    async def _handler(self, ws):
+        subscribed = asyncio.Event()
+        keys: dict[str, set] = {}
+        self.subscriptions.append(keys)
+        replay = None
+        try:
+            async for message in ws:
+                for request in json.loads(message)['requests']:
+                    command = request['command']
+                    if command == 'LOGIN':
+                        self.logins += 1
+                    elif command in ('SUBS', 'ADD'):
+                        symbols = set(request['parameters']['keys'].split(','))
+                        keys[request['service']] = symbols if command == 'SUBS' else keys.get(request['service'], set()) | symbols
+                        subscribed.set()
+                    elif command == 'UNSUBS':
+                        keys.get(request['service'], set()).difference_update(request['parameters']['keys'].split(','))
+                    await ws.send(self._response(request))
+                    if command == 'LOGOUT':
+                        await ws.close()
+                if subscribed.is_set() and replay is None:
+                    replay = asyncio.ensure_future(self._replay(ws))
+        finally:
+            if replay is not None:
+                replay.cancel()
+
+    async def _replay(self, ws):
+        sent = 0
+        delay = 1.0 / self.rate if self.rate else 0.0
+        while self.position < len(self.frames):
+            if self.drop_after is not None and sent >= self.drop_after:
+                await ws.close()
+                return
+            await ws.send(self.frames[self.position])
+            self.position += 1
+            sent += 1
+            if delay:
+                await asyncio.sleep(delay)
+            elif sent % 256 == 0:
+                await asyncio.sleep(0)
+        self.done.set()
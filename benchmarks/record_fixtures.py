@@ -0,0 +1,76 @@
+# Record real Schwab responses for the mock server to replay (MockServer(fixtures=path), bench_suite.py --fixtures).
+# Usage: python3 benchmarks/record_fixtures.py [--out fixtures.json] [--symbol AAPL]
+# Talks to Schwab with your tokens, read-only endpoints only. Every key in MASKED_KEYS is replaced wherever it shows
+# up: account numbers/ids and hashes (accounts, orders, transactions, preferences) and the streamerInfo customer,
+# correlation, channel and function ids. Everything else is kept as Schwab sent it (symbols, prices, quantities,
+# order/activity ids, times, balances and positions), so look the file over before sharing it.
+import argparse
+import datetime as dt
+import json
+
+import common  # noqa: F401 (puts the repo root on sys.path)
+from metrics import route
+from trader import Trader
+
+MASKED_KEYS = {'accountNumber': '12345678', 'accountId': '12345678', 'hashValue': 'MOCKHASH',
+               'displayAcctId': '...5678', 'nickName': 'MOCK', 'schwabClientCustomerId': 'MOCKCUSTOMER',
+               'schwabClientCorrelId': 'MOCKCORREL', 'schwabClientChannel': 'N9', 'schwabClientFunctionId': 'APIAPP'}
+
+
+def mask(value):
+    if isinstance(value, dict):
+        return {key: MASKED_KEYS[key] if key in MASKED_KEYS else mask(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [mask(item) for item in value]
+    return value
+
+
+def record(trader: Trader, symbol: str) -> dict:
+    fixtures = {}
+    send = trader._request
+
+    def recording(method, path, *args, **kwargs):
+        response = send(method, path, *args, **kwargs)
+        if response.status_code < 400:
+            body = mask(json.loads(response.content)) if response.content else None
+            fixtures.setdefault(route(method, path), []).append({'status': response.status_code, 'body': body})
+        return response
+
+    trader._request = recording
+    account_hash = trader.account_hash()
+    now = dt.datetime.now(dt.timezone.utc)
+    start, end = (now - dt.timedelta(days=7)).strftime('%Y-%m-%dT%H:%M:%S.000Z'), now.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+    trader.get_quotes(f'{symbol},MSFT,NVDA')
+    trader.get_single_quote(symbol)
+    trader.get_option_chains(symbol)
+    trader.get_expiration_option_chain(symbol)
+    trader.get_price_history(symbol, periodType='day', period=1, frequencyType='minute', frequency=1)
+    trader.get_movers('$SPX')
+    trader.get_market_hours(['equity', 'option'])
+    trader.get_instruments(symbol, 'symbol-search')
+    trader.get_account_number()
+    trader.get_account(fields='positions')
+    trader.get_account_accountNumber(fields='positions')
+    trader.get_orders(account_hash, start, end)
+    trader.get_all_orders(start, end)
+    trader.get_all_transactions(account_hash, start, end)
+    trader.get_user_preferences()
+    return fixtures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--out', default='fixtures.json')
+    parser.add_argument('--symbol', default='AAPL')
+    args = parser.parse_args()
+
+    with Trader(args) as trader:
+        fixtures = record(trader, args.symbol)
+    with open(args.out, 'w') as f:
+        json.dump(fixtures, f)
+    for label, responses in sorted(fixtures.items()):
+        print(f'{label:<64} {len(responses)} response(s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,428 @@
+# chain_archive.py keeps intraday option chain snapshots (get_option_chains every minute or so) compact on disk.
+# Every snapshot is normalized to fixed width columns (market_arrays.OptionChainTable) and only the fields that
+# changed since the previous snapshot of the same underlying are written, one zlib compressed frame per snapshot.
+# A fixed width time index next to the data points at every frame and keyframe, so any past chain is rebuilt by
+# seeking to the keyframe before it and applying the few deltas after that instead of replaying the whole day.
+# One .chains/.index pair per underlying and market day: <root>/<UNDERLYING>/<YYYY-MM-DD>.chains
+# Imports
+import datetime as dt
+import os
+import struct
+import threading
+import time
+import zlib
+import numpy as np
+from history_store import to_epoch_ms
+from market_arrays import CHAIN_FLOAT_COLUMNS, CHAIN_INT_COLUMNS, OptionChainTable
+from market_calendar import market_date
+
+DEFAULT_ARCHIVE_PATH = os.path.expanduser('~/.schwab_auto_trader/chains')
+
+# Every column is stored as its 64 bit pattern, floats are compared bit for bit (NaN == NaN, no rounding).
+COLUMNS = CHAIN_FLOAT_COLUMNS + CHAIN_INT_COLUMNS
+_IS_FLOAT = np.array([name in CHAIN_FLOAT_COLUMNS for name in COLUMNS])
+
+# Schwab sends decimals (cents, greeks to 3 places): the changed values of a float column are stored as differences
+# of their fixed point values at the first of these decimal places that gives every double back exactly, RAW (the
+# XOR of the two bit patterns) if none does. Int columns store plain differences (INT).
+# Small integers compress far better than the mantissa bytes of two nearby doubles.
+DECIMALS = (0, 2, 3, 4, 6)
+INT = 254
+RAW = 255
+
+# One row per snapshot, offset/length locate its frame in the .chains file.
+INDEX_DTYPE = np.dtype([('timestamp', '<i8'), ('offset', '<i8'), ('length', '<i4'), ('flags', '<i4')])
+KEYFRAME = 1
+
+# Frame header: timestamp (ms), underlyingPrice, contracts known after the frame, contracts added by it, flags.
+_FRAME = struct.Struct('<qdIII')
+
+# A keyframe (full snapshot, contract dictionary restarted) every this many frames bounds the work of at().
+DEFAULT_KEYFRAME_INTERVAL = 30
+
+
+def _fixed_point(bits: np.ndarray, scale) -> np.ndarray:
+    return np.round(bits.view(np.float64) * scale)
+
+
+def _decode_deltas(old: np.ndarray, delta: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    # old: int64 bit patterns, codes: the column code of every value. Returns the new bit patterns.
+    new = old + delta
+    raw = codes == RAW
+    new[raw] = old[raw] ^ delta[raw]
+    fixed = codes < INT
+    scale = 10.0 ** codes[fixed]
+    new[fixed] = ((_fixed_point(old[fixed], scale) + delta[fixed]) / scale).view(np.int64)
+    return new
+
+
+def _encode_deltas(old: np.ndarray, new: np.ndarray, columns: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # old/new: int64 bit patterns of every changed value, columns: the column of each. Returns (column codes, deltas).
+    codes = np.where(_IS_FLOAT, RAW, INT).astype(np.uint8)
+    undecided = _IS_FLOAT.copy()
+    with np.errstate(invalid='ignore', over='ignore'):
+        for places in DECIMALS:
+            chosen = undecided[columns]
+            if not chosen.any():
+                break
+            scale = 10.0 ** places
+            base, target = _fixed_point(old[chosen], scale), _fixed_point(new[chosen], scale)
+            fits = (np.abs(base) < 2 ** 52) & (np.abs(target) < 2 ** 52)
+            delta = np.where(fits, target - base, 0).astype(np.int64)
+            exact = fits & (((base + delta) / scale).view(np.int64) == new[chosen])
+            failed = np.bincount(columns[chosen][~exact], minlength=len(COLUMNS)) > 0
+            codes[undecided & ~failed] = places
+            undecided &= failed
+    deltas = new - old
+    value_codes = codes[columns]
+    raw = value_codes == RAW
+    deltas[raw] = new[raw] ^ old[raw]
+    fixed = value_codes < INT
+    scale = 10.0 ** value_codes[fixed]
+    deltas[fixed] = (_fixed_point(new[fixed], scale) - _fixed_point(old[fixed], scale)).astype(np.int64)
+    return codes, deltas
+
+
+class _ChainState:
+    # Contract dictionary plus the latest value of every column of every contract ever seen since the last keyframe.
+    # The writer encodes new snapshots against it, readers decode frames into it, so both sides agree on contract ids.
+
+    def __init__(self):
+        self.ids: dict[str, int] = {}
+        self.symbols: list[str] = []
+        self.expirations = np.empty(0, dtype=np.int64)
+        self.is_call = np.empty(0, dtype=bool)
+        self.values = np.zeros((len(COLUMNS), 0), dtype=np.int64)
+        self.present = np.zeros(0, dtype=bool)
+        self.underlying_price = np.nan
+        self.timestamp = None
+        self.changed = 0
+        self._symbol_array = None
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def _grow(self, symbols: list[str], expirations: np.ndarray, is_call: np.ndarray):
+        if not symbols:
+            return
+        for symbol in symbols:
+            self.ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        self.expirations = np.concatenate([self.expirations, expirations.astype(np.int64)])
+        self.is_call = np.concatenate([self.is_call, is_call.astype(bool)])
+        self.values = np.hstack([self.values, np.zeros((len(COLUMNS), len(symbols)), dtype=np.int64)])
+        self._symbol_array = None
+
+    def encode(self, chain: OptionChainTable, timestamp: int, keyframe: bool) -> bytes:
+        """
+        Frame payload (uncompressed) taking this state to chain, and apply it.
+        """
+        if keyframe:
+            self.__init__()
+        ids = np.fromiter((self.ids.get(symbol, -1) for symbol in chain.symbol), dtype=np.int64, count=len(chain))
+        new = ids < 0
+        added = list(chain.symbol[new])
+        ids[new] = np.arange(len(self), len(self) + len(added))
+        expirations = chain.expiration[new].astype('datetime64[D]').astype(np.int64)
+        self._grow(added, expirations, chain.is_call[new])
+
+        values = self.values.copy()
+        values[:, ids] = np.vstack([np.stack([getattr(chain, name) for name in CHAIN_FLOAT_COLUMNS]).view(np.int64),
+                                    np.stack([getattr(chain, name) for name in CHAIN_INT_COLUMNS])])
+        changed = values != self.values
+        codes, delta = _encode_deltas(self.values[changed], values[changed], np.nonzero(changed)[0])
+        self.changed = len(delta)
+        self.values = values
+        self.present = np.zeros(len(self), dtype=bool)
+        self.present[ids] = True
+        price = np.nan if chain.underlying_price is None else float(chain.underlying_price)
+        self.underlying_price, self.timestamp = price, timestamp
+
+        header = _FRAME.pack(timestamp, price, len(self), len(added), KEYFRAME if keyframe else 0)
+        return b''.join((header, expirations.astype('<i4').tobytes(), chain.is_call[new].astype(np.uint8).tobytes(),
+                         '\n'.join(added).encode(), b'\0', np.packbits(self.present).tobytes(),
+                         np.packbits(changed, axis=1).tobytes(), codes.tobytes(),
+                         # Byte planes (all low bytes, then all second bytes, ...): small deltas leave runs of 0x00/0xff.
+                         delta.view(np.uint8).reshape(-1, 8).T.tobytes()))
+
+    def decode(self, payload: bytes):
+        """
+        Apply one frame payload.
+        """
+        timestamp, price, contracts, added, flags = _FRAME.unpack_from(payload)
+        if flags & KEYFRAME:
+            self.__init__()
+        offset = _FRAME.size
+        expirations = np.frombuffer(payload, '<i4', added, offset)
+        offset += 4 * added
+        is_call = np.frombuffer(payload, np.uint8, added, offset)
+        offset += added
+        end = payload.index(b'\0', offset)
+        self._grow(payload[offset:end].decode().split('\n') if added else [], expirations, is_call)
+        offset = end + 1
+
+        mask_bytes = (contracts + 7) // 8
+        self.present = np.unpackbits(np.frombuffer(payload, np.uint8, mask_bytes, offset), count=contracts).astype(bool)
+        offset += mask_bytes
+        masks = np.frombuffer(payload, np.uint8, mask_bytes * len(COLUMNS), offset).reshape(len(COLUMNS), mask_bytes)
+        changed = np.unpackbits(masks, axis=1, count=contracts).astype(bool)
+        offset += mask_bytes * len(COLUMNS)
+        codes = np.frombuffer(payload, np.uint8, len(COLUMNS), offset)
+        offset += len(COLUMNS)
+        columns = np.nonzero(changed)[0]
+        delta = np.frombuffer(payload, np.uint8, 8 * len(columns), offset).reshape(8, -1).T.copy().view(np.int64).ravel()
+        self.values[changed] = _decode_deltas(self.values[changed], delta, codes[columns])
+        self.underlying_price, self.timestamp = price, timestamp
+
+    def table(self, underlying: str) -> OptionChainTable:
+        """
+        The contracts present in the last snapshot, in the order they first appeared since the keyframe.
+        """
+        if self._symbol_array is None:
+            self._symbol_array = np.array(self.symbols, dtype=object)
+        rows = np.flatnonzero(self.present)
+        table = OptionChainTable()
+        table.underlying = underlying
+        table.underlying_price = None if np.isnan(self.underlying_price) else self.underlying_price
+        table.symbol = self._symbol_array[rows]
+        table.expiration = self.expirations[rows].astype('datetime64[D]')
+        table.is_call = self.is_call[rows]
+        values = self.values[:, rows]
+        for i, name in enumerate(COLUMNS):
+            setattr(table, name, values[i].view(np.float64) if name in CHAIN_FLOAT_COLUMNS else values[i])
+        return table
+
+
+class _Writer:
+    # Append side of one underlying/day: open files, the encoder state and frames since the last keyframe.
+    __slots__ = ('day', 'data', 'index', 'offset', 'state', 'since_keyframe')
+
+
+def _read_index(path: str) -> np.ndarray:
+    try:
+        with open(path, 'rb') as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return np.empty(0, dtype=INDEX_DTYPE)
+    # A record cut short by a crash mid-write is not part of the index.
+    return np.frombuffer(raw, INDEX_DTYPE, len(raw) // INDEX_DTYPE.itemsize)
+
+
+class ChainArchive:
+    """
+    Append-only option chain snapshot archive.
+
+        archive = ChainArchive()
+        archive.append(trader.get_option_chains('SPY', strikeCount=40))   # every minute, or archive.record(...)
+        chain = archive.at('SPY', dt.datetime(2025, 1, 17, 10, 30))        # market_arrays.OptionChainTable
+        for timestamp, chain in archive.replay('SPY', start, end): ...
+
+    One process appends to an underlying at a time, readers (any process) only see frames whose index record
+    was written, so they can read while the writer is appending.
+    """
+    def __init__(self, root: str = DEFAULT_ARCHIVE_PATH, keyframe_interval: int = DEFAULT_KEYFRAME_INTERVAL,
+                 level: int = 6):
+        """
+        :param root: Directory holding one sub directory per underlying.
+        :type root: str
+        :param keyframe_interval: Frames between full snapshots, at() applies at most keyframe_interval - 1 deltas.
+        :type keyframe_interval: int
+        :param level: zlib compression level of the frames.
+        :type level: int
+        """
+        self.root = root
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.level = level
+        self.stats = {'snapshots': 0, 'keyframes': 0, 'contracts': 0, 'fields_changed': 0, 'bytes_written': 0}
+        self._writers: dict[str, _Writer] = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            for writer in self._writers.values():
+                writer.data.close()
+                writer.index.close()
+            self._writers.clear()
+
+    @staticmethod
+    def _key(underlying: str) -> str:
+        return underlying.replace('/', '_').replace('$', '_')
+
+    def _paths(self, underlying: str, day: dt.date) -> tuple[str, str]:
+        base = os.path.join(self.root, self._key(underlying), day.isoformat())
+        return f'{base}.chains', f'{base}.index'
+
+    # ---------- Writing ---------- #
+
+    def _writer(self, underlying: str, day: dt.date) -> _Writer:
+        writer = self._writers.get(underlying)
+        if writer is not None and writer.day == day:
+            return writer
+        if writer is not None:
+            writer.data.close()
+            writer.index.close()
+        data_path, index_path = self._paths(underlying, day)
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+        index = _read_index(index_path)
+        writer = _Writer()
+        writer.day = day
+        writer.state = _ChainState()
+        writer.since_keyframe = self.keyframe_interval  # nothing to delta against, unless the day is resumed below
+        writer.offset = int(index['offset'][-1] + index['length'][-1]) if len(index) else 0
+        writer.data = open(data_path, 'ab')
+        # Drop a frame (or index record) a crashed writer left behind without its index record.
+        writer.data.truncate(writer.offset)
+        writer.index = open(index_path, 'ab')
+        writer.index.truncate(len(index) * INDEX_DTYPE.itemsize)
+        if len(index):
+            # Picking up a day another process (e.g. the previous cron run) wrote: rebuild its last state.
+            keyframes = np.flatnonzero(index['flags'] & KEYFRAME)
+            if len(keyframes):
+                first = int(keyframes[-1])
+                for payload in self._frames(data_path, index[first:]):
+                    writer.state.decode(payload)
+                writer.since_keyframe = len(index) - first
+        self._writers[underlying] = writer
+        return writer
+
+    def append(self, chain: OptionChainTable | dict, timestamp: int | dt.datetime | None = None) -> int:
+        """
+        Add one snapshot.
+        :param chain: get_option_chains() response or the OptionChainTable built from one.
+        :type chain: OptionChainTable | dict
+        :param timestamp: When the snapshot was taken, ms since the UNIX epoch or a datetime (naive = New York time).
+                          Defaults to now. Has to be later than the last snapshot of the underlying.
+        :type timestamp: int | dt.datetime | None
+        :return: Bytes written.
+        :rtype: int
+        """
+        if isinstance(chain, dict):
+            chain = OptionChainTable.from_json(chain)
+        if not chain.underlying:
+            raise ValueError("Chain has no underlying symbol.")
+        timestamp = to_epoch_ms(timestamp) if timestamp is not None else int(time.time() * 1000)
+        with self._lock:
+            writer = self._writer(chain.underlying, market_date(timestamp))
+            last = writer.state.timestamp
+            if last is not None and timestamp <= last:
+                raise ValueError(f"{chain.underlying} snapshot at {timestamp} is not after the last one ({last}).")
+            keyframe = writer.since_keyframe >= self.keyframe_interval
+            frame = zlib.compress(writer.state.encode(chain, timestamp, keyframe), self.level)
+            writer.data.write(frame)
+            writer.data.flush()
+            record = np.array([(timestamp, writer.offset, len(frame), KEYFRAME if keyframe else 0)], dtype=INDEX_DTYPE)
+            writer.index.write(record.tobytes())
+            writer.index.flush()
+            writer.offset += len(frame)
+            writer.since_keyframe = 1 if keyframe else writer.since_keyframe + 1
+
+            self.stats['snapshots'] += 1
+            self.stats['keyframes'] += keyframe
+            self.stats['contracts'] += len(chain)
+            self.stats['fields_changed'] += writer.state.changed
+            self.stats['bytes_written'] += len(frame) + INDEX_DTYPE.itemsize
+        return len(frame) + INDEX_DTYPE.itemsize
+
+    def record(self, trader, underlyings, **chain_params) -> int:
+        """
+        One snapshot round: get_option_chains for every underlying, appended as it arrives. Call it every minute
+        (a loop or cron, the next run resumes the day's deltas).
+        :param trader: Trader the requests go through.
+        :type trader: Trader
+        :param underlyings: Symbols to snapshot.
+        :param chain_params: Extra get_option_chains arguments e.g. strikeCount=40.
+        :return: Snapshots written.
+        :rtype: int
+        """
+        written = 0
+        for symbol in [underlyings] if isinstance(underlyings, str) else underlyings:
+            try:
+                data = trader.get_option_chains(symbol, **chain_params)
+                if data:
+                    self.append(data)
+                    written += 1
+            except Exception as exc:
+                trader.log.error(f"ChainArchive get_option_chains({symbol}) failed: {exc!r}")
+        return written
+
+    # ---------- Reading ---------- #
+
+    def underlyings(self) -> list[str]:
+        return sorted(entry.name for entry in os.scandir(self.root) if entry.is_dir())
+
+    def days(self, underlying: str) -> list[dt.date]:
+        try:
+            names = os.listdir(os.path.join(self.root, self._key(underlying)))
+        except FileNotFoundError:
+            return []
+        return sorted(dt.date.fromisoformat(name[:-len('.index')]) for name in names if name.endswith('.index'))
+
+    def index(self, underlying: str, day: dt.date) -> np.ndarray:
+        """
+        Time index of one day (INDEX_DTYPE), index['timestamp'] are the snapshot times.
+        """
+        return _read_index(self._paths(underlying, day)[1])
+
+    @staticmethod
+    def _frames(path: str, records: np.ndarray):
+        # One seek and one read for the whole run of frames, then decompress them one at a time.
+        if not len(records):
+            return
+        start = int(records['offset'][0])
+        with open(path, 'rb') as f:
+            f.seek(start)
+            raw = f.read(int(records['offset'][-1] + records['length'][-1]) - start)
+        for offset, length in zip(records['offset'].tolist(), records['length'].tolist()):
+            yield zlib.decompress(raw[offset - start:offset - start + length])
+
+    def at(self, underlying: str, when: int | dt.datetime) -> OptionChainTable | None:
+        """
+        The chain as of when: the last snapshot taken at or before it on the same market day.
+        :param when: ms since the UNIX epoch or a datetime (naive = New York time).
+        :type when: int | dt.datetime
+        :return: None if there is no snapshot of the underlying on that day at or before when.
+        :rtype: OptionChainTable | None
+        """
+        when = to_epoch_ms(when)
+        day = market_date(when)
+        index = self.index(underlying, day)
+        position = int(np.searchsorted(index['timestamp'], when, 'right')) - 1
+        if position < 0:
+            return None
+        keyframes = np.flatnonzero(index['flags'][:position + 1] & KEYFRAME)
+        if not len(keyframes):
+            return None
+        state = _ChainState()
+        for payload in self._frames(self._paths(underlying, day)[0], index[keyframes[-1]:position + 1]):
+            state.decode(payload)
+        return state.table(underlying)
+
+    def replay(self, underlying: str, start: int | dt.datetime | dt.date, end: int | dt.datetime | dt.date):
+        """
+        Every snapshot between start and end (inclusive) in time order, decoded incrementally.
+        A date as end means the whole of that market day, replay('SPY', day, day) is one day.
+        :return: Iterator of (timestamp ms, OptionChainTable).
+        """
+        start, end = to_epoch_ms(start), to_epoch_ms(end, end=True)
+        for day in self.days(underlying):
+            if not market_date(start) <= day <= market_date(end):
+                continue
+            index = self.index(underlying, day)
+            times = index['timestamp']
+            lo, hi = int(np.searchsorted(times, start, 'left')), int(np.searchsorted(times, end, 'right'))
+            if lo >= hi:
+                continue
+            keyframes = np.flatnonzero(index['flags'][:lo + 1] & KEYFRAME)
+            first = int(keyframes[-1]) if len(keyframes) else 0
+            state = _ChainState()
+            for position, payload in enumerate(self._frames(self._paths(underlying, day)[0], index[first:hi]), first):
+                state.decode(payload)
+                if position >= lo:
+                    yield state.timestamp, state.table(underlying)
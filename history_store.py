@@ -0,0 +1,186 @@
+# history_store.py keeps downloaded candles on disk so get_price_history only has to fetch what is missing.
+# One .npy file per symbol/frequency, memory-mapped on read, plus a small .json with the ranges already fetched.
+# Imports
+import datetime as dt
+import json
+import os
+import threading
+import time
+import numpy as np
+from market_calendar import MARKET_TZ, market_date, day_start_ms, trading_ranges
+
+DEFAULT_HISTORY_PATH = os.path.expanduser('~/.schwab_auto_trader/history')
+
+# One row per candle, datetime is milliseconds since the UNIX epoch like the Schwab response.
+CANDLE_DTYPE = np.dtype([('datetime', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'),
+                         ('close', '<f8'), ('volume', '<i8')])
+
+# periodType Schwab expects for each frequencyType when asking for an explicit start/end date.
+PERIOD_TYPES = {'minute': 'day', 'daily': 'year', 'weekly': 'year', 'monthly': 'year'}
+
+# Longest span fetched in one get_price_history call per frequencyType (ms).
+DAY_MS = 24 * 60 * 60 * 1000
+MAX_FETCH_SPAN = {'minute': 10 * DAY_MS, 'daily': 20 * 365 * DAY_MS, 'weekly': 20 * 365 * DAY_MS,
+                  'monthly': 20 * 365 * DAY_MS}
+
+
+def to_epoch_ms(value: int | dt.datetime | dt.date, end: bool = False) -> int:
+    """
+    Accepts ms since the UNIX epoch (what Schwab uses), a datetime (naive = New York time) or a date (midnight New York).
+    With end set a date is the end of that day (the last ms before the next midnight), so an inclusive range
+    ending on a date covers the whole day.
+    """
+    if isinstance(value, dt.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=MARKET_TZ)
+        return int(value.timestamp() * 1000)
+    if isinstance(value, dt.date):
+        return day_start_ms(value + dt.timedelta(days=1)) - 1 if end else day_start_ms(value)
+    return int(value)
+
+
+def _merge_ranges(ranges: list[list[int]]) -> list[list[int]]:
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _subtract_ranges(start: int, end: int, covered: list[list[int]]) -> list[tuple[int, int]]:
+    gaps = []
+    cursor = start
+    for lo, hi in covered:
+        if hi < cursor:
+            continue
+        if lo > end:
+            break
+        if lo > cursor:
+            gaps.append((cursor, lo - 1))
+        cursor = max(cursor, hi + 1)
+    if cursor <= end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+class HistoryStore:
+    """
+    On disk candle store, see Trader.get_candles() for the normal way to use it.
+    Reads are zero-copy: the array handed back is a slice of a read-only memory map.
+    """
+    def __init__(self, root: str = DEFAULT_HISTORY_PATH):
+        """
+        :param root: Directory the .npy/.json files are kept in.
+        :type root: str
+        """
+        self.root = root
+        self._lock = threading.Lock()
+        self._maps: dict[str, np.ndarray] = {}
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def key(symbol: str, frequencyType: str, frequency: int, extended: bool = False) -> str:
+        safe = symbol.replace('/', '_').replace('$', '_')
+        return f"{safe}_{frequencyType}{frequency}{'_ext' if extended else ''}"
+
+    def _paths(self, key: str) -> tuple[str, str]:
+        base = os.path.join(self.root, key)
+        return f'{base}.npy', f'{base}.json'
+
+    def _covered(self, key: str) -> list[list[int]]:
+        try:
+            with open(self._paths(key)[1]) as f:
+                return json.load(f)['covered']
+        except (OSError, ValueError, KeyError):
+            return []
+
+    def _candles(self, key: str) -> np.ndarray:
+        candles = self._maps.get(key)
+        if candles is None:
+            path = self._paths(key)[0]
+            if not os.path.exists(path):
+                return np.empty(0, dtype=CANDLE_DTYPE)
+            candles = self._maps[key] = np.load(path, mmap_mode='r')
+        return candles
+
+    def missing_ranges(self, symbol: str, frequencyType: str, frequency: int, startDate, endDate,
+                       extended: bool = False) -> list[tuple[int, int]]:
+        """
+        Ranges that still have to be fetched, already split to fit one request each.
+        Weekends and market holidays are never reported as missing.
+        :return: list of (startDate, endDate) in ms since the UNIX epoch.
+        :rtype: list[tuple[int, int]]
+        """
+        start, end = to_epoch_ms(startDate), to_epoch_ms(endDate, end=True)
+        key = self.key(symbol, frequencyType, frequency, extended)
+        with self._lock:
+            covered = self._covered(key)
+        span = MAX_FETCH_SPAN.get(frequencyType, MAX_FETCH_SPAN['daily'])
+        missing = []
+        for lo, hi in _subtract_ranges(start, end, covered):
+            # Trim the gap to its first and last trading day, a gap that is only weekends/holidays is skipped.
+            # Weekly/monthly candles are stamped on the first day of the period which may be a holiday, leave those alone.
+            if frequencyType in ('minute', 'daily'):
+                pieces = trading_ranges(lo, hi)
+                if not pieces:
+                    continue
+                lo, hi = pieces[0][0], pieces[-1][1]
+            while lo <= hi:
+                missing.append((lo, min(hi, lo + span - 1)))
+                lo += span
+        return missing
+
+    def merge(self, symbol: str, frequencyType: str, frequency: int, candles: list[dict], covered: tuple[int, int],
+              extended: bool = False):
+        """
+        Add freshly fetched candles, duplicates (same datetime) are replaced by the new values.
+        :param candles: 'candles' list from a get_price_history response.
+        :type candles: list[dict]
+        :param covered: (startDate, endDate) the candles were fetched for. Nothing from the current
+                        trading day on is marked covered since those bars can still change.
+        :type covered: tuple[int, int]
+        """
+        key = self.key(symbol, frequencyType, frequency, extended)
+        fresh = np.empty(len(candles), dtype=CANDLE_DTYPE)
+        for i, candle in enumerate(candles):
+            fresh[i] = (candle['datetime'], candle['open'], candle['high'], candle['low'],
+                        candle['close'], candle.get('volume', 0))
+        npy_path, json_path = self._paths(key)
+
+        with self._lock:
+            existing = self._candles(key)
+            # New rows go first so np.unique (first occurrence wins) keeps them over the stored ones.
+            both = np.concatenate([fresh, existing])
+            _, index = np.unique(both['datetime'], return_index=True)
+            merged = both[index]
+            self._maps.pop(key, None)
+            tmp = f'{npy_path}.tmp.npy'
+            np.save(tmp, merged)
+            os.replace(tmp, npy_path)
+
+            today = day_start_ms(market_date(int(time.time() * 1000)))
+            start, end = covered[0], min(covered[1], today - 1)
+            ranges = self._covered(key)
+            if start <= end:
+                ranges = _merge_ranges(ranges + [[start, end]])
+            with open(f'{json_path}.tmp', 'w') as f:
+                json.dump({'symbol': symbol, 'frequencyType': frequencyType, 'frequency': frequency,
+                           'extended': extended, 'covered': ranges}, f)
+            os.replace(f'{json_path}.tmp', json_path)
+
+    def read(self, symbol: str, frequencyType: str, frequency: int, startDate, endDate,
+             extended: bool = False) -> np.ndarray:
+        """
+        Candles between startDate and endDate (inclusive, a date endDate includes that whole day).
+        :return: Read-only structured array view (CANDLE_DTYPE) over the memory-mapped file,
+                 e.g. candles['close'] for the closes.
+        :rtype: np.ndarray
+        """
+        start, end = to_epoch_ms(startDate), to_epoch_ms(endDate, end=True)
+        with self._lock:
+            candles = self._candles(self.key(symbol, frequencyType, frequency, extended))
+        times = candles['datetime']
+        lo, hi = np.searchsorted(times, start, 'left'), np.searchsorted(times, end, 'right')
+        return candles[lo:hi]
@@ -0,0 +1,82 @@
+# json_codec.py decodes Schwab response bodies. A full option chain is several MB of JSON and
+# response.json() (stdlib json on top of a str copy of the body) was the top line in our profiles.
+# Uses orjson or msgspec when installed, stdlib json otherwise.
+# Imports
+import json
+
+# Backends in the order 'auto' tries them.
+BACKENDS = ('orjson', 'msgspec', 'json')
+
+
+def _load_backend(name: str):
+    # Returns a loads(bytes) function for the backend, raises ImportError if it is not installed.
+    if name == 'orjson':
+        import orjson
+        return orjson.loads
+    if name == 'msgspec':
+        import msgspec
+        return msgspec.json.Decoder().decode
+    if name == 'json':
+        return json.loads
+    raise ValueError(f"Unknown json backend {name!r}, expected 'auto' or one of {BACKENDS}.")
+
+
+class JsonDecoder:
+    """
+    Turns response bodies into python objects.
+
+        decoder = JsonDecoder()                      # fastest installed backend
+        data = decoder.decode(response.content)      # plain dicts/lists, same as response.json()
+        chain = decoder.decode(response.content, schema='chain')   # market_structs.OptionChain (needs msgspec)
+
+    Typed decoding goes straight from bytes into the msgspec Structs in market_structs.py, only the fields
+    declared there are kept so the result is a lot smaller than the dict form.
+    """
+    def __init__(self, backend: str = 'auto'):
+        """
+        :param backend: 'auto', 'orjson', 'msgspec' or 'json'. 'auto' picks the first one installed.
+        :type backend: str
+        """
+        if backend == 'auto':
+            for name in BACKENDS:
+                try:
+                    self.loads = _load_backend(name)
+                except ImportError:
+                    continue
+                backend = name
+                break
+        else:
+            self.loads = _load_backend(backend)
+        self.backend = backend
+        self._typed = {}
+
+    def __repr__(self):
+        return f'JsonDecoder({self.backend!r})'
+
+    def typed_decoder(self, schema: str):
+        """
+        msgspec decoder for one of market_structs.SCHEMAS, built on first use.
+        :param schema: 'quotes', 'chain' or 'candles'.
+        :type schema: str
+        :rtype: msgspec.json.Decoder
+        """
+        decoder = self._typed.get(schema)
+        if decoder is None:
+            # Imported here so msgspec is only needed by people asking for typed results.
+            import msgspec
+            from market_structs import SCHEMAS
+            decoder = self._typed[schema] = msgspec.json.Decoder(SCHEMAS[schema])
+        return decoder
+
+    def decode(self, body: bytes | str, schema: str | None = None):
+        """
+        :param body: Raw response body (response.content).
+        :type body: bytes | str
+        :param schema: Decode into market_structs types instead of dicts, see typed_decoder().
+        :type schema: str | None
+        :return: Decoded body.
+        :rtype: dict | list | msgspec.Struct
+        """
+        if schema is not None:
+            return self.typed_decoder(schema).decode(body)
+        return self.loads(body)
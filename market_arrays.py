@@ -0,0 +1,133 @@
+# market_arrays.py turns price history and option chain responses into flat numpy columns.
+# Indicators work on contiguous float64/int64 arrays instead of walking lists of candle dicts
+# and chain maps keyed by expiration then strike.
+# Imports
+import operator
+import numpy as np
+
+_CANDLE_FIELDS = operator.itemgetter('datetime', 'open', 'high', 'low', 'close', 'volume')
+
+# Float columns pulled off every option contract, in order.
+CHAIN_FLOAT_COLUMNS = ('strike', 'bid', 'ask', 'last', 'mark', 'volatility', 'delta', 'gamma', 'theta', 'vega', 'rho',
+                       'theoretical_value', 'multiplier')
+CHAIN_INT_COLUMNS = ('open_interest', 'volume', 'bid_size', 'ask_size', 'days_to_expiration')
+_CONTRACT_FLOAT_KEYS = ('strikePrice', 'bid', 'ask', 'last', 'mark', 'volatility', 'delta', 'gamma',
+                        'theta', 'vega', 'rho', 'theoreticalOptionValue', 'multiplier')
+_CONTRACT_INT_KEYS = ('openInterest', 'totalVolume', 'bidSize', 'askSize', 'daysToExpiration')
+_CONTRACT_FLOATS = operator.itemgetter(*_CONTRACT_FLOAT_KEYS)
+_CONTRACT_INTS = operator.itemgetter(*_CONTRACT_INT_KEYS)
+
+
+def _pluck(getter, keys: tuple[str, ...], record: dict, default) -> tuple:
+    # itemgetter is the fast path, fall back to .get() for the odd contract missing a field.
+    try:
+        return getter(record)
+    except KeyError:
+        return tuple(record.get(key, default) for key in keys)
+
+
+class Candles:
+    """
+    Price history as a struct of arrays, every column is a contiguous array of the same length.
+    datetime/volume are int64 (datetime in ms since the UNIX epoch), open/high/low/close are float64.
+    """
+    __slots__ = ('symbol', 'datetime', 'open', 'high', 'low', 'close', 'volume')
+
+    def __init__(self, symbol: str, datetime: np.ndarray, open: np.ndarray, high: np.ndarray, low: np.ndarray,
+                 close: np.ndarray, volume: np.ndarray):
+        self.symbol = symbol
+        self.datetime = datetime
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+
+    def __len__(self):
+        return len(self.datetime)
+
+    def __repr__(self):
+        return f'Candles({self.symbol!r}, {len(self)} rows)'
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, column).nbytes for column in self.__slots__[1:])
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'Candles':
+        """
+        Build from a get_price_history response in one pass over the candle dicts.
+        :param data: {'symbol': ..., 'candles': [{'open', 'high', 'low', 'close', 'volume', 'datetime'}, ...]}
+        :type data: dict
+        :rtype: Candles
+        """
+        candles = data.get('candles') or []
+        # ms timestamps and share volumes are exact in float64 (< 2**53), split into columns after.
+        rows = np.array([_CANDLE_FIELDS(candle) for candle in candles], dtype=np.float64).reshape(len(candles), 6)
+        columns = rows.T
+        return cls(data.get('symbol'), columns[0].astype(np.int64), columns[1].copy(), columns[2].copy(),
+                   columns[3].copy(), columns[4].copy(), columns[5].astype(np.int64))
+
+    @classmethod
+    def from_records(cls, records: np.ndarray, symbol: str | None = None) -> 'Candles':
+        """
+        Build from a structured array, e.g. what Trader.get_candles() returns (copies each field to make it contiguous).
+        """
+        return cls(symbol, *(np.ascontiguousarray(records[name]) for name in
+                             ('datetime', 'open', 'high', 'low', 'close', 'volume')))
+
+
+class OptionChainTable:
+    """
+    Option chain flattened to one row per contract. Columns are attributes:
+    symbol, expiration (datetime64[D]), is_call (bool), the CHAIN_FLOAT_COLUMNS as float64 and the
+    CHAIN_INT_COLUMNS as int64.
+    """
+    __slots__ = ('underlying', 'underlying_price', 'symbol', 'expiration', 'is_call') + CHAIN_FLOAT_COLUMNS + CHAIN_INT_COLUMNS
+
+    def __len__(self):
+        return len(self.symbol)
+
+    def __repr__(self):
+        return f'OptionChainTable({self.underlying!r}, {len(self)} contracts)'
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, column).nbytes for column in self.__slots__[2:])
+
+    def column_names(self) -> tuple[str, ...]:
+        return self.__slots__[2:]
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'OptionChainTable':
+        """
+        Build from a get_option_chains response in one pass over callExpDateMap/putExpDateMap.
+        :param data: get_option_chains() response.
+        :type data: dict
+        :rtype: OptionChainTable
+        """
+        symbols, expirations, is_call, floats, ints = [], [], [], [], []
+        for exp_map, call in ((data.get('callExpDateMap') or {}, True), (data.get('putExpDateMap') or {}, False)):
+            for exp_key, strikes in exp_map.items():
+                expiration = exp_key.split(':', 1)[0]
+                for contracts in strikes.values():
+                    for contract in contracts:
+                        symbols.append(contract['symbol'])
+                        expirations.append(expiration)
+                        is_call.append(call)
+                        floats.append(_pluck(_CONTRACT_FLOATS, _CONTRACT_FLOAT_KEYS, contract, np.nan))
+                        ints.append(_pluck(_CONTRACT_INTS, _CONTRACT_INT_KEYS, contract, 0))
+
+        table = cls()
+        table.underlying = data.get('symbol')
+        table.underlying_price = data.get('underlyingPrice')
+        table.symbol = np.array(symbols, dtype=object)
+        table.expiration = np.array(expirations, dtype='datetime64[D]')
+        table.is_call = np.array(is_call, dtype=bool)
+        float_rows = np.array(floats, dtype=np.float64).reshape(len(symbols), len(CHAIN_FLOAT_COLUMNS)).T
+        int_rows = np.array(ints, dtype=np.int64).reshape(len(symbols), len(CHAIN_INT_COLUMNS)).T
+        for name, column in zip(CHAIN_FLOAT_COLUMNS, float_rows):
+            setattr(table, name, column.copy())
+        for name, column in zip(CHAIN_INT_COLUMNS, int_rows):
+            setattr(table, name, column.copy())
+        return table
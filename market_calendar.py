@@ -0,0 +1,114 @@
+# market_calendar.py knows which days the US equity market is open (weekends and NYSE holidays).
+# Rules based, no network call, good from 1990 onwards (one-off closures like national days of mourning are not included).
+# Imports
+import datetime as dt
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+MARKET_TZ = ZoneInfo('America/New_York')
+
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> dt.date:
+    # n-th weekday (Mon=0) of a month, n=-1 is the last one.
+    if n > 0:
+        first = dt.date(year, month, 1)
+        return first + dt.timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = dt.date(year + (month == 12), month % 12 + 1, 1) - dt.timedelta(days=1)
+    return last - dt.timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _easter(year: int) -> dt.date:
+    # Anonymous Gregorian algorithm.
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = b // 4, b % 4
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month = (h + l - 7 * m + 114) // 31
+    day = (h + l - 7 * m + 114) % 31 + 1
+    return dt.date(year, month, day)
+
+
+def _observed(day: dt.date) -> dt.date:
+    # Saturday holidays are observed Friday, Sunday holidays Monday.
+    if day.weekday() == 5:
+        return day - dt.timedelta(days=1)
+    if day.weekday() == 6:
+        return day + dt.timedelta(days=1)
+    return day
+
+
+@lru_cache(maxsize=None)
+def nyse_holidays(year: int) -> frozenset[dt.date]:
+    """
+    Full day NYSE closures for a year.
+    :param year: e.g. 2024
+    :type year: int
+    :return: set of dates the market is closed (weekdays only).
+    :rtype: frozenset[dt.date]
+    """
+    holidays = {
+        _nth_weekday(year, 1, 0, 3),                # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),                # Washington's Birthday
+        _easter(year) - dt.timedelta(days=2),       # Good Friday
+        _nth_weekday(year, 5, 0, -1),               # Memorial Day
+        _observed(dt.date(year, 7, 4)),             # Independence Day
+        _nth_weekday(year, 9, 0, 1),                # Labor Day
+        _nth_weekday(year, 11, 3, 4),               # Thanksgiving
+        _observed(dt.date(year, 12, 25)),           # Christmas
+    }
+    # New Year's Day on a Saturday is not moved back into December.
+    new_year = dt.date(year, 1, 1)
+    if new_year.weekday() != 5:
+        holidays.add(_observed(new_year))
+    if year >= 2022:
+        holidays.add(_observed(dt.date(year, 6, 19)))  # Juneteenth
+    return frozenset(day for day in holidays if day.weekday() < 5)
+
+
+def is_trading_day(day: dt.date) -> bool:
+    """
+    True if the market is open on this date.
+    """
+    return day.weekday() < 5 and day not in nyse_holidays(day.year)
+
+
+def market_date(epoch_ms: int) -> dt.date:
+    """
+    New York calendar date of a timestamp in milliseconds since the UNIX epoch.
+    """
+    return dt.datetime.fromtimestamp(epoch_ms / 1000, MARKET_TZ).date()
+
+
+def day_start_ms(day: dt.date) -> int:
+    """
+    Midnight New York time of a date, in milliseconds since the UNIX epoch.
+    """
+    return int(dt.datetime.combine(day, dt.time(), tzinfo=MARKET_TZ).timestamp() * 1000)
+
+
+def trading_ranges(start_ms: int, end_ms: int) -> list[tuple[int, int]]:
+    """
+    Cut [start_ms, end_ms] down to the parts that fall on trading days, consecutive trading days are kept together.
+    :return: list of (start_ms, end_ms) ranges, empty if the span is all weekends/holidays.
+    :rtype: list[tuple[int, int]]
+    """
+    ranges = []
+    day = market_date(start_ms)
+    last = market_date(end_ms)
+    current = None
+    while day <= last:
+        lo = max(start_ms, day_start_ms(day))
+        hi = min(end_ms, day_start_ms(day + dt.timedelta(days=1)) - 1)
+        if is_trading_day(day):
+            current = [current[0], hi] if current else [lo, hi]
+        elif current:
+            ranges.append(tuple(current))
+            current = None
+        day += dt.timedelta(days=1)
+    if current:
+        ranges.append(tuple(current))
+    return ranges
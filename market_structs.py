@@ -0,0 +1,93 @@
+# market_structs.py holds msgspec Structs for the hot market data payloads (quotes, option chains, candles).
+# JsonDecoder(schema=...) decodes response bodies straight into these, skipping the intermediate dicts.
+# Only the fields declared here are kept, everything else in the payload is skipped while parsing.
+# Field names are snake_case, Schwab's camelCase keys are mapped with rename='camel'.
+# Imports
+import msgspec
+
+
+class QuoteFields(msgspec.Struct, rename='camel', gc=False):
+    bid_price: float | None = None
+    bid_size: int | None = None
+    ask_price: float | None = None
+    ask_size: int | None = None
+    last_price: float | None = None
+    last_size: int | None = None
+    mark: float | None = None
+    open_price: float | None = None
+    high_price: float | None = None
+    low_price: float | None = None
+    close_price: float | None = None
+    net_change: float | None = None
+    net_percent_change: float | None = None
+    total_volume: int | None = None
+    volatility: float | None = None
+    quote_time: int | None = None
+    trade_time: int | None = None
+
+
+class Quote(msgspec.Struct, rename='camel', gc=False):
+    symbol: str | None = None
+    asset_main_type: str | None = None
+    realtime: bool | None = None
+    quote: QuoteFields | None = None
+
+
+class OptionContract(msgspec.Struct, rename='camel', gc=False):
+    symbol: str
+    put_call: str | None = None
+    strike_price: float | None = None
+    expiration_date: str | None = None
+    days_to_expiration: int | None = None
+    bid: float | None = None
+    ask: float | None = None
+    last: float | None = None
+    mark: float | None = None
+    bid_size: int | None = None
+    ask_size: int | None = None
+    total_volume: int | None = None
+    open_interest: int | None = None
+    volatility: float | None = None
+    delta: float | None = None
+    gamma: float | None = None
+    theta: float | None = None
+    vega: float | None = None
+    rho: float | None = None
+    theoretical_option_value: float | None = None
+    multiplier: float | None = None
+    in_the_money: bool | None = None
+
+
+class OptionChain(msgspec.Struct, rename='camel', gc=False):
+    """
+    callExpDateMap/putExpDateMap keep Schwab's nesting: 'yyyy-MM-dd:dte' -> strike -> [OptionContract].
+    """
+    symbol: str | None = None
+    status: str | None = None
+    underlying_price: float | None = None
+    call_exp_date_map: dict[str, dict[str, list[OptionContract]]] = {}
+    put_exp_date_map: dict[str, dict[str, list[OptionContract]]] = {}
+
+
+class Candle(msgspec.Struct, gc=False):
+    datetime: int
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: int = 0
+
+
+class PriceHistory(msgspec.Struct, rename='camel', gc=False):
+    symbol: str | None = None
+    empty: bool = False
+    previous_close: float | None = None
+    candles: list[Candle] = []
+
+
+# Schema name -> type, what JsonDecoder.decode(body, schema=name) builds.
+SCHEMAS = {
+    'quotes': dict[str, Quote],
+    'chain': OptionChain,
+    'candles': PriceHistory,
+}
@@ -0,0 +1,355 @@
+# metrics.py times every request the Trader sends, split into where the time went:
+# connect (DNS + TCP + TLS, 0 on a reused connection), wait (request sent -> response headers, mostly Schwab),
+# download (headers -> last body byte) and decode (JSON). Sizes, status codes and retries are counted per endpoint,
+# and the whole lot can be exported as Prometheus text or written out as JSON snapshots.
+# Imports
+import json
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+PHASES = ('connect', 'wait', 'download', 'decode', 'total')
+
+# Histogram upper bounds, seconds for phases and bytes for payloads. Anything bigger lands in +Inf.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# Path segments following these are ids, folded into a placeholder so every account/order/symbol shares a series.
+PATH_PARAMS = {'accounts': '{accountHash}', 'orders': '{orderId}', 'transactions': '{transactionId}',
+               'markets': '{market_id}', 'instruments': '{cusip_id}', 'movers': '{symbol_id}'}
+# Fixed path segments that sit where an id could, e.g. /trader/v1/accounts/accountNumbers.
+PATH_LITERALS = {'accountNumbers'}
+
+_local = threading.local()
+
+
+def route(method: str, path: str) -> str:
+    """
+    Endpoint label for a request e.g. GET /trader/v1/accounts/{accountHash}/orders.
+    """
+    parts = path.strip('/').split('/')
+    for i in range(1, len(parts)):
+        placeholder = PATH_PARAMS.get(parts[i - 1])
+        if placeholder and parts[i] not in PATH_PARAMS and parts[i] not in PATH_LITERALS:
+            parts[i] = placeholder
+    # /marketdata/v1/{symbol_id}/quotes
+    if len(parts) == 4 and parts[0] == 'marketdata' and parts[3] == 'quotes':
+        parts[2] = '{symbol_id}'
+    return f"{method} /{'/'.join(parts)}"
+
+
+class Histogram:
+    """
+    Fixed bucket histogram, what Prometheus expects. quantile() answers with the bucket's upper bound.
+    """
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds: tuple = LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.bounds[i] if i < len(self.bounds) else float('inf')
+        return float('inf')
+
+    def summary(self) -> dict:
+        return {'count': self.count, 'sum': self.sum, 'p50': self.quantile(0.5), 'p99': self.quantile(0.99)}
+
+
+def _timed_pool_classes():
+    # urllib3 pool classes whose connections report how long connect() took to the current thread.
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    def timed(connection_class):
+        class TimedConnection(connection_class):
+            def connect(self):
+                start = time.perf_counter()
+                try:
+                    return super().connect()
+                finally:
+                    _local.connect = getattr(_local, 'connect', 0.0) + time.perf_counter() - start
+        return TimedConnection
+
+    class TimedHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = timed(HTTPConnection)
+
+    class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = timed(HTTPSConnection)
+
+    return {'http': TimedHTTPConnectionPool, 'https': TimedHTTPSConnectionPool}
+
+
+class _HttpxTrace:
+    # httpx 'trace' extension callback, keeps the perf_counter() of the events the phases are cut from.
+    __slots__ = ('events',)
+
+    def __init__(self):
+        self.events = {}
+
+    def __call__(self, event: str, info: dict):
+        self.events[event.split('.', 1)[-1]] = time.perf_counter()
+
+
+class Metrics:
+    """
+    Per endpoint latency histograms (one per phase), payload size histograms, status code and retry counters.
+
+        metrics = Metrics()
+        trader = Trader(args, metrics=metrics)
+        ...
+        print(metrics.prometheus())             # or metrics.start_snapshots('metrics.json', interval=60)
+        metrics.trace_sample_rate = 0.01        # keep 1% of requests in metrics.traces, any time
+
+    Connect time is only split out on pooled requests sessions (instrument_session()) and httpx clients,
+    otherwise it is part of wait.
+    """
+    def __init__(self, trace_sample_rate: float = 0.0, max_traces: int = 1000, namespace: str = 'schwab'):
+        """
+        :param trace_sample_rate: Share of requests (0-1) whose full timing is kept in self.traces. 0 is free.
+        :type trace_sample_rate: float
+        :param max_traces: Newest traces kept.
+        :type max_traces: int
+        :param namespace: Prefix of the Prometheus metric names.
+        :type namespace: str
+        """
+        self.trace_sample_rate = trace_sample_rate
+        self.traces: deque[dict] = deque(maxlen=max_traces)
+        self.namespace = namespace
+        self._phases: dict[tuple[str, str], Histogram] = {}
+        self._sizes: dict[tuple[str, str], Histogram] = {}
+        self._statuses: dict[tuple[str, int], int] = {}
+        self._retries: dict[str, int] = {}
+        self._errors: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = None
+
+# ---------- Sending ---------- #
+
+    def instrument_session(self, session):
+        """
+        Make the connections of a requests.Session report their connect time. Other clients are left alone.
+        """
+        adapters = getattr(session, 'adapters', None)
+        if not adapters:
+            return
+        pool_classes = _timed_pool_classes()
+        for adapter in adapters.values():
+            manager = getattr(adapter, 'poolmanager', None)
+            if manager is not None:
+                manager.pool_classes_by_scheme = pool_classes
+                manager.clear()
+
+    def send(self, client, method: str, url: str, **kwargs):
+        """
+        client.request() with the phases measured, they are left on response.timing.
+        :param client: requests.Session, the requests module or httpx.Client.
+        """
+        start = time.perf_counter()
+        if hasattr(client, 'build_request'):
+            trace = _HttpxTrace()
+            data = kwargs.pop('data', None)
+            if data is not None:
+                kwargs['content'] = data
+            response = client.request(method, url, extensions={'trace': trace}, **kwargs)
+            end = time.perf_counter()
+            events = trace.events
+            connect = events.get('start_tls.complete', events.get('connect_tcp.complete', start)) - \
+                events.get('connect_tcp.started', start)
+            headers = events.get('receive_response_headers.complete', end)
+        else:
+            _local.connect = 0.0
+            response = client.request(method, url, stream=True, **kwargs)
+            headers = time.perf_counter()
+            response.content  # noqa: B018, reads the body
+            end = time.perf_counter()
+            connect = _local.connect
+        response.timing = {'connect': connect, 'wait': max(0.0, headers - start - connect),
+                           'download': end - headers, 'total': end - start}
+        return response
+
+# ---------- Recording ---------- #
+
+    def observe(self, label: str, response, attempts: int = 1):
+        """
+        Record a finished request, response is the last one sent (after any 401/429 resends).
+        :param label: Endpoint label, see route().
+        :param attempts: Times the request was sent.
+        """
+        timing = getattr(response, 'timing', None) or {}
+        request_bytes = self._request_size(response)
+        response_bytes = len(response.content)
+        status = response.status_code
+        with self._lock:
+            for phase, seconds in timing.items():
+                histogram = self._phases.get((label, phase))
+                if histogram is None:
+                    histogram = self._phases[(label, phase)] = Histogram()
+                histogram.observe(seconds)
+            for direction, size in (('request', request_bytes), ('response', response_bytes)):
+                histogram = self._sizes.get((label, direction))
+                if histogram is None:
+                    histogram = self._sizes[(label, direction)] = Histogram(SIZE_BUCKETS)
+                histogram.observe(size)
+            self._statuses[(label, status)] = self._statuses.get((label, status), 0) + 1
+            if attempts > 1:
+                self._retries[label] = self._retries.get(label, 0) + attempts - 1
+        response.metrics_label = label
+        if self.trace_sample_rate and random.random() < self.trace_sample_rate:
+            response.trace = {'time': time.time(), 'endpoint': label, 'url': str(response.url), 'status': status,
+                              'attempts': attempts, 'request_bytes': request_bytes, 'response_bytes': response_bytes,
+                              **timing}
+            self.traces.append(response.trace)
+
+    def observe_error(self, label: str, exc: Exception):
+        """
+        Count a request that raised (timeout, connection reset...) instead of answering.
+        """
+        key = f'{label} {type(exc).__name__}'
+        with self._lock:
+            self._errors[key] = self._errors.get(key, 0) + 1
+
+    def observe_decode(self, response, seconds: float):
+        """
+        Record the JSON decode of a response that went through observe().
+        """
+        label = getattr(response, 'metrics_label', None)
+        if label is None:
+            return
+        with self._lock:
+            histogram = self._phases.get((label, 'decode'))
+            if histogram is None:
+                histogram = self._phases[(label, 'decode')] = Histogram()
+            histogram.observe(seconds)
+        trace = getattr(response, 'trace', None)
+        if trace is not None:
+            trace['decode'] = seconds
+
+    @staticmethod
+    def _request_size(response) -> int:
+        request = getattr(response, 'request', None)
+        body = getattr(request, 'body', None)  # requests
+        if body is None:
+            try:
+                body = request.content  # httpx
+            except Exception:
+                body = None
+        return len(body) if body else 0
+
+# ---------- Export ---------- #
+
+    def snapshot(self) -> dict:
+        """
+        Everything recorded so far as plain data, p50/p99 are bucket upper bounds.
+        """
+        endpoints = {}
+        with self._lock:
+            for (label, phase), histogram in self._phases.items():
+                endpoints.setdefault(label, {}).setdefault('phases', {})[phase] = histogram.summary()
+            for (label, direction), histogram in self._sizes.items():
+                endpoints.setdefault(label, {})[f'{direction}_bytes'] = histogram.summary()
+            for (label, status), count in self._statuses.items():
+                endpoints.setdefault(label, {}).setdefault('status', {})[str(status)] = count
+            for label, count in self._retries.items():
+                endpoints.setdefault(label, {})['retries'] = count
+            errors = dict(self._errors)
+        return {'time': time.time(), 'endpoints': endpoints, 'errors': errors}
+
+    def prometheus(self) -> str:
+        """
+        Prometheus text exposition format (version 0.0.4).
+        """
+        ns = self.namespace
+        lines = []
+
+        def histograms(name: str, help_text: str, series: dict, label_name: str):
+            lines.append(f'# HELP {ns}_{name} {help_text}')
+            lines.append(f'# TYPE {ns}_{name} histogram')
+            for (label, kind), histogram in sorted(series.items()):
+                labels = f'endpoint="{_escape(label)}",{label_name}="{kind}"'
+                cumulative = 0
+                for bound, count in zip(histogram.bounds + (float('inf'),), histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(float(bound))
+                    lines.append(f'{ns}_{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f'{ns}_{name}_sum{{{labels}}} {histogram.sum!r}')
+                lines.append(f'{ns}_{name}_count{{{labels}}} {histogram.count}')
+
+        with self._lock:
+            histograms('request_duration_seconds', 'Request time per endpoint and phase.', self._phases, 'phase')
+            histograms('payload_bytes', 'Request/response body size per endpoint.', self._sizes, 'direction')
+            lines.append(f'# HELP {ns}_responses_total Responses per endpoint and status code.')
+            lines.append(f'# TYPE {ns}_responses_total counter')
+            for (label, status), count in sorted(self._statuses.items()):
+                lines.append(f'{ns}_responses_total{{endpoint="{_escape(label)}",status="{status}"}} {count}')
+            lines.append(f'# HELP {ns}_retries_total Resends after 401/429 per endpoint.')
+            lines.append(f'# TYPE {ns}_retries_total counter')
+            for label, count in sorted(self._retries.items()):
+                lines.append(f'{ns}_retries_total{{endpoint="{_escape(label)}"}} {count}')
+            lines.append(f'# HELP {ns}_errors_total Requests that raised instead of answering.')
+            lines.append(f'# TYPE {ns}_errors_total counter')
+            for key, count in sorted(self._errors.items()):
+                label, error = key.rsplit(' ', 1)
+                lines.append(f'{ns}_errors_total{{endpoint="{_escape(label)}",error="{error}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._phases.clear()
+            self._sizes.clear()
+            self._statuses.clear()
+            self._retries.clear()
+            self._errors.clear()
+        self.traces.clear()
+
+    def write_snapshot(self, path: str):
+        """
+        Write snapshot() as JSON to path (replaced atomically, readers never see half a file).
+        """
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def start_snapshots(self, path: str, interval: float = 60.0):
+        """
+        write_snapshot(path) every interval seconds on a background thread, until close().
+        """
+        def run():
+            while not self._closed.wait(interval):
+                self.write_snapshot(path)
+
+        if self._thread is None:
+            self._closed.clear()
+            self._thread = threading.Thread(target=run, name='metrics-snapshots', daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        self._closed.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+            self._thread = None
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
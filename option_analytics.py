@@ -0,0 +1,303 @@
+# option_analytics.py prices option chains locally: implied volatility, greeks and theoretical values for every
+# contract of a fetched chain in one numpy pass, and whole-chain what-if grids (spot x vol x time) without asking
+# Schwab again (get_option_chains(strategy='ANALYTICAL', ...) is a multi-MB round trip per scenario).
+# European contracts use Black-Scholes-Merton, American ones Bjerksund-Stensland (1993).
+# Imports
+import datetime as dt
+import numpy as np
+from market_arrays import OptionChainTable
+
+try:
+    from scipy.special import ndtr as _ndtr
+except ImportError:
+    _ndtr = None
+
+MODELS = ('european', 'american')
+
+# Shortest time to expiration priced, same day contracts would otherwise divide by zero.
+MIN_YEARS = 1.0 / (365.0 * 24.0)
+# Implied volatility search range.
+MIN_VOL, MAX_VOL = 1e-4, 5.0
+
+
+def norm_cdf(x: np.ndarray) -> np.ndarray:
+    """
+    Standard normal CDF, scipy's ndtr when installed, otherwise an erf approximation good to ~1e-7.
+    """
+    if _ndtr is not None:
+        return _ndtr(x)
+    # Abramowitz & Stegun 7.1.26 on |x| / sqrt(2).
+    z = np.abs(x) / np.sqrt(2.0)
+    t = 1.0 / (1.0 + 0.3275911 * z)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1.0 - poly * np.exp(-z * z)
+    return 0.5 * (1.0 + np.sign(x) * erf)
+
+
+def norm_pdf(x: np.ndarray) -> np.ndarray:
+    return np.exp(-0.5 * x * x) / np.sqrt(2.0 * np.pi)
+
+
+def black_scholes(spot, strike, years, rate, dividend, vol, is_call) -> np.ndarray:
+    """
+    Black-Scholes-Merton price, every argument is a scalar or an array (broadcast together).
+    :param years: Time to expiration in years.
+    :param rate: Risk free rate, continuously compounded (0.045 = 4.5%).
+    :param dividend: Continuous dividend yield.
+    :param vol: Volatility as a fraction (0.25 = 25%, Schwab's volatility column is in percent).
+    :param is_call: True for calls, False for puts.
+    """
+    years = np.maximum(years, MIN_YEARS)
+    root = vol * np.sqrt(years)
+    d1 = (np.log(spot / strike) + (rate - dividend + 0.5 * vol * vol) * years) / root
+    discounted_spot = spot * np.exp(-dividend * years)
+    discounted_strike = strike * np.exp(-rate * years)
+    call = discounted_spot * norm_cdf(d1) - discounted_strike * norm_cdf(d1 - root)
+    # Puts from put-call parity, one pair of CDFs per contract instead of two.
+    return np.where(is_call, call, call - discounted_spot + discounted_strike)
+
+
+def _bs_american_call(spot, strike, years, rate, carry, vol):
+    # Bjerksund-Stensland 1993 call with cost of carry b = carry, valid where carry < rate.
+    var = vol * vol
+    beta = (0.5 - carry / var) + np.sqrt((carry / var - 0.5) ** 2 + 2.0 * rate / var)
+    b_infinity = beta / (beta - 1.0) * strike
+    b_zero = np.where(rate - carry > 0, np.maximum(strike, rate / np.maximum(rate - carry, 1e-12) * strike), strike)
+    h = -(carry * years + 2.0 * vol * np.sqrt(years)) * b_zero / (b_infinity - b_zero)
+    trigger = b_zero + (b_infinity - b_zero) * (1.0 - np.exp(h))
+    alpha = (trigger - strike) * trigger ** -beta
+
+    def phi(gamma, barrier):
+        lam = (-rate + gamma * carry + 0.5 * gamma * (gamma - 1.0) * var) * years
+        d = -(np.log(spot / barrier) + (carry + (gamma - 0.5) * var) * years) / (vol * np.sqrt(years))
+        kappa = 2.0 * carry / var + (2.0 * gamma - 1.0)
+        return np.exp(lam) * spot ** gamma * (norm_cdf(d) - (trigger / spot) ** kappa *
+                                              norm_cdf(d - 2.0 * np.log(trigger / spot) / (vol * np.sqrt(years))))
+
+    value = (alpha * spot ** beta - alpha * phi(beta, trigger) + phi(1.0, trigger) - phi(1.0, strike)
+             - strike * phi(0.0, trigger) + strike * phi(0.0, strike))
+    return np.where(spot >= trigger, spot - strike, value)
+
+
+def bjerksund_stensland(spot, strike, years, rate, dividend, vol, is_call) -> np.ndarray:
+    """
+    American option price (Bjerksund-Stensland 1993), same arguments as black_scholes().
+    Calls on non dividend payers never get exercised early and come out at the Black-Scholes price.
+    """
+    spot, strike, years, rate, dividend, vol, is_call = np.broadcast_arrays(
+        *(np.asarray(value, dtype=np.float64) for value in (spot, strike, years, rate, dividend, vol)),
+        np.asarray(is_call, dtype=bool))
+    years = np.maximum(years, MIN_YEARS)
+    carry = rate - dividend
+    european = black_scholes(spot, strike, years, rate, dividend, vol, is_call)
+    # Puts through the put-call transformation P(S, K, T, r, b) = C(K, S, T, r - b, -b).
+    call_rate = np.where(is_call, rate, dividend)
+    call_carry = np.where(is_call, carry, -carry)
+    # Only contracts that can be worth exercising early (carry < rate) go through the expensive formula.
+    early = call_carry < call_rate
+    if not early.any():
+        return european
+    call_spot = np.where(is_call, spot, strike)[early]
+    call_strike = np.where(is_call, strike, spot)[early]
+    with np.errstate(all='ignore'):
+        american = _bs_american_call(call_spot, call_strike, years[early], call_rate[early], call_carry[early],
+                                     vol[early])
+    values = european.copy()
+    values[early] = np.where(np.isfinite(american), np.maximum(american, european[early]), european[early])
+    return values
+
+
+def price(spot, strike, years, rate, dividend, vol, is_call, model: str = 'european') -> np.ndarray:
+    if model == 'european':
+        return black_scholes(spot, strike, years, rate, dividend, vol, is_call)
+    if model == 'american':
+        return bjerksund_stensland(spot, strike, years, rate, dividend, vol, is_call)
+    raise ValueError(f"Unknown model {model!r}, expected one of {MODELS}.")
+
+
+def greeks(spot, strike, years, rate, dividend, vol, is_call) -> dict[str, np.ndarray]:
+    """
+    Black-Scholes-Merton greeks in Schwab's units: theta per calendar day, vega and rho per 1 point (1%).
+    """
+    years = np.maximum(years, MIN_YEARS)
+    root_t = np.sqrt(years)
+    d1 = (np.log(spot / strike) + (rate - dividend + 0.5 * vol * vol) * years) / (vol * root_t)
+    d2 = d1 - vol * root_t
+    spot_discount = np.exp(-dividend * years)
+    strike_discount = np.exp(-rate * years)
+    pdf = norm_pdf(d1)
+    sign = np.where(is_call, 1.0, -1.0)
+    delta = sign * spot_discount * norm_cdf(sign * d1)
+    gamma = spot_discount * pdf / (spot * vol * root_t)
+    vega = spot * spot_discount * pdf * root_t
+    theta = (-spot * spot_discount * pdf * vol / (2.0 * root_t)
+             - sign * rate * strike * strike_discount * norm_cdf(sign * d2)
+             + sign * dividend * spot * spot_discount * norm_cdf(sign * d1))
+    rho = sign * strike * years * strike_discount * norm_cdf(sign * d2)
+    return {'delta': delta, 'gamma': gamma, 'theta': theta / 365.0, 'vega': vega / 100.0, 'rho': rho / 100.0}
+
+
+def finite_difference_greeks(spot, strike, years, rate, dividend, vol, is_call,
+                             model: str = 'american') -> dict[str, np.ndarray]:
+    """
+    Greeks of any model by bumping its inputs, same units as greeks().
+    """
+    def value(s=spot, t=years, r=rate, v=vol):
+        return price(s, strike, t, r, dividend, v, is_call, model)
+
+    spot = np.asarray(spot, dtype=np.float64)
+    bump = spot * 0.001
+    up, mid, down = value(s=spot + bump), value(), value(s=spot - bump)
+    day = 1.0 / 365.0
+    return {'delta': (up - down) / (2.0 * bump),
+            'gamma': (up - 2.0 * mid + down) / (bump * bump),
+            'theta': value(t=np.maximum(np.asarray(years) - day, MIN_YEARS)) - mid,
+            'vega': value(v=vol + 0.005) - value(v=np.maximum(vol - 0.005, MIN_VOL)),
+            'rho': (value(r=rate + 0.0005) - value(r=rate - 0.0005)) / 0.1}
+
+
+def implied_volatility(market_price, spot, strike, years, rate, dividend, is_call, model: str = 'european',
+                       tol: float = 1e-6, max_iter: int = 100) -> np.ndarray:
+    """
+    Volatility (fraction) each price implies, NaN where the price is outside what any volatility gives
+    (below intrinsic value or above the underlying).
+    Newton steps on Black-Scholes vega kept inside a bisection bracket, so every contract converges.
+    """
+    arrays = np.broadcast_arrays(
+        *(np.asarray(value, dtype=np.float64) for value in (market_price, spot, strike, years, rate, dividend)),
+        np.asarray(is_call, dtype=bool))
+    shape = arrays[0].shape
+    market_price, spot, strike, years, rate, dividend, is_call = (array.ravel() for array in arrays)
+    years = np.maximum(years, MIN_YEARS)
+    low = np.full(market_price.shape, MIN_VOL)
+    high = np.full(market_price.shape, MAX_VOL)
+    valid = (price(spot, strike, years, rate, dividend, low, is_call, model) <= market_price) & \
+            (market_price <= price(spot, strike, years, rate, dividend, high, is_call, model)) & \
+            np.isfinite(market_price)
+    vol = np.full(market_price.shape, 0.3)
+    active = valid.copy()
+    for _ in range(max_iter):
+        if not active.any():
+            break
+        index = np.flatnonzero(active)
+        args = (spot[index], strike[index], years[index], rate[index], dividend[index])
+        v = vol[index]
+        diff = price(*args, v, is_call[index], model) - market_price[index]
+        converged = np.abs(diff) < tol
+        # Tighten the bracket, then take the Newton step if it stays inside it, bisect otherwise.
+        high[index] = np.where(diff > 0, v, high[index])
+        low[index] = np.where(diff <= 0, v, low[index])
+        vega = greeks(*args, v, is_call[index])['vega'] * 100.0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = v - diff / vega
+        inside = (step > low[index]) & (step < high[index]) & np.isfinite(step)
+        vol[index] = np.where(converged, v, np.where(inside, step, 0.5 * (low[index] + high[index])))
+        active[index] = ~converged & (high[index] - low[index] > tol * 1e-3)
+    return np.where(valid, vol, np.nan).reshape(shape)
+
+
+class ChainAnalytics:
+    """
+    Implied volatility, greeks and theoretical values for a whole chain, plus scenario grids.
+
+        chain = trader.get_option_chains('AAPL', as_arrays=True)
+        analytics = ChainAnalytics(chain, rate=0.045)
+        analytics.iv, analytics.greeks['delta']        # one value per contract, same order as chain
+        grid = analytics.scenarios(spots=np.linspace(90, 110, 21), vol_shifts=[-0.05, 0, 0.05], days_forward=[0, 7])
+
+    Implied volatility comes from the mid price (bid/ask, falling back to mark then last). Contracts whose price
+    implies nothing fall back to Schwab's volatility column.
+    """
+    def __init__(self, chain: OptionChainTable | dict, rate: float = 0.045, dividend_yield: float = 0.0,
+                 model: str = 'european', spot: float | None = None, as_of: dt.date | None = None):
+        """
+        :param chain: get_option_chains() response or its OptionChainTable (as_arrays=True).
+        :type chain: OptionChainTable | dict
+        :param rate: Risk free rate, continuously compounded.
+        :type rate: float
+        :param dividend_yield: Continuous dividend yield of the underlying.
+        :type dividend_yield: float
+        :param model: 'european' (Black-Scholes-Merton) or 'american' (Bjerksund-Stensland).
+        :type model: str
+        :param spot: Underlying price, defaults to the chain's underlyingPrice.
+        :type spot: float | None
+        :param as_of: Date time to expiration is measured from, defaults to the chain's daysToExpiration.
+        :type as_of: dt.date | None
+        """
+        if model not in MODELS:
+            raise ValueError(f"Unknown model {model!r}, expected one of {MODELS}.")
+        self.chain = chain if isinstance(chain, OptionChainTable) else OptionChainTable.from_json(chain)
+        self.rate = rate
+        self.dividend_yield = dividend_yield
+        self.model = model
+        self.spot = float(spot if spot is not None else self.chain.underlying_price)
+        if as_of is None:
+            days = self.chain.days_to_expiration.astype(np.float64)
+        else:
+            days = (self.chain.expiration - np.datetime64(as_of, 'D')).astype(np.float64)
+        self.years = np.maximum(days, 0.0) / 365.0
+        self.market_price = self._mid()
+        self.iv = implied_volatility(self.market_price, self.spot, self.chain.strike, self.years, rate, dividend_yield,
+                                     self.chain.is_call, model)
+        self.volatility = np.where(np.isnan(self.iv), self.chain.volatility / 100.0, self.iv)
+        self.theoretical = self.value()
+        self.greeks = self.greeks_at()
+
+    def __len__(self):
+        return len(self.chain)
+
+    def __repr__(self):
+        return f'ChainAnalytics({self.chain.underlying!r}, {len(self)} contracts, {self.model})'
+
+    def _mid(self) -> np.ndarray:
+        chain = self.chain
+        mid = np.where((chain.bid > 0) & (chain.ask > 0), 0.5 * (chain.bid + chain.ask), np.nan)
+        mid = np.where(np.isnan(mid) & (chain.mark > 0), chain.mark, mid)
+        return np.where(np.isnan(mid) & (chain.last > 0), chain.last, mid)
+
+    def value(self, spot=None, vol=None, years=None, rate: float | None = None, index=slice(None)) -> np.ndarray:
+        """
+        Theoretical value of every contract (or the ones picked by index), inputs left out are the chain's
+        (broadcasts like numpy).
+        """
+        return price(self.spot if spot is None else spot, self.chain.strike[index],
+                     self.years[index] if years is None else years, self.rate if rate is None else rate,
+                     self.dividend_yield, self.volatility[index] if vol is None else vol, self.chain.is_call[index],
+                     self.model)
+
+    def greeks_at(self, spot=None, vol=None, years=None) -> dict[str, np.ndarray]:
+        """
+        Greeks of every contract (closed form for european, bumped for american).
+        """
+        args = (self.spot if spot is None else spot, self.chain.strike, self.years if years is None else years,
+                self.rate, self.dividend_yield, self.volatility if vol is None else vol, self.chain.is_call)
+        if self.model == 'european':
+            return greeks(*args)
+        return finite_difference_greeks(*args, model=self.model)
+
+    def scenarios(self, spots, vol_shifts=(0.0,), days_forward=(0.0,), index=slice(None)) -> np.ndarray:
+        """
+        Every contract (or the ones picked by index) revalued on a grid.
+        :param spots: Underlying prices.
+        :param vol_shifts: Added to each contract's volatility (0.05 = +5 points).
+        :param days_forward: Calendar days passed.
+        :return: Array shaped (spots, vol_shifts, days_forward, contracts).
+        :rtype: np.ndarray
+        """
+        spots = np.asarray(spots, dtype=np.float64)[:, None, None, None]
+        vols = np.maximum(self.volatility[index] + np.asarray(vol_shifts, dtype=np.float64)[None, :, None, None],
+                          MIN_VOL)
+        years = np.maximum(self.years[index] - np.asarray(days_forward, dtype=np.float64)[None, None, :, None] / 365.0,
+                           0.0)
+        return self.value(spot=spots, vol=vols, years=years, index=index)
+
+    def position_scenarios(self, quantities: np.ndarray, spots, vol_shifts=(0.0,), days_forward=(0.0,)) -> np.ndarray:
+        """
+        P&L of holding quantities (contracts per row of the chain, short < 0) on the scenarios() grid,
+        against today's theoretical values.
+        :return: Array shaped (spots, vol_shifts, days_forward).
+        :rtype: np.ndarray
+        """
+        held = np.flatnonzero(quantities)
+        grid = self.scenarios(spots, vol_shifts, days_forward, index=held) - self.theoretical[held]
+        return grid @ (np.asarray(quantities, dtype=np.float64)[held] * self.chain.multiplier[held])
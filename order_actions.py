@@ -0,0 +1,366 @@
+# order_actions.py cancels or reprices many working orders at once, e.g. pull everything on a symbol when a
+# strategy misbehaves. The working orders come from one get_all_orders() call (or an OrderBook), the cancels and
+# replaces go out concurrently through the trader's order lane (so they stay under the order budget), and every
+# outcome is confirmed against the order's status afterwards.
+# Imports
+import datetime as dt
+import time
+from concurrent.futures import ThreadPoolExecutor
+from order_book import OPEN_STATUSES, MAX_LOOKBACK, format_time, order_symbols
+
+# Outcome of one action.
+ACCEPTED = 'accepted'        # Schwab took the request, status not checked (yet)
+CONFIRMED = 'confirmed'      # the order reached the status the action was after (CANCELED / REPLACED)
+FILLED = 'filled'            # the order filled before the cancel/replace got to it
+REJECTED = 'rejected'        # Schwab refused the request and the order is still open
+FAILED = 'failed'            # no answer, 5xx, or the order ended some other way
+UNCONFIRMED = 'unconfirmed'  # accepted but still open when confirm_timeout ran out
+SKIPPED = 'skipped'          # nothing sent e.g. repricing a market order
+OUTCOMES = (ACCEPTED, CONFIRMED, FILLED, REJECTED, FAILED, UNCONFIRMED, SKIPPED)
+
+CANCEL = 'cancel'
+REPLACE = 'replace'
+
+# Statuses that count as done for a cancel (the order can not trade any more).
+CANCEL_DONE = {'CANCELED', 'EXPIRED', 'REJECTED'}
+
+# What a replacement order is built from, everything else on an order is filled in by Schwab.
+ORDER_FIELDS = ('session', 'duration', 'orderType', 'complexOrderStrategyType', 'price', 'stopPrice',
+                'stopPriceLinkBasis', 'stopPriceLinkType', 'stopPriceOffset', 'stopType', 'priceLinkBasis',
+                'priceLinkType', 'taxLotMethod', 'specialInstruction', 'orderStrategyType', 'cancelTime')
+LEG_FIELDS = ('orderLegType', 'instruction', 'quantity', 'positionEffect', 'quantityType')
+
+# Order types repricing applies to.
+PRICED_TYPES = ('LIMIT', 'STOP_LIMIT')
+
+
+def round_price(value: float) -> float:
+    """
+    Round to the equity tick: cents from $1 up, hundredths of a cent below.
+    """
+    return round(value, 2) if value >= 1 else round(value, 4)
+
+
+def replacement_form(order: dict, price: float | None = None) -> dict:
+    """
+    Order form for change_order() built from an order as get_orders() returns it.
+    A partially filled single leg order is replaced for its remaining quantity.
+    :param order: The working order.
+    :type order: dict
+    :param price: New limit price, None keeps the current one.
+    :type price: float | None
+    :rtype: dict
+    """
+    form = {key: order[key] for key in ORDER_FIELDS if order.get(key) is not None}
+    legs = order.get('orderLegCollection') or ()
+    form['orderLegCollection'] = []
+    for leg in legs:
+        entry = {key: leg[key] for key in LEG_FIELDS if leg.get(key) is not None}
+        entry['instrument'] = {'symbol': leg['instrument']['symbol'], 'assetType': leg['instrument']['assetType']}
+        form['orderLegCollection'].append(entry)
+    remaining = order.get('remainingQuantity')
+    if len(legs) == 1 and order.get('filledQuantity') and remaining:
+        form['orderLegCollection'][0]['quantity'] = remaining
+    if price is not None:
+        form['price'] = price
+    return form
+
+
+class OrderAction:
+    """
+    One cancel or replace and what came of it. sent/answered/done are perf_counter() times.
+    """
+    __slots__ = ('kind', 'order', 'order_id', 'account', 'form', 'status_code', 'new_order_id', 'outcome', 'status',
+                 'error', 'sent', 'answered', 'done')
+
+    def __init__(self, kind: str, order: dict, form: dict | None = None):
+        self.kind = kind
+        self.order = order
+        self.order_id = order.get('orderId')
+        self.account = str(order.get('accountNumber'))
+        self.form = form
+        self.status_code = None
+        self.new_order_id = None
+        self.outcome = None
+        self.status = order.get('status')
+        self.error = None
+        self.sent = self.answered = self.done = None
+
+    def __repr__(self):
+        return f'OrderAction({self.kind}, order_id={self.order_id}, outcome={self.outcome}, status={self.status})'
+
+    def finish(self, outcome: str, when: float, error: str | None = None):
+        self.outcome = outcome
+        self.done = when
+        if error is not None:
+            self.error = error
+
+
+class BulkResult:
+    """
+    Every action of one bulk call, with the time it took until all of them were answered and until the
+    orders were flat (every action confirmed, filled or skipped).
+    """
+    def __init__(self, kind: str, actions: list[OrderAction], started: float):
+        self.kind = kind
+        self.actions = actions
+        self.started = started
+
+    def __repr__(self):
+        return f'BulkResult({self.kind}, {self.counts()}, flat_after={self.time_to_flat})'
+
+    def __len__(self):
+        return len(self.actions)
+
+    def __iter__(self):
+        return iter(self.actions)
+
+    def counts(self) -> dict[str, int]:
+        counts = {}
+        for action in self.actions:
+            counts[action.outcome] = counts.get(action.outcome, 0) + 1
+        return counts
+
+    @property
+    def ok(self) -> bool:
+        return all(action.outcome in (CONFIRMED, FILLED, SKIPPED) for action in self.actions)
+
+    @property
+    def time_to_answered(self) -> float:
+        """
+        Seconds until Schwab had answered every request.
+        """
+        answered = [action.answered for action in self.actions if action.answered is not None]
+        return max(answered) - self.started if answered else 0.0
+
+    @property
+    def time_to_flat(self) -> float | None:
+        """
+        Seconds until the last order was confirmed done, None if some were not.
+        """
+        if not self.ok:
+            return None
+        done = [action.done for action in self.actions if action.done is not None]
+        return max(done) - self.started if done else 0.0
+
+    def failures(self) -> list[OrderAction]:
+        return [action for action in self.actions if action.outcome in (REJECTED, FAILED, UNCONFIRMED)]
+
+    def summary(self) -> dict:
+        return {'kind': self.kind, 'orders': len(self.actions), **self.counts(),
+                'time_to_answered': self.time_to_answered, 'time_to_flat': self.time_to_flat}
+
+
+class OrderActions:
+    """
+    Bulk cancel/replace over the working orders of every account (or a book's account).
+
+        actions = OrderActions(trader)
+        result = actions.cancel_all(symbol='AAPL')           # or cancel_all() to pull everything
+        print(result.time_to_flat, result.failures())
+        actions.reprice(0.05, aggressive=True)               # buys up 5 cents, sells down 5 cents
+
+    Requests go through trader.delete_order()/change_order(), so the rate limiter puts them in the order lane
+    and the order budget sets how fast a large batch can go out.
+    """
+    def __init__(self, trader, book=None, max_workers: int = 16, confirm_timeout: float = 10.0,
+                 poll_interval: float = 0.25, lookback: dt.timedelta = MAX_LOOKBACK):
+        """
+        :param trader: Trader used for every request.
+        :type trader: Trader
+        :param book: OrderBook to take the working orders from and to confirm with, None asks get_all_orders().
+        :type book: OrderBook | None
+        :param max_workers: Requests in flight at once.
+        :type max_workers: int
+        :param confirm_timeout: Seconds to wait for the orders to reach their final status.
+        :type confirm_timeout: float
+        :param poll_interval: Seconds between status checks while confirming.
+        :type poll_interval: float
+        :param lookback: How far back get_all_orders() looks for working orders (GTC orders can be weeks old).
+        :type lookback: dt.timedelta
+        """
+        self.trader = trader
+        self.log = trader.log
+        self.book = book
+        self.max_workers = max_workers
+        self.confirm_timeout = confirm_timeout
+        self.poll_interval = poll_interval
+        self.lookback = min(lookback, MAX_LOOKBACK)
+        self.stats = {'cancels': 0, 'replaces': 0, 'failures': 0, 'snapshots': 0}
+
+# ---------- Working Orders ---------- #
+
+    def _snapshot(self) -> dict[int, dict]:
+        # Every order in the window by id, one request (or an OrderBook sync).
+        self.stats['snapshots'] += 1
+        if self.book is not None:
+            self.book.sync()
+            return {order['orderId']: order for order in self.book.orders()}
+        now = dt.datetime.now(dt.timezone.utc)
+        orders = self.trader.get_all_orders(format_time(now - self.lookback), format_time(now + dt.timedelta(minutes=1)))
+        return {order['orderId']: order for order in orders or ()}
+
+    def working(self, symbol: str | list[str] | None = None, account: str | int | None = None, where=None) -> list[dict]:
+        """
+        Orders that can still change, filtered.
+        :param symbol: Only orders with a leg on this symbol (or any of these symbols).
+        :type symbol: str | list[str] | None
+        :param account: Only orders of this account number.
+        :type account: str | int | None
+        :param where: Extra filter, where(order) -> bool.
+        :rtype: list[dict]
+        """
+        symbols = {symbol} if isinstance(symbol, str) else set(symbol) if symbol is not None else None
+        orders = []
+        for order in self._snapshot().values():
+            if order.get('status') not in OPEN_STATUSES:
+                continue
+            if account is not None and str(order.get('accountNumber')) != str(account):
+                continue
+            if symbols is not None and not symbols & order_symbols(order):
+                continue
+            if where is not None and not where(order):
+                continue
+            orders.append(order)
+        return orders
+
+# ---------- Bulk Actions ---------- #
+
+    def cancel_all(self, symbol: str | list[str] | None = None, account: str | int | None = None, where=None,
+                   confirm: bool = True) -> BulkResult:
+        """
+        Cancel every working order matching the filters (all of them when there are none).
+        :param confirm: Wait until the orders show CANCELED (or FILLED).
+        :type confirm: bool
+        :rtype: BulkResult
+        """
+        return self.cancel(self.working(symbol, account, where), confirm)
+
+    def reprice(self, offset: float, symbol: str | list[str] | None = None, account: str | int | None = None,
+                where=None, percent: bool = False, aggressive: bool = False, confirm: bool = True) -> BulkResult:
+        """
+        Replace every working limit order matching the filters at its price moved by offset.
+        Market, stop and multi order (OCO/TRIGGER) strategies are skipped.
+        :param offset: Dollars to add to the price, or a fraction of it with percent=True.
+        :type offset: float
+        :param percent: offset is a fraction of the price (0.01 = 1%).
+        :type percent: bool
+        :param aggressive: Move buys up and sells down by offset (toward the market) instead of all of them up.
+        :type aggressive: bool
+        :param confirm: Wait until the orders show REPLACED (or FILLED).
+        :type confirm: bool
+        :rtype: BulkResult
+        """
+        replacements = []
+        for order in self.working(symbol, account, where):
+            price = order.get('price')
+            if order.get('orderType') not in PRICED_TYPES or price is None or order.get('childOrderStrategies'):
+                replacements.append((order, None))
+                continue
+            move = price * offset if percent else offset
+            if aggressive and str(order['orderLegCollection'][0].get('instruction', '')).startswith('SELL'):
+                move = -move
+            replacements.append((order, replacement_form(order, round_price(price + move))))
+        return self.replace(replacements, confirm)
+
+    def cancel(self, orders: list[dict], confirm: bool = True) -> BulkResult:
+        """
+        Cancel these orders concurrently.
+        :param orders: Orders as get_orders() returns them (orderId and accountNumber are used).
+        :type orders: list[dict]
+        :rtype: BulkResult
+        """
+        self.stats['cancels'] += len(orders)
+        return self._run(CANCEL, [OrderAction(CANCEL, order) for order in orders], confirm)
+
+    def replace(self, replacements: list[tuple[dict, dict | None]], confirm: bool = True) -> BulkResult:
+        """
+        Replace orders concurrently.
+        :param replacements: (order, new order form) pairs, a None form skips the order.
+        :type replacements: list[tuple[dict, dict | None]]
+        :rtype: BulkResult
+        """
+        self.stats['replaces'] += len(replacements)
+        return self._run(REPLACE, [OrderAction(REPLACE, order, form) for order, form in replacements], confirm)
+
+    def _run(self, kind: str, actions: list[OrderAction], confirm: bool) -> BulkResult:
+        started = time.perf_counter()
+        for action in actions:
+            if action.kind == REPLACE and action.form is None:
+                action.finish(SKIPPED, started)
+        todo = [action for action in actions if action.outcome is None]
+        if todo:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(todo))) as pool:
+                list(pool.map(self._send, todo))
+        result = BulkResult(kind, actions, started)
+        if confirm:
+            self._confirm([action for action in todo if action.outcome in (ACCEPTED, REJECTED)])
+        failures = result.failures()
+        if failures:
+            self.stats['failures'] += len(failures)
+            self.log.error(f"{kind} left {len(failures)} of {len(actions)} orders not done: {failures[:5]}")
+        return result
+
+    def _send(self, action: OrderAction):
+        action.sent = time.perf_counter()
+        try:
+            account_hash = self.trader.account_hash(action.account)
+            if action.kind == CANCEL:
+                response = self.trader.delete_order(account_hash, action.order_id)
+            else:
+                response = self.trader.change_order(account_hash, action.order_id, action.form)
+        except Exception as exc:
+            action.answered = time.perf_counter()
+            action.finish(FAILED, action.answered, repr(exc))
+            return
+        action.answered = time.perf_counter()
+        action.status_code = response.status_code
+        if response.status_code in (200, 201):
+            location = response.headers.get('Location') or ''
+            if action.kind == REPLACE and location:
+                new_id = location.rstrip('/').rsplit('/', 1)[-1]
+                action.new_order_id = int(new_id) if new_id.isdigit() else new_id
+            action.outcome = ACCEPTED
+        elif 400 <= response.status_code < 500:
+            # Usually the order just filled or was already cancelled, _confirm() sorts that out.
+            action.outcome = REJECTED
+            action.error = f'{response.status_code} {response.content[:200]!r}'
+        else:
+            action.finish(FAILED, action.answered, f'{response.status_code} {response.content[:200]!r}')
+
+    def _confirm(self, actions: list[OrderAction]):
+        """
+        Poll the order statuses until every accepted action shows its result or confirm_timeout runs out.
+        Rejected actions are checked once: an order that had already filled or been cancelled is done as well.
+        """
+        pending = {action.order_id: action for action in actions}
+        deadline = time.monotonic() + self.confirm_timeout
+        while pending:
+            try:
+                snapshot = self._snapshot()
+            except Exception as exc:
+                self.log.error(f"Confirming {len(pending)} orders failed: {exc!r}")
+                snapshot = {}
+            now = time.perf_counter()
+            for order_id, action in list(pending.items()):
+                order = snapshot.get(order_id)
+                status = order.get('status') if order is not None else None
+                if status is not None:
+                    action.status = status
+                done = CANCEL_DONE if action.kind == CANCEL else {'REPLACED'}
+                if status in done:
+                    action.finish(CONFIRMED, now)
+                elif status == 'FILLED':
+                    action.finish(FILLED, now)
+                elif status is not None and status not in OPEN_STATUSES:
+                    action.finish(FAILED, now, f'order ended {status}')
+                elif action.outcome == REJECTED:
+                    action.done = now
+                else:
+                    continue
+                del pending[order_id]
+            if not pending or time.monotonic() >= deadline:
+                break
+            time.sleep(self.poll_interval)
+        for action in pending.values():
+            action.outcome = UNCONFIRMED
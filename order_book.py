@@ -0,0 +1,298 @@
+# order_book.py keeps a local, indexed copy of the account's orders so strategy code can ask
+# "what is WORKING on AAPL" without a round trip, and get told when something fills or gets cancelled.
+# Syncs are incremental: only orders entered since the oldest one still open (or since the last sync) are fetched.
+# Imports
+import datetime as dt
+import threading
+
+# Statuses an order can still change from. Anything else (FILLED, CANCELED, REJECTED, EXPIRED, REPLACED) is final.
+OPEN_STATUSES = {'AWAITING_PARENT_ORDER', 'AWAITING_CONDITION', 'AWAITING_STOP_CONDITION', 'AWAITING_MANUAL_REVIEW',
+                 'ACCEPTED', 'AWAITING_UR_OUT', 'PENDING_ACTIVATION', 'QUEUED', 'WORKING', 'PENDING_CANCEL',
+                 'PENDING_REPLACE', 'NEW', 'AWAITING_RELEASE_TIME', 'PENDING_ACKNOWLEDGEMENT', 'PENDING_RECALL'}
+
+# Events passed to the callbacks registered with OrderBook.on().
+EVENT_NEW = 'new'          # first time the order is seen
+EVENT_FILL = 'fill'        # filledQuantity went up (partial or complete)
+EVENT_CANCEL = 'cancel'    # status turned CANCELED
+EVENT_STATUS = 'status'    # any status change, fired along with the ones above
+EVENTS = (EVENT_NEW, EVENT_FILL, EVENT_CANCEL, EVENT_STATUS)
+
+# Schwab only serves orders entered within the last 60 days.
+MAX_LOOKBACK = dt.timedelta(days=60)
+
+
+def parse_time(value: str) -> dt.datetime:
+    """
+    Parse the enteredTime/closeTime Schwab puts on orders e.g. 2024-01-02T15:04:05+0000.
+    """
+    return dt.datetime.fromisoformat(value)
+
+
+def format_time(value: dt.datetime) -> str:
+    """
+    Format for fromEnteredTime/toEnteredTime, yyyy-MM-dd'T'HH:mm:ss.SSSZ in UTC.
+    """
+    value = value.astimezone(dt.timezone.utc)
+    return value.strftime('%Y-%m-%dT%H:%M:%S.') + f'{value.microsecond // 1000:03d}Z'
+
+
+def order_symbols(order: dict) -> set[str]:
+    """
+    Every instrument symbol in an order, child orders (OCO/TRIGGER) included.
+    """
+    symbols = {leg['instrument']['symbol'] for leg in order.get('orderLegCollection') or ()
+               if leg.get('instrument', {}).get('symbol')}
+    for child in order.get('childOrderStrategies') or ():
+        symbols |= order_symbols(child)
+    return symbols
+
+
+class OrderBook:
+    """
+    Orders keyed by orderId, indexed by status, symbol and (status, symbol).
+
+        book = OrderBook(trader).start()
+        book.on(EVENT_FILL, lambda event, order, previous: print(order['orderId'], order['filledQuantity']))
+        book.orders(status='WORKING', symbol='AAPL')    # no network call
+
+    The background thread polls fast (min_interval) while orders are changing and backs off to max_interval
+    when nothing moves. attach_streamer() makes account activity messages trigger a sync right away.
+    """
+    def __init__(self, trader, account_hash: str | None = None, min_interval: float = 1.0,
+                 max_interval: float = 30.0, overlap: float = 5.0, lookback: dt.timedelta = dt.timedelta(days=1),
+                 max_results: int = 3000):
+        """
+        :param trader: Trader used for get_orders/get_all_orders.
+        :type trader: Trader
+        :param account_hash: Only track this account (get_orders), None tracks every account (get_all_orders).
+        :type account_hash: str | None
+        :param min_interval: Seconds between polls while orders are changing.
+        :type min_interval: float
+        :param max_interval: Longest wait between polls when nothing changes.
+        :type max_interval: float
+        :param overlap: Seconds each sync window reaches back past the previous one, covers clock skew.
+        :type overlap: float
+        :param lookback: How far back the first sync goes (capped at 60 days).
+        :type lookback: dt.timedelta
+        :param max_results: maxResults sent with every sync.
+        :type max_results: int
+        """
+        self.trader = trader
+        self.log = trader.log
+        self.account_hash = account_hash
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.overlap = dt.timedelta(seconds=overlap)
+        self.lookback = min(lookback, MAX_LOOKBACK)
+        self.max_results = max_results
+        self.interval = min_interval
+        self.last_sync: dt.datetime | None = None
+        self.stats = {'syncs': 0, 'failures': 0, 'fetched': 0, 'changed': 0, 'pokes': 0}
+        self._orders: dict[int, dict] = {}
+        self._by_status: dict[str, dict[int, dict]] = {}
+        self._by_symbol: dict[str, dict[int, dict]] = {}
+        self._by_status_symbol: dict[tuple[str, str], dict[int, dict]] = {}
+        self._callbacks: dict[str, list] = {}
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = None
+
+    def __len__(self):
+        return len(self._orders)
+
+    def __contains__(self, order_id: int):
+        return order_id in self._orders
+
+# ---------- Queries ---------- #
+
+    def get(self, order_id: int) -> dict | None:
+        return self._orders.get(order_id)
+
+    def orders(self, status: str | None = None, symbol: str | None = None) -> list[dict]:
+        """
+        Orders matching status and/or symbol, straight from the index.
+        :param status: e.g. WORKING, FILLED.
+        :type status: str | None
+        :param symbol: e.g. AAPL.
+        :type symbol: str | None
+        :rtype: list[dict]
+        """
+        with self._lock:
+            if status is not None and symbol is not None:
+                bucket = self._by_status_symbol.get((status, symbol))
+            elif status is not None:
+                bucket = self._by_status.get(status)
+            elif symbol is not None:
+                bucket = self._by_symbol.get(symbol)
+            else:
+                bucket = self._orders
+            return list(bucket.values()) if bucket else []
+
+    def open_orders(self, symbol: str | None = None) -> list[dict]:
+        """
+        Every order that can still change (OPEN_STATUSES).
+        """
+        with self._lock:
+            return [order for status in OPEN_STATUSES for order in self.orders(status, symbol)]
+
+# ---------- Events ---------- #
+
+    def on(self, event: str, callback):
+        """
+        Call callback(event, order, previous) for EVENT_NEW, EVENT_FILL, EVENT_CANCEL or EVENT_STATUS.
+        previous is the last version of the order seen (None for new orders).
+        """
+        if event not in EVENTS:
+            raise ValueError(f"Unknown event {event!r}, expected one of {EVENTS}.")
+        self._callbacks.setdefault(event, []).append(callback)
+
+    def _emit(self, events: list[tuple[str, dict, dict | None]]):
+        for event, order, previous in events:
+            for callback in self._callbacks.get(event, ()):
+                try:
+                    callback(event, order, previous)
+                except Exception as exc:
+                    self.log.error(f"OrderBook callback {callback!r} failed: {exc!r}")
+
+# ---------- Sync ---------- #
+
+    def _index(self, order: dict, add: bool):
+        order_id = order['orderId']
+        status = order.get('status')
+        buckets = [self._by_status.setdefault(status, {})]
+        for symbol in order_symbols(order):
+            buckets.append(self._by_symbol.setdefault(symbol, {}))
+            buckets.append(self._by_status_symbol.setdefault((status, symbol), {}))
+        for bucket in buckets:
+            if add:
+                bucket[order_id] = order
+            else:
+                bucket.pop(order_id, None)
+
+    def apply(self, orders: list[dict]) -> int:
+        """
+        Merge orders (as returned by get_orders/get_all_orders) into the book and fire the events.
+        :return: Number of new or changed orders.
+        :rtype: int
+        """
+        events = []
+        changed = 0
+        with self._lock:
+            for order in orders:
+                order_id = order.get('orderId')
+                if order_id is None:
+                    continue
+                previous = self._orders.get(order_id)
+                if previous is not None and previous == order:
+                    continue
+                if previous is not None:
+                    self._index(previous, add=False)
+                self._orders[order_id] = order
+                self._index(order, add=True)
+                changed += 1
+
+                if previous is None:
+                    events.append((EVENT_NEW, order, None))
+                    if order.get('filledQuantity'):
+                        events.append((EVENT_FILL, order, None))
+                else:
+                    if (order.get('filledQuantity') or 0) > (previous.get('filledQuantity') or 0):
+                        events.append((EVENT_FILL, order, previous))
+                    if order.get('status') != previous.get('status'):
+                        events.append((EVENT_STATUS, order, previous))
+                        if order.get('status') == 'CANCELED':
+                            events.append((EVENT_CANCEL, order, previous))
+        self._emit(events)
+        return changed
+
+    def _window_start(self, now: dt.datetime) -> dt.datetime:
+        # Open orders can still change, so the window has to reach back to the oldest of them.
+        start = self.last_sync - self.overlap if self.last_sync is not None else now - self.lookback
+        for order in self.open_orders():
+            try:
+                start = min(start, parse_time(order['enteredTime']))
+            except (KeyError, ValueError):
+                continue
+        return max(start, now - MAX_LOOKBACK)
+
+    def sync(self) -> int:
+        """
+        Fetch the orders entered since the window start and merge them in.
+        :return: Number of new or changed orders, -1 if the request failed.
+        :rtype: int
+        """
+        now = dt.datetime.now(dt.timezone.utc)
+        start, end = format_time(self._window_start(now)), format_time(now + dt.timedelta(minutes=1))
+        if self.account_hash is not None:
+            orders = self.trader.get_orders(self.account_hash, start, end, maxResults=self.max_results)
+        else:
+            orders = self.trader.get_all_orders(start, end, maxResults=self.max_results)
+        self.stats['syncs'] += 1
+        if orders is None:
+            self.stats['failures'] += 1
+            return -1
+        if len(orders) >= self.max_results:
+            self.log.error(f"OrderBook sync got {len(orders)} orders (maxResults), older ones may be missing.")
+        changed = self.apply(orders)
+        self.last_sync = now
+        self.stats['fetched'] += len(orders)
+        self.stats['changed'] += changed
+        return changed
+
+    def _next_interval(self, changed: int) -> float:
+        if changed:
+            return self.min_interval
+        if not any(self._by_status.get(status) for status in OPEN_STATUSES):
+            return self.max_interval
+        return min(self.max_interval, self.interval * 2)
+
+# ---------- Background ---------- #
+
+    def start(self):
+        """
+        Sync on a background thread, adaptively spaced between min_interval and max_interval.
+        """
+        if self._thread is None:
+            self._closed = False
+            self._thread = threading.Thread(target=self._run, name='order-book', daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+            self._thread = None
+
+    def poke(self):
+        """
+        Sync now instead of waiting for the next poll (e.g. something happened on the account).
+        """
+        self.stats['pokes'] += 1
+        self._wake.set()
+
+    def attach_streamer(self, streamer, key: str = 'Account Activity'):
+        """
+        Sync whenever the streamer's ACCT_ACTIVITY channel reports something on the account.
+        :param streamer: streamer.Streamer, started or not.
+        :param key: Subscription key for the ACCT_ACTIVITY service.
+        :type key: str
+        """
+        from streamer import ACCT_ACTIVITY
+        streamer.on(ACCT_ACTIVITY, lambda service, key, content: self.poke())
+        streamer.subscribe(ACCT_ACTIVITY, key)
+
+    def _run(self):
+        while not self._closed:
+            try:
+                changed = self.sync()
+            except Exception as exc:
+                self.stats['failures'] += 1
+                self.log.error(f"OrderBook sync failed: {exc!r}")
+                changed = -1
+            # A failed sync backs off like an idle one.
+            self.interval = min(self.max_interval, self.interval * 2) if changed < 0 else self._next_interval(changed)
+            self._wake.wait(self.interval)
+            self._wake.clear()
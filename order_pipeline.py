@@ -0,0 +1,364 @@
+# order_pipeline.py gets orders on the wire with as little work as possible between the signal and the send.
+# Order forms are compiled once into pre-encoded JSON chunks, submitting only patches price/quantity bytes in
+# and posts them over a connection reserved for order traffic. Every submission records when it hit each stage.
+# Imports
+import collections
+import itertools
+import json
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from trader import JSON_HEADERS
+
+# Values accepted by the Schwab order schema, see docs/orderform.md.
+ORDER_TYPES = {'MARKET', 'LIMIT', 'STOP', 'STOP_LIMIT', 'TRAILING_STOP', 'TRAILING_STOP_LIMIT', 'MARKET_ON_CLOSE',
+               'LIMIT_ON_CLOSE'}
+SESSIONS = {'NORMAL', 'AM', 'PM', 'EXTENDED', 'SEAMLESS'}
+DURATIONS = {'DAY', 'GOOD_TILL_CANCEL', 'FILL_OR_KILL', 'IMMEDIATE_OR_CANCEL', 'GOOD_TILL_DATE'}
+STRATEGY_TYPES = {'SINGLE', 'OCO', 'TRIGGER'}
+INSTRUCTIONS = {'BUY', 'SELL', 'SELL_SHORT', 'BUY_TO_COVER', 'BUY_TO_OPEN', 'BUY_TO_CLOSE', 'SELL_TO_OPEN',
+                'SELL_TO_CLOSE'}
+ASSET_TYPES = {'EQUITY', 'OPTION', 'MUTUAL_FUND', 'FIXED_INCOME', 'CASH_EQUIVALENT', 'INDEX', 'CURRENCY',
+               'COLLECTIVE_INVESTMENT'}
+
+# Price fields that take a slot, and the order types that need each of them.
+PRICE_FIELDS = {'price': {'LIMIT', 'STOP_LIMIT', 'LIMIT_ON_CLOSE'}, 'stopPrice': {'STOP', 'STOP_LIMIT'}}
+
+
+class Slot:
+    """
+    Placeholder for a value patched in at submit time, e.g. Slot('price') or Slot('quantity', 'int').
+    """
+    __slots__ = ('name', 'kind')
+
+    def __init__(self, name: str, kind: str = 'price'):
+        self.name = name
+        self.kind = kind
+
+    def __repr__(self):
+        return f'Slot({self.name!r}, {self.kind!r})'
+
+
+def format_price(value: float) -> bytes:
+    # Schwab takes prices as strings, 2 decimals at/above $1 and 4 below (sub-penny quoting).
+    if not value > 0:
+        raise ValueError(f"Price must be positive, got {value!r}.")
+    return (b'"%.2f"' if value >= 1 else b'"%.4f"') % value
+
+
+def format_quantity(value: int) -> bytes:
+    if value != int(value) or value <= 0:
+        raise ValueError(f"Quantity must be a positive whole number, got {value!r}.")
+    return b'%d' % value
+
+
+FORMATTERS = {'price': format_price, 'int': format_quantity}
+
+
+def validate_order(order: dict, path: str = 'order'):
+    """
+    Check an order form against the schema rules in docs/orderform.md, raises ValueError on the first problem.
+    Slots count as valid values, their content is checked by the formatters at submit time.
+    """
+    strategy = order.get('orderStrategyType')
+    if strategy not in STRATEGY_TYPES:
+        raise ValueError(f"{path}: orderStrategyType {strategy!r} not one of {sorted(STRATEGY_TYPES)}.")
+    children = order.get('childOrderStrategies') or []
+    if strategy == 'OCO':
+        if len(children) != 2:
+            raise ValueError(f"{path}: OCO orders need exactly 2 childOrderStrategies.")
+    else:
+        for key, allowed in (('orderType', ORDER_TYPES), ('session', SESSIONS), ('duration', DURATIONS)):
+            if order.get(key) not in allowed:
+                raise ValueError(f"{path}: {key} {order.get(key)!r} not one of {sorted(allowed)}.")
+        for field, order_types in PRICE_FIELDS.items():
+            if order['orderType'] in order_types and field not in order:
+                raise ValueError(f"{path}: {order['orderType']} orders need a {field}.")
+        legs = order.get('orderLegCollection') or []
+        if not legs:
+            raise ValueError(f"{path}: orderLegCollection is empty.")
+        for i, leg in enumerate(legs):
+            instrument = leg.get('instrument') or {}
+            if leg.get('instruction') not in INSTRUCTIONS:
+                raise ValueError(f"{path}.orderLegCollection[{i}]: instruction {leg.get('instruction')!r} "
+                                 f"not one of {sorted(INSTRUCTIONS)}.")
+            if instrument.get('assetType') not in ASSET_TYPES or not instrument.get('symbol'):
+                raise ValueError(f"{path}.orderLegCollection[{i}]: instrument needs a symbol and an assetType.")
+            if 'quantity' not in leg:
+                raise ValueError(f"{path}.orderLegCollection[{i}]: quantity missing.")
+        if strategy == 'TRIGGER' and not children:
+            raise ValueError(f"{path}: TRIGGER orders need childOrderStrategies.")
+    for i, child in enumerate(children):
+        validate_order(child, f'{path}.childOrderStrategies[{i}]')
+
+
+class OrderTemplate:
+    """
+    An order form compiled to JSON once. The Slots in it become gaps in the encoded bytes and render()
+    fills them, so submitting costs a join of a few byte strings instead of building and dumping a dict.
+
+        template = OrderTemplate(limit_form('AAPL', 'BUY'))
+        body = template.render(price=187.5, quantity=10)
+    """
+    def __init__(self, order: dict, name: str | None = None):
+        """
+        :param order: Order form with Slot placeholders, validated here (ValueError if it is not a valid order).
+        :type order: dict
+        :param name: Label used in submission records, defaults to orderType/orderStrategyType.
+        :type name: str | None
+        """
+        validate_order(order)
+        self.name = name or order.get('orderType') or order['orderStrategyType']
+        markers = {}
+        counter = itertools.count()
+
+        def encode(value):
+            # json.dumps hands us anything it can't encode, Slots become unique marker strings to split on.
+            if not isinstance(value, Slot):
+                raise TypeError(f"{type(value).__name__} is not JSON serializable")
+            marker = f'@@slot{next(counter)}@@'
+            markers[f'"{marker}"'] = value
+            return marker
+
+        encoded = json.dumps(order, default=encode, separators=(',', ':'))
+        self._chunks: list[bytes] = []
+        self._slots: list[Slot] = []
+        for marker, slot in markers.items():
+            head, encoded = encoded.split(marker, 1)
+            self._chunks.append(head.encode())
+            self._slots.append(slot)
+        self._chunks.append(encoded.encode())
+        self.slot_names = tuple(dict.fromkeys(slot.name for slot in self._slots))
+
+    def __repr__(self):
+        return f'OrderTemplate({self.name!r}, slots={self.slot_names})'
+
+    def render(self, **values) -> bytes:
+        """
+        :param values: One value per slot name e.g. price=187.5, quantity=10.
+        :return: The request body.
+        :rtype: bytes
+        """
+        formatted = {}
+        for slot in self._slots:
+            if slot.name not in formatted:
+                if slot.name not in values:
+                    raise ValueError(f"{self.name}: missing value for {slot.name!r}.")
+                formatted[slot.name] = FORMATTERS[slot.kind](values[slot.name])
+        chunks = self._chunks
+        parts = [chunks[0]]
+        for slot, chunk in zip(self._slots, chunks[1:]):
+            parts.append(formatted[slot.name])
+            parts.append(chunk)
+        return b''.join(parts)
+
+
+# ---------- Order Forms ---------- #
+# Builders for the usual order forms, fields left as Slots are filled in at submit time.
+
+def _single(symbol: str, instruction: str, order_type: str, asset_type: str, duration: str, session: str,
+            quantity=Slot('quantity', 'int'), **prices) -> dict:
+    return {'orderType': order_type, 'session': session, 'duration': duration, **prices,
+            'orderStrategyType': 'SINGLE',
+            'orderLegCollection': [{'instruction': instruction, 'quantity': quantity,
+                                    'instrument': {'symbol': symbol, 'assetType': asset_type}}]}
+
+
+def market_form(symbol: str, instruction: str = 'BUY', asset_type: str = 'EQUITY', duration: str = 'DAY',
+                session: str = 'NORMAL') -> dict:
+    """
+    Market order, slots: quantity.
+    """
+    return _single(symbol, instruction, 'MARKET', asset_type, duration, session)
+
+
+def limit_form(symbol: str, instruction: str = 'BUY', asset_type: str = 'EQUITY', duration: str = 'DAY',
+               session: str = 'NORMAL') -> dict:
+    """
+    Limit order, slots: price, quantity.
+    """
+    return _single(symbol, instruction, 'LIMIT', asset_type, duration, session, price=Slot('price'))
+
+
+def stop_form(symbol: str, instruction: str = 'SELL', asset_type: str = 'EQUITY', duration: str = 'DAY',
+              session: str = 'NORMAL') -> dict:
+    """
+    Stop (market) order, slots: stop_price, quantity.
+    """
+    return _single(symbol, instruction, 'STOP', asset_type, duration, session, stopPrice=Slot('stop_price'))
+
+
+def oco_form(symbol: str, instruction: str = 'SELL', asset_type: str = 'EQUITY', duration: str = 'GOOD_TILL_CANCEL',
+             session: str = 'NORMAL') -> dict:
+    """
+    One-cancels-other exit: a limit (take profit) and a stop (stop loss) for the same quantity.
+    Slots: take_profit, stop_loss, quantity.
+    """
+    return {'orderStrategyType': 'OCO', 'childOrderStrategies': [
+        _single(symbol, instruction, 'LIMIT', asset_type, duration, session, price=Slot('take_profit')),
+        _single(symbol, instruction, 'STOP', asset_type, duration, session, stopPrice=Slot('stop_loss'))]}
+
+
+def bracket_form(symbol: str, instruction: str = 'BUY', exit_instruction: str = 'SELL', asset_type: str = 'EQUITY',
+                 duration: str = 'DAY', exit_duration: str = 'GOOD_TILL_CANCEL', session: str = 'NORMAL') -> dict:
+    """
+    Limit entry that triggers an OCO exit once filled. Slots: price, take_profit, stop_loss, quantity.
+    """
+    entry = _single(symbol, instruction, 'LIMIT', asset_type, duration, session, price=Slot('price'))
+    entry['orderStrategyType'] = 'TRIGGER'
+    entry['childOrderStrategies'] = [oco_form(symbol, exit_instruction, asset_type, exit_duration, session)]
+    return entry
+
+
+class OrderSubmission:
+    """
+    One submitted order and the perf_counter() time it reached each stage:
+    signal (decision made), rendered (body ready), acquired (rate limiter let it through), response (answer read).
+    """
+    __slots__ = ('template', 'values', 'status_code', 'order_id', 'stages', 'response')
+
+    def __init__(self, template: str, values: dict, stages: dict):
+        self.template = template
+        self.values = values
+        self.stages = stages
+        self.status_code = None
+        self.order_id = None
+        self.response = None
+
+    def __repr__(self):
+        return f'OrderSubmission({self.template!r}, status={self.status_code}, order_id={self.order_id})'
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code in (200, 201)
+
+    def durations(self) -> dict[str, float]:
+        """
+        Seconds spent between consecutive stages, keyed by the stage that ended it, plus 'total'.
+        """
+        stages = list(self.stages.items())
+        durations = {name: end - start for (_, start), (name, end) in zip(stages, stages[1:])}
+        durations['total'] = stages[-1][1] - stages[0][1]
+        return durations
+
+
+class OrderPipeline:
+    """
+    Submits pre-compiled orders for one account over a connection reserved for orders, so an order never
+    waits behind a market data download or pays for a TLS handshake.
+
+        pipeline = OrderPipeline(trader, account_hash)
+        pipeline.add('aapl_buy', OrderTemplate(limit_form('AAPL', 'BUY')))
+        submission = pipeline.submit('aapl_buy', price=187.5, quantity=10)
+    """
+    def __init__(self, trader, account_hash: str | int | None = None, keep_warm: float | None = 30.0,
+                 history: int = 1000):
+        """
+        :param trader: Trader used for auth, the rate limiter and 401/429 handling.
+        :type trader: Trader
+        :param account_hash: hashed (or plain) account number, None is the first account. Resolved once here,
+                             trades will be executed on this Account!
+        :type account_hash: str | int | None
+        :param keep_warm: Seconds between keep-alive pings on the order connection, None to disable.
+        :type keep_warm: float | None
+        :param history: Number of OrderSubmission records kept for latency_report().
+        :type history: int
+        """
+        self.trader = trader
+        self.account_hash = trader.account_hash(account_hash)
+        self.path = f'/trader/v1/accounts/{self.account_hash}/orders'
+        self.templates: dict[str, OrderTemplate] = {}
+        self.submissions = collections.deque(maxlen=history)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if getattr(trader, 'metrics', None) is not None:
+            trader.metrics.instrument_session(self.session)
+        self.keep_warm = keep_warm
+        self._closed = threading.Event()
+        self._thread = None
+        self.warm()
+        if keep_warm:
+            self._thread = threading.Thread(target=self._keep_warm, name='order-pipeline-warm', daemon=True)
+            self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._closed.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        self.session.close()
+
+    def warm(self):
+        """
+        Open (or keep open) the order connection. A HEAD on the base url is enough for TCP+TLS, it does not
+        count against the order quota.
+        """
+        try:
+            self.session.head(self.trader.tokens.base_url, timeout=self.trader.timeout)
+        except requests.RequestException as exc:
+            self.trader.log.error(f"Order connection warm up failed: {exc!r}")
+
+    def _keep_warm(self):
+        while not self._closed.wait(self.keep_warm):
+            self.warm()
+
+    def add(self, name: str, template: OrderTemplate | dict) -> OrderTemplate:
+        """
+        Register a template (an order form dict is compiled, and validated, here).
+        """
+        if isinstance(template, dict):
+            template = OrderTemplate(template, name)
+        self.templates[name] = template
+        return template
+
+    def submit(self, name: str, signal_time: float | None = None, **values) -> OrderSubmission:
+        """
+        Render the template and post it.
+        :param name: Template name given to add().
+        :type name: str
+        :param signal_time: time.perf_counter() when the decision was made, defaults to now.
+        :type signal_time: float | None
+        :param values: Slot values e.g. price=187.5, quantity=10.
+        :return: Record with the status code, the new order id (from the Location header) and stage timestamps.
+        :rtype: OrderSubmission
+        """
+        stages = {'signal': signal_time if signal_time is not None else time.perf_counter()}
+        body = self.templates[name].render(**values)
+        stages['rendered'] = time.perf_counter()
+        submission = OrderSubmission(name, values, stages)
+        response = self.trader._request('POST', self.path, data=body, headers=JSON_HEADERS,
+                                        client=self.session, stages=stages)
+        stages['response'] = time.perf_counter()
+        submission.response = response
+        submission.status_code = response.status_code
+        location = response.headers.get('Location')
+        if location:
+            submission.order_id = location.rstrip('/').rsplit('/', 1)[-1]
+        if not submission.ok:
+            self.trader.log.error(f"Order {name} {values} rejected: {response.status_code} {response.text}")
+        self.submissions.append(submission)
+        return submission
+
+    def latency_report(self) -> dict[str, dict[str, float]]:
+        """
+        p50/p99/max seconds per stage over the kept submissions.
+        :rtype: dict[str, dict[str, float]]
+        """
+        by_stage = collections.defaultdict(list)
+        for submission in self.submissions:
+            for stage, seconds in submission.durations().items():
+                by_stage[stage].append(seconds)
+        report = {}
+        for stage, values in by_stage.items():
+            values.sort()
+            report[stage] = {'p50': values[len(values) // 2], 'p99': values[min(len(values) - 1, int(len(values) * 0.99))],
+                             'max': values[-1]}
+        return report
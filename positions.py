@@ -0,0 +1,342 @@
+# positions.py keeps a live copy of the account's positions, balances and P&L in memory.
+# It is loaded once from get_account_accountNumber(fields="positions") and then moved by fills and quotes,
+# so risk checks before an order are a dictionary lookup instead of a round trip and a walk of the snapshot.
+# Imports
+import threading
+import time
+
+# Instructions that add to a position, everything else (SELL, SELL_SHORT, SELL_TO_OPEN...) takes away.
+BUY_INSTRUCTIONS = {'BUY', 'BUY_TO_OPEN', 'BUY_TO_CLOSE', 'BUY_TO_COVER'}
+
+# Contract multiplier per asset type, anything not listed trades 1:1.
+MULTIPLIERS = {'OPTION': 100.0}
+
+
+class Position:
+    """
+    One instrument. quantity is signed (short < 0), average_price is per share/contract
+    (not multiplied), realized_pnl is what closed trades made since the engine was loaded.
+    """
+    __slots__ = ('symbol', 'asset_type', 'quantity', 'average_price', 'multiplier', 'last_price', 'realized_pnl')
+
+    def __init__(self, symbol: str, asset_type: str = 'EQUITY', quantity: float = 0.0, average_price: float = 0.0,
+                 last_price: float | None = None, realized_pnl: float = 0.0):
+        self.symbol = symbol
+        self.asset_type = asset_type
+        self.quantity = quantity
+        self.average_price = average_price
+        self.multiplier = MULTIPLIERS.get(asset_type, 1.0)
+        self.last_price = average_price if last_price is None else last_price
+        self.realized_pnl = realized_pnl
+
+    def __repr__(self):
+        return f'Position({self.symbol!r}, {self.quantity:g} @ {self.average_price:.4f}, last {self.last_price:.4f})'
+
+    @property
+    def market_value(self) -> float:
+        return self.quantity * self.last_price * self.multiplier
+
+    @property
+    def unrealized_pnl(self) -> float:
+        return (self.last_price - self.average_price) * self.quantity * self.multiplier
+
+    def fill(self, quantity: float, price: float) -> float:
+        """
+        Apply a fill (quantity > 0 buys, < 0 sells).
+        :return: P&L realized by the part of the fill that closed existing quantity.
+        :rtype: float
+        """
+        held = self.quantity
+        realized = 0.0
+        if held == 0 or (held > 0) == (quantity > 0):
+            total = abs(held) + abs(quantity)
+            self.average_price = (self.average_price * abs(held) + price * abs(quantity)) / total
+        else:
+            closed = min(abs(quantity), abs(held))
+            realized = closed * (price - self.average_price) * (1 if held > 0 else -1) * self.multiplier
+            if abs(quantity) > abs(held):
+                self.average_price = price  # flipped, what is left was opened at this price
+        self.quantity = held + quantity
+        if self.quantity == 0:
+            self.average_price = 0.0
+        self.realized_pnl += realized
+        return realized
+
+
+class PositionEngine:
+    """
+    Positions, cash/buying power and P&L for one account, moved event by event (each one O(1)) and checked
+    against Schwab every reconcile_interval seconds.
+
+        engine = PositionEngine(trader).start()
+        engine.attach_order_book(book)        # fills
+        engine.attach_streamer(streamer)      # LEVELONE_EQUITIES last prices
+        ok, reason = engine.check_order('AAPL', 'BUY', 10, 187.5)
+    """
+    def __init__(self, trader, reconcile_interval: float | None = 60.0, allow_short: bool = False,
+                 max_position_value: float | None = None, account: str | int | None = None):
+        """
+        :param trader: Trader used for the account snapshot (get_account_accountNumber).
+        :type trader: Trader
+        :param reconcile_interval: Seconds between snapshot reconciles on the background thread, None to disable.
+        :type reconcile_interval: float | None
+        :param allow_short: Let check_order() pass sells bigger than the position.
+        :type allow_short: bool
+        :param max_position_value: check_order() refuses orders leaving a position worth more than this.
+        :type max_position_value: float | None
+        :param account: Account number or hash the positions belong to, None is the first account.
+        :type account: str | int | None
+        """
+        self.trader = trader
+        self.log = trader.log
+        self.reconcile_interval = reconcile_interval
+        self.allow_short = allow_short
+        self.max_position_value = max_position_value
+        self.account = account
+        self.positions: dict[str, Position] = {}
+        self.account_number = None
+        self.cash = 0.0
+        self.buying_power = 0.0
+        self.realized_pnl = 0.0
+        self.market_value = 0.0
+        self.unrealized_pnl = 0.0
+        self.loaded_at = None
+        self.stats = {'fills': 0, 'quotes': 0, 'reconciles': 0, 'reconcile_failures': 0, 'drift': 0}
+        self._seen_fills: dict[int, float] = {}
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = None
+
+    def __contains__(self, symbol: str):
+        return symbol in self.positions
+
+    def get(self, symbol: str) -> Position | None:
+        return self.positions.get(symbol)
+
+    def quantity(self, symbol: str) -> float:
+        position = self.positions.get(symbol)
+        return position.quantity if position is not None else 0.0
+
+# ---------- Snapshot ---------- #
+
+    def load(self, snapshot: dict | None = None) -> bool:
+        """
+        Replace the state with an account snapshot, realized P&L starts over at 0.
+        :param snapshot: get_account_accountNumber(fields="positions") response, fetched when None.
+        :type snapshot: dict | None
+        :return: False if the snapshot could not be fetched.
+        :rtype: bool
+        """
+        if snapshot is None:
+            snapshot = self.trader.get_account_accountNumber(fields='positions', account=self.account)
+            if snapshot is None:
+                return False
+        account = snapshot.get('securitiesAccount', snapshot)
+        balances = account.get('currentBalances') or {}
+        positions = {}
+        for raw in account.get('positions') or ():
+            instrument = raw.get('instrument') or {}
+            symbol = instrument.get('symbol')
+            if not symbol:
+                continue
+            quantity = (raw.get('longQuantity') or 0.0) - (raw.get('shortQuantity') or 0.0)
+            position = Position(symbol, instrument.get('assetType', 'EQUITY'), quantity, raw.get('averagePrice') or 0.0)
+            if quantity and raw.get('marketValue') is not None:
+                position.last_price = raw['marketValue'] / (quantity * position.multiplier)
+            positions[symbol] = position
+
+        with self._lock:
+            self.account_number = account.get('accountNumber')
+            self.positions = positions
+            self.cash = balances.get('cashBalance', balances.get('availableFunds', 0.0)) or 0.0
+            self.buying_power = balances.get('buyingPower', balances.get('cashAvailableForTrading', self.cash)) or 0.0
+            self.realized_pnl = 0.0
+            self.market_value = sum(position.market_value for position in positions.values())
+            self.unrealized_pnl = sum(position.unrealized_pnl for position in positions.values())
+            self.loaded_at = time.time()
+        return True
+
+    def reconcile(self) -> int:
+        """
+        Fetch a fresh snapshot, count positions whose quantity drifted from ours and take Schwab's numbers.
+        :return: Number of symbols that disagreed, -1 if the snapshot could not be fetched.
+        :rtype: int
+        """
+        snapshot = self.trader.get_account_accountNumber(fields='positions', account=self.account)
+        self.stats['reconciles'] += 1
+        if snapshot is None:
+            self.stats['reconcile_failures'] += 1
+            return -1
+        with self._lock:
+            before = {symbol: position.quantity for symbol, position in self.positions.items() if position.quantity}
+            realized = {symbol: position.realized_pnl for symbol, position in self.positions.items()}
+            total_realized = self.realized_pnl
+            self.load(snapshot)
+            # The snapshot has no realized P&L, carry ours over.
+            self.realized_pnl = total_realized
+            for symbol, pnl in realized.items():
+                if pnl and symbol in self.positions:
+                    self.positions[symbol].realized_pnl = pnl
+            after = {symbol: position.quantity for symbol, position in self.positions.items() if position.quantity}
+        drift = sum(1 for symbol in before.keys() | after.keys() if before.get(symbol) != after.get(symbol))
+        if drift:
+            self.stats['drift'] += drift
+            self.log.error(f"PositionEngine reconcile: {drift} position(s) differed from Schwab, snapshot taken.")
+        return drift
+
+# ---------- Events ---------- #
+
+    def on_fill(self, symbol: str, instruction: str, quantity: float, price: float, asset_type: str = 'EQUITY'):
+        """
+        Apply an execution.
+        :param instruction: BUY, SELL, SELL_SHORT, BUY_TO_COVER, BUY_TO_OPEN...
+        :type instruction: str
+        :param quantity: Shares/contracts filled (positive).
+        :type quantity: float
+        :param price: Execution price per share/contract.
+        :type price: float
+        """
+        signed = quantity if instruction in BUY_INSTRUCTIONS else -quantity
+        with self._lock:
+            position = self.positions.get(symbol)
+            if position is None:
+                position = self.positions[symbol] = Position(symbol, asset_type, last_price=price)
+            self.market_value -= position.market_value
+            self.unrealized_pnl -= position.unrealized_pnl
+            self.realized_pnl += position.fill(signed, price)
+            self.market_value += position.market_value
+            self.unrealized_pnl += position.unrealized_pnl
+            cost = signed * price * position.multiplier
+            self.cash -= cost
+            self.buying_power -= cost
+            self.stats['fills'] += 1
+
+    def on_quote(self, symbol: str, price: float):
+        """
+        Mark a position to a new price, ignored for symbols not held and for NaN prices.
+        """
+        position = self.positions.get(symbol)
+        if position is None or price != price:
+            return
+        with self._lock:
+            delta = (price - position.last_price) * position.quantity * position.multiplier
+            position.last_price = price
+            self.market_value += delta
+            self.unrealized_pnl += delta
+            self.stats['quotes'] += 1
+
+    def on_order_event(self, event: str, order: dict, previous: dict | None):
+        """
+        OrderBook EVENT_FILL callback: applies the newly filled quantity at the average price of the executions
+        behind it.
+        """
+        order_id = order.get('orderId')
+        filled = order.get('filledQuantity') or 0.0
+        delta = filled - self._seen_fills.get(order_id, (previous or {}).get('filledQuantity') or 0.0)
+        if delta <= 0:
+            return
+        self._seen_fills[order_id] = filled
+        legs = order.get('orderLegCollection') or ()
+        if not legs:
+            return
+        leg = legs[0]
+        instrument = leg.get('instrument') or {}
+        self.on_fill(instrument.get('symbol'), leg.get('instruction'), delta, self._execution_price(order, delta),
+                     instrument.get('assetType', 'EQUITY'))
+
+    @staticmethod
+    def _execution_price(order: dict, quantity: float) -> float:
+        # Quantity weighted price of the newest executions adding up to quantity (the ones not applied yet, a sync
+        # can pick up several), falls back to the latest leg price and then the order price.
+        remaining, cost, latest = quantity, 0.0, None
+        for activity in reversed(order.get('orderActivityCollection') or ()):
+            for execution in reversed(activity.get('executionLegs') or ()):
+                if execution.get('price') is None:
+                    continue
+                latest = float(execution['price']) if latest is None else latest
+                taken = min(remaining, float(execution.get('quantity') or 0.0))
+                cost += taken * float(execution['price'])
+                remaining -= taken
+                if remaining <= 0:
+                    return cost / quantity
+        if remaining < quantity:
+            return cost / (quantity - remaining)
+        if latest is not None:
+            return latest
+        return float(order.get('price') or order.get('stopPrice') or 0.0)
+
+    def attach_order_book(self, book):
+        """
+        Apply every fill the order_book.OrderBook sees.
+        """
+        from order_book import EVENT_FILL
+        book.on(EVENT_FILL, self.on_order_event)
+
+    def attach_streamer(self, streamer, subscribe: bool = True):
+        """
+        Mark positions to LEVELONE_EQUITIES/LEVELONE_OPTIONS last prices from a streamer.Streamer.
+        :param subscribe: Subscribe the held symbols too.
+        :type subscribe: bool
+        """
+        from streamer import LEVELONE_EQUITIES, LEVELONE_OPTIONS
+        for service in (LEVELONE_EQUITIES, LEVELONE_OPTIONS):
+            streamer.on(service, lambda service, symbol, table: self.on_quote(symbol, table.value(symbol, 'last')))
+            symbols = [symbol for symbol, position in self.positions.items()
+                       if (position.asset_type == 'OPTION') == (service == LEVELONE_OPTIONS)]
+            if subscribe and symbols:
+                streamer.subscribe(service, symbols)
+
+# ---------- Pre-trade Checks ---------- #
+
+    def check_order(self, symbol: str, instruction: str, quantity: float, price: float,
+                    asset_type: str = 'EQUITY') -> tuple[bool, str]:
+        """
+        Local risk check, no network call.
+        :return: (ok, reason), reason is '' when ok.
+        :rtype: tuple[bool, str]
+        """
+        if quantity <= 0 or price <= 0:
+            return False, 'quantity and price must be positive'
+        position = self.positions.get(symbol)
+        held = position.quantity if position is not None else 0.0
+        multiplier = position.multiplier if position is not None else MULTIPLIERS.get(asset_type, 1.0)
+        signed = quantity if instruction in BUY_INSTRUCTIONS else -quantity
+        # Covering a short needs no cash up front, only the part of a buy that opens (or adds to) a long does.
+        opening = max(0.0, held + signed) - max(0.0, held)
+        if signed > 0 and opening * price * multiplier > self.buying_power:
+            return False, f'needs {opening * price * multiplier:.2f}, buying power {self.buying_power:.2f}'
+        if signed < 0 and not self.allow_short and quantity > max(held, 0.0):
+            return False, f'selling {quantity:g} with {held:g} held'
+        if self.max_position_value is not None and abs((held + signed) * price * multiplier) > self.max_position_value:
+            return False, f'position would be worth more than {self.max_position_value:.2f}'
+        return True, ''
+
+# ---------- Background ---------- #
+
+    def start(self):
+        """
+        Load the snapshot (if not loaded yet) and reconcile every reconcile_interval seconds on a background thread.
+        """
+        if self.loaded_at is None:
+            self.load()
+        if self.reconcile_interval and self._thread is None:
+            self._closed = False
+            self._thread = threading.Thread(target=self._run, name='position-engine', daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+            self._thread = None
+
+    def _run(self):
+        while not self._wake.wait(self.reconcile_interval) and not self._closed:
+            try:
+                self.reconcile()
+            except Exception as exc:
+                self.stats['reconcile_failures'] += 1
+                self.log.error(f"PositionEngine reconcile failed: {exc!r}")
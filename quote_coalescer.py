@@ -0,0 +1,114 @@
+# quote_coalescer.py merges single-symbol quote requests from many threads into multi-symbol get_quotes calls.
+# Strategy code calling trader.get_single_quote(ticker) from all over the place ends up costing
+# one round trip per batch window instead of one per symbol.
+# Imports
+import threading
+import time
+from concurrent.futures import Future
+
+# Max symbols sent in one get_quotes request.
+MAX_QUOTE_SYMBOLS = 500
+
+class QuoteCoalescer:
+    """
+    Collects the symbols requested within a short window and fetches them with one get_quotes call
+    (chunked at max_symbols), then hands each caller back its own quote.
+
+        coalescer = QuoteCoalescer(trader, window=0.01)
+        quote = coalescer.get('AAPL')   # {'AAPL': {...}} same shape as get_single_quote
+    """
+    def __init__(self, trader, window: float = 0.01, max_symbols: int = MAX_QUOTE_SYMBOLS, fields: str | None = None):
+        """
+        :param trader: Trader used to send the merged get_quotes requests.
+        :type trader: Trader
+        :param window: Seconds to wait for more symbols after the first one arrives (5-20 ms works well).
+        :type window: float
+        :param max_symbols: Symbols per request, a full batch goes out right away without waiting for the window.
+        :type max_symbols: int
+        :param fields: fields param passed to get_quotes e.g. "quote".
+        :type fields: str | None
+        """
+        self.trader = trader
+        self.window = window
+        self.max_symbols = max_symbols
+        self.fields = fields
+        self._cond = threading.Condition()
+        self._pending: dict[str, list[Future]] = {}
+        self._deadline = None
+        self._closed = False
+        self.stats = {'requests': 0, 'round_trips': 0, 'symbols_sent': 0, 'batches': 0}
+        self._thread = threading.Thread(target=self._run, name='quote-coalescer', daemon=True)
+        self._thread.start()
+
+    def submit(self, symbol: str) -> Future:
+        """
+        Queue a symbol for the next batch.
+        :param symbol: Ticker e.g. "AAPL".
+        :type symbol: str
+        :return: Future resolving to {symbol: quote} or None if Schwab did not return it.
+        :rtype: Future
+        """
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("QuoteCoalescer is closed.")
+            self.stats['requests'] += 1
+            if not self._pending:
+                self._deadline = time.monotonic() + self.window
+            self._pending.setdefault(symbol, []).append(future)
+            if len(self._pending) == 1 or len(self._pending) >= self.max_symbols:
+                self._cond.notify()
+        return future
+
+    def get(self, symbol: str, timeout: float | None = None) -> dict | None:
+        """
+        Blocking version of submit().
+        :param symbol: Ticker e.g. "AAPL".
+        :type symbol: str
+        :param timeout: Seconds to wait for the quote.
+        :type timeout: float | None
+        :return: {symbol: quote} or None.
+        :rtype: dict | None
+        """
+        return self.submit(symbol).result(timeout)
+
+    def close(self):
+        """
+        Flush whatever is pending and stop the dispatcher thread.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                while (self._pending and not self._closed and len(self._pending) < self.max_symbols
+                       and time.monotonic() < self._deadline):
+                    self._cond.wait(self._deadline - time.monotonic())
+                if not self._pending and self._closed:
+                    return
+                batch, self._pending = self._pending, {}
+            self._dispatch(batch)
+
+    def _dispatch(self, batch: dict[str, list[Future]]):
+        symbols = list(batch)
+        self.stats['batches'] += 1
+        for start in range(0, len(symbols), self.max_symbols):
+            chunk = symbols[start:start + self.max_symbols]
+            self.stats['round_trips'] += 1
+            self.stats['symbols_sent'] += len(chunk)
+            try:
+                data = self.trader.get_quotes(','.join(chunk), fields=self.fields) or {}
+            except Exception as e:
+                for symbol in chunk:
+                    for future in batch[symbol]:
+                        future.set_exception(e)
+                continue
+            for symbol in chunk:
+                quote = {symbol: data[symbol]} if symbol in data else None
+                for future in batch[symbol]:
+                    future.set_result(quote)
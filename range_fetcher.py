@@ -0,0 +1,234 @@
+# range_fetcher.py pulls transactions or orders over spans longer than one API call allows
+# (transactions: 1 year / 3000 results, orders: 60 days / 3000 results).
+# The span is cut into day-aligned windows fetched in parallel, windows that come back full are split in half
+# and fetched again, and finished days are saved so the next run only asks Schwab for days it has not seen.
+# An orders day is only saved once every order on it reached a final status, a working order can still fill.
+# Imports
+import datetime as dt
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from order_book import OPEN_STATUSES, format_time, parse_time
+
+DEFAULT_RANGE_PATH = os.path.expanduser('~/.schwab_auto_trader/ranges')
+
+# Every transaction type, get_all_transactions returns nothing without types.
+TRANSACTION_TYPES = ('TRADE,RECEIVE_AND_DELIVER,DIVIDEND_OR_INTEREST,ACH_RECEIPT,ACH_DISBURSEMENT,CASH_RECEIPT,'
+                     'CASH_DISBURSEMENT,ELECTRONIC_FUND,WIRE_OUT,WIRE_IN,JOURNAL,MEMORANDUM,MARGIN_CALL,MONEY_MARKET,'
+                     'SMA_ADJUSTMENT')
+
+# Per kind: id field, time field used to file records by day, longest window the API takes, result cap.
+KINDS = {
+    'transactions': {'id': 'activityId', 'time': 'time', 'max_days': 365, 'cap': 3000},
+    'orders': {'id': 'orderId', 'time': 'enteredTime', 'max_days': 60, 'cap': 3000},
+}
+
+# Windows are not split below this, a full window this small is logged instead.
+MIN_WINDOW = dt.timedelta(minutes=1)
+
+
+def _utc_midnight(value: dt.date | dt.datetime) -> dt.datetime:
+    if isinstance(value, dt.datetime):
+        value = value.astimezone(dt.timezone.utc).date()
+    return dt.datetime.combine(value, dt.time(), tzinfo=dt.timezone.utc)
+
+
+class RangeFetcher:
+    """
+    Streams every transaction (or order) between two dates, no matter how far apart.
+
+        fetcher = RangeFetcher(trader, 'transactions', account_hash)
+        for transaction in fetcher.fetch(dt.date(2021, 1, 1), dt.date.today()):
+            ...
+
+    Records come out as their window finishes, not in time order, each id once.
+    Days before today (UTC) are saved under path/<kind>/<account>/yyyy-mm-dd.json and read back on later runs,
+    for orders only days without an order in OPEN_STATUSES (those are fetched again every run).
+    """
+    def __init__(self, trader, kind: str = 'transactions', account_hash: str | None = None, window_days: int = 30,
+                 max_workers: int = 4, path: str | None = DEFAULT_RANGE_PATH, types: str = TRANSACTION_TYPES):
+        """
+        :param trader: Trader used for the requests, they go through its rate limiter.
+        :type trader: Trader
+        :param kind: 'transactions' or 'orders'.
+        :type kind: str
+        :param account_hash: hashed account number. Required for transactions, None fetches orders for all accounts.
+        :type account_hash: str | None
+        :param window_days: Days per request before any splitting (capped by the kind's API limit).
+        :type window_days: int
+        :param max_workers: Windows fetched at the same time.
+        :type max_workers: int
+        :param path: Directory the fetched days are kept in, None keeps nothing.
+        :type path: str | None
+        :param types: Transaction types asked for (transactions only).
+        :type types: str
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Unknown kind {kind!r}, expected one of {tuple(KINDS)}.")
+        if kind == 'transactions' and account_hash is None:
+            raise ValueError("Transactions need an account_hash.")
+        self.trader = trader
+        self.kind = kind
+        self.spec = KINDS[kind]
+        self.account_hash = account_hash
+        self.window = dt.timedelta(days=max(1, min(window_days, self.spec['max_days'])))
+        self.max_workers = max_workers
+        self.types = types
+        self.directory = os.path.join(path, kind, account_hash or 'all') if path else None
+        self.stats = {'requests': 0, 'splits': 0, 'failures': 0, 'cached_days': 0, 'fetched_days': 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+# ---------- Local Days ---------- #
+
+    def _day_path(self, day: dt.date) -> str:
+        return os.path.join(self.directory, f'{day.isoformat()}.json')
+
+    def _settled(self, records: list[dict]) -> bool:
+        # Orders entered on a day keep changing (fills, cancels, GTC orders working for weeks) until they are final.
+        return self.kind != 'orders' or not any(record.get('status') in OPEN_STATUSES for record in records)
+
+    def _load_day(self, day: dt.date) -> list[dict] | None:
+        if self.directory is None:
+            return None
+        try:
+            with open(self._day_path(day)) as f:
+                records = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return records if self._settled(records) else None
+
+    def _save_days(self, start: dt.datetime, end: dt.datetime, records: list[dict]):
+        # Only whole days that are over can't change any more, today is always fetched again, so is a day that
+        # still holds an open order.
+        if self.directory is None:
+            return
+        today = _utc_midnight(dt.datetime.now(dt.timezone.utc))
+        by_day: dict[dt.date, list[dict]] = {}
+        for record in records:
+            try:
+                by_day.setdefault(parse_time(record[self.spec['time']]).astimezone(dt.timezone.utc).date(), []).append(record)
+            except (KeyError, ValueError):
+                continue
+        os.makedirs(self.directory, exist_ok=True)
+        day = start
+        while day < min(end, today):
+            path = self._day_path(day.date())
+            records = by_day.get(day.date(), [])
+            if self._settled(records):
+                tmp = f'{path}.tmp'
+                with open(tmp, 'w') as f:
+                    json.dump(records, f)
+                os.replace(tmp, path)
+            else:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            day += dt.timedelta(days=1)
+
+# ---------- Fetching ---------- #
+
+    def _request(self, start: dt.datetime, end: dt.datetime) -> list[dict] | None:
+        self._count('requests')
+        # end is exclusive, the API's endDate is inclusive.
+        start_text, end_text = format_time(start), format_time(end - dt.timedelta(milliseconds=1))
+        if self.kind == 'transactions':
+            return self.trader.get_all_transactions(self.account_hash, start_text, end_text, types=self.types)
+        if self.account_hash is not None:
+            return self.trader.get_orders(self.account_hash, start_text, end_text, maxResults=self.spec['cap'])
+        return self.trader.get_all_orders(start_text, end_text, maxResults=self.spec['cap'])
+
+    def _fetch_window(self, start: dt.datetime, end: dt.datetime) -> list[dict] | None:
+        """
+        Everything in [start, end), splitting in half while a request comes back at the cap.
+        """
+        records = self._request(start, end)
+        if records is None:
+            self._count('failures')
+            return None
+        if len(records) < self.spec['cap']:
+            return records
+        if end - start <= MIN_WINDOW:
+            self.trader.log.error(f"{self.kind}: {len(records)} results between {start} and {end}, "
+                                  f"some may be missing.")
+            return records
+        self._count('splits')
+        middle = start + (end - start) / 2
+        first = self._fetch_window(start, middle)
+        second = self._fetch_window(middle, end)
+        if first is None or second is None:
+            return None
+        return first + second
+
+    def _missing_windows(self, start: dt.datetime, end: dt.datetime, cached: dict) -> list[tuple[dt.datetime, dt.datetime]]:
+        # Runs of days not on disk, cut into window sized pieces.
+        windows = []
+        day = start
+        while day < end:
+            if day.date() in cached:
+                day += dt.timedelta(days=1)
+                continue
+            window_start = day
+            while day < end and day.date() not in cached and day - window_start < self.window:
+                day += dt.timedelta(days=1)
+            windows.append((window_start, min(day, end)))
+        return windows
+
+    def fetch(self, start: dt.date | dt.datetime, end: dt.date | dt.datetime | None = None):
+        """
+        Yield every record between start and end (inclusive days).
+        :param start: First day.
+        :type start: date | datetime
+        :param end: Last day, defaults to today.
+        :type end: date | datetime | None
+        :return: Generator of transaction/order dicts.
+        """
+        start = _utc_midnight(start)
+        end = _utc_midnight(end or dt.datetime.now(dt.timezone.utc)) + dt.timedelta(days=1)
+        id_field = self.spec['id']
+        seen = set()
+
+        def unseen(records: list[dict]):
+            for record in records:
+                key = record.get(id_field)
+                if key is None or key not in seen:
+                    seen.add(key)
+                    yield record
+
+        cached = {}
+        day = start
+        today = _utc_midnight(dt.datetime.now(dt.timezone.utc))
+        while day < min(end, today):
+            records = self._load_day(day.date())
+            if records is not None:
+                cached[day.date()] = records
+            day += dt.timedelta(days=1)
+        self._count('cached_days', len(cached))
+        for records in cached.values():
+            yield from unseen(records)
+
+        windows = self._missing_windows(start, end, cached)
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='range-fetcher') as pool:
+            pending = {pool.submit(self._fetch_window, *window): window for window in windows}
+            try:
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        window_start, window_end = pending.pop(future)
+                        records = future.result()
+                        if records is None:
+                            self.trader.log.error(f"{self.kind}: fetching {window_start:%Y-%m-%d} - "
+                                                  f"{window_end:%Y-%m-%d} failed, skipped.")
+                            continue
+                        self._save_days(window_start, window_end, records)
+                        self._count('fetched_days', (window_end - window_start).days)
+                        yield from unseen(records)
+            finally:
+                # Generator closed early, don't start the windows still queued.
+                for future in pending:
+                    future.cancel()
@@ -0,0 +1,235 @@
+# rate_limiter.py keeps Trader under the Schwab request quotas.
+# Every request takes a token from the bucket of its endpoint family before it goes out,
+# order requests jump the queue so they are never stuck behind a bulk market data scan.
+# Imports
+import contextlib
+import heapq
+import itertools
+import threading
+import time
+
+# Endpoint families, each one gets its own bucket.
+ORDERS = 'orders'
+MARKET_DATA = 'marketdata'
+
+# Priority lanes, lower goes first.
+PRIORITY_ORDER = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BULK = 2
+LANES = (PRIORITY_ORDER, PRIORITY_NORMAL, PRIORITY_BULK)
+
+# Requests per minute, the README has you set the app Order Limit to 120, market data is capped at 120 as well.
+DEFAULT_LIMITS = {ORDERS: 120, MARKET_DATA: 120}
+
+
+def endpoint_family(path: str) -> str:
+    """
+    Map a request path to its rate limit family.
+    :param path: Path relative to the base url e.g. /marketdata/v1/quotes
+    :type path: str
+    :return: MARKET_DATA or ORDERS.
+    :rtype: str
+    """
+    return MARKET_DATA if path.startswith('/marketdata/') else ORDERS
+
+
+def default_priority(method: str) -> int:
+    """
+    Anything that changes an order (POST/PUT/DELETE) rides in the order lane, reads are normal priority.
+    """
+    return PRIORITY_NORMAL if method == 'GET' else PRIORITY_ORDER
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Parse a Retry-After header, either delay-seconds or an HTTP date.
+    :return: Seconds to wait or None if missing/unparseable.
+    :rtype: float | None
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    import email.utils
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class TokenBucket:
+    """
+    Classic token bucket: refills rate_per_minute tokens a minute, holds at most burst tokens.
+    Not thread safe on its own, RequestScheduler guards it with its lock.
+    """
+    def __init__(self, rate_per_minute: float, burst: int | None = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst if burst is not None else max(1, int(rate_per_minute // 6))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """
+        Seconds until a token can be taken, 0 if one is available now.
+        """
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def block(self, seconds: float, now: float):
+        """
+        Hand out nothing for the next seconds (server told us to back off) and drain what is left.
+        """
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0.0
+        self.updated = max(self.updated, now)
+
+
+class RequestScheduler:
+    """
+    Thread safe scheduler in front of every Trader request. One TokenBucket per endpoint family,
+    waiting requests are served by priority lane then arrival order.
+    Share one scheduler between Trader objects that use the same Schwab app.
+    """
+    def __init__(self, limits: dict[str, float] | None = None, bursts: dict[str, int] | None = None):
+        """
+        :param limits: Requests per minute per family e.g. {'orders': 120, 'marketdata': 120}.
+        :type limits: dict[str, float] | None
+        :param bursts: Bucket capacity per family, defaults to 10 seconds worth of requests.
+        :type bursts: dict[str, int] | None
+        """
+        limits = {**DEFAULT_LIMITS, **(limits or {})}
+        bursts = bursts or {}
+        self.buckets = {family: TokenBucket(rate, bursts.get(family)) for family, rate in limits.items()}
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._waiting = {family: [] for family in self.buckets}
+        self._local = threading.local()
+        self.metrics = {family: {'queue_depth': {lane: 0 for lane in LANES}, 'max_queue_depth': 0, 'granted': 0,
+                                 'wait_seconds': 0.0, 'max_wait_seconds': 0.0, 'throttled': 0, 'backoff_seconds': 0.0}
+                        for family in self.buckets}
+
+    @contextlib.contextmanager
+    def priority(self, lane: int):
+        """
+        Run every GET made in this thread inside the block in the given lane, e.g. a bulk scan:
+
+            with trader.scheduler.priority(PRIORITY_BULK):
+                for symbol in universe: trader.get_option_chains(symbol)
+        """
+        previous = getattr(self._local, 'lane', None)
+        self._local.lane = lane
+        try:
+            yield
+        finally:
+            self._local.lane = previous
+
+    def lane_for(self, method: str) -> int:
+        """
+        Lane for a request made from this thread, order changes always use PRIORITY_ORDER.
+        """
+        if method != 'GET':
+            return PRIORITY_ORDER
+        lane = getattr(self._local, 'lane', None)
+        return default_priority(method) if lane is None else lane
+
+    def acquire(self, family: str, priority: int = PRIORITY_NORMAL) -> float:
+        """
+        Block until the request is allowed to go out.
+        :param family: ORDERS or MARKET_DATA.
+        :type family: str
+        :param priority: PRIORITY_ORDER, PRIORITY_NORMAL or PRIORITY_BULK.
+        :type priority: int
+        :return: Seconds spent waiting.
+        :rtype: float
+        """
+        bucket = self.buckets[family]
+        waiting = self._waiting[family]
+        metrics = self.metrics[family]
+        start = time.monotonic()
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(waiting, ticket)
+            metrics['queue_depth'][priority] += 1
+            metrics['max_queue_depth'] = max(metrics['max_queue_depth'], len(waiting))
+            try:
+                while True:
+                    timeout = None
+                    if waiting[0] == ticket:
+                        timeout = bucket.wait_time(time.monotonic())
+                        if timeout <= 0:
+                            bucket.take()
+                            break
+                    self._cond.wait(timeout)
+            finally:
+                waiting.remove(ticket)
+                heapq.heapify(waiting)
+                metrics['queue_depth'][priority] -= 1
+                self._cond.notify_all()
+
+            waited = time.monotonic() - start
+            metrics['granted'] += 1
+            metrics['wait_seconds'] += waited
+            metrics['max_wait_seconds'] = max(metrics['max_wait_seconds'], waited)
+        return waited
+
+    def try_acquire(self, family: str) -> bool:
+        """
+        Take a token only if one is free right now and nobody is queued for it, never waits.
+        Used for optional requests (hedges) that should not eat into what queued requests are waiting for.
+        :return: True when a token was taken.
+        :rtype: bool
+        """
+        bucket = self.buckets[family]
+        with self._cond:
+            if self._waiting[family] or bucket.wait_time(time.monotonic()) > 0:
+                return False
+            bucket.take()
+            self.metrics[family]['granted'] += 1
+            return True
+
+    async def acquire_async(self, family: str, priority: int = PRIORITY_NORMAL) -> float:
+        """
+        acquire() for asyncio callers, waits in a worker thread so the event loop keeps running.
+        """
+        import asyncio
+        return await asyncio.get_running_loop().run_in_executor(None, self.acquire, family, priority)
+
+    def backoff(self, family: str, seconds: float):
+        """
+        Stop handing out tokens for a family, called when Schwab answers 429.
+        :param family: ORDERS or MARKET_DATA.
+        :type family: str
+        :param seconds: How long to back off, usually the Retry-After header.
+        :type seconds: float
+        """
+        with self._cond:
+            self.buckets[family].block(seconds, time.monotonic())
+            self.metrics[family]['throttled'] += 1
+            self.metrics[family]['backoff_seconds'] += seconds
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        """
+        Snapshot of the queue metrics per family.
+        :return: {family: {'queue_depth': {lane: n}, 'max_queue_depth', 'granted', 'wait_seconds', ...}}
+        :rtype: dict
+        """
+        with self._cond:
+            return {family: {**metrics, 'queue_depth': dict(metrics['queue_depth']),
+                             'tokens': round(self.buckets[family].tokens, 2)}
+                    for family, metrics in self.metrics.items()}
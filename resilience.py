@@ -0,0 +1,440 @@
+# resilience.py decides how hard Trader tries before giving up on a request.
+# Per endpoint timeouts, jittered exponential retries for GETs (never for order changes, a POST that timed out
+# may still have been placed), hedged quote reads (a second request goes out when the first is slower than the
+# endpoint's p95) and one circuit breaker per endpoint family so a Schwab outage fails fast instead of piling up.
+# Imports
+import collections
+import heapq
+import itertools
+import random
+import sys
+import threading
+import time
+
+# Seconds before a request gives up, by endpoint label (metrics.route). Anything not listed uses Trader.timeout.
+DEFAULT_TIMEOUTS = {
+    'GET /marketdata/v1/quotes': 3.0,
+    'GET /marketdata/v1/{symbol_id}/quotes': 3.0,
+    'GET /marketdata/v1/chains': 15.0,
+    'GET /marketdata/v1/expirationchain': 10.0,
+    'GET /marketdata/v1/pricehistory': 15.0,
+    'GET /trader/v1/orders': 15.0,
+    'GET /trader/v1/accounts/{accountHash}/orders': 15.0,
+    'GET /trader/v1/accounts/{accountHash}/transactions': 20.0,
+    'POST /trader/v1/accounts/{accountHash}/orders': 10.0,
+    'PUT /trader/v1/accounts/{accountHash}/orders/{orderId}': 10.0,
+    'DELETE /trader/v1/accounts/{accountHash}/orders/{orderId}': 10.0,
+}
+
+# Latency critical reads that are hedged.
+HEDGED_ROUTES = {'GET /marketdata/v1/quotes', 'GET /marketdata/v1/{symbol_id}/quotes'}
+
+# Statuses worth another try, the server (or a proxy in front of it) failed rather than the request.
+RETRY_STATUSES = {500, 502, 503, 504}
+
+
+def transport_errors() -> tuple:
+    """
+    Transport errors: the request may never have reached Schwab, or the answer never made it back.
+    Looked up when an exception is being matched (except transport_errors():) and built from the clients
+    already imported, a request can only have failed in a client that was imported to send it. So neither
+    this module nor a failed request imports requests, httpx or stdlib_http.
+    """
+    errors = ()
+    requests = sys.modules.get('requests')
+    if requests is not None:
+        errors += (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                   requests.exceptions.ChunkedEncodingError)
+    httpx = sys.modules.get('httpx')
+    if httpx is not None:
+        errors += (httpx.TransportError,)
+    stdlib_http = sys.modules.get('stdlib_http')
+    if stdlib_http is not None:
+        errors += (stdlib_http.TransportError,)
+    return errors
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """
+    The circuit breaker of the endpoint family is open, the request was not sent.
+    """
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter: retry n waits uniform(0, min(max_delay, base_delay * 2**n)) seconds,
+    so clients that failed together do not all come back at the same moment.
+    """
+    def __init__(self, retries: int = 2, base_delay: float = 0.2, max_delay: float = 5.0,
+                 statuses=RETRY_STATUSES, methods=('GET',)):
+        """
+        :param retries: Extra attempts after the first one.
+        :type retries: int
+        :param base_delay: Cap of the first backoff, doubled every retry.
+        :type base_delay: float
+        :param max_delay: Largest backoff cap.
+        :type max_delay: float
+        :param statuses: Response statuses that are retried (transport errors always are).
+        :param methods: Methods that are safe to resend. Only GET by default, an order change is never resent.
+        """
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.statuses = frozenset(statuses)
+        self.methods = frozenset(methods)
+
+    def retryable(self, method: str) -> bool:
+        return method in self.methods and self.retries > 0
+
+    def delay(self, retry: int) -> float:
+        return random.uniform(0.0, min(self.max_delay, self.base_delay * 2.0 ** retry))
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold failures in a row (transport errors, 5xx), every request then fails fast
+    with CircuitOpenError. After reset_timeout seconds one trial request is let through (half open),
+    its success closes the breaker again, a failure opens it for another reset_timeout.
+    """
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.stats = {'opened': 0, 'rejected': 0}
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f'CircuitBreaker({self.name!r}, {self.state}, {self.failures} failures)'
+
+    def before(self):
+        """
+        Call before sending, raises CircuitOpenError when the request must not go out.
+        """
+        if self.state == CLOSED:
+            return
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._trial = False
+            # A trial that never reported back (cancelled, unexpected error) does not block the breaker forever.
+            if self.state == HALF_OPEN and (not self._trial or time.monotonic() - self.opened_at >= self.reset_timeout):
+                self._trial = True
+                self.opened_at = time.monotonic()
+                return
+            if self.state == CLOSED:
+                return
+            self.stats['rejected'] += 1
+            retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        raise CircuitOpenError(f"Circuit for {self.name} is {self.state} after {self.failures} failures, "
+                               f"not sending (next try in {retry_in:.1f}s).")
+
+    def success(self):
+        if self.state == CLOSED and not self.failures:
+            return
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.stats['opened'] += 1
+            self._trial = False
+
+
+class LatencyWindow:
+    """
+    Last few latencies of one endpoint, quantile() is refreshed every refresh observations (not per request).
+    """
+    def __init__(self, size: int = 200, refresh: int = 20):
+        self.samples = collections.deque(maxlen=size)
+        self.refresh = refresh
+        self._cached = {}
+        self._since = 0
+
+    def observe(self, seconds: float):
+        self.samples.append(seconds)
+        self._since += 1
+        if self._since >= self.refresh:
+            self._cached.clear()
+            self._since = 0
+
+    def quantile(self, pct: float) -> float:
+        value = self._cached.get(pct)
+        if value is None:
+            ordered = sorted(self.samples)
+            value = self._cached[pct] = ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+        return value
+
+
+class _HedgeTimer:
+    # One thread firing the hedges of every request in flight. Entries are [deadline, seq, action, active],
+    # a request that answered in time only clears active, the entry is dropped when its deadline comes up.
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+        self._wake = threading.Condition()
+        self._thread = None
+
+    def schedule(self, deadline: float, action) -> list:
+        entry = [deadline, next(self._seq), action, True]
+        with self._wake:
+            heapq.heappush(self._heap, entry)
+            if self._heap[0] is entry:
+                self._wake.notify()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='hedge-timer', daemon=True)
+                self._thread.start()
+        return entry
+
+    @staticmethod
+    def cancel(entry: list):
+        entry[3] = False
+
+    def _run(self):
+        while True:
+            with self._wake:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._wake.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                entry = heapq.heappop(self._heap)
+            if entry[3]:
+                entry[2]()
+
+
+class RequestExecutor:
+    """
+    The resilience settings Trader._request applies to every request, share one between Traders so they see
+    the same breakers and latencies.
+
+        trader = Trader(args, executor=RequestExecutor(retry=RetryPolicy(retries=3), hedge_percentile=90))
+        trader.executor.stats()
+
+    Hedging: the first attempt goes out on the caller's thread, the hedge timer starts when it does. Once the
+    timer runs out the copy is sent from the hedge pool, at most hedge_budget of the hedged route's requests
+    get one (so a backlog can't double the load on the rate budget). A blocking caller can't be handed the copy's
+    answer while its own request is still reading, the copy covers for a first attempt that fails or stalls
+    until its timeout: its answer is used instead of starting a retry from scratch.
+    """
+    def __init__(self, retry: RetryPolicy | None = None, timeouts: dict[str, float] | None = None,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0, hedge_routes=HEDGED_ROUTES,
+                 hedge_percentile: float = 95.0, min_hedge_delay: float = 0.02, hedge_samples: int = 20,
+                 hedge_workers: int = 8, hedge_budget: float = 0.05, hedge_burst: float = 10.0):
+        """
+        :param retry: Retry policy, RetryPolicy() if None.
+        :type retry: RetryPolicy | None
+        :param timeouts: Timeout per endpoint label on top of DEFAULT_TIMEOUTS.
+        :type timeouts: dict[str, float] | None
+        :param failure_threshold: Failures in a row that open a family's circuit breaker.
+        :type failure_threshold: int
+        :param reset_timeout: Seconds an open breaker waits before letting a trial request through.
+        :type reset_timeout: float
+        :param hedge_routes: Endpoint labels (GET only) that are hedged, empty turns hedging off.
+        :param hedge_percentile: A hedge goes out once the first request took longer than this latency percentile.
+        :type hedge_percentile: float
+        :param min_hedge_delay: Never hedge sooner than this, keeps a fast endpoint from being hedged on noise.
+        :type min_hedge_delay: float
+        :param hedge_samples: Latencies needed for an endpoint before it is hedged.
+        :type hedge_samples: int
+        :param hedge_workers: Threads sending the hedged copies (first attempts never wait for them).
+        :type hedge_workers: int
+        :param hedge_budget: Share of the hedged routes' requests that may get a hedged copy.
+        :type hedge_budget: float
+        :param hedge_burst: Hedges that can be saved up while requests are fast.
+        :type hedge_burst: float
+        """
+        self.retry = retry or RetryPolicy()
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.hedge_routes = frozenset(hedge_routes)
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.hedge_samples = hedge_samples
+        self.hedge_workers = hedge_workers
+        self.hedge_budget = hedge_budget
+        self.hedge_burst = hedge_burst
+        self._hedge_tokens = hedge_burst
+        self._timer = _HedgeTimer()
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self.latencies: dict[str, LatencyWindow] = {}
+        self.counters = {'retries': 0, 'hedges': 0, 'hedge_wins': 0, 'hedges_skipped': 0, 'transport_errors': 0}
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def timeout(self, label: str, default: float) -> float:
+        return self.timeouts.get(label, default)
+
+    def breaker(self, family: str) -> CircuitBreaker:
+        breaker = self.breakers.get(family)
+        if breaker is None:
+            with self._lock:
+                breaker = self.breakers.setdefault(family, CircuitBreaker(family, self.failure_threshold,
+                                                                          self.reset_timeout))
+        return breaker
+
+    def count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def hedged(self, method: str, label: str) -> bool:
+        return method == 'GET' and label in self.hedge_routes
+
+    def _earn_hedge(self):
+        with self._lock:
+            self._hedge_tokens = min(self.hedge_burst, self._hedge_tokens + self.hedge_budget)
+
+    def _take_hedge(self) -> bool:
+        with self._lock:
+            if self._hedge_tokens >= 1.0:
+                self._hedge_tokens -= 1.0
+                return True
+            self.counters['hedges_skipped'] += 1
+            return False
+
+    def _window(self, label: str) -> LatencyWindow:
+        window = self.latencies.get(label)
+        if window is None:
+            with self._lock:
+                window = self.latencies.setdefault(label, LatencyWindow())
+        return window
+
+    def hedge_delay(self, label: str) -> float | None:
+        """
+        Seconds to wait on the first request before hedging, None while there are too few latencies to tell.
+        """
+        window = self.latencies.get(label)
+        if window is None or len(window.samples) < self.hedge_samples:
+            return None
+        return max(self.min_hedge_delay, window.quantile(self.hedge_percentile))
+
+    def hedge(self, label: str, send, spare=lambda: True):
+        """
+        send() on this thread and, if it has not answered within the endpoint's hedge delay (and the hedge budget
+        allows), send a copy from the hedge pool. The first attempt's answer is returned, the copy's only when the
+        first attempt raised. The unused response is closed when it lands. Latencies feed the percentile either way.
+        :param send: Sends the request, returns the response.
+        :param spare: Called before hedging, False skips the hedge (e.g. no rate limit token to spare).
+        """
+        window = self._window(label)
+        delay = self.hedge_delay(label)
+        self._earn_hedge()
+
+        def timed():
+            start = time.perf_counter()
+            response = send()
+            window.observe(time.perf_counter() - start)
+            return response
+
+        if delay is None:
+            return timed()
+        lock = threading.Lock()
+        state = {'done': False, 'copy': None}
+
+        def fire():
+            with lock:
+                if state['done'] or not self._take_hedge() or not spare():
+                    return
+                if self._pool is None:
+                    from concurrent.futures import ThreadPoolExecutor
+                    with self._lock:
+                        if self._pool is None:
+                            self._pool = ThreadPoolExecutor(max_workers=self.hedge_workers, thread_name_prefix='hedge')
+                self.count('hedges')
+                state['copy'] = self._pool.submit(timed)
+
+        entry = self._timer.schedule(time.monotonic() + delay, fire)
+        try:
+            response = timed()
+        except Exception as error:
+            with lock:
+                state['done'] = True
+                copy = state['copy']
+            self._timer.cancel(entry)
+            if copy is None:
+                raise
+            # The first attempt failed (e.g. timed out) while the copy was out, its answer saves a retry.
+            try:
+                response = copy.result()
+            except Exception:
+                raise error from None
+            self.count('hedge_wins')
+            return response
+        with lock:
+            state['done'] = True
+            copy = state['copy']
+        self._timer.cancel(entry)
+        if copy is not None:
+            copy.add_done_callback(_close_response)
+        return response
+
+    async def hedge_async(self, label: str, send, spare=lambda: True):
+        """
+        hedge() for AsyncTrader, send is a coroutine function and the losing request is cancelled.
+        """
+        import asyncio
+        window = self._window(label)
+        delay = self.hedge_delay(label)
+        self._earn_hedge()
+
+        async def timed():
+            start = time.perf_counter()
+            response = await send()
+            window.observe(time.perf_counter() - start)
+            return response
+
+        if delay is None:
+            return await timed()
+        first = asyncio.ensure_future(timed())
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done or not self._take_hedge() or not spare():
+            return await first
+        self.count('hedges')
+        second = asyncio.ensure_future(timed())
+        pending = {first, second}
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = done.pop()
+            if winner.exception() is None or not pending:
+                break
+        for loser in pending:
+            loser.cancel()
+        if winner is second and winner.exception() is None:
+            self.count('hedge_wins')
+        return winner.result()
+
+    def stats(self) -> dict:
+        """
+        :return: Counters, breaker states and the p50/p95 latency of every hedged endpoint.
+        :rtype: dict
+        """
+        with self._lock:
+            return {**self.counters,
+                    'breakers': {family: {'state': breaker.state, 'failures': breaker.failures, **breaker.stats}
+                                 for family, breaker in self.breakers.items()},
+                    'latency': {label: {'p50': window.quantile(50), f'p{self.hedge_percentile:g}':
+                                        window.quantile(self.hedge_percentile), 'samples': len(window.samples)}
+                                for label, window in self.latencies.items() if window.samples}}
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+
+def _close_response(future):
+    # The losing side of a hedge, its connection goes back to the pool once the body is released.
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
@@ -0,0 +1,182 @@
+# response_cache.py is a small TTL + LRU cache for the Trader endpoints whose data changes at most daily
+# (instruments, market hours, expiration series, account numbers, user preferences).
+# Imports
+import datetime as dt
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from market_calendar import MARKET_TZ
+
+DAY = 24 * 60 * 60
+DEFAULT_CACHE_PATH = os.path.expanduser('~/.schwab_auto_trader/response-cache.json')
+
+
+def until_next_trading_day(now: float | None = None) -> float:
+    """
+    Seconds until the next midnight in New York, that's when market hours and expiration series roll over.
+    :param now: Unix time, defaults to time.time().
+    :type now: float | None
+    :return: seconds
+    :rtype: float
+    """
+    now = time.time() if now is None else now
+    local = dt.datetime.fromtimestamp(now, MARKET_TZ)
+    midnight = dt.datetime.combine(local.date() + dt.timedelta(days=1), dt.time(), tzinfo=MARKET_TZ)
+    return max(1.0, midnight.timestamp() - now)
+
+
+def _copy(value):
+    # Cached responses are JSON (dicts, lists, scalars), copying those by hand is a lot faster than copy.deepcopy.
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    return value
+
+
+# TTL per endpoint, seconds or a callable taking the current time and returning seconds.
+DEFAULT_TTLS = {
+    'get_instruments': DAY,
+    'get_instrument_cusip': DAY,
+    'get_market_hours': until_next_trading_day,
+    'get_market_hours_by_id': until_next_trading_day,
+    'get_expiration_option_chain': until_next_trading_day,
+    'get_account_number': DAY,
+    'get_user_preferences': DAY,
+}
+
+# Cached in memory but never written to disk: account numbers/hashes, and user preferences which carry the
+# account list and the streamer customer id.
+MEMORY_ONLY = frozenset({'get_account_number', 'get_user_preferences'})
+
+
+class ResponseCache:
+    """
+    Thread safe TTL cache with an LRU size bound. Keys are the endpoint, request path and
+    the params left after Trader._params_parser(), so equivalent calls share an entry.
+    With a path the cache is written to disk on save()/close() and read back on start, so a warm
+    restart skips the network. The file is created readable by the owner only (0600), and endpoints in
+    memory_only (account numbers and user preferences by default) are never written to it.
+    Values are copied going in and coming out, a caller changing its result can't change anyone else's.
+    """
+    def __init__(self, ttls: dict | None = None, max_entries: int = 1024, path: str | None = None,
+                 memory_only=MEMORY_ONLY):
+        """
+        :param ttls: Per endpoint TTL overrides, merged over DEFAULT_TTLS. Endpoints without a TTL are not cached.
+        :type ttls: dict | None
+        :param max_entries: Max number of responses kept, least recently used are evicted first.
+        :type max_entries: int
+        :param path: JSON file to persist the cache to, None keeps it in memory only.
+        :type path: str | None
+        :param memory_only: Endpoints that are cached but left out of the file.
+        :type memory_only: Iterable[str]
+        """
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.max_entries = max_entries
+        self.path = path
+        self.memory_only = frozenset(memory_only)
+        self._entries: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0, 'by_endpoint': {}}
+        if path:
+            self.load()
+
+    @staticmethod
+    def make_key(endpoint: str, path: str, params: dict | None) -> str:
+        return json.dumps([endpoint, path, params or {}], sort_keys=True, default=str)
+
+    def ttl_for(self, endpoint: str) -> float | None:
+        ttl = self.ttls.get(endpoint)
+        return ttl(time.time()) if callable(ttl) else ttl
+
+    def _count(self, endpoint: str, outcome: str):
+        self.stats[outcome] += 1
+        counts = self.stats['by_endpoint'].setdefault(endpoint, {'hits': 0, 'misses': 0})
+        counts[outcome] += 1
+
+    def get(self, endpoint: str, path: str, params: dict | None = None) -> tuple[bool, object]:
+        """
+        :return: (hit, value), value is None on a miss.
+        :rtype: tuple[bool, object]
+        """
+        key = self.make_key(endpoint, path, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.time():
+                del self._entries[key]
+                self.stats['expired'] += 1
+                entry = None
+            if entry is None:
+                self._count(endpoint, 'misses')
+                return False, None
+            self._entries.move_to_end(key)
+            self._count(endpoint, 'hits')
+            value = entry[1]
+        return True, _copy(value)
+
+    def set(self, endpoint: str, path: str, params: dict | None, value):
+        """
+        Store a response, ignored for endpoints without a TTL.
+        """
+        ttl = self.ttl_for(endpoint)
+        if not ttl:
+            return
+        key = self.make_key(endpoint, path, params)
+        value = _copy(value)
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def invalidate(self, endpoint: str | None = None):
+        """
+        Drop every entry, or only the ones for a single endpoint.
+        """
+        with self._lock:
+            if endpoint is None:
+                self._entries.clear()
+                return
+            prefix = json.dumps([endpoint])[:-1]
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+    def save(self):
+        """
+        Write the unexpired entries to self.path, except the memory_only endpoints. The file is 0600.
+        """
+        if not self.path:
+            return
+        now = time.time()
+        with self._lock:
+            entries = [[key, expires, value] for key, (expires, value) in self._entries.items()
+                       if expires > now and json.loads(key)[0] not in self.memory_only]
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = f'{self.path}.tmp'
+        # os.open's mode only applies when the file is created, drop a leftover tmp file made with other permissions.
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        with os.fdopen(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+            json.dump(entries, f)
+        os.replace(tmp, self.path)
+
+    def load(self):
+        """
+        Read entries saved by save(), expired ones are skipped. A missing or broken file just means a cold cache.
+        """
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        with self._lock:
+            for key, expires, value in entries[-self.max_entries:]:
+                if expires > now and json.loads(key)[0] not in self.memory_only:
+                    self._entries[key] = (expires, value)
+
+    def close(self):
+        self.save()
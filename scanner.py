@@ -0,0 +1,461 @@
+# scanner.py screens a universe of symbols on indicators that are kept up to date bar by bar.
+# Every symbol keeps its recent closes in a ring buffer and SMA/EMA/RSI/VWAP move by O(1) per new bar (running sums
+# and recursive averages, nothing is recomputed over the window). Each indicator is one numpy column over all symbols,
+# so a filter like "close > sma_50 and rsi_14 < 30" is a handful of vector operations across thousands of symbols.
+# Imports
+import ast
+import datetime as dt
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from market_calendar import MARKET_TZ
+
+DAY_MS = 86_400_000
+
+# Functions a filter expression may call, name -> numpy function.
+FILTER_FUNCTIONS = {'abs': np.abs, 'min': np.minimum, 'max': np.maximum, 'log': np.log, 'sqrt': np.sqrt,
+                    'isnan': np.isnan}
+
+# Syntax allowed in a filter expression, anything else (attributes, subscripts, lambdas...) is refused.
+_FILTER_NODES = (ast.Expression, ast.BoolOp, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Call, ast.Name, ast.Load,
+                 ast.Constant, ast.And, ast.Or, ast.Not, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Mod, ast.Pow,
+                 ast.USub, ast.UAdd, ast.Invert, ast.BitAnd, ast.BitOr, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq,
+                 ast.NotEq)
+
+# Bar fields every symbol has a column for, in the order update()/update_many() take them.
+BAR_COLUMNS = ('time', 'open', 'high', 'low', 'close', 'volume')
+
+
+class _VectorBooleans(ast.NodeTransformer):
+    # and/or/not and chained comparisons do not work element-wise on arrays, rewrite them to &, |, ~.
+    def visit_BoolOp(self, node):
+        self.generic_visit(node)
+        op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+        return functools.reduce(lambda left, right: ast.BinOp(left, op, right), node.values)
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        return ast.UnaryOp(ast.Invert(), node.operand) if isinstance(node.op, ast.Not) else node
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        if len(node.ops) == 1:
+            return node
+        operands = [node.left, *node.comparators]
+        parts = [ast.Compare(operands[i], [op], [operands[i + 1]]) for i, op in enumerate(node.ops)]
+        return functools.reduce(lambda left, right: ast.BinOp(left, ast.BitAnd(), right), parts)
+
+
+def compile_filter(expression: str, names) -> object:
+    """
+    Compile a filter expression over column names, e.g. "close > sma_50 and rsi_14 < 30 and volume > 1e5".
+    Arithmetic, comparisons, and/or/not and FILTER_FUNCTIONS are allowed, a comparison with a NaN column is False.
+    :param names: Column names the expression may use.
+    :return: Code object for eval() with the columns as names.
+    :raises ValueError: Unknown name or syntax that is not allowed.
+    """
+    tree = ast.parse(expression, mode='eval')
+    for node in ast.walk(tree):
+        if not isinstance(node, _FILTER_NODES):
+            raise ValueError(f"Filter {expression!r}: {type(node).__name__} is not allowed.")
+        if isinstance(node, ast.Call) and not (isinstance(node.func, ast.Name) and node.func.id in FILTER_FUNCTIONS):
+            raise ValueError(f"Filter {expression!r}: only {', '.join(FILTER_FUNCTIONS)} can be called.")
+        if isinstance(node, ast.Name) and node.id not in names and node.id not in FILTER_FUNCTIONS:
+            raise ValueError(f"Filter {expression!r}: unknown column {node.id!r}.")
+    tree = ast.fix_missing_locations(_VectorBooleans().visit(tree))
+    return compile(tree, f'<filter {expression}>', 'eval')
+
+
+def _session_days(times: np.ndarray) -> np.ndarray:
+    # New York trading day of each bar (ms timestamps), what VWAP resets on. One UTC offset per batch,
+    # a batch never spans the 2am DST switch of a trading day.
+    if not len(times):
+        return times
+    offset = dt.datetime.fromtimestamp(int(times.max()) / 1000, MARKET_TZ).utcoffset()
+    return (times + int(offset.total_seconds() * 1000)) // DAY_MS
+
+
+def mover_symbols(trader, indexes=('$SPX', '$COMPX', '$DJI'), sort: str | None = None) -> list[str]:
+    """
+    Symbols of the get_movers screeners of a few indexes, de-duplicated in order. A starting universe for a Scanner.
+    """
+    symbols = {}
+    for index in indexes:
+        movers = trader.get_movers(index, sort=sort) or {}
+        for screener in movers.get('screeners', ()):
+            symbols.setdefault(screener['symbol'], None)
+    return list(symbols)
+
+
+class Scanner:
+    """
+    Indicator columns for a universe of symbols, updated incrementally from bars (update, update_many, seed, load,
+    streamer CHART_EQUITY) or ticks (on_tick, on_quotes, streamer LEVELONE_EQUITIES, grouped into bar_ms bars).
+
+        scanner = Scanner(sma=(20, 50), rsi=(14,))
+        scanner.load(trader, mover_symbols(trader), start, end)
+        scanner.attach_streamer(streamer)
+        scanner.scan('close > sma_50 and rsi_14 < 30', sort='volume', limit=20)
+
+    Columns: time, open, high, low, close, volume (the last bar), bars (bars seen), last (last tick), vwap (session),
+    sma_N, ema_N (seeded with the first close), rsi_N (Wilder). An indicator is NaN until it has enough bars.
+    """
+    def __init__(self, symbols=(), sma=(20, 50), ema=(12, 26), rsi=(14,), window: int | None = None,
+                 bar_ms: int = 60_000, workers: int | None = None, parallel_threshold: int = 100_000):
+        """
+        :param symbols: Starting universe, more are added by add() or as their first bar arrives.
+        :param sma: Simple moving average periods, one sma_N column each.
+        :param ema: Exponential moving average periods, one ema_N column each.
+        :param rsi: Relative strength index periods, one rsi_N column each.
+        :param window: Closes kept per symbol (history()), at least the longest SMA period.
+        :type window: int | None
+        :param bar_ms: Bar length ticks are grouped into.
+        :type bar_ms: int
+        :param workers: Threads for big universes (numpy releases the GIL), CPU count if None.
+        :type workers: int | None
+        :param parallel_threshold: Symbols updated/scanned at once before the work is split over the threads.
+        :type parallel_threshold: int
+        """
+        self.sma, self.ema, self.rsi = tuple(sma), tuple(ema), tuple(rsi)
+        self.window = max((window or 0, *self.sma, 1))
+        self.bar_ms = bar_ms
+        self.workers = workers or os.cpu_count() or 1
+        self.parallel_threshold = parallel_threshold
+        self.symbols: list[str] = []
+        self.index: dict[str, int] = {}
+        self.stats = {'bars': 0, 'ticks': 0, 'stale': 0, 'scans': 0}
+        self._lock = threading.RLock()
+        self._pool = None
+        self._filters = {}
+        self._pending: dict[str, list] = {}   # symbol -> [bar start, open, high, low, close, volume] built from ticks
+        self._capacity = 0
+        names = [*BAR_COLUMNS, 'bars', 'last', 'vwap', *(f'sma_{n}' for n in self.sma),
+                 *(f'ema_{n}' for n in self.ema), *(f'rsi_{n}' for n in self.rsi)]
+        self._columns = {name: self._blank(name, 0) for name in names}
+        state = ['_session', '_pv', '_pvolume', '_ring', *(f'_sum_{n}' for n in self.sma),
+                 *(f'_gain_{n}' for n in self.rsi), *(f'_loss_{n}' for n in self.rsi)]
+        self._state = {name: self._blank(name, 0) for name in state}
+        self.add(symbols)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __contains__(self, symbol: str):
+        return symbol in self.index
+
+    def __repr__(self):
+        return f'Scanner({len(self)} symbols, {len(self._columns)} columns)'
+
+    def _blank(self, name: str, rows: int) -> np.ndarray:
+        if name in ('time', 'bars', '_session'):
+            return np.zeros(rows, dtype=np.int64)
+        if name in ('_pv', '_pvolume') or name.startswith(('_sum_', '_gain_', '_loss_')):
+            return np.zeros(rows)
+        return np.full((rows, self.window) if name == '_ring' else rows, np.nan)
+
+    @property
+    def columns(self) -> dict[str, np.ndarray]:
+        """
+        {name: column}, views over the symbols added so far (row i is self.symbols[i]).
+        """
+        rows = len(self.symbols)
+        return {name: column[:rows] for name, column in self._columns.items()}
+
+    def add(self, symbols) -> list[int]:
+        """
+        Add symbols to the universe (known ones are kept as they are).
+        :return: Row of each symbol.
+        :rtype: list[int]
+        """
+        symbols = [symbols] if isinstance(symbols, str) else list(symbols)
+        new = [symbol for symbol in dict.fromkeys(symbols) if symbol not in self.index]
+        if new:
+            rows = len(self.symbols) + len(new)
+            if rows > self._capacity:
+                self._grow(max(rows, 2 * self._capacity, 64))
+            for symbol in new:
+                self.index[symbol] = len(self.symbols)
+                self.symbols.append(symbol)
+        return [self.index[symbol] for symbol in symbols]
+
+    def _grow(self, capacity: int):
+        # Doubling, so adding symbols one at a time stays amortized O(1).
+        for arrays in (self._columns, self._state):
+            for name, array in arrays.items():
+                grown = self._blank(name, capacity)
+                grown[:len(array)] = array
+                arrays[name] = grown
+        self._capacity = capacity
+
+    def row(self, symbol: str) -> dict | None:
+        """
+        :return: {column: value} for one symbol, None if it is not in the universe.
+        :rtype: dict | None
+        """
+        index = self.index.get(symbol)
+        if index is None:
+            return None
+        return {name: column[index].item() for name, column in self._columns.items()}
+
+    def history(self, symbol: str) -> np.ndarray:
+        """
+        Last closes of a symbol (up to window of them), oldest first.
+        """
+        index = self.index[symbol]
+        count = int(self._columns['bars'][index])
+        kept = min(count, self.window)
+        return self._state['_ring'][index, (np.arange(count - kept, count)) % self.window]
+
+# ---------- Updates ---------- #
+
+    def update(self, symbol: str, time: int, open: float, high: float, low: float, close: float, volume: float = 0.0):
+        """
+        One new bar for one symbol (O(1)). A bar not newer than the symbol's last bar is dropped (stats['stale']).
+        """
+        self.update_many([symbol], [time], [open], [high], [low], [close], [volume])
+
+    def update_many(self, symbols: list[str], time, open, high, low, close, volume):
+        """
+        One new bar for each of many symbols (a symbol at most once), e.g. every symbol's minute bar at once.
+        Vectorized across the symbols, split over the worker threads past parallel_threshold.
+        :param time: Bar times, ms since the UNIX epoch.
+        """
+        with self._lock:
+            rows = np.asarray(self.add(symbols), dtype=np.int64)
+            bars = [np.asarray(time, dtype=np.int64), *(np.asarray(values, dtype=np.float64) for values in
+                                                       (open, high, low, close, volume))]
+            fresh = bars[0] > self._columns['time'][rows]
+            if not fresh.all():
+                self.stats['stale'] += int((~fresh).sum())
+                rows, bars = rows[fresh], [values[fresh] for values in bars]
+            self._chunked(self._apply, rows, *bars)
+            self.stats['bars'] += len(rows)
+
+    def _apply(self, rows, time, open, high, low, close, volume):
+        # Every indicator moves by O(1) per row: running sums for SMA and VWAP, recursive EMA and Wilder averages.
+        columns, state, window = self._columns, self._state, self.window
+        count = columns['bars'][rows]
+        previous = columns['close'][rows]
+        ring = state['_ring']
+        for n in self.sma:
+            leaving = np.where(count >= n, ring[rows, (count - n) % window], 0.0)
+            sums = state[f'_sum_{n}'][rows] + close - leaving
+            state[f'_sum_{n}'][rows] = sums
+            columns[f'sma_{n}'][rows] = np.where(count + 1 >= n, sums / n, np.nan)
+        ring[rows, count % window] = close
+        for n in self.ema:
+            ema = columns[f'ema_{n}'][rows]
+            columns[f'ema_{n}'][rows] = np.where(np.isnan(ema), close, ema + 2.0 / (n + 1) * (close - ema))
+        change = np.where(count > 0, close - previous, 0.0)
+        gain, loss = np.maximum(change, 0.0), np.maximum(-change, 0.0)
+        for n in self.rsi:
+            # The first n changes are averaged plainly, Wilder smoothing after that.
+            seeding = count <= n
+            gains, losses = state[f'_gain_{n}'][rows], state[f'_loss_{n}'][rows]
+            gains = np.where(seeding, gains + gain / n, (gains * (n - 1) + gain) / n)
+            losses = np.where(seeding, losses + loss / n, (losses * (n - 1) + loss) / n)
+            state[f'_gain_{n}'][rows], state[f'_loss_{n}'][rows] = gains, losses
+            total = gains + losses
+            rsi = np.where(total > 0, 100.0 * gains / np.where(total > 0, total, 1.0), 50.0)
+            columns[f'rsi_{n}'][rows] = np.where(count >= n, rsi, np.nan)
+        session = _session_days(time)
+        new_session = session != state['_session'][rows]
+        typical = (high + low + close) / 3.0
+        pv = np.where(new_session, 0.0, state['_pv'][rows]) + typical * volume
+        pvolume = np.where(new_session, 0.0, state['_pvolume'][rows]) + volume
+        state['_session'][rows], state['_pv'][rows], state['_pvolume'][rows] = session, pv, pvolume
+        columns['vwap'][rows] = np.where(pvolume > 0, pv / np.where(pvolume > 0, pvolume, 1.0), typical)
+        for name, values in zip(BAR_COLUMNS, (time, open, high, low, close, volume)):
+            columns[name][rows] = values
+        columns['last'][rows] = close
+        columns['bars'][rows] = count + 1
+
+    def _chunked(self, function, rows, *arrays):
+        # Row blocks on the thread pool when there are enough of them to pay for it, inline otherwise.
+        if len(rows) < self.parallel_threshold or self.workers < 2:
+            return [function(rows, *arrays)]
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='scanner')
+        bounds = np.linspace(0, len(rows), self.workers + 1, dtype=np.int64)
+        futures = [self._pool.submit(function, rows[start:end], *(array[start:end] for array in arrays))
+                   for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+        return [future.result() for future in futures]
+
+    def seed(self, candles: dict[str, np.ndarray], bars: int | None = None):
+        """
+        Replay price history into the indicators, e.g. {symbol: Trader.get_candles(...)}. Bar i of every symbol goes
+        in with one vectorized update across the symbols, so seeding costs (bars x columns) vector operations.
+        :param candles: symbol -> candles, oldest first (history_store.CANDLE_DTYPE arrays or market_arrays.Candles).
+        :param bars: Only replay the last bars of each symbol (EMA/RSI need a few times their period to settle).
+        :type bars: int | None
+        """
+        columns = {symbol: [np.asarray(data[name] if isinstance(data, np.ndarray) else getattr(data, name))
+                            for name in ('datetime', 'open', 'high', 'low', 'close', 'volume')]
+                   for symbol, data in candles.items()}
+        if bars is not None:
+            columns = {symbol: [values[-bars:] for values in fields] for symbol, fields in columns.items()}
+        columns = {symbol: fields for symbol, fields in columns.items() if len(fields[0])}
+        if not columns:
+            return
+        symbols = list(columns)
+        lengths = np.array([len(columns[symbol][0]) for symbol in symbols])
+        longest = int(lengths.max())
+        # (longest x symbols) matrices, each symbol's bars aligned at the start.
+        matrices = []
+        for field in range(6):
+            matrix = np.zeros((longest, len(symbols)), dtype=np.int64 if field == 0 else np.float64)
+            for column, symbol in enumerate(symbols):
+                matrix[:lengths[column], column] = columns[symbol][field]
+            matrices.append(matrix)
+        for step in range(longest):
+            present = np.flatnonzero(lengths > step)
+            self.update_many([symbols[column] for column in present], *(matrix[step, present] for matrix in matrices))
+
+    def load(self, trader, symbols: list[str], startDate, endDate, frequencyType: str = 'minute', frequency: int = 1,
+             max_workers: int = 4, bars: int | None = None) -> dict[str, np.ndarray]:
+        """
+        Fetch price history with Trader.get_candles (the history store only asks Schwab for what it does not have)
+        on max_workers threads and seed() the scanner with it. A symbol that fails is logged and left out.
+        :return: symbol -> candles that were loaded.
+        :rtype: dict[str, np.ndarray]
+        """
+        def fetch(symbol):
+            try:
+                return symbol, trader.get_candles(symbol, startDate, endDate, frequencyType, frequency)
+            except Exception as exc:
+                trader.log.error(f"Scanner could not load {symbol}: {exc!r}")
+                return symbol, None
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='scanner-load') as pool:
+            candles = {symbol: data for symbol, data in pool.map(fetch, symbols) if data is not None}
+        self.add(symbols)
+        self.seed(candles, bars)
+        return candles
+
+    def on_tick(self, symbol: str, price: float, size: float = 0.0, time: int | None = None):
+        """
+        A trade (or last price) for one symbol. Sets last right away and groups ticks into bar_ms bars, a bar goes
+        into the indicators when the first tick of the next bar arrives (flush() closes them all).
+        """
+        if price != price:  # NaN, the field was not sent
+            return
+        with self._lock:
+            index = self.index.get(symbol)
+            if index is None:
+                index = self.add(symbol)[0]
+            self._columns['last'][index] = price
+            self.stats['ticks'] += 1
+            if time is None:
+                return
+            start = int(time) - int(time) % self.bar_ms
+            pending = self._pending.get(symbol)
+            if pending is None or start > pending[0]:
+                if pending is not None:
+                    self.update(symbol, *pending)
+                self._pending[symbol] = [start, price, price, price, price, size]
+            elif start == pending[0]:
+                pending[2] = max(pending[2], price)
+                pending[3] = min(pending[3], price)
+                pending[4] = price
+                pending[5] += size
+
+    def flush(self):
+        """
+        Close every bar being built from ticks.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if pending:
+            self.update_many(list(pending), *zip(*pending.values()))
+
+    def on_quotes(self, quotes: dict):
+        """
+        Ticks from a get_quotes response ({symbol: {'quote': {'lastPrice', 'tradeTime', ...}}}), the polling way in.
+        """
+        for symbol, quote in quotes.items():
+            data = quote.get('quote') if isinstance(quote, dict) else None
+            if data and data.get('lastPrice') is not None:
+                self.on_tick(symbol, data['lastPrice'], 0.0, data.get('tradeTime'))
+
+    def attach_streamer(self, streamer, service: str | None = None, subscribe: bool = True):
+        """
+        Feed the scanner from a streamer.Streamer: CHART_EQUITY bars (default) or LEVELONE_EQUITIES ticks grouped
+        into bar_ms bars. Use one of the two, both would count every bar twice.
+        :param subscribe: Subscribe the universe too.
+        :type subscribe: bool
+        """
+        from streamer import CHART_EQUITY, LEVELONE_EQUITIES
+        service = service or CHART_EQUITY
+        if service == CHART_EQUITY:
+            def on_bar(service, symbol, table):
+                time = table.value(symbol, 'chart_time')
+                if time == time:
+                    self.update(symbol, int(time), *(table.value(symbol, name) for name in
+                                                     ('open', 'high', 'low', 'close', 'volume')))
+            streamer.on(service, on_bar)
+        elif service == LEVELONE_EQUITIES:
+            def on_quote(service, symbol, table):
+                time = table.value(symbol, 'trade_time')
+                size = table.value(symbol, 'last_size')
+                self.on_tick(symbol, table.value(symbol, 'last'), size if size == size else 0.0,
+                             int(time) if time == time else None)
+            streamer.on(service, on_quote)
+        else:
+            raise ValueError(f"Scanner takes {CHART_EQUITY} or {LEVELONE_EQUITIES}, not {service}.")
+        if subscribe and self.symbols:
+            streamer.subscribe(service, self.symbols)
+
+# ---------- Filters ---------- #
+
+    def mask(self, expression: str) -> np.ndarray:
+        """
+        Evaluate a filter expression (see compile_filter) over every symbol.
+        :return: Boolean array, one entry per symbol in self.symbols order.
+        :rtype: np.ndarray
+        """
+        code = self._filters.get(expression)
+        if code is None:
+            code = self._filters[expression] = compile_filter(expression, self._columns)
+        with self._lock:
+            rows = np.arange(len(self.symbols))
+            columns = self._columns
+
+            def evaluate(block):
+                # Blocks are contiguous runs of rows, slicing keeps the columns as views.
+                names = {name: column[block[0]:block[-1] + 1] for name, column in columns.items()}
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    result = eval(code, {'__builtins__': {}, **FILTER_FUNCTIONS}, names)
+                return np.broadcast_to(np.asarray(result, dtype=bool), len(block))
+
+            result = np.concatenate(self._chunked(evaluate, rows)) if len(rows) else np.zeros(0, dtype=bool)
+            self.stats['scans'] += 1
+        return result
+
+    def scan(self, expression: str | None = None, sort: str | None = None, descending: bool = True,
+             limit: int | None = None) -> list[str]:
+        """
+        Symbols passing a filter, e.g. scan('close > vwap and rsi_14 > 70', sort='volume', limit=20).
+        :param expression: Filter (see compile_filter), every symbol if None.
+        :type expression: str | None
+        :param sort: Column to order the matches by (NaN last).
+        :type sort: str | None
+        :param limit: At most this many symbols.
+        :type limit: int | None
+        :rtype: list[str]
+        """
+        matches = np.flatnonzero(self.mask(expression)) if expression else np.arange(len(self.symbols))
+        if sort is not None:
+            values = self._columns[sort][matches].astype(np.float64)
+            keys = np.where(np.isnan(values), -np.inf if descending else np.inf, values)
+            order = np.argsort(-keys if descending else keys, kind='stable')
+            matches = matches[order]
+        if limit is not None:
+            matches = matches[:limit]
+        return [self.symbols[index] for index in matches]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
@@ -0,0 +1,561 @@
+# shared_quotes.py shares the latest quotes and option chains between processes on one host.
+# One QuotePublisher process owns the Trader (or Streamer) and writes into a named shared memory table, every
+# strategy process attaches a SharedQuoteTable and reads straight out of the mapping: no round trip, no pickling
+# and no lock, each row carries a seqlock counter so a reader can tell when it raced the writer and re-read.
+# API usage stays one set of requests no matter how many strategy processes are reading.
+# Imports
+import os
+import struct
+import tempfile
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+from market_arrays import CHAIN_FLOAT_COLUMNS, CHAIN_INT_COLUMNS, OptionChainTable
+from quote_coalescer import MAX_QUOTE_SYMBOLS
+
+DEFAULT_TABLE_NAME = 'schwab-quotes'
+
+# Columns of every row, all float64. Option contracts published from a chain also fill the chain columns and
+# underlying (row of the underlying symbol, -1 otherwise). updated is the publisher's time.time() for the row.
+FIELDS = ('bid', 'ask', 'last', 'mark', 'bid_size', 'ask_size', 'volume', 'open', 'high', 'low', 'close',
+          'net_change', 'quote_time', 'trade_time', 'volatility', 'delta', 'gamma', 'theta', 'vega', 'rho',
+          'theoretical_value', 'strike', 'multiplier', 'open_interest', 'days_to_expiration', 'is_call', 'expiration',
+          'underlying_price', 'underlying', 'updated')
+COLUMN = {name: index for index, name in enumerate(FIELDS)}
+
+# get_quotes 'quote' keys -> column.
+QUOTE_KEYS = {'bidPrice': 'bid', 'askPrice': 'ask', 'lastPrice': 'last', 'mark': 'mark', 'bidSize': 'bid_size',
+              'askSize': 'ask_size', 'totalVolume': 'volume', 'openPrice': 'open', 'highPrice': 'high',
+              'lowPrice': 'low', 'closePrice': 'close', 'netChange': 'net_change', 'quoteTime': 'quote_time',
+              'tradeTime': 'trade_time', 'volatility': 'volatility', 'delta': 'delta', 'gamma': 'gamma',
+              'theta': 'theta', 'vega': 'vega', 'rho': 'rho', 'theoreticalOptionValue': 'theoretical_value',
+              'strikePrice': 'strike', 'multiplier': 'multiplier', 'openInterest': 'open_interest',
+              'daysToExpiration': 'days_to_expiration', 'underlyingPrice': 'underlying_price'}
+
+# Streamer QuoteTable columns that are named differently here.
+STREAMER_COLUMNS = {'total_volume': 'volume'}
+
+SYMBOL_BYTES = 32
+_MAGIC = 0x53434857514F5445  # 'SCHWQOTE'
+_HEADER = struct.Struct('<QQQQQd')  # magic, fields, capacity, symbols, publisher pid, heartbeat
+_HEADER_BYTES = 64
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    # Attaching must not register the segment with this process's resource tracker (before Python 3.13 it does),
+    # the tracker would unlink it when the process exits and take it away from the publisher and every reader.
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    register = resource_tracker.register
+
+    def skip_segment(resource: str, rtype: str):
+        if rtype != 'shared_memory' or resource.lstrip('/') != name.lstrip('/'):
+            register(resource, rtype)
+
+    resource_tracker.register = skip_segment
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+def subscription_path(name: str) -> str:
+    return os.path.join(tempfile.gettempdir(), f'{name}.subscriptions')
+
+
+class SharedQuoteTable:
+    """
+    Fixed capacity table in shared memory: a header, a directory of symbols (row i is directory[i]), one uint64
+    sequence number per row and a (capacity x FIELDS) float64 matrix.
+
+    Single writer (the publisher), any number of readers. The writer makes a row's sequence odd, writes the row,
+    then makes it even again. A reader copies the row between two reads of the sequence and keeps it when both
+    are the same even number, otherwise it reads again. Rows are added to the directory before the symbol count
+    goes up, so readers only ever see complete entries. Relies on aligned 8 byte stores not being torn and on
+    stores becoming visible in program order (x86), which is what the seqlock needs.
+
+        table = SharedQuoteTable()                   # attach to the publisher's table
+        table.subscribe(['AAPL', 'MSFT'])            # ask the publisher to poll them
+        table.get('AAPL')['last']
+        table.read(['AAPL', 'MSFT'], ['bid', 'ask'])  # (2, 2) array
+        table.chain('AAPL')                          # market_arrays.OptionChainTable
+    """
+    def __init__(self, name: str = DEFAULT_TABLE_NAME, create: bool = False, capacity: int = 50_000):
+        """
+        :param name: Shared memory segment name, the same on the publisher and the readers.
+        :type name: str
+        :param create: Create the segment (the publisher does this), attach to an existing one otherwise.
+        :type create: bool
+        :param capacity: Rows (symbols and option contracts) the table holds, only used with create.
+        :type capacity: int
+        """
+        self.name = name
+        if create:
+            size = _HEADER_BYTES + capacity * (SYMBOL_BYTES + 8 + 8 * len(FIELDS))
+            try:
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            except FileExistsError:
+                # Left behind by a publisher that did not shut down cleanly.
+                stale = shared_memory.SharedMemory(name=name)
+                stale.close()
+                stale.unlink()
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            self.shm.buf[:_HEADER_BYTES] = bytes(_HEADER_BYTES)
+            _HEADER.pack_into(self.shm.buf, 0, _MAGIC, len(FIELDS), capacity, 0, os.getpid(), time.time())
+        else:
+            self.shm = _attach(name)
+            magic, fields, capacity = _HEADER.unpack_from(self.shm.buf, 0)[:3]
+            if magic != _MAGIC or fields != len(FIELDS):
+                self.shm.close()
+                raise ValueError(f"Shared memory {name!r} is not a quote table with this layout.")
+        self.capacity = capacity
+        self.owner = create
+        buf = self.shm.buf
+        offset = _HEADER_BYTES
+        self._header = np.ndarray(5, dtype=np.uint64, buffer=buf, offset=0)  # magic..pid, heartbeat is float
+        self._heartbeat = np.ndarray(1, dtype=np.float64, buffer=buf, offset=40)
+        self._directory = np.ndarray(capacity, dtype=f'S{SYMBOL_BYTES}', buffer=buf, offset=offset)
+        offset += capacity * SYMBOL_BYTES
+        self.seq = np.ndarray(capacity, dtype=np.uint64, buffer=buf, offset=offset)
+        offset += capacity * 8
+        self.data = np.ndarray((capacity, len(FIELDS)), dtype=np.float64, buffer=buf, offset=offset)
+        if create:
+            self.data[:] = np.nan
+            self.data[:, COLUMN['underlying']] = -1
+        self.index: dict[str, int] = {}
+        self._known = 0
+        self._lock = threading.Lock()
+        self._subscriptions = 0   # bytes of the subscription file already taken
+        self.stats = {'reads': 0, 'retries': 0}
+
+    def __len__(self):
+        return int(self._header[3])
+
+    def __contains__(self, symbol: str):
+        return self.row(symbol) is not None
+
+    def __repr__(self):
+        return f'SharedQuoteTable({self.name!r}, {len(self)}/{self.capacity} rows)'
+
+    def close(self):
+        """
+        Drop this process's mapping, the publisher also removes the segment.
+        """
+        for name in ('_header', '_heartbeat', '_directory', 'seq', 'data'):
+            setattr(self, name, None)  # views keep the buffer exported, close() fails while they exist
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    @property
+    def publisher_pid(self) -> int:
+        return int(self._header[4])
+
+    @property
+    def heartbeat(self) -> float:
+        """
+        time.time() of the publisher's last cycle, readers can tell a dead publisher from quiet symbols.
+        """
+        return float(self._heartbeat[0])
+
+# ---------- Reading ---------- #
+
+    def _refresh(self):
+        # Pick up directory entries added since the last look, the count is only raised after they are written.
+        count = int(self._header[3])
+        if count > self._known:
+            for row in range(self._known, count):
+                self.index[self._directory[row].decode()] = row
+            self._known = count
+
+    def row(self, symbol: str) -> int | None:
+        row = self.index.get(symbol)
+        if row is None:
+            self._refresh()
+            row = self.index.get(symbol)
+        return row
+
+    def symbols(self) -> list[str]:
+        self._refresh()
+        return list(self.index)
+
+    def _read_rows(self, rows: np.ndarray, columns) -> np.ndarray:
+        # Seqlock read of many rows at once, only the rows that raced the writer are read again.
+        seq, data = self.seq, self.data
+        values = np.empty((len(rows), len(columns) if not isinstance(columns, slice) else len(FIELDS)))
+        todo = np.arange(len(rows))
+        while True:
+            before = seq[rows[todo]]
+            values[todo] = data[rows[todo]][:, columns]
+            after = seq[rows[todo]]
+            torn = (before != after) | (before & 1).astype(bool)
+            self.stats['reads'] += 1
+            if not torn.any():
+                return values
+            self.stats['retries'] += 1
+            todo = todo[torn]
+
+    def get(self, symbol: str) -> dict | None:
+        """
+        :return: {column: value} for one symbol (NaN for what was never published), None if it is not in the table.
+        :rtype: dict | None
+        """
+        row = self.row(symbol)
+        if row is None:
+            return None
+        return dict(zip(FIELDS, self._read_rows(np.array([row]), slice(None))[0].tolist()))
+
+    def read(self, symbols: list[str], fields=('bid', 'ask', 'last')) -> np.ndarray:
+        """
+        Consistent copy of a few columns for many symbols, symbols not in the table come back as NaN rows.
+        :return: (len(symbols) x len(fields)) float64 array.
+        :rtype: np.ndarray
+        """
+        rows = np.full(len(symbols), -1, dtype=np.int64)
+        for position, symbol in enumerate(symbols):
+            row = self.row(symbol)
+            if row is not None:
+                rows[position] = row
+        columns = [COLUMN[name] for name in fields]
+        values = np.full((len(symbols), len(columns)), np.nan)
+        present = rows >= 0
+        if present.any():
+            values[present] = self._read_rows(rows[present], columns)
+        return values
+
+    def age(self, symbol: str) -> float:
+        """
+        Seconds since the symbol's row was last published, inf if it never was.
+        """
+        row = self.row(symbol)
+        updated = self.data[row, COLUMN['updated']] if row is not None else np.nan
+        return time.time() - updated if updated == updated else float('inf')
+
+    def chain(self, underlying: str, retries: int = 100) -> OptionChainTable | None:
+        """
+        Latest chain snapshot of an underlying as an OptionChainTable, None if no chain was published for it.
+        The whole snapshot is consistent: the publisher holds the underlying's sequence odd while it writes a chain,
+        and while it writes a quote (publish, publish_quotes, a streamer) into one of the chain's contracts.
+        """
+        parent = self.row(underlying)
+        if parent is None:
+            return None
+        for _ in range(retries):
+            before = int(self.seq[parent])
+            if before & 1:
+                self.stats['retries'] += 1
+                continue
+            # Contracts of a chain are added to the directory before its sequence goes odd, picking them up after
+            # an even read covers every contract of the snapshot being read (also on a retry after a publish).
+            self._refresh()
+            rows = np.flatnonzero(self.data[:self._known, COLUMN['underlying']] == parent)
+            values = self.data[rows]
+            if int(self.seq[parent]) == before:
+                break
+            self.stats['retries'] += 1
+        else:
+            raise TimeoutError(f"Chain for {underlying} kept changing while it was read.")
+        self.stats['reads'] += 1
+        if not len(rows):
+            return None
+        table = OptionChainTable()
+        table.underlying = underlying
+        table.underlying_price = float(values[0, COLUMN['underlying_price']])
+        table.symbol = self._directory[rows].astype(str).astype(object)
+        table.expiration = values[:, COLUMN['expiration']].astype('datetime64[D]')
+        table.is_call = values[:, COLUMN['is_call']] > 0
+        for name in CHAIN_FLOAT_COLUMNS:
+            setattr(table, name, values[:, COLUMN[name]].copy())
+        for name in CHAIN_INT_COLUMNS:
+            setattr(table, name, np.nan_to_num(values[:, COLUMN[name]]).astype(np.int64))
+        return table
+
+    def subscribe(self, symbols, chains=()):
+        """
+        Ask the publisher to poll more symbols (and chains). Appends to a file next to the segment, one short write
+        per call so concurrent readers do not need a lock (O_APPEND writes under PIPE_BUF are not interleaved).
+        """
+        symbols = [symbols] if isinstance(symbols, str) else list(symbols)
+        lines = [f'Q {symbol}\n' for symbol in symbols] + [f'C {symbol}\n' for symbol in chains]
+        fd = os.open(subscription_path(self.name), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            batch = ''
+            for line in lines:
+                if len(batch) + len(line) > 4096:
+                    os.write(fd, batch.encode())
+                    batch = ''
+                batch += line
+            if batch:
+                os.write(fd, batch.encode())
+        finally:
+            os.close(fd)
+
+# ---------- Writing (publisher side) ---------- #
+
+    def add(self, symbol: str) -> int:
+        row = self.index.get(symbol)
+        if row is not None:
+            return row
+        count = int(self._header[3])
+        if count >= self.capacity:
+            raise OverflowError(f"Shared quote table {self.name!r} is full ({self.capacity} rows).")
+        self._directory[count] = symbol.encode()[:SYMBOL_BYTES]
+        self._header[3] = count + 1
+        self.index[symbol] = count
+        self._known = count + 1
+        return count
+
+    def _guards(self, row: int) -> list[int]:
+        # Rows whose sequence guards a write to row: its own, plus its underlying's when it is a contract of a
+        # published chain, so chain() retries instead of mixing contracts from before and after a quote update.
+        parent = int(self.data[row, COLUMN['underlying']])
+        return [row] if parent < 0 else [parent, row]
+
+    def publish(self, symbol: str, values: dict):
+        """
+        Write some columns of one row, the others keep their value.
+        """
+        columns = [COLUMN[name] for name in values]
+        with self._lock:
+            row = self.add(symbol)
+            guards = self._guards(row)
+            self.seq[guards] += 1
+            self.data[row, columns] = list(values.values())
+            self.data[row, COLUMN['updated']] = time.time()
+            self.seq[guards] += 1
+
+    def publish_quotes(self, quotes: dict) -> int:
+        """
+        Write a get_quotes response, one row per symbol.
+        :return: Rows written.
+        :rtype: int
+        """
+        now = time.time()
+        updated = COLUMN['updated']
+        written = 0
+        with self._lock:
+            for symbol, quote in (quotes or {}).items():
+                data = quote.get('quote') if isinstance(quote, dict) else None
+                if not data:
+                    continue
+                row = self.add(symbol)
+                values = self.data[row]
+                guards = self._guards(row)
+                self.seq[guards] += 1
+                for key, value in data.items():
+                    column = QUOTE_KEYS.get(key)
+                    if column is not None and isinstance(value, (int, float)):
+                        values[COLUMN[column]] = value
+                values[updated] = now
+                self.seq[guards] += 1
+                written += 1
+        return written
+
+    def publish_chain(self, chain: OptionChainTable | dict) -> int:
+        """
+        Write a get_option_chains response (or the OptionChainTable built from one), one row per contract.
+        Contracts that dropped out of the chain since the last publish are detached from the underlying.
+        :return: Contracts written.
+        :rtype: int
+        """
+        if isinstance(chain, dict):
+            chain = OptionChainTable.from_json(chain)
+        now = time.time()
+        with self._lock:
+            parent = self.add(chain.underlying)
+            rows = np.array([self.add(symbol) for symbol in chain.symbol], dtype=np.int64)
+            block = np.full((len(rows), len(FIELDS)), np.nan)
+            for name in (*CHAIN_FLOAT_COLUMNS, *CHAIN_INT_COLUMNS):
+                block[:, COLUMN[name]] = getattr(chain, name)
+            block[:, COLUMN['is_call']] = chain.is_call
+            block[:, COLUMN['expiration']] = chain.expiration.astype('datetime64[D]').astype(np.int64)
+            block[:, COLUMN['underlying_price']] = chain.underlying_price if chain.underlying_price is not None \
+                else np.nan
+            block[:, COLUMN['underlying']] = parent
+            block[:, COLUMN['updated']] = now
+            # The underlying's sequence guards the snapshot as a whole, each contract's its own row.
+            self.seq[parent] += 1
+            known = self.data[:int(self._header[3]), COLUMN['underlying']]
+            gone = np.setdiff1d(np.flatnonzero(known == parent), rows)
+            self.seq[gone] += 1
+            self.data[gone, COLUMN['underlying']] = -1
+            self.seq[gone] += 1
+            self.seq[rows] += 1
+            self.data[rows] = block
+            self.seq[rows] += 1
+            self.data[parent, COLUMN['underlying_price']] = block[0, COLUMN['underlying_price']] if len(rows) \
+                else np.nan
+            self.seq[parent] += 1
+        return len(rows)
+
+    def beat(self):
+        self._heartbeat[0] = time.time()
+
+    def take_subscriptions(self) -> tuple[list[str], list[str]]:
+        """
+        Symbols and chains readers asked for since the last call (publisher side).
+        """
+        path = subscription_path(self.name)
+        try:
+            with open(path, 'rb') as f:
+                f.seek(self._subscriptions)
+                text = f.read()
+        except FileNotFoundError:
+            return [], []
+        end = text.rfind(b'\n') + 1  # a half written last line is picked up next time
+        self._subscriptions += end
+        symbols, chains = [], []
+        for line in text[:end].decode().splitlines():
+            kind, _, symbol = line.partition(' ')
+            (chains if kind == 'C' else symbols).append(symbol)
+        return symbols, chains
+
+
+class QuotePublisher:
+    """
+    The one process that talks to Schwab: polls get_quotes for every watched symbol (MAX_QUOTE_SYMBOLS per request)
+    every quote_interval seconds and get_option_chains for every watched underlying every chain_interval seconds,
+    and publishes into a SharedQuoteTable. Readers add symbols with SharedQuoteTable.subscribe().
+
+        with QuotePublisher(trader, quote_interval=1.0) as publisher:
+            publisher.watch(['AAPL', 'MSFT'], chains=['SPY'])
+            publisher.join()   # or keep the process busy with something else
+    """
+    def __init__(self, trader, name: str = DEFAULT_TABLE_NAME, capacity: int = 50_000,
+                 quote_interval: float | None = 1.0,
+                 chain_interval: float = 30.0, chain_params: dict | None = None):
+        """
+        :param trader: Trader the requests go through (rate limiter, retries and metrics included).
+        :type trader: Trader
+        :param name: Shared memory name readers attach to.
+        :type name: str
+        :param capacity: Rows in the table, symbols plus every contract of every watched chain.
+        :type capacity: int
+        :param quote_interval: Seconds between get_quotes rounds, None leaves quotes to attach_streamer().
+        :type quote_interval: float | None
+        :param chain_interval: Seconds between get_option_chains rounds.
+        :type chain_interval: float
+        :param chain_params: Extra get_option_chains arguments e.g. {'strikeCount': 20}.
+        :type chain_params: dict | None
+        """
+        self.trader = trader
+        self.log = trader.log
+        self.table = SharedQuoteTable(name, create=True, capacity=capacity)
+        self.quote_interval = quote_interval
+        self.chain_interval = chain_interval
+        self.chain_params = chain_params or {}
+        self.quotes: dict[str, None] = {}
+        self.chains: dict[str, float] = {}   # underlying -> time.monotonic() of the next fetch
+        self.stats = {'quote_requests': 0, 'chain_requests': 0, 'rows_published': 0, 'errors': 0}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = None
+        try:
+            os.remove(subscription_path(name))
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def watch(self, symbols=(), chains=()):
+        """
+        Add symbols to the quote rounds and underlyings to the chain rounds.
+        """
+        symbols = [symbols] if isinstance(symbols, str) else symbols
+        with self._lock:
+            for symbol in symbols:
+                self.quotes.setdefault(symbol, None)
+            for symbol in chains:
+                self.chains.setdefault(symbol, 0.0)
+        self._wake.set()
+
+    def start(self) -> 'QuotePublisher':
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='quote-publisher', daemon=True)
+            self._thread.start()
+        return self
+
+    def join(self, timeout: float | None = None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+        self.table.close()
+        try:
+            os.remove(subscription_path(self.table.name))
+        except FileNotFoundError:
+            pass
+
+    def poll(self):
+        """
+        One round: pick up subscriptions, refresh quotes, refresh the chains that are due.
+        """
+        symbols, chains = self.table.take_subscriptions()
+        if symbols or chains:
+            self.watch(symbols, chains)
+        with self._lock:
+            quotes = list(self.quotes) if self.quote_interval is not None else []
+            now = time.monotonic()
+            due = [symbol for symbol, at in self.chains.items() if at <= now]
+            for symbol in due:
+                self.chains[symbol] = now + self.chain_interval
+        for start in range(0, len(quotes), MAX_QUOTE_SYMBOLS):
+            batch = quotes[start:start + MAX_QUOTE_SYMBOLS]
+            try:
+                data = self.trader.get_quotes(batch)
+                self.stats['quote_requests'] += 1
+                self.stats['rows_published'] += self.table.publish_quotes(data)
+            except Exception as exc:
+                self.stats['errors'] += 1
+                self.log.error(f"QuotePublisher get_quotes failed: {exc!r}")
+        for symbol in due:
+            try:
+                data = self.trader.get_option_chains(symbol, **self.chain_params)
+                self.stats['chain_requests'] += 1
+                if data:
+                    self.stats['rows_published'] += self.table.publish_chain(data)
+            except Exception as exc:
+                self.stats['errors'] += 1
+                self.log.error(f"QuotePublisher get_option_chains({symbol}) failed: {exc!r}")
+        self.table.beat()
+
+    def attach_streamer(self, streamer, subscribe: bool = True):
+        """
+        Publish every LEVELONE_EQUITIES/LEVELONE_OPTIONS update from a streamer.Streamer as it arrives, on top of
+        (or instead of, with quote_interval=None) the polling rounds.
+        """
+        from streamer import LEVELONE_EQUITIES, LEVELONE_OPTIONS
+        columns = {}
+
+        def on_quote(service, symbol, table):
+            names = columns.get(service)
+            if names is None:
+                names = columns[service] = [(name, STREAMER_COLUMNS.get(name, name)) for name in table.names
+                                            if STREAMER_COLUMNS.get(name, name) in COLUMN]
+            row = table.get(symbol)
+            self.table.publish(symbol, {column: row[name] for name, column in names if row[name] == row[name]})
+
+        for service in (LEVELONE_EQUITIES, LEVELONE_OPTIONS):
+            streamer.on(service, on_quote)
+        if subscribe and self.quotes:
+            streamer.subscribe(LEVELONE_EQUITIES, list(self.quotes))
+
+    def _run(self):
+        while not self._closed:
+            started = time.monotonic()
+            self.poll()
+            interval = self.quote_interval if self.quote_interval is not None else 1.0
+            self._wake.wait(max(0.0, interval - (time.monotonic() - started)))
+            self._wake.clear()
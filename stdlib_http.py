@@ -0,0 +1,175 @@
+# stdlib_http.py is a small pooled HTTP/1.1 client on http.client, for short scripts that should not pay for
+# importing requests (~100 ms of urllib3/certifi/charset detection) to send a handful of calls.
+# Trader(args, stdlib_http=True) sends through it, it speaks the part of the requests.Session API Trader uses.
+# Imports
+import http.client
+import json as jsonlib
+import select
+import threading
+import urllib.parse
+
+
+class TransportError(Exception):
+    """
+    The request could not be sent or the answer never made it back (connection refused/reset, timeout, TLS...).
+    resilience.transport_errors() includes it, so failed GETs are retried like requests' ConnectionError.
+    """
+
+
+class Response:
+    """
+    Fully read response, the attributes Trader and its helpers use from requests.Response.
+    """
+    def __init__(self, url: str, status_code: int, reason: str, headers, content: bytes):
+        self.url = url
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers  # http.client.HTTPMessage, get() is case insensitive
+        self.content = content
+
+    def __repr__(self):
+        return f'<Response [{self.status_code}]>'
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8', 'replace')
+
+    def json(self):
+        return jsonlib.loads(self.content)
+
+    def close(self):
+        # The body is read up front and the connection already went back to the pool.
+        pass
+
+
+def _dropped(connection: http.client.HTTPConnection) -> bool:
+    # An idle keep-alive socket that is readable was closed by the server (or has garbage on it), don't reuse it.
+    sock = connection.sock
+    if sock is None:
+        return True
+    try:
+        return bool(select.select([sock], [], [], 0)[0])
+    except (OSError, ValueError):
+        return True
+
+
+class StdlibSession:
+    """
+    Keeps up to pool_maxsize idle connections per host open between calls, so only the first call to a host
+    pays for the TCP+TLS handshake. Thread safe, a connection is used by one request at a time.
+
+    Usage:
+        session = StdlibSession()
+        response = session.request('GET', 'https://api.schwabapi.com/marketdata/v1/quotes',
+                                   params={'symbols': 'AAPL'}, headers={'Authorization': 'Bearer ...'}, timeout=5)
+        response.status_code, response.content
+        session.close()
+    """
+    def __init__(self, pool_maxsize: int = 16, keep_alive: bool = True):
+        """
+        :param pool_maxsize: Max number of idle connections kept open per host.
+        :type pool_maxsize: int
+        :param keep_alive: Keep connections open between calls (sends 'Connection: close' when False).
+        :type keep_alive: bool
+        """
+        self.pool_maxsize = pool_maxsize
+        self.keep_alive = keep_alive
+        self.headers = {} if keep_alive else {'Connection': 'close'}
+        self.stats = {'requests': 0, 'connections': 0}
+        self._idle: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+        self._ssl_context = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _connect(self, scheme: str, host: str, timeout: float | None) -> http.client.HTTPConnection:
+        key = (scheme, host)
+        with self._lock:
+            idle = self._idle.get(key)
+            while idle:
+                connection = idle.pop()
+                if not _dropped(connection):
+                    return connection
+                connection.close()
+            self.stats['connections'] += 1
+            if scheme == 'https' and self._ssl_context is None:
+                import ssl
+                self._ssl_context = ssl.create_default_context()
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, timeout=timeout, context=self._ssl_context)
+        return http.client.HTTPConnection(host, timeout=timeout)
+
+    def _release(self, key: tuple, connection: http.client.HTTPConnection):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.pool_maxsize:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def request(self, method: str, url: str, params: dict | None = None, json=None, data: bytes | None = None,
+                headers: dict | None = None, timeout: float | None = None, stream: bool = False) -> Response:
+        """
+        Send the request and read the whole answer. Same arguments as requests.Session.request (stream is ignored,
+        the body is always read).
+        :return: The response.
+        :rtype: Response
+        :raises TransportError: The request could not be sent or no answer came back.
+        """
+        parts = urllib.parse.urlsplit(url)
+        target = parts.path or '/'
+        query = '&'.join(filter(None, (parts.query, urllib.parse.urlencode(params, doseq=True) if params else '')))
+        if query:
+            target = f'{target}?{query}'
+        send_headers = {**self.headers, **headers} if headers else dict(self.headers)
+        if json is not None and data is None:
+            data = jsonlib.dumps(json).encode()
+            send_headers.setdefault('Content-Type', 'application/json')
+        elif isinstance(data, str):
+            data = data.encode()
+
+        key = (parts.scheme, parts.netloc)
+        connection = self._connect(parts.scheme, parts.netloc, timeout)
+        try:
+            connection.timeout = timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(timeout)
+            connection.request(method, target, body=data, headers=send_headers)
+            answer = connection.getresponse()
+            content = answer.read()
+        except (OSError, http.client.HTTPException) as exc:
+            connection.close()
+            raise TransportError(f'{method} {url}: {type(exc).__name__}: {exc}') from exc
+        except BaseException:
+            connection.close()
+            raise
+        self.stats['requests'] += 1
+        if answer.will_close or not self.keep_alive:
+            connection.close()
+        else:
+            self._release(key, connection)
+        return Response(url, answer.status, answer.reason, answer.headers, content)
+
+    def get(self, url: str, **kwargs) -> Response:
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url: str, **kwargs) -> Response:
+        return self.request('HEAD', url, **kwargs)
+
+    def close(self):
+        """
+        Close every idle connection.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
@@ -0,0 +1,358 @@
+# streamer.py is the Schwab streaming (WebSocket) market data client.
+# Polling get_quotes caps quote latency at the poll interval, the streamer pushes every change as it happens.
+# Connection details come from get_user_preferences()['streamerInfo'], updates land in QuoteTables
+# and are handed to the callbacks registered with Streamer.on().
+# Imports
+import asyncio
+import itertools
+import json
+import math
+import threading
+import time
+from array import array
+import websockets
+from websockets.exceptions import WebSocketException
+from json_codec import JsonDecoder
+
+# Services (channels) the streamer knows how to decode.
+LEVELONE_EQUITIES = 'LEVELONE_EQUITIES'
+LEVELONE_OPTIONS = 'LEVELONE_OPTIONS'
+CHART_EQUITY = 'CHART_EQUITY'
+ACCT_ACTIVITY = 'ACCT_ACTIVITY'
+
+# Numeric fields kept per service, Schwab field number -> column name. Field 0 is always the symbol (the 'key').
+SERVICE_FIELDS = {
+    LEVELONE_EQUITIES: {1: 'bid', 2: 'ask', 3: 'last', 4: 'bid_size', 5: 'ask_size', 8: 'total_volume',
+                        9: 'last_size', 10: 'high', 11: 'low', 12: 'close', 17: 'open', 18: 'net_change',
+                        33: 'mark', 34: 'quote_time', 35: 'trade_time', 42: 'net_percent_change'},
+    LEVELONE_OPTIONS: {2: 'bid', 3: 'ask', 4: 'last', 5: 'high', 6: 'low', 7: 'close', 8: 'total_volume',
+                       9: 'open_interest', 10: 'volatility', 16: 'bid_size', 17: 'ask_size', 18: 'last_size',
+                       19: 'net_change', 20: 'strike', 27: 'days_to_expiration', 28: 'delta', 29: 'gamma',
+                       30: 'theta', 31: 'vega', 32: 'rho', 34: 'theoretical_value', 35: 'underlying_price',
+                       37: 'mark', 38: 'quote_time', 39: 'trade_time'},
+    CHART_EQUITY: {1: 'open', 2: 'high', 3: 'low', 4: 'close', 5: 'volume', 6: 'sequence', 7: 'chart_time',
+                   8: 'chart_day'},
+}
+
+# Services passed to the callbacks as they come (no table), service -> fields to request.
+# ACCT_ACTIVITY: 1 account, 2 message type (OrderCreated, OrderFilled...), 3 message data (JSON text).
+EVENT_FIELDS = {
+    ACCT_ACTIVITY: (1, 2, 3),
+}
+
+
+class StreamerError(Exception):
+    """
+    The streamer refused a request (bad login, unknown service...).
+    """
+
+
+class QuoteTable:
+    """
+    Latest values for every symbol of one service. Each symbol is one float64 row (array('d')) with a
+    slot per field, NaN until the first update sets it. Schwab only sends the fields that changed,
+    apply() writes those into the row and leaves the rest alone.
+    """
+    def __init__(self, fields: dict[int, str]):
+        """
+        :param fields: Schwab field number -> column name, see SERVICE_FIELDS.
+        :type fields: dict[int, str]
+        """
+        self.fields = fields
+        self.names = tuple(fields.values())
+        self._slots = {str(number): slot for slot, number in enumerate(fields)}
+        self._columns = {name: slot for slot, name in enumerate(self.names)}
+        self._blank = array('d', [math.nan]) * len(fields)
+        self._rows: dict[str, array] = {}
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, symbol: str):
+        return symbol in self._rows
+
+    def symbols(self) -> list[str]:
+        return list(self._rows)
+
+    def apply(self, content: dict) -> array:
+        """
+        Merge one streamer content entry {'key': symbol, '<field number>': value, ...} into the table.
+        :return: The symbol's row.
+        :rtype: array
+        """
+        row = self._rows.get(content['key'])
+        if row is None:
+            row = self._rows[content['key']] = array('d', self._blank)
+        slots = self._slots
+        for field, value in content.items():
+            slot = slots.get(field)
+            if slot is not None:
+                row[slot] = value
+        return row
+
+    def value(self, symbol: str, name: str) -> float:
+        """
+        Latest value of one column e.g. table.value('AAPL', 'bid'), NaN if it was never sent.
+        """
+        row = self._rows.get(symbol)
+        return row[self._columns[name]] if row is not None else math.nan
+
+    def get(self, symbol: str) -> dict | None:
+        """
+        :return: {column name: value} for the symbol, None if nothing was received for it yet.
+        :rtype: dict | None
+        """
+        row = self._rows.get(symbol)
+        return dict(zip(self.names, row)) if row is not None else None
+
+
+class Streamer:
+    """
+    Logs in to the Schwab streamer, keeps the subscriptions and reconnects (then resubscribes) when the
+    socket drops. Runs on its own thread with start()/stop(), or await run() from an existing event loop.
+
+        streamer = Streamer(trader)
+        streamer.on(LEVELONE_EQUITIES, lambda service, symbol, table: print(symbol, table.value(symbol, 'last')))
+        streamer.subscribe(LEVELONE_EQUITIES, ['AAPL', 'MSFT'])
+        streamer.start()
+
+    Callbacks run on the streamer thread, keep them short (or hand the work to a queue).
+    """
+    def __init__(self, trader, reconnect: bool = True, max_backoff: float = 30.0, login_timeout: float = 10.0,
+                 decoder: JsonDecoder | None = None):
+        """
+        :param trader: Trader used for the streamer info (get_user_preferences) and the access token.
+        :type trader: Trader
+        :param reconnect: Reconnect and resubscribe when the connection drops.
+        :type reconnect: bool
+        :param max_backoff: Longest wait between reconnect attempts, the wait doubles from 1s up to this.
+        :type max_backoff: float
+        :param login_timeout: Seconds to wait for the LOGIN response.
+        :type login_timeout: float
+        :param decoder: Decoder for incoming messages, defaults to the trader's.
+        :type decoder: JsonDecoder | None
+        """
+        self.trader = trader
+        self.log = trader.log
+        self.reconnect = reconnect
+        self.max_backoff = max_backoff
+        self.login_timeout = login_timeout
+        self.decoder = decoder or getattr(trader, 'decoder', None) or JsonDecoder()
+        self.tables = {service: QuoteTable(fields) for service, fields in SERVICE_FIELDS.items()}
+        self.connected = threading.Event()
+        self.stats = {'messages': 0, 'updates': 0, 'heartbeats': 0, 'connects': 0, 'reconnects': 0,
+                      'callback_errors': 0}
+        self._subscriptions: dict[str, set[str]] = {}
+        self._subs_lock = threading.Lock()
+        self._callbacks: dict[str, list] = {}
+        self._request_ids = itertools.count()
+        self._info = None
+        self._ws = None
+        self._loop = None
+        self._thread = None
+        self._stopping = False
+
+# ---------- Public Methods ---------- #
+
+    def on(self, service: str, callback):
+        """
+        Call callback(service, symbol, table) after every update for service.
+        For EVENT_FIELDS services (ACCT_ACTIVITY) it is callback(service, key, content) with the raw content dict.
+        :param service: LEVELONE_EQUITIES, LEVELONE_OPTIONS, CHART_EQUITY or ACCT_ACTIVITY.
+        :type service: str
+        :param callback: callable(service: str, symbol: str, table: QuoteTable)
+        """
+        self._check_service(service)
+        self._callbacks.setdefault(service, []).append(callback)
+
+    def subscribe(self, service: str, symbols: str | list[str]):
+        """
+        Add symbols to a service. Remembered across reconnects, sent right away when connected.
+        :param service: LEVELONE_EQUITIES, LEVELONE_OPTIONS, CHART_EQUITY or ACCT_ACTIVITY (key e.g. "Account Activity").
+        :type service: str
+        :param symbols: "AAPL" or ["AAPL", "MSFT"], options use the Schwab option symbol e.g. "AAPL  250117C00200000".
+        :type symbols: str | list[str]
+        """
+        self._check_service(service)
+        symbols = [symbols] if isinstance(symbols, str) else list(symbols)
+        with self._subs_lock:
+            keys = self._subscriptions.setdefault(service, set())
+            command = 'ADD' if keys else 'SUBS'
+            keys.update(symbols)
+            self._send_threadsafe(self._subs_request(service, command, symbols))
+
+    def unsubscribe(self, service: str, symbols: str | list[str]):
+        """
+        Drop symbols from a service, their rows stay in the table with the last values received.
+        """
+        symbols = [symbols] if isinstance(symbols, str) else list(symbols)
+        with self._subs_lock:
+            self._subscriptions.get(service, set()).difference_update(symbols)
+            self._send_threadsafe(self._request(service, 'UNSUBS', {'keys': ','.join(symbols)}))
+
+    def start(self):
+        """
+        Run the streamer on a background thread.
+        :return: self, so streamer.start().connected.wait(5) works.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stopping = False
+        self._thread = threading.Thread(target=asyncio.run, args=(self.run(),), name='schwab-streamer', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float | None = 5.0):
+        """
+        Log out, close the socket and wait for the background thread to finish.
+        """
+        self._stopping = True
+        if self._loop is not None and self._ws is not None:
+            future = asyncio.run_coroutine_threadsafe(self._close(), self._loop)
+            try:
+                future.result(timeout)
+            except Exception as exc:
+                self.log.error(f"Streamer close failed: {exc!r}")
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    async def run(self):
+        """
+        Connect, log in, subscribe and dispatch messages until stop(). Reconnects with exponential
+        backoff when the socket drops (unless reconnect=False).
+        """
+        self._loop = asyncio.get_running_loop()
+        delay = 1.0
+        while not self._stopping:
+            try:
+                info = self._streamer_info()
+                async with websockets.connect(info['streamerSocketUrl'], max_size=None) as ws:
+                    await self._login(ws)
+                    # Anything subscribe() adds from here on is sent by subscribe() itself.
+                    with self._subs_lock:
+                        self._ws = ws
+                        resubscribe = {service: sorted(keys) for service, keys in self._subscriptions.items() if keys}
+                    self.stats['connects'] += 1
+                    for service, keys in resubscribe.items():
+                        await ws.send(self._subs_request(service, 'SUBS', keys))
+                    self.connected.set()
+                    delay = 1.0
+                    async for message in ws:
+                        self._dispatch(message)
+            except (OSError, asyncio.TimeoutError, WebSocketException, StreamerError,
+                    ValueError) as exc:
+                # WebSocketException covers a drop (ConnectionClosed) as well as a rejected handshake (InvalidStatus
+                # while Schwab restarts, InvalidURI), ValueError a frame that doesn't decode: all of them reconnect.
+                if not self._stopping:
+                    self.log.error(f"Streamer connection lost: {exc!r}")
+                # The socket url or customer id may be what changed (Schwab moved the account to another streamer
+                # host), fetch them again before the next try.
+                self._info = None
+            finally:
+                self._ws = None
+                self.connected.clear()
+
+            if self._stopping or not self.reconnect:
+                break
+            self.stats['reconnects'] += 1
+            await asyncio.sleep(delay)
+            delay = min(self.max_backoff, delay * 2)
+
+# ---------- Protocol ---------- #
+
+    def _check_service(self, service: str):
+        if service not in SERVICE_FIELDS and service not in EVENT_FIELDS:
+            raise ValueError(f"Unsupported service {service!r}, "
+                             f"expected one of {tuple(SERVICE_FIELDS) + tuple(EVENT_FIELDS)}.")
+
+    def _streamer_info(self) -> dict:
+        if self._info is None:
+            preferences = self.trader.get_user_preferences()
+            if not preferences or not preferences.get('streamerInfo'):
+                raise StreamerError("get_user_preferences() returned no streamerInfo.")
+            self._info = preferences['streamerInfo'][0]
+        return self._info
+
+    def _request(self, service: str, command: str, parameters: dict) -> str:
+        info = self._info or {}
+        return json.dumps({'requests': [{
+            'requestid': str(next(self._request_ids)), 'service': service, 'command': command,
+            'SchwabClientCustomerId': info.get('schwabClientCustomerId'),
+            'SchwabClientCorrelId': info.get('schwabClientCorrelId'),
+            'parameters': parameters}]})
+
+    def _subs_request(self, service: str, command: str, symbols: list[str]) -> str:
+        fields = ','.join(str(number) for number in (0, *(SERVICE_FIELDS.get(service) or EVENT_FIELDS[service])))
+        return self._request(service, command, {'keys': ','.join(symbols), 'fields': fields})
+
+    async def _login(self, ws):
+        info = self._info
+        await ws.send(self._request('ADMIN', 'LOGIN', {
+            'Authorization': self.trader.tokens.access_token,
+            'SchwabClientChannel': info.get('schwabClientChannel'),
+            'SchwabClientFunctionId': info.get('schwabClientFunctionId')}))
+        deadline = time.monotonic() + self.login_timeout
+        while True:
+            message = await asyncio.wait_for(ws.recv(), max(0.0, deadline - time.monotonic()))
+            for response in self.decoder.decode(message).get('response', ()):
+                if response.get('command') == 'LOGIN':
+                    content = response.get('content') or {}
+                    if content.get('code', 0) != 0:
+                        raise StreamerError(f"Streamer login failed: {content.get('msg')}")
+                    return
+
+    async def _close(self):
+        ws = self._ws
+        if ws is None:
+            return
+        try:
+            await ws.send(self._request('ADMIN', 'LOGOUT', {}))
+        except websockets.ConnectionClosed:
+            pass
+        await ws.close()
+
+    def _send_threadsafe(self, message: str):
+        # Only sent when connected, otherwise run() sends every subscription after the next login.
+        ws = self._ws
+        if ws is None or self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(ws.send(message), self._loop)
+
+    def _dispatch(self, message: str | bytes):
+        payload = self.decoder.decode(message)
+        self.stats['messages'] += 1
+        for data in payload.get('data', ()):
+            service = data.get('service')
+            callbacks = self._callbacks.get(service, ())
+            table = self.tables.get(service)
+            if table is None:
+                if service in EVENT_FIELDS:
+                    self._dispatch_events(service, data.get('content', ()), callbacks)
+                continue
+            for content in data.get('content', ()):
+                table.apply(content)
+                self.stats['updates'] += 1
+                for callback in callbacks:
+                    try:
+                        callback(service, content['key'], table)
+                    except Exception as exc:
+                        self.stats['callback_errors'] += 1
+                        self.log.error(f"Streamer callback {callback!r} failed: {exc!r}")
+        for response in payload.get('response', ()):
+            content = response.get('content') or {}
+            if content.get('code', 0) != 0:
+                self.log.error(f"Streamer {response.get('service')} {response.get('command')} failed: "
+                               f"{content.get('msg')}")
+        if 'notify' in payload:
+            self.stats['heartbeats'] += 1
+
+    def _dispatch_events(self, service: str, contents: list, callbacks):
+        for content in contents:
+            self.stats['updates'] += 1
+            for callback in callbacks:
+                try:
+                    callback(service, content.get('key'), content)
+                except Exception as exc:
+                    self.stats['callback_errors'] += 1
+                    self.log.error(f"Streamer callback {callback!r} failed: {exc!r}")
@@ -0,0 +1,10 @@
+# conftest.py puts the repo root and benchmarks/ (mock_server.py) on sys.path for the tests.
+# Run from the repo root: python -m pytest -q tests
+# Imports
+import os
+import sys
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (REPO, os.path.join(REPO, 'benchmarks')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
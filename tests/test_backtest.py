@@ -0,0 +1,36 @@
+# BacktestTrader fill rules on a single bar.
+# Imports
+import numpy as np
+import pytest
+
+from backtest import BacktestTrader, FillModel, Panel
+
+
+def one_bar(open_: float, high: float, low: float, close: float) -> BacktestTrader:
+    column = lambda value: np.array([[value]], dtype=np.float64)
+    panel = Panel(['AAPL'], np.array([0], dtype=np.int64), column(open_), column(high), column(low), column(close),
+                  column(1000.0))
+    return BacktestTrader(panel, FillModel(slippage_bps=0.0))
+
+
+def order(kind: str, instruction: str, **prices) -> dict:
+    return {'orderType': kind, **{key: str(value) for key, value in prices.items()},
+            'orderLegCollection': [{'instruction': instruction, 'quantity': 10,
+                                    'instrument': {'symbol': 'AAPL', 'assetType': 'EQUITY'}}]}
+
+
+@pytest.mark.parametrize('bar, form, expected', [
+    # Buys: stop 101, limit 102.
+    ((100, 103, 99, 102), order('STOP_LIMIT', 'BUY', stopPrice=101, price=102), 101.0),
+    ((101.5, 103, 101, 102), order('STOP_LIMIT', 'BUY', stopPrice=101, price=102), 101.5),
+    ((105, 106, 104, 105), order('STOP_LIMIT', 'BUY', stopPrice=101, price=102), None),
+    ((100, 100.5, 99, 100), order('STOP_LIMIT', 'BUY', stopPrice=101, price=102), None),
+    # Sells: stop 99, limit 98.
+    ((100, 101, 97, 98), order('STOP_LIMIT', 'SELL', stopPrice=99, price=98), 99.0),
+    ((98.5, 99, 97, 98), order('STOP_LIMIT', 'SELL', stopPrice=99, price=98), 98.5),
+    ((95, 96, 94, 95), order('STOP_LIMIT', 'SELL', stopPrice=99, price=98), None),
+    # A plain stop fills through the gap.
+    ((105, 106, 104, 105), order('STOP', 'BUY', stopPrice=101), 105.0),
+])
+def test_stop_limit_fills_only_within_the_limit(bar, form, expected):
+    assert one_bar(*bar)._fill_price(form, 0) == expected
@@ -0,0 +1,88 @@
+# ChainArchive round trip: every snapshot read back (at, replay) equals what was appended, across keyframes,
+# contracts coming and going, values the fixed-point deltas can't hold, and a writer reopening the day.
+# Imports
+import datetime as dt
+
+import numpy as np
+import pytest
+
+from chain_archive import ChainArchive
+from market_arrays import OptionChainTable
+from market_calendar import MARKET_TZ
+from mock_server import _chain
+
+OPEN_MS = int(dt.datetime(2025, 1, 15, 9, 30, tzinfo=MARKET_TZ).timestamp() * 1000)
+
+
+def snapshots(count: int, seed: int = 1) -> list[dict]:
+    # The mock chain repriced every step: cents quotes, 3 decimal greeks, the odd unrounded value, growing volume
+    # and a strike that is only listed in some of the snapshots.
+    rng = np.random.default_rng(seed)
+    chains = []
+    for step in range(count):
+        chain = _chain('SPY', strikes=6, expirations=2)
+        for exp_map in (chain['callExpDateMap'], chain['putExpDateMap']):
+            for strikes in exp_map.values():
+                if step % 3 == 1:
+                    strikes.pop(next(iter(strikes)))
+                for contracts in strikes.values():
+                    contract = contracts[0]
+                    bid = round(float(rng.uniform(0.5, 20.0)), 2)
+                    contract.update(bid=bid, ask=round(bid + 0.05, 2), mark=round(bid + 0.025, 3),
+                                    delta=round(float(rng.uniform(-1, 1)), 3),
+                                    theoreticalOptionValue=float(rng.uniform(0.5, 20.0)),
+                                    totalVolume=step * 10 + int(rng.integers(0, 5)), bidSize=int(rng.integers(1, 50)))
+                    if rng.random() < 0.1:
+                        contract['volatility'] = float('nan')
+        chain['underlyingPrice'] = round(100 + step * 0.1, 2)
+        chains.append(chain)
+    return chains
+
+
+def assert_same(table: OptionChainTable, chain: dict):
+    expected = OptionChainTable.from_json(chain)
+    assert table.underlying == expected.underlying and len(table) == len(expected)
+    order, expected_order = np.argsort(table.symbol), np.argsort(expected.symbol)
+    for column in expected.column_names():
+        np.testing.assert_array_equal(getattr(table, column)[order], getattr(expected, column)[expected_order],
+                                      err_msg=column)
+
+
+@pytest.fixture
+def chains() -> list[dict]:
+    return snapshots(12)
+
+
+def test_at_returns_each_snapshot(tmp_path, chains):
+    with ChainArchive(str(tmp_path), keyframe_interval=4) as archive:
+        for i, chain in enumerate(chains):
+            archive.append(chain, OPEN_MS + i * 60_000)
+        assert archive.stats['keyframes'] == 3
+    reader = ChainArchive(str(tmp_path))
+    for i, chain in enumerate(chains):
+        assert_same(reader.at('SPY', OPEN_MS + i * 60_000 + 30_000), chain)
+    assert reader.at('SPY', OPEN_MS - 1) is None
+
+
+def test_replay_yields_every_snapshot_in_order(tmp_path, chains):
+    with ChainArchive(str(tmp_path), keyframe_interval=5) as archive:
+        for i, chain in enumerate(chains):
+            archive.append(chain, OPEN_MS + i * 60_000)
+    replayed = list(ChainArchive(str(tmp_path)).replay('SPY', OPEN_MS, dt.date(2025, 1, 15)))
+    assert [timestamp for timestamp, _ in replayed] == [OPEN_MS + i * 60_000 for i in range(len(chains))]
+    for (_, table), chain in zip(replayed, chains):
+        assert_same(table, chain)
+
+
+def test_reopened_writer_continues_the_day(tmp_path, chains):
+    with ChainArchive(str(tmp_path), keyframe_interval=30) as archive:
+        for i, chain in enumerate(chains[:5]):
+            archive.append(chain, OPEN_MS + i * 60_000)
+    with ChainArchive(str(tmp_path), keyframe_interval=30) as archive:
+        for i, chain in enumerate(chains[5:], start=5):
+            archive.append(chain, OPEN_MS + i * 60_000)
+        with pytest.raises(ValueError):
+            archive.append(chains[0], OPEN_MS)
+    reader = ChainArchive(str(tmp_path))
+    for i, chain in enumerate(chains):
+        assert_same(reader.at('SPY', OPEN_MS + i * 60_000), chain)
@@ -0,0 +1,62 @@
+# Range math of history_store.py: date ends cover the whole day, covered ranges and gaps.
+# Imports
+import datetime as dt
+
+import pytest
+
+from history_store import HistoryStore, to_epoch_ms
+from market_calendar import day_start_ms
+
+MINUTE_MS = 60_000
+DAYS = [dt.date(2024, 1, 2), dt.date(2024, 1, 3), dt.date(2024, 1, 4), dt.date(2024, 1, 5)]
+
+
+def minute_bars(days: list[dt.date]) -> list[dict]:
+    # Regular session minute bars, 9:30 to 15:59 New York time.
+    bars = []
+    for day in days:
+        open_ms = day_start_ms(day) + (9 * 60 + 30) * MINUTE_MS
+        bars += [{'datetime': open_ms + i * MINUTE_MS, 'open': 1.0, 'high': 1.0, 'low': 1.0, 'close': 1.0,
+                  'volume': 100} for i in range(390)]
+    return bars
+
+
+@pytest.fixture
+def store(tmp_path) -> HistoryStore:
+    store = HistoryStore(str(tmp_path))
+    covered = (day_start_ms(DAYS[0]), day_start_ms(DAYS[-1] + dt.timedelta(days=1)) - 1)
+    store.merge('AAPL', 'minute', 1, minute_bars(DAYS), covered)
+    return store
+
+
+def test_date_end_is_end_of_day():
+    day = dt.date(2024, 1, 5)
+    assert to_epoch_ms(day) == day_start_ms(day)
+    assert to_epoch_ms(day, end=True) == day_start_ms(dt.date(2024, 1, 6)) - 1
+    assert to_epoch_ms(1_700_000_000_000, end=True) == 1_700_000_000_000
+
+
+def test_read_date_range_includes_last_day(store):
+    candles = store.read('AAPL', 'minute', 1, DAYS[0], DAYS[-1])
+    assert len(candles) == 4 * 390
+    assert candles['datetime'][-1] == day_start_ms(DAYS[-1]) + (15 * 60 + 59) * MINUTE_MS
+
+
+def test_read_single_day(store):
+    assert len(store.read('AAPL', 'minute', 1, DAYS[1], DAYS[1])) == 390
+
+
+def test_read_ms_range_is_inclusive(store):
+    first = day_start_ms(DAYS[0]) + (9 * 60 + 30) * MINUTE_MS
+    assert len(store.read('AAPL', 'minute', 1, first, first + 9 * MINUTE_MS)) == 10
+
+
+def test_nothing_missing_for_fetched_days(store):
+    assert store.missing_ranges('AAPL', 'minute', 1, DAYS[0], DAYS[-1]) == []
+
+
+def test_missing_next_day_only(store):
+    # Monday after the stored week, the weekend in between is never fetched.
+    monday = dt.date(2024, 1, 8)
+    missing = store.missing_ranges('AAPL', 'minute', 1, DAYS[0], monday)
+    assert missing == [(day_start_ms(monday), day_start_ms(monday + dt.timedelta(days=1)) - 1)]
@@ -0,0 +1,78 @@
+# OrderBook incremental sync against the mock Schwab server: only new or changed orders count, events fire once.
+# Imports
+import pytest
+
+from mock_server import MockServer, StubTokens
+from order_book import EVENT_CANCEL, EVENT_FILL, EVENT_NEW, EVENT_STATUS, OrderBook
+from trader import Trader
+
+
+def limit_order(symbol: str, quantity: int = 10) -> dict:
+    return {'orderType': 'LIMIT', 'session': 'NORMAL', 'duration': 'DAY', 'price': '100.00',
+            'orderStrategyType': 'SINGLE',
+            'orderLegCollection': [{'instruction': 'BUY', 'quantity': quantity,
+                                    'instrument': {'symbol': symbol, 'assetType': 'EQUITY'}}]}
+
+
+@pytest.fixture
+def trader():
+    with MockServer() as server, Trader(None, tokens=StubTokens(server.base_url), rate_limit=False,
+                                        resilient=False, auto_refresh=False) as trader:
+        trader.server = server
+        yield trader
+
+
+@pytest.fixture
+def book(trader):
+    book = OrderBook(trader, account_hash='MOCKHASH')
+    book.events = []
+    for event in (EVENT_NEW, EVENT_FILL, EVENT_STATUS, EVENT_CANCEL):
+        book.on(event, lambda event, order, previous: book.events.append((event, order['orderId'])))
+    return book
+
+
+def place(trader, symbol: str) -> int:
+    response = trader.post_orders('MOCKHASH', limit_order(symbol))
+    assert response.status_code == 201
+    return int(response.headers['Location'].rsplit('/', 1)[1])
+
+
+def test_first_sync_loads_every_order(trader, book):
+    ids = [place(trader, symbol) for symbol in ('AAPL', 'MSFT', 'AAPL')]
+    assert book.sync() == 3
+    assert len(book) == 3 and all(order_id in book for order_id in ids)
+    assert sorted(order['orderId'] for order in book.orders(symbol='AAPL')) == [ids[0], ids[2]]
+    assert book.events == [(EVENT_NEW, order_id) for order_id in ids]
+
+
+def test_unchanged_orders_are_not_counted_again(trader, book):
+    place(trader, 'AAPL')
+    book.sync()
+    book.events.clear()
+    assert book.sync() == 0
+    assert book.events == []
+    assert book.stats['syncs'] == 2 and book.stats['changed'] == 1
+
+
+def test_changes_are_picked_up_and_reindexed(trader, book):
+    filled, canceled, untouched = (place(trader, symbol) for symbol in ('AAPL', 'MSFT', 'NVDA'))
+    book.sync()
+    book.events.clear()
+    with trader.server.httpd.lock:
+        trader.server.httpd.orders[filled].update(status='FILLED', filledQuantity=10.0, remainingQuantity=0.0)
+    trader.delete_order('MOCKHASH', canceled)
+
+    assert book.sync() == 2
+    assert sorted(book.events) == sorted([(EVENT_FILL, filled), (EVENT_STATUS, filled), (EVENT_STATUS, canceled),
+                                          (EVENT_CANCEL, canceled)])
+    assert [order['orderId'] for order in book.open_orders()] == [untouched]
+    assert [order['orderId'] for order in book.orders(status='FILLED', symbol='AAPL')] == [filled]
+    assert book.orders(status='WORKING', symbol='AAPL') == []
+
+
+def test_failed_sync_keeps_the_book(trader, book):
+    place(trader, 'AAPL')
+    book.sync()
+    trader.server.httpd.error_rate = 1.0
+    assert book.sync() == -1
+    assert len(book) == 1 and book.stats['failures'] == 1
@@ -0,0 +1,37 @@
+# OrderPipeline against the mock Schwab server: the account is resolved once, orders land on it.
+# Imports
+import pytest
+
+from mock_server import MockServer, StubTokens
+from order_pipeline import OrderPipeline, limit_form
+from trader import Trader
+
+
+@pytest.fixture
+def trader():
+    with MockServer(accounts=2) as server, Trader(None, tokens=StubTokens(server.base_url), rate_limit=False,
+                                                  resilient=False, auto_refresh=False) as trader:
+        trader.server = server
+        yield trader
+
+
+@pytest.mark.parametrize('account, expected', [(None, 'MOCKHASH'), ('12345679', 'MOCKHASH1'),
+                                               (12345679, 'MOCKHASH1'), ('MOCKHASH1', 'MOCKHASH1')])
+def test_account_is_resolved_to_its_hash(trader, account, expected):
+    with OrderPipeline(trader, account, keep_warm=None) as pipeline:
+        assert pipeline.account_hash == expected
+        assert pipeline.path == f'/trader/v1/accounts/{expected}/orders'
+
+
+def test_submit_places_the_order_on_the_account(trader):
+    with OrderPipeline(trader, 12345679, keep_warm=None) as pipeline:
+        pipeline.add('buy', limit_form('AAPL', 'BUY'))
+        submission = pipeline.submit('buy', price=187.5, quantity=10)
+    assert submission.ok and submission.order_id is not None
+    order = trader.server.httpd.orders[int(submission.order_id)]
+    assert order['accountNumber'] == 12345679 and order['price'] == '187.50'
+
+
+def test_unknown_account_number_fails_up_front(trader):
+    with pytest.raises(ValueError):
+        OrderPipeline(trader, 99999999, keep_warm=None)
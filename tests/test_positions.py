@@ -0,0 +1,68 @@
+# Position.fill and PositionEngine.on_fill: average price, realized P&L, flips and the engine's running totals.
+# Imports
+import pytest
+
+from positions import Position, PositionEngine
+
+
+class NoTrader:
+    # PositionEngine only needs a log until it fetches a snapshot, the tests hand it one.
+    class log:
+        @staticmethod
+        def error(message):
+            raise AssertionError(message)
+
+
+def test_adding_averages_the_price():
+    position = Position('AAPL')
+    assert position.fill(10, 100.0) == 0.0
+    assert position.fill(30, 104.0) == 0.0
+    assert position.quantity == 40 and position.average_price == pytest.approx(103.0)
+
+
+def test_selling_part_realizes_pnl_and_keeps_the_average():
+    position = Position('AAPL', quantity=40, average_price=103.0)
+    assert position.fill(-10, 110.0) == pytest.approx(70.0)
+    assert position.quantity == 30 and position.average_price == pytest.approx(103.0)
+    assert position.realized_pnl == pytest.approx(70.0)
+
+
+def test_closing_resets_the_average():
+    position = Position('AAPL', quantity=10, average_price=50.0)
+    assert position.fill(-10, 45.0) == pytest.approx(-50.0)
+    assert position.quantity == 0 and position.average_price == 0.0
+
+
+def test_flip_opens_the_rest_at_the_fill_price():
+    position = Position('AAPL', quantity=10, average_price=50.0)
+    assert position.fill(-25, 60.0) == pytest.approx(100.0)
+    assert position.quantity == -15 and position.average_price == 60.0
+
+
+def test_short_gains_when_price_drops():
+    position = Position('AAPL', quantity=-20, average_price=80.0)
+    assert position.fill(5, 70.0) == pytest.approx(50.0)
+    assert position.quantity == -15 and position.average_price == 80.0
+
+
+def test_option_pnl_uses_the_multiplier():
+    position = Position('AAPL  250117C00150000', 'OPTION')
+    position.fill(2, 3.0)
+    assert position.fill(-2, 4.5) == pytest.approx(2 * 1.5 * position.multiplier)
+    assert position.multiplier == 100
+
+
+def test_engine_totals_follow_fills():
+    engine = PositionEngine(NoTrader(), reconcile_interval=None)
+    engine.load({'securitiesAccount': {'accountNumber': '12345678', 'positions': [],
+                                       'currentBalances': {'cashBalance': 10_000.0, 'buyingPower': 10_000.0}}})
+    engine.on_fill('AAPL', 'BUY', 10, 100.0)
+    engine.on_fill('AAPL', 'SELL', 4, 110.0)
+    engine.on_quote('AAPL', 120.0)
+    position = engine.get('AAPL')
+    assert position.quantity == 6 and position.average_price == pytest.approx(100.0)
+    assert engine.realized_pnl == pytest.approx(40.0)
+    assert engine.cash == pytest.approx(10_000.0 - 1000.0 + 440.0)
+    assert engine.market_value == pytest.approx(6 * 120.0)
+    assert engine.unrealized_pnl == pytest.approx(6 * 20.0)
+    assert engine.stats['fills'] == 2
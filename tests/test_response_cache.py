@@ -0,0 +1,84 @@
+# ResponseCache: values are copied in and out, TTLs, LRU eviction and the round trip through the file.
+# Imports
+import time
+
+from response_cache import ResponseCache
+
+PATH = '/marketdata/v1/instruments'
+PARAMS = {'symbol': 'AAPL', 'projection': 'fundamental'}
+
+
+def instruments() -> dict:
+    return {'instruments': [{'symbol': 'AAPL', 'fundamental': {'peRatio': 30.1}}]}
+
+
+def test_caller_changing_the_stored_value_does_not_change_the_cache():
+    cache = ResponseCache()
+    value = instruments()
+    cache.set('get_instruments', PATH, PARAMS, value)
+    value['instruments'][0]['fundamental']['peRatio'] = 0.0
+    value['instruments'].append({'symbol': 'MSFT'})
+    assert cache.get('get_instruments', PATH, PARAMS) == (True, instruments())
+
+
+def test_caller_changing_a_hit_does_not_change_the_cache():
+    cache = ResponseCache()
+    cache.set('get_instruments', PATH, PARAMS, instruments())
+    _, first = cache.get('get_instruments', PATH, PARAMS)
+    first['instruments'][0]['fundamental']['peRatio'] = 0.0
+    _, second = cache.get('get_instruments', PATH, PARAMS)
+    assert second == instruments() and second is not first
+
+
+def test_endpoints_without_ttl_are_not_cached():
+    cache = ResponseCache()
+    cache.set('get_quotes', '/marketdata/v1/quotes', None, {'AAPL': {}})
+    assert cache.get('get_quotes', '/marketdata/v1/quotes') == (False, None)
+
+
+def test_expired_entries_miss():
+    cache = ResponseCache(ttls={'get_instruments': 0.01})
+    cache.set('get_instruments', PATH, PARAMS, instruments())
+    time.sleep(0.02)
+    assert cache.get('get_instruments', PATH, PARAMS) == (False, None)
+    assert cache.stats['expired'] == 1
+
+
+def test_least_recently_used_is_evicted():
+    cache = ResponseCache(max_entries=2)
+    for symbol in ('A', 'B'):
+        cache.set('get_instruments', PATH, {'symbol': symbol}, {'symbol': symbol})
+    cache.get('get_instruments', PATH, {'symbol': 'A'})
+    cache.set('get_instruments', PATH, {'symbol': 'C'}, {'symbol': 'C'})
+    assert cache.get('get_instruments', PATH, {'symbol': 'B'})[0] is False
+    assert cache.get('get_instruments', PATH, {'symbol': 'A'})[0] is True
+
+
+def test_saved_cache_is_loaded_back(tmp_path):
+    path = str(tmp_path / 'cache.json')
+    cache = ResponseCache(path=path)
+    cache.set('get_instruments', PATH, PARAMS, instruments())
+    cache.close()
+    assert ResponseCache(path=path).get('get_instruments', PATH, PARAMS) == (True, instruments())
+
+
+def test_account_endpoints_are_not_written_to_disk(tmp_path):
+    path = str(tmp_path / 'cache.json')
+    cache = ResponseCache(path=path)
+    cache.set('get_account_number', '/trader/v1/accounts/accountNumbers', None,
+              [{'accountNumber': '12345678', 'hashValue': 'MOCKHASH'}])
+    cache.set('get_instruments', PATH, PARAMS, instruments())
+    cache.close()
+    with open(path) as f:
+        saved = f.read()
+    assert '12345678' not in saved and 'MOCKHASH' not in saved
+    assert cache.get('get_account_number', '/trader/v1/accounts/accountNumbers')[0] is True
+    assert ResponseCache(path=path).get('get_instruments', PATH, PARAMS)[0] is True
+
+
+def test_cache_file_is_owner_only(tmp_path):
+    path = tmp_path / 'cache.json'
+    cache = ResponseCache(path=str(path))
+    cache.set('get_instruments', PATH, PARAMS, instruments())
+    cache.close()
+    assert path.stat().st_mode & 0o777 == 0o600
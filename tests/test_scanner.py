@@ -0,0 +1,106 @@
+# Scanner indicators (SMA, EMA, Wilder RSI, session VWAP) against a from-scratch computation over the whole series.
+# Imports
+import datetime as dt
+
+import numpy as np
+import pytest
+
+from market_calendar import MARKET_TZ
+from scanner import Scanner
+
+SMA, EMA, RSI = (5, 20), (12,), (14,)
+
+
+def sma(closes: np.ndarray, n: int) -> float:
+    return closes[-n:].mean() if len(closes) >= n else np.nan
+
+
+def ema(closes: np.ndarray, n: int) -> float:
+    value = closes[0]
+    for close in closes[1:]:
+        value += 2.0 / (n + 1) * (close - value)
+    return value
+
+
+def rsi(closes: np.ndarray, n: int) -> float:
+    changes = np.diff(closes)
+    if len(changes) < n:
+        return np.nan
+    gain = np.maximum(changes[:n], 0).mean()
+    loss = np.maximum(-changes[:n], 0).mean()
+    for change in changes[n:]:
+        gain = (gain * (n - 1) + max(change, 0.0)) / n
+        loss = (loss * (n - 1) + max(-change, 0.0)) / n
+    return 100.0 * gain / (gain + loss) if gain + loss > 0 else 50.0
+
+
+def vwap(times, highs, lows, closes, volumes) -> float:
+    day = dt.datetime.fromtimestamp(times[-1] / 1000, MARKET_TZ).date()
+    today = np.array([dt.datetime.fromtimestamp(t / 1000, MARKET_TZ).date() == day for t in times])
+    typical = (highs + lows + closes) / 3.0
+    return (typical[today] * volumes[today]).sum() / volumes[today].sum()
+
+
+def bars(seed: int, count: int) -> dict[str, np.ndarray]:
+    # Minute bars over two trading days so VWAP has to reset.
+    rng = np.random.default_rng(seed)
+    first = int(dt.datetime(2024, 1, 2, 15, 30, tzinfo=MARKET_TZ).timestamp() * 1000)
+    times = first + np.arange(count, dtype=np.int64) * 60_000
+    times[count // 2:] += 17 * 60 * 60_000 + 30 * 60_000     # next morning
+    closes = 100 + np.cumsum(rng.normal(0, 0.5, count))
+    opens = closes + rng.normal(0, 0.1, count)
+    return {'datetime': times, 'open': opens, 'high': np.maximum(opens, closes) + 0.2,
+            'low': np.minimum(opens, closes) - 0.2, 'close': closes,
+            'volume': rng.integers(100, 10_000, count).astype(np.float64)}
+
+
+def check(scanner: Scanner, symbol: str, data: dict, upto: int):
+    closes = data['close'][:upto]
+    row = scanner.row(symbol)
+    assert row['bars'] == upto and row['close'] == closes[-1]
+    for n in SMA:
+        assert row[f'sma_{n}'] == pytest.approx(sma(closes, n), nan_ok=True)
+    for n in EMA:
+        assert row[f'ema_{n}'] == pytest.approx(ema(closes, n))
+    for n in RSI:
+        assert row[f'rsi_{n}'] == pytest.approx(rsi(closes, n), nan_ok=True)
+    assert row['vwap'] == pytest.approx(vwap(data['datetime'][:upto], data['high'][:upto], data['low'][:upto],
+                                             closes, data['volume'][:upto]))
+    np.testing.assert_array_equal(scanner.history(symbol), closes[-scanner.window:])
+
+
+def test_incremental_updates_match_from_scratch():
+    data = bars(1, 60)
+    scanner = Scanner(sma=SMA, ema=EMA, rsi=RSI)
+    for i in range(60):
+        scanner.update('AAPL', *(data[name][i] for name in ('datetime', 'open', 'high', 'low', 'close', 'volume')))
+        if i in (0, 3, 4, 13, 14, 19, 29, 30, 59):
+            check(scanner, 'AAPL', data, i + 1)
+
+
+def test_seed_across_symbols_of_different_lengths():
+    candles = {'AAPL': bars(2, 80), 'MSFT': bars(3, 40), 'NVDA': bars(4, 10)}
+    scanner = Scanner(sma=SMA, ema=EMA, rsi=RSI)
+    scanner.seed({symbol: np.rec.fromarrays([data[name] for name in data], names=list(data))
+                  for symbol, data in candles.items()})
+    for symbol, data in candles.items():
+        check(scanner, symbol, data, len(data['close']))
+
+
+def test_stale_bars_are_dropped():
+    data = bars(5, 3)
+    scanner = Scanner(sma=(2,), ema=(), rsi=())
+    for i in (0, 1, 1, 0, 2):
+        scanner.update('AAPL', data['datetime'][i], 1.0, 1.0, 1.0, data['close'][i], 1.0)
+    assert scanner.stats['stale'] == 2
+    np.testing.assert_array_equal(scanner.history('AAPL'), data['close'][1:3])
+
+
+def test_scan_filters_and_sorts():
+    scanner = Scanner(sma=(2,), ema=(), rsi=())
+    for symbol, closes in (('UP', (1.0, 2.0, 3.0)), ('DOWN', (3.0, 2.0, 1.0)), ('FLAT', (2.0, 2.0, 2.0))):
+        for i, close in enumerate(closes):
+            scanner.update(symbol, 1_704_205_800_000 + i * 60_000, close, close, close, close, 10.0 * (i + 1))
+    assert scanner.scan('close > sma_2') == ['UP']
+    assert scanner.scan('close >= sma_2', sort='close', descending=False) == ['FLAT', 'UP']
+    assert scanner.scan(sort='close', limit=2) == ['UP', 'FLAT']
@@ -0,0 +1,52 @@
+# SharedQuoteTable: quotes and chains read back from shared memory, and the sequences guarding a chain snapshot.
+# Imports
+import os
+
+import numpy as np
+import pytest
+
+from market_arrays import OptionChainTable
+from mock_server import _chain
+from shared_quotes import SharedQuoteTable
+
+
+@pytest.fixture
+def table():
+    table = SharedQuoteTable(f'test_quotes_{os.getpid()}', create=True, capacity=1000)
+    yield table
+    table.close()
+
+
+def test_quotes_round_trip(table):
+    assert table.publish_quotes({'AAPL': {'quote': {'bidPrice': 1.5, 'askPrice': 1.6, 'lastPrice': 1.55}},
+                                 'BAD': {}}) == 1
+    reader = SharedQuoteTable(table.name)
+    try:
+        assert reader.get('AAPL')['bid'] == 1.5
+        np.testing.assert_array_equal(reader.read(['AAPL', 'MSFT'], ['ask']), [[1.6], [np.nan]])
+    finally:
+        reader.close()
+
+
+def test_chain_round_trip_and_dropped_contracts(table):
+    chain = _chain('SPY', strikes=4)
+    table.publish_chain(chain)
+    assert sorted(table.chain('SPY').symbol) == sorted(OptionChainTable.from_json(chain).symbol)
+    smaller = _chain('SPY', strikes=2)
+    table.publish_chain(smaller)
+    assert sorted(table.chain('SPY').symbol) == sorted(OptionChainTable.from_json(smaller).symbol)
+
+
+def test_contract_quote_updates_guard_the_chain(table):
+    chain = OptionChainTable.from_json(_chain('SPY', strikes=2))
+    table.publish_chain(chain)
+    parent, contract = table.row('SPY'), table.row(chain.symbol[0])
+    before = int(table.seq[parent])
+    table.publish(chain.symbol[0], {'bid': 9.5})
+    table.publish_quotes({chain.symbol[1]: {'quote': {'bidPrice': 8.5}}})
+    assert int(table.seq[parent]) == before + 4 and int(table.seq[parent]) % 2 == 0
+    assert table.chain('SPY').bid[list(table.chain('SPY').symbol).index(chain.symbol[0])] == 9.5
+    # A plain quote row guards only itself.
+    table.publish('AAPL', {'bid': 1.0})
+    assert int(table.seq[parent]) == before + 4 and int(table.seq[table.row('AAPL')]) == 2
+    assert int(table.seq[contract]) % 2 == 0
@@ -0,0 +1,47 @@
+# stdlib_http.StdlibSession against the mock Schwab server: reads, JSON bodies, connection reuse, transport errors.
+# Imports
+import json
+
+import pytest
+
+from mock_server import MockServer
+from resilience import transport_errors
+from stdlib_http import StdlibSession, TransportError
+
+
+@pytest.fixture(scope='module')
+def server():
+    with MockServer() as server:
+        yield server
+
+
+def test_get_with_params(server):
+    with StdlibSession() as session:
+        response = session.request('GET', f'{server.base_url}/marketdata/v1/quotes',
+                                   params={'symbols': 'AAPL,MSFT', 'fields': 'quote'}, timeout=5)
+    assert response.status_code == 200 and response.ok
+    assert set(json.loads(response.content)) == {'AAPL', 'MSFT'}
+    assert response.headers.get('content-type').startswith('application/json')
+
+
+def test_post_json_keeps_headers(server):
+    hashed = 'MOCKHASH'
+    order = {'orderType': 'MARKET', 'orderLegCollection': [{'quantity': 1, 'instruction': 'BUY'}]}
+    with StdlibSession() as session:
+        response = session.request('POST', f'{server.base_url}/trader/v1/accounts/{hashed}/orders', json=order,
+                                   timeout=5)
+    assert response.status_code == 201
+    assert response.headers.get('Location').startswith(f'/trader/v1/accounts/{hashed}/orders/')
+
+
+def test_connection_is_reused(server):
+    with StdlibSession() as session:
+        for _ in range(5):
+            assert session.get(f'{server.base_url}/marketdata/v1/AAPL/quotes', timeout=5).status_code == 200
+        assert session.stats == {'requests': 5, 'connections': 1}
+
+
+def test_transport_error_is_retryable():
+    with StdlibSession() as session, pytest.raises(TransportError) as error:
+        session.get('http://127.0.0.1:9/marketdata/v1/quotes', timeout=1)
+    assert isinstance(error.value, transport_errors())
@@ -0,0 +1,27 @@
+# Streamer against the mock Schwab server and MockStreamer: reconnecting after the socket url changes.
+# Imports
+import time
+
+import pytest
+
+pytest.importorskip('websockets')
+
+from mock_server import MockServer, StubTokens
+from mock_streamer import MockStreamer
+from streamer import Streamer
+from trader import Trader
+
+
+def test_failed_connection_fetches_the_streamer_info_again():
+    with MockStreamer([]) as mock, MockServer(streamer_url='ws://127.0.0.1:9') as server:
+        with Trader(None, tokens=StubTokens(server.base_url), rate_limit=False) as trader:
+            streamer = Streamer(trader, max_backoff=1.0).start()
+            deadline = time.monotonic() + 5
+            while not streamer.stats['reconnects'] and time.monotonic() < deadline:
+                time.sleep(0.01)
+            # Schwab handed out a new host, the next try has to ask for it instead of dialing the old one.
+            server.httpd.streamer_url = mock.url
+            connected = streamer.connected.wait(5)
+            streamer.stop()
+    assert connected
+    assert mock.logins >= 1
@@ -0,0 +1,125 @@
+# Trader._request against the mock Schwab server: 5xx retries, 429 backoff and the 401 refresh + resend.
+# Imports
+import pytest
+
+from mock_server import MockSchwabHandler, MockServer, StubTokens
+from rate_limiter import MARKET_DATA, ORDERS, RequestScheduler
+from resilience import RequestExecutor, RetryPolicy
+from token_refresher import TokenRefresher
+from trader import Trader
+
+QUOTE_ROUTE = 'GET /marketdata/v1/{symbol_id}/quotes'
+ORDER_ROUTE = 'POST /trader/v1/accounts/{accountHash}/orders'
+QUOTE = {'AAPL': {'symbol': 'AAPL', 'quote': {'lastPrice': 100.0}}}
+
+
+def answer(status: int, body=None, headers: dict | None = None) -> dict:
+    return {'status': status, 'body': body if body is not None else {'message': f'status {status}'},
+            'headers': headers or {}}
+
+
+def make_trader(server: MockServer, tokens=None, retries: int = 2, **kwargs) -> Trader:
+    executor = RequestExecutor(retry=RetryPolicy(retries=retries, base_delay=0.001), failure_threshold=10 ** 6,
+                               hedge_routes=())
+    kwargs.setdefault('rate_limit', False)
+    return Trader(None, tokens=tokens or StubTokens(server.base_url), executor=executor, auto_refresh=False,
+                  **kwargs)
+
+
+def unlimited_scheduler() -> RequestScheduler:
+    # 429s are only backed off and resent with a scheduler, give it limits that never hold a request back.
+    return RequestScheduler(limits={MARKET_DATA: 1e9, ORDERS: 1e9})
+
+
+def test_get_retried_after_5xx():
+    fixtures = {QUOTE_ROUTE: [answer(503), answer(502), answer(200, QUOTE)]}
+    with MockServer(fixtures=fixtures) as server, make_trader(server) as trader:
+        assert trader.get_single_quote('AAPL') == QUOTE
+        assert server.hits == 3
+        assert trader.executor.counters['retries'] == 2
+
+
+def test_get_gives_up_after_retries():
+    with MockServer(error_rate=1.0) as server, make_trader(server, retries=2) as trader:
+        assert trader.get_single_quote('AAPL') is None
+        assert server.hits == 3
+
+
+def test_post_is_never_retried():
+    with MockServer(fixtures={ORDER_ROUTE: [answer(503)]}) as server, make_trader(server) as trader:
+        response = trader.post_orders('MOCKHASH', {'orderType': 'MARKET'})
+        assert response.status_code == 503
+        assert server.hits == 1
+        assert trader.executor.counters['retries'] == 0
+
+
+def test_429_backs_off_and_resends():
+    fixtures = {QUOTE_ROUTE: [answer(429, headers={'Retry-After': '0'}), answer(200, QUOTE)]}
+    with MockServer(fixtures=fixtures) as server, \
+            make_trader(server, rate_limit=True, scheduler=unlimited_scheduler()) as trader:
+        assert trader.get_single_quote('AAPL') == QUOTE
+        assert server.hits == 2
+
+
+def test_429_resends_at_most_max_throttle_retries():
+    with MockServer(throttle_rate=1.0) as server, \
+            make_trader(server, rate_limit=True, scheduler=unlimited_scheduler(), max_throttle_retries=2) as trader:
+        assert trader.get_single_quote('AAPL') is None
+        assert server.hits == 3
+
+
+class AuthorizingHandler(MockSchwabHandler):
+    # Answers 401 unless the request carries the current token of the server.
+
+    def _handle(self, method: str):
+        if self.headers.get('Authorization') != f'Bearer {self.server.valid_token}':
+            self.server.unauthorized += 1
+            self._send_json({'message': 'Unauthorized', 'errors': ['token expired']}, 401)
+            return
+        super()._handle(method)
+
+
+class ExpiringTokens(StubTokens):
+    # refresh_access_token() gets the token the server currently accepts.
+
+    def __init__(self, server: MockServer):
+        super().__init__(server.base_url, access_token='expired-token')
+        self.server = server
+
+    def refresh_access_token(self):
+        self.access_token = self.server.httpd.valid_token
+
+
+@pytest.fixture
+def auth_server():
+    with MockServer(handler=AuthorizingHandler) as server:
+        server.httpd.valid_token = 'fresh-token'
+        server.httpd.unauthorized = 0
+        yield server
+
+
+def test_401_refreshes_and_resends_once(auth_server):
+    tokens = ExpiringTokens(auth_server)
+    refresher = TokenRefresher(tokens)
+    with make_trader(auth_server, tokens=tokens, token_refresher=refresher) as trader:
+        assert trader.get_single_quote('AAPL') is not None
+        assert auth_server.httpd.unauthorized == 1
+        assert refresher.stats['unauthorized'] == 1
+        # The new token is used from then on.
+        assert trader.get_single_quote('MSFT') is not None
+        assert auth_server.httpd.unauthorized == 1
+
+
+def test_401_without_refresher_is_returned(auth_server):
+    with make_trader(auth_server, tokens=ExpiringTokens(auth_server)) as trader:
+        assert trader.get_single_quote('AAPL') is None
+        assert auth_server.hits == 0 and auth_server.httpd.unauthorized == 1
+
+
+def test_401_after_refresh_is_not_resent_again(auth_server):
+    tokens = ExpiringTokens(auth_server)
+    auth_server.httpd.valid_token = 'never-handed-out'
+    refresher = TokenRefresher(tokens, refresh=lambda: setattr(tokens, 'access_token', 'still-wrong'))
+    with make_trader(auth_server, tokens=tokens, token_refresher=refresher) as trader:
+        assert trader.get_single_quote('AAPL') is None
+        assert auth_server.httpd.unauthorized == 2
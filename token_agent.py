@@ -0,0 +1,317 @@
+# token_agent.py keeps the decrypted Schwab tokens in one long lived process and hands them out over a Unix socket,
+# so scripts and cron jobs skip the password prompt, the decryption and the refresh on every launch.
+# The agent renews the access token in the background (token_refresher.TokenRefresher), a Trader built without
+# tokens asks the agent first (Trader(token_agent=True), the default) and only reads the socket again when its
+# copy of the token is about to expire.
+#
+#     python3 token_agent.py            # prompts for the encryption password once, then serves until stopped
+#     python3 token_agent.py --status   # refresh stats of the running agent
+#     python3 token_agent.py --stop
+# Imports
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from token_refresher import TokenRefresher, DEFAULT_REFRESH_MARGIN
+
+DEFAULT_SOCKET_PATH = os.environ.get('SCHWAB_TOKEN_AGENT') or os.path.expanduser('~/.schwab_auto_trader/token-agent.sock')
+
+# A client asks the agent for a new token this many seconds before its copy expires.
+CLIENT_MARGIN = 60.0
+
+OPS = ('token', 'refresh', 'stats', 'stop')
+
+
+class _AgentHandler(socketserver.StreamRequestHandler):
+    # One connection, any number of newline delimited JSON requests on it.
+
+    def handle(self):
+        agent = self.server.agent
+        if not agent.authorized(self.request):
+            agent.stats['refused'] += 1
+            return
+        agent.stats['connections'] += 1
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                reply = agent.handle(request)
+            except Exception as exc:
+                reply = {'error': repr(exc)}
+            self.wfile.write(json.dumps(reply).encode() + b'\n')
+            if reply.get('stopping'):
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                return
+
+
+class _AgentServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class TokenAgent:
+    """
+    Serves tokens.access_token (and base_url, account_hash) to processes of the same user.
+
+        agent = TokenAgent(Tokens(args)).start()   # or agent.serve_forever()
+
+    Requests, one JSON object per line: {"op": "token"}, {"op": "refresh", "stale": token}, {"op": "stats"},
+    {"op": "stop"}. The socket is only reachable by the user running the agent (0600, peer uid checked on Linux).
+    """
+    def __init__(self, tokens, path: str | None = None, refresh_margin: float = DEFAULT_REFRESH_MARGIN,
+                 token_refresher: TokenRefresher | None = None, log=None):
+        """
+        :param tokens: Tokens object holding the decrypted tokens.
+        :type tokens: Tokens
+        :param path: Socket path, defaults to $SCHWAB_TOKEN_AGENT or ~/.schwab_auto_trader/token-agent.sock.
+        :type path: str | None
+        :param refresh_margin: Seconds before expiry the access token is renewed.
+        :type refresh_margin: float
+        :param token_refresher: Refresher to use, built if None (and tokens can be refreshed).
+        :type token_refresher: TokenRefresher | None
+        :param log: Log object for refresh failures.
+        """
+        self.tokens = tokens
+        self.path = path or DEFAULT_SOCKET_PATH
+        self.log = log
+        self.refresher = token_refresher
+        if self.refresher is None and TokenRefresher.supported(tokens):
+            self.refresher = TokenRefresher(tokens, refresh_margin=refresh_margin, log=log)
+        self.started_at = time.time()
+        self.stats = {'connections': 0, 'refused': 0, **{op: 0 for op in OPS}}
+        self.server = None
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _bind(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        if os.path.exists(self.path):
+            if connect_agent(self.path) is not None:
+                raise RuntimeError(f"A token agent is already listening on {self.path}.")
+            os.unlink(self.path)  # left behind by an agent that died
+        umask = os.umask(0o177)
+        try:
+            self.server = _AgentServer(self.path, _AgentHandler)
+        finally:
+            os.umask(umask)
+        self.server.agent = self
+        if self.refresher is not None:
+            self.refresher.start()
+
+    def serve_forever(self):
+        """
+        Serve on this thread until stop is requested (or KeyboardInterrupt).
+        """
+        if self.server is None:
+            self._bind()
+        try:
+            self.server.serve_forever()
+        finally:
+            self.close()
+
+    def start(self) -> 'TokenAgent':
+        """
+        Serve on a background thread.
+        """
+        if self.server is None:
+            self._bind()
+            self._thread = threading.Thread(target=self.server.serve_forever, name='token-agent', daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        if self.server is not None:
+            if self._thread is not None:
+                self.server.shutdown()
+                self._thread.join(timeout=1.0)
+                self._thread = None
+            self.server.server_close()
+            self.server = None
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+        if self.refresher is not None:
+            self.refresher.close()
+
+    def authorized(self, connection: socket.socket) -> bool:
+        """
+        Only the user running the agent gets tokens. The socket file is 0600 already, SO_PEERCRED (Linux)
+        checks the uid of the connecting process on top of that.
+        """
+        if not hasattr(socket, 'SO_PEERCRED'):
+            return True
+        credentials = connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+        _, uid, _ = struct.unpack('3i', credentials)
+        return uid == os.getuid()
+
+    def _token(self) -> dict:
+        expires = self.refresher.expires_at if self.refresher is not None \
+            else getattr(self.tokens, 'access_token_expires', None)
+        return {'access_token': self.tokens.access_token, 'expires': expires, 'base_url': self.tokens.base_url,
+                'account_hash': getattr(self.tokens, 'account_hash', None)}
+
+    def handle(self, request: dict) -> dict:
+        """
+        Answer one request.
+        """
+        op = request.get('op')
+        if op not in OPS:
+            return {'error': f"Unknown op {op!r}."}
+        self.stats[op] += 1
+        if op == 'token':
+            return self._token()
+        if op == 'refresh':
+            if self.refresher is None:
+                return {'error': "These tokens can not be refreshed."}
+            if self.refresher.refresh(stale_token=request.get('stale')) is None:
+                return {'error': f"Refresh failed: {self.refresher.stats['last_error']}"}
+            return self._token()
+        if op == 'stats':
+            refresher = dict(self.refresher.stats) if self.refresher is not None else {}
+            return {'pid': os.getpid(), 'uptime': time.time() - self.started_at, **self.stats,
+                    'expires_in': (self._token()['expires'] or time.time()) - time.time(), 'refresher': refresher}
+        return {'stopping': True}
+
+
+class AgentTokens:
+    """
+    Tokens stand-in backed by a TokenAgent. access_token is served from a local copy (a plain attribute read)
+    and only fetched from the agent again shortly before it expires, refresh_access_token() asks the agent to
+    refresh, single flight across every process using it.
+    """
+    def __init__(self, path: str | None = None, timeout: float = 5.0, margin: float = CLIENT_MARGIN):
+        """
+        :param path: Agent socket path, defaults to DEFAULT_SOCKET_PATH.
+        :type path: str | None
+        :param timeout: Seconds to wait for the agent (a refresh may go out to Schwab).
+        :type timeout: float
+        :param margin: Seconds before expiry the local copy is replaced.
+        :type margin: float
+        :raises OSError: if no agent is listening.
+        """
+        self.path = path or DEFAULT_SOCKET_PATH
+        self.timeout = timeout
+        self.margin = margin
+        self.base_url = None
+        self.account_hash = None
+        self.access_token_expires = None
+        self._access_token = None
+        self._checked = 0.0
+        self._sock = None
+        self._file = None
+        self._lock = threading.Lock()
+        self._update(self.call('token'))
+
+    def __repr__(self):
+        return f'AgentTokens({self.path!r})'
+
+    def call(self, op: str, **fields) -> dict:
+        """
+        Send one request to the agent, reconnecting once if the connection went away.
+        :raises OSError: if the agent can not be reached.
+        """
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                        self._sock.settimeout(self.timeout)
+                        self._sock.connect(self.path)
+                        self._file = self._sock.makefile('rb')
+                    self._sock.sendall(json.dumps({'op': op, **fields}).encode() + b'\n')
+                    line = self._file.readline()
+                    if not line:
+                        raise ConnectionError("Token agent closed the connection.")
+                    return json.loads(line)
+                except OSError:
+                    self._disconnect()
+                    if attempt:
+                        raise
+
+    def _disconnect(self):
+        if self._file is not None:
+            self._file.close()
+        if self._sock is not None:
+            self._sock.close()
+        self._sock = self._file = None
+
+    def close(self):
+        with self._lock:
+            self._disconnect()
+
+    def _update(self, reply: dict):
+        if reply.get('error'):
+            raise RuntimeError(f"Token agent: {reply['error']}")
+        self._access_token = reply['access_token']
+        self.access_token_expires = reply.get('expires')
+        self.base_url = reply.get('base_url')
+        self.account_hash = reply.get('account_hash')
+
+    @property
+    def access_token(self) -> str:
+        expires = self.access_token_expires
+        if expires is not None and time.time() > expires - self.margin and time.monotonic() - self._checked > 1.0:
+            # The agent renews before we get here, take its current token (at most once a second).
+            self._checked = time.monotonic()
+            try:
+                self._update(self.call('token'))
+            except (OSError, RuntimeError):
+                pass
+        return self._access_token
+
+    def refresh_access_token(self):
+        """
+        Have the agent refresh, or pick up the token it already renewed since ours was handed out.
+        """
+        self._update(self.call('refresh', stale=self._access_token))
+
+
+def connect_agent(path: str | None = None) -> AgentTokens | None:
+    """
+    AgentTokens for the agent on path, None if no agent is listening there.
+    """
+    path = path or DEFAULT_SOCKET_PATH
+    if not os.path.exists(path):
+        return None
+    try:
+        return AgentTokens(path)
+    except (OSError, RuntimeError):
+        return None
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Hold the Schwab tokens in memory and serve them over a Unix socket.')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET_PATH, help='socket path (default %(default)s)')
+    parser.add_argument('--status', action='store_true', help='print the stats of the running agent')
+    parser.add_argument('--stop', action='store_true', help='stop the running agent')
+    args = parser.parse_args()
+
+    if args.status or args.stop:
+        tokens = connect_agent(args.socket)
+        if tokens is None:
+            raise SystemExit(f"No token agent listening on {args.socket}.")
+        print(json.dumps(tokens.call('stop' if args.stop else 'stats'), indent=2))
+        return
+
+    from tokens import Tokens
+    from localutils.log_obj import Log
+    agent = TokenAgent(Tokens(args), args.socket, log=Log())
+    print(f"Token agent listening on {agent.path}, pid {os.getpid()}.")
+    try:
+        agent.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+# token_refresher.py renews the Schwab access token in the background, before it expires,
+# so no request has to wait on (or fail because of) a refresh.
+# Schwab access tokens last 30 minutes, the refresh token about a week (docs/schwab-authentication.md).
+# Imports
+import threading
+import time
+
+ACCESS_TOKEN_LIFETIME = 30 * 60
+
+# Seconds before expiry the background thread renews the token.
+DEFAULT_REFRESH_MARGIN = 5 * 60
+
+
+class TokenRefresher:
+    """
+    Keeps tokens.access_token fresh. A daemon thread refreshes refresh_margin seconds before expiry and
+    Trader calls refresh(stale_token=...) when Schwab answers 401. Refreshes are single flight: callers that
+    arrive while one is running wait for it and reuse its token instead of starting their own.
+
+    The refresh itself is done by the refresh callable, tokens.refresh_access_token() by default. It must
+    leave the new token in tokens.access_token. If tokens has an access_token_expires attribute
+    (unix time) it is used for scheduling, otherwise the token is assumed to last lifetime seconds.
+    """
+    def __init__(self, tokens, refresh=None, lifetime: float = ACCESS_TOKEN_LIFETIME,
+                 refresh_margin: float = DEFAULT_REFRESH_MARGIN, retry_delay: float = 15.0, log=None):
+        """
+        :param tokens: Tokens object the Trader reads access_token from.
+        :type tokens: Tokens
+        :param refresh: Callable doing the refresh, defaults to tokens.refresh_access_token.
+        :param lifetime: Seconds an access token is valid.
+        :type lifetime: float
+        :param refresh_margin: Renew this many seconds before the token expires.
+        :type refresh_margin: float
+        :param retry_delay: Seconds to wait before trying again after a failed background refresh.
+        :type retry_delay: float
+        :param log: Log object for refresh failures.
+        """
+        self.tokens = tokens
+        self.refresh_fn = refresh if refresh is not None else tokens.refresh_access_token
+        self.lifetime = lifetime
+        self.refresh_margin = refresh_margin
+        self.retry_delay = retry_delay
+        self.log = log
+        self.refreshed_at = time.time()
+        self.stats = {'refreshes': 0, 'failures': 0, 'background': 0, 'unauthorized': 0, 'coalesced': 0,
+                      'last_latency': 0.0, 'max_latency': 0.0, 'total_latency': 0.0, 'last_error': None}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = None
+
+    @classmethod
+    def supported(cls, tokens) -> bool:
+        """
+        True if tokens can be refreshed with the default refresh callable.
+        """
+        return callable(getattr(tokens, 'refresh_access_token', None))
+
+    @property
+    def expires_at(self) -> float:
+        # Ignore an expiry the refresh callable did not move forward, it would have us refreshing in a loop.
+        expires = getattr(self.tokens, 'access_token_expires', None)
+        return float(expires) if expires and float(expires) > self.refreshed_at else self.refreshed_at + self.lifetime
+
+    @property
+    def mean_latency(self) -> float:
+        return self.stats['total_latency'] / self.stats['refreshes'] if self.stats['refreshes'] else 0.0
+
+    def start(self):
+        """
+        Start the background renewal thread.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='token-refresher', daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def refresh(self, stale_token: str | None = None, reason: str = 'unauthorized') -> str | None:
+        """
+        Refresh the access token, at most one refresh runs at a time.
+        :param stale_token: The token the caller found to be bad. If tokens.access_token already changed
+                            by the time the lock is free, someone else refreshed it and nothing is sent.
+        :type stale_token: str | None
+        :param reason: Stats bucket, 'unauthorized' (a 401) or 'background'.
+        :type reason: str
+        :return: The current access token, None if the refresh failed.
+        :rtype: str | None
+        """
+        with self._lock:
+            if stale_token is not None and self.tokens.access_token != stale_token:
+                self.stats['coalesced'] += 1
+                return self.tokens.access_token
+
+            start = time.perf_counter()
+            try:
+                self.refresh_fn()
+            except Exception as exc:
+                self.stats['failures'] += 1
+                self.stats['last_error'] = repr(exc)
+                if self.log is not None:
+                    self.log.error(f"Access token refresh failed: {exc!r}")
+                return None
+            latency = time.perf_counter() - start
+            self.refreshed_at = time.time()
+            self.stats['refreshes'] += 1
+            self.stats[reason] += 1
+            self.stats['last_latency'] = latency
+            self.stats['max_latency'] = max(self.stats['max_latency'], latency)
+            self.stats['total_latency'] += latency
+            self.stats['last_error'] = None
+            return self.tokens.access_token
+
+    def _run(self):
+        while not self._closed:
+            wait = self.expires_at - self.refresh_margin - time.time()
+            if wait > 0:
+                self._wake.wait(wait)
+                self._wake.clear()
+                continue
+            if self.refresh(reason='background') is None:
+                self._wake.wait(self.retry_delay)
+                self._wake.clear()
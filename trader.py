@@ -1,26 +1,400 @@
 # Trader.py is where the simplified trade class is. 
+# requests, tokens (cryptography) and httpx are imported when first needed, so a short script that gets its
+# tokens from the token agent (token_agent.py) starts without paying for them.
 # Imports
 import os
-import requests
 import urllib.parse
 import json
 import datetime as dt
-from tokens import Tokens
+import time
 from localutils.log_obj import Log
 from zoneinfo import ZoneInfo
+from rate_limiter import RequestScheduler, endpoint_family, parse_retry_after
+from response_cache import ResponseCache
+from json_codec import JsonDecoder
+from token_refresher import TokenRefresher, DEFAULT_REFRESH_MARGIN
+from metrics import Metrics, route
+from resilience import RequestExecutor, transport_errors
+
+# Headers sent with every order (POST/PUT) request, the Authorization header is added in _request().
+JSON_HEADERS = {"Accept": "application/json", "Content-Type": "application/json"}
+
+
+def is_account_number(account: str | int) -> bool:
+    """
+    Plain account numbers are short and all digits, hashed ones are 64 hex characters.
+    """
+    return isinstance(account, int) or (isinstance(account, str) and account.isdigit() and len(account) < 20)
+
+
+def load_tokens(args, token_agent: bool | str = True):
+    """
+    Tokens from the token agent when one is running, otherwise Tokens(args) (password prompt, decryption...).
+    """
+    if token_agent:
+        from token_agent import connect_agent
+        tokens = connect_agent(None if token_agent is True else token_agent)
+        if tokens is not None:
+            return tokens
+    from tokens import Tokens
+    return Tokens(args)
+
 
 class Trader:
 
-    def __init__(self, args):
-        self.tokens = Tokens(args)
+    def __init__(self, args, tokens=None, pooled: bool = True, pool_connections: int = 4, pool_maxsize: int = 16,
+                 pool_block: bool = False, keep_alive: bool = True, keep_alive_expiry: float = 60.0, http2: bool = False,
+                 rate_limit: bool = True, scheduler: RequestScheduler | None = None, max_throttle_retries: int = 3,
+                 cache: ResponseCache | None = None, history_store=None, json_backend: str = 'auto',
+                 auto_refresh: bool = True, refresh_margin: float = DEFAULT_REFRESH_MARGIN,
+                 token_refresher: TokenRefresher | None = None, metrics: Metrics | None = None,
+                 resilient: bool = True, executor: RequestExecutor | None = None, token_agent: bool | str = True,
+                 stdlib_http: bool = False):
+        """
+        :param args: commandline args passed through to Tokens.
+        :param tokens: An already built Tokens object, skips building Tokens(args) (handy for scripts and benchmarks).
+        :param pooled: Send every request through one persistent session. False falls back to a new connection per call.
+        :type pooled: bool
+        :param pool_connections: Number of per-host connection pools to keep around.
+        :type pool_connections: int
+        :param pool_maxsize: Max number of connections kept open per host.
+        :type pool_maxsize: int
+        :param pool_block: Block when the pool for a host is exhausted instead of opening a throwaway connection.
+        :type pool_block: bool
+        :param keep_alive: Keep connections open between calls (sends 'Connection: close' when False).
+        :type keep_alive: bool
+        :param keep_alive_expiry: Seconds an idle connection is kept before being dropped (httpx/http2 only).
+        :type keep_alive_expiry: float
+        :param http2: Use HTTP/2 when httpx[http2] is installed, falls back to requests otherwise.
+        :type http2: bool
+        :param rate_limit: Pass every request through a RequestScheduler so bursts stay under the Schwab quotas.
+        :type rate_limit: bool
+        :param scheduler: Scheduler to use, share one between Traders running on the same app. Built if None.
+        :type scheduler: RequestScheduler | None
+        :param max_throttle_retries: How many times a request answered with 429 is retried after backing off.
+        :type max_throttle_retries: int
+        :param cache: Response cache for the slow changing endpoints (instruments, market hours, account numbers...).
+                      None sends every call to Schwab.
+        :type cache: ResponseCache | None
+        :param history_store: Local candle store used by get_candles(), a HistoryStore in the default
+                              location is made on first use if None.
+        :type history_store: HistoryStore | None
+        :param json_backend: JSON decoder for response bodies, 'auto' uses orjson or msgspec when installed and
+                             falls back to the stdlib json module. See json_codec.JsonDecoder.
+        :type json_backend: str
+        :param auto_refresh: Renew the access token on a background thread before it expires, and refresh + resend
+                             once when Schwab answers 401. Needs tokens.refresh_access_token() or a token_refresher.
+        :type auto_refresh: bool
+        :param refresh_margin: Seconds before expiry the background refresh happens.
+        :type refresh_margin: float
+        :param token_refresher: Refresher to use, share one between Traders on the same tokens. Built if None.
+        :type token_refresher: TokenRefresher | None
+        :param metrics: Records per endpoint phase latencies, sizes, status codes and retries of every request
+                        (see metrics.Metrics). None records nothing.
+        :type metrics: Metrics | None
+        :param resilient: Per endpoint timeouts, retries of failed GETs, hedged quote reads and circuit breakers
+                          (see resilience.RequestExecutor). False sends every request once with self.timeout.
+        :type resilient: bool
+        :param executor: Executor to use, share one between Traders so they share breakers and latencies.
+                         Built if None.
+        :type executor: RequestExecutor | None
+        :param token_agent: When tokens is None, take them from a running token agent (token_agent.py) instead of
+                            building Tokens(args), no password prompt or decryption. True uses the default socket,
+                            a str is the socket path, False always builds Tokens(args).
+        :type token_agent: bool | str
+        :param stdlib_http: Send through stdlib_http.StdlibSession (http.client, pooled) instead of requests, saves
+                            the ~100 ms requests import in short scripts. HTTP/1.1 only, no per-phase connect timing
+                            in metrics.
+        :type stdlib_http: bool
+        """
+        self.tokens = tokens if tokens is not None else load_tokens(args, token_agent)
         self.log = Log()
         self.timeout = 5
+        self.pooled = pooled
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.keep_alive = keep_alive
+        self.keep_alive_expiry = keep_alive_expiry
+        self.http2 = http2
+        self.stdlib_http = stdlib_http
+        self._auth = (None, {})
+        self.session = self._build_session() if pooled else None
+        self.metrics = metrics
+        self.executor = (executor or RequestExecutor()) if resilient else None
+        self._owns_executor = resilient and executor is None
+        if metrics is not None and self.session is not None:
+            metrics.instrument_session(self.session)
+        self.scheduler = (scheduler or RequestScheduler()) if rate_limit else None
+        self.max_throttle_retries = max_throttle_retries
+        self.quote_coalescer = None
+        self.cache = cache
+        self.history_store = history_store
+        self._account_hashes = None
+        self.decoder = JsonDecoder(json_backend)
+        self.token_refresher = token_refresher
+        self._owns_refresher = False
+        if auto_refresh and token_refresher is None and TokenRefresher.supported(self.tokens):
+            self.token_refresher = TokenRefresher(self.tokens, refresh_margin=refresh_margin, log=self.log)
+            self._owns_refresher = True
+        if auto_refresh and self.token_refresher is not None:
+            self.token_refresher.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """
+        Close the pooled session and every connection it holds.
+        """
+        if self.quote_coalescer is not None:
+            self.quote_coalescer.close()
+            self.quote_coalescer = None
+        if self.cache is not None:
+            self.cache.close()
+        if self._owns_refresher:
+            self.token_refresher.close()
+        if self._owns_executor:
+            self.executor.close()
+        if self.session is not None:
+            self.session.close()
+
+    def _build_session(self):
+        """
+        Build the persistent session every endpoint method goes through. The session keeps TCP+TLS
+        connections to the Schwab base url open so only the first call pays for the handshake.
+        :return: StdlibSession with stdlib_http, httpx.Client when http2 is requested and available,
+                 otherwise a requests.Session.
+        """
+        if self.stdlib_http:
+            from stdlib_http import StdlibSession
+            return StdlibSession(pool_maxsize=self.pool_maxsize, keep_alive=self.keep_alive)
+        if self.http2:
+            try:
+                import httpx
+                import h2  # httpx needs the h2 package for http2=True
+            except ImportError:
+                self.log.error("http2 requested but httpx[http2] is not installed, falling back to requests.")
+            else:
+                limits = httpx.Limits(max_connections=self.pool_connections * self.pool_maxsize,
+                                      max_keepalive_connections=self.pool_maxsize if self.keep_alive else 0,
+                                      keepalive_expiry=self.keep_alive_expiry)
+                return httpx.Client(http2=True, limits=limits, timeout=self.timeout)
+
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize,
+                              pool_block=self.pool_block)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def enable_quote_coalescing(self, window: float = 0.01, max_symbols: int | None = None):
+        """
+        Route get_single_quote() through a QuoteCoalescer, single-symbol calls made from different threads
+        within window seconds go out as one get_quotes request.
+        :param window: Seconds to collect symbols before sending the batch.
+        :type window: float
+        :param max_symbols: Symbols per get_quotes request, defaults to the coalescer's MAX_QUOTE_SYMBOLS.
+        :type max_symbols: int | None
+        :return: The coalescer, its stats dict counts requests vs round trips.
+        :rtype: QuoteCoalescer
+        """
+        from quote_coalescer import QuoteCoalescer
+        if self.quote_coalescer is not None:
+            self.quote_coalescer.close()
+        kwargs = {'max_symbols': max_symbols} if max_symbols else {}
+        self.quote_coalescer = QuoteCoalescer(self, window=window, **kwargs)
+        return self.quote_coalescer
+
+    def _auth_headers(self) -> tuple[str, dict]:
+        # (token, headers), only rebuilt when the access token actually changed. One tuple so a thread never pairs
+        # the token with another thread's header.
+        token = self.tokens.access_token
+        auth = self._auth
+        if token != auth[0]:
+            auth = self._auth = (token, {'Authorization': f'Bearer {token}'})
+        return auth
+
+    def _request(self, method: str, path: str, params: dict | None = None, json: dict | None = None,
+                 headers: dict | None = None, timeout: float | None = None, data: bytes | None = None,
+                 client=None, stages: dict | None = None):
+        """
+        Every endpoint method sends its request through here. Takes a token from the rate limiter first
+        and backs off/resends when Schwab answers 429. A 401 refreshes the access token and resends once.
+        With self.executor set GETs that fail (transport error, 5xx) are retried with jittered backoff, quote
+        reads are hedged and the family's circuit breaker raises resilience.CircuitOpenError while it is open.
+        With self.metrics set the phases, sizes, status and resends of the request are recorded there.
+        :param method: HTTP method, GET, POST, PUT, DELETE.
+        :type method: str
+        :param path: Path relative to the Schwab base url e.g. /marketdata/v1/quotes
+        :type path: str
+        :param params: Query params, None values are dropped.
+        :type params: dict | None
+        :param json: Request body for order requests.
+        :type json: dict | None
+        :param headers: Extra headers on top of Authorization.
+        :type headers: dict | None
+        :param timeout: Seconds before giving up, defaults to the executor's timeout for the endpoint or self.timeout.
+        :type timeout: float | None
+        :param data: Already encoded request body, sent as is instead of json.
+        :type data: bytes | None
+        :param client: Session to send on instead of self.session (the order pipeline has its own connection).
+        :type client: requests.Session | None
+        :param stages: When given, time.perf_counter() at the moment the rate limiter let the request through
+                       is stored under 'acquired'.
+        :type stages: dict | None
+        :return: The http response.
+        :rtype: requests.Response | httpx.Response
+        """
+        sent_token, request_headers = self._auth_headers()
+        if headers:
+            request_headers = {**request_headers, **headers}
+        if client is None:
+            client = self.session
+            if client is None and self.stdlib_http:
+                from stdlib_http import StdlibSession
+                client = StdlibSession(keep_alive=False)
+            elif client is None:
+                import requests
+                client = requests
+        url = f'{self.tokens.base_url}{path}'
+        params = self._params_parser(params) if params else None
+        family = endpoint_family(path)
+        executor = self.executor
+        label = route(method, path) if self.metrics is not None or executor is not None else None
+        if timeout is None:
+            timeout = self.timeout if executor is None else executor.timeout(label, self.timeout)
+        breaker = executor.breaker(family) if executor is not None else None
+        retry = executor.retry if executor is not None and executor.retry.retryable(method) else None
+        hedged = executor is not None and executor.hedged(method, label)
+
+        def send():
+            if self.metrics is None:
+                return client.request(method, url, params=params, json=json, data=data, headers=request_headers,
+                                      timeout=timeout)
+            try:
+                return self.metrics.send(client, method, url, params=params, json=json, data=data,
+                                         headers=request_headers, timeout=timeout)
+            except Exception as exc:
+                self.metrics.observe_error(label, exc)
+                raise
+
+        def spare_token():
+            return self.scheduler is None or self.scheduler.try_acquire(family)
+
+        attempt = 0
+        attempt_count = 0
+        retries = 0
+        reauthorized = False
+        while True:
+            if breaker is not None:
+                breaker.before()
+            if self.scheduler is not None:
+                self.scheduler.acquire(family, self.scheduler.lane_for(method))
+            if stages is not None:
+                stages['acquired'] = time.perf_counter()
+            attempt_count += 1
+            try:
+                response = executor.hedge(label, send, spare_token) if hedged else send()
+            except transport_errors() as exc:
+                if breaker is None:
+                    raise
+                breaker.failure()
+                executor.count('transport_errors')
+                if retry is None or retries >= retry.retries:
+                    raise
+                delay = retry.delay(retries)
+                retries += 1
+                executor.count('retries')
+                self.log.error(f"{type(exc).__name__} on {path}, retrying in {delay:.2f}s "
+                               f"(retry {retries}/{retry.retries}).")
+                time.sleep(delay)
+                continue
+            if breaker is not None:
+                if response.status_code >= 500:
+                    breaker.failure()
+                else:
+                    breaker.success()
+            if response.status_code == 401 and self.token_refresher is not None and not reauthorized:
+                # Expired token, Schwab did not act on the request so it is safe to resend (orders included).
+                reauthorized = True
+                if self.token_refresher.refresh(stale_token=sent_token) is not None:
+                    sent_token, request_headers = self._auth_headers()
+                    if headers:
+                        request_headers = {**request_headers, **headers}
+                    continue
+            if retry is not None and response.status_code in retry.statuses and retries < retry.retries:
+                delay = retry.delay(retries)
+                retries += 1
+                executor.count('retries')
+                self.log.error(f"{response.status_code} on {path}, retrying in {delay:.2f}s "
+                               f"(retry {retries}/{retry.retries}).")
+                response.close()
+                time.sleep(delay)
+                continue
+            if response.status_code != 429 or self.scheduler is None or attempt >= self.max_throttle_retries:
+                if self.metrics is not None:
+                    self.metrics.observe(label, response, attempt_count)
+                return response
+
+            # Throttled, a 429 means Schwab did not act on the request so it is safe to resend (orders included).
+            delay = parse_retry_after(response.headers.get('Retry-After'))
+            if delay is None:
+                delay = 2.0 ** attempt
+            attempt += 1
+            self.log.error(f"429 Too Many Requests on {path}, backing off {delay:.1f}s "
+                           f"(retry {attempt}/{self.max_throttle_retries}).")
+            self.scheduler.backoff(family, delay)
+
+    def _json(self, response, schema: str | None = None):
+        # response.json() decodes with the stdlib after copying the body to a str, go straight from the bytes.
+        if self.metrics is None:
+            return self.decoder.decode(response.content, schema)
+        start = time.perf_counter()
+        data = self.decoder.decode(response.content, schema)
+        self.metrics.observe_decode(response, time.perf_counter() - start)
+        return data
+
+    def _cached_get(self, endpoint: str, path: str, params: dict | None = None):
+        """
+        GET through the response cache (when there is one). Only 200 responses are cached.
+        :param endpoint: Name of the calling method, picks the TTL and the stats bucket.
+        :type endpoint: str
+        :param path: Path relative to the Schwab base url.
+        :type path: str
+        :param params: Query params, None values are dropped before building the cache key.
+        :type params: dict | None
+        :return: Decoded response or None on error.
+        :rtype: dict | None
+        """
+        params = self._params_parser(params) if params else None
+        if self.cache is not None:
+            hit, data = self.cache.get(endpoint, path, params)
+            if hit:
+                return data
+
+        response = self._request('GET', path, params=params)
+        if response.status_code == 200:
+            data = self._json(response)
+            if self.cache is not None:
+                self.cache.set(endpoint, path, params, data)
+            return data
+
+        else:
+            self.log.error(response)
 
     def _params_parser(self, params: dict):
         for key in list(params.keys()):
             if params[key] is None: del params[key]
         return params
-    
+
     def time_parser(self, time_value: str, time_format: str):
             """
             Time parser checks the time value and format and return the correct time var.
@@ -73,39 +447,66 @@ class Trader:
 # Account Methods retrieve information about user account information, accountnum, funds, holdings, etc.
 
     def get_account(self, fields: str | None = None):
-        response = requests.get(f'{self.tokens.base_url}/trader/v1/accounts/',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            params={'fields': fields},
-                            timeout=self.timeout)
+        response = self._request('GET', '/trader/v1/accounts/', params={'fields': fields})
         
         if response.status_code == 200:
-            data = response.json()
+            data = self._json(response)
             return data
         
         else:
             self.log.error(response)
 
     def get_account_number(self):
-        response = requests.get(f'{self.tokens.base_url}/trader/v1/accounts/accountNumbers',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            timeout=self.timeout)
-        
-        if response.status_code == 200:
-            data = response.json()
-            return data
-        
-        else:
-            self.log.error(response)
+        return self._cached_get('get_account_number', '/trader/v1/accounts/accountNumbers')
 
-    def get_account_accountNumber(self, fields: str | None = None):
-        # Lol fix the account hash store. 
-        response = requests.get(f'{self.tokens.base_url}/trader/v1/accounts/{(self.tokens.account_hash[0]['hashValue'])}',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            params={'fields': fields},
-                            timeout=self.timeout)
+    def account_hashes(self, refresh: bool = False) -> dict[str, str]:
+        """
+        Hashed account numbers keyed by account number, resolved once from get_account_number().
+        Falls back to the hashes Tokens fetched at login if the call fails.
+        :param refresh: Ask Schwab again (e.g. after opening an account).
+        :type refresh: bool
+        :return: {accountNumber: hashValue}, in the order Schwab lists them.
+        :rtype: dict[str, str]
+        """
+        if self._account_hashes is None or refresh:
+            numbers = self.get_account_number() or getattr(self.tokens, 'account_hash', None) or []
+            hashes = {str(entry['accountNumber']): entry['hashValue'] for entry in numbers}
+            if not hashes:
+                return {}
+            self._account_hashes = hashes
+        return self._account_hashes
+
+    def account_hash(self, account: str | int | None = None) -> str:
+        """
+        Hash to put in an account url. Every per account method runs its accountHash through here,
+        so they all take a plain account number as well.
+        :param account: Account number, hashed account number (returned as is) or None for the first account.
+        :type account: str | int | None
+        :return: hashed account number.
+        :rtype: str
+        """
+        if account is not None and not is_account_number(account):
+            return account
+        hashes = self.account_hashes()
+        if not hashes:
+            raise ValueError("No account numbers, get_account_number() failed.")
+        if account is None:
+            return next(iter(hashes.values()))
+        try:
+            return hashes[str(account)]
+        except KeyError:
+            raise ValueError(f"Unknown account number {account}, accounts are {list(hashes)}.") from None
+
+    def get_account_accountNumber(self, fields: str | None = None, account: str | int | None = None):
+        """
+        Balances (and positions with fields='positions') of one account.
+        :param account: Account number or hash, None is the first account.
+        :type account: str | int | None
+        """
+        response = self._request('GET', f'/trader/v1/accounts/{self.account_hash(account)}', params={'fields': fields})
         
         if response.status_code == 200:
-            data = response.json()
+            data = self._json(response)
             return data
         
         else:
@@ -114,16 +515,20 @@ class Trader:
 # ---------- Info Methods ----------- #
 # This section contains methods used for querying infromation about stocks. 
 
-    def get_single_quote(self, ticker):
+    def get_single_quote(self, ticker, typed: bool = False):
         """
         Get single quote, can take a single string as a symbol just use that.) 
+        Goes through the quote coalescer when enable_quote_coalescing() was called (dict results only).
+        :param typed: Return {symbol: market_structs.Quote} instead of the dict (needs msgspec).
+        :type typed: bool
         """
-        response = requests.get(f'{self.tokens.base_url}/marketdata/v1/{ticker}/quotes',
-                           headers = {'Authorization': f'Bearer {self.tokens.access_token}'},
-                           params=())
+        if self.quote_coalescer is not None and not typed:
+            return self.quote_coalescer.get(ticker)
+
+        response = self._request('GET', f'/marketdata/v1/{ticker}/quotes')
         
         if response.status_code == 200:
-            data = response.json()
+            data = self._json(response, 'quotes' if typed else None)
             return data
         
         else:
@@ -132,7 +537,7 @@ class Trader:
         
     
     
-    def get_quotes(self, tickers: str | list[str], fields=None, indicative: bool = False) -> dict:
+    def get_quotes(self, tickers: str | list[str], fields=None, indicative: bool = False, typed: bool = False) -> dict:
         """
         Get quotes for a list of tickers. 
         :param tickers: list of symbol string e.g. ("AAPL"), ["AAPL", "$SPX", "NVDA", "ADUR"]
@@ -141,21 +546,21 @@ class Trader:
         :type fields: str | None
         :param indicative: whether to get indicative quotes (True/False)
         :type indicative: boolean | None
+        :param typed: Decode into {symbol: market_structs.Quote} instead of dicts (needs msgspec).
+        :type typed: bool
         :return: dictonary of quotes
         :rtype: dict[]
         """
-        response = requests.get(f'{self.tokens.base_url}/marketdata/v1/quotes',
-                           headers = {'Authorization': f'Bearer {self.tokens.access_token}'},
-                           params=({'symbols':tickers, 'fields': fields, 'indicative': indicative}),
-                           timeout=self.timeout)
+        response = self._request('GET', '/marketdata/v1/quotes',
+                                 params=({'symbols':tickers, 'fields': fields, 'indicative': indicative}))
         
 
         if response.status_code == 200:
-            data = response.json()
+            data = self._json(response, 'quotes' if typed else None)
             return data
         
         else:
-            data = response.json()
+            data = self._json(response)
             print(data)
             self.log.error(response)
         
@@ -174,12 +579,11 @@ class Trader:
         :rtype: dict[]
         """
 
-        response = requests.get(f'{self.tokens.base_url}/marketdata/v1/movers/{exchange}',
-                            headers = {'Authorization': f'Bearer {self.tokens.access_token}'},
-                            params=({'sort': sort, 'frequency': frequency}), timeout=self.timeout)
+        response = self._request('GET', f'/marketdata/v1/movers/{exchange}',
+                                 params=({'sort': sort, 'frequency': frequency}))
         
         if response.status_code == 200:
-            data = response.json()
+            data = self._json(response)
             return data
         
         else:
@@ -195,17 +599,8 @@ class Trader:
         :return: instruments
         :rtype: dict[]
         """
-        response = requests.get(f'{self.tokens.base_url}/marketdata/v1/instruments',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            params={'symbol': symbol, 'projection': projection},
-                            timeout=self.timeout)
-    
-        if response.status_code == 200:
-            data = response.json()
-            return data
-        
-        else:
-            self.log.error(response)
+        return self._cached_get('get_instruments', '/marketdata/v1/instruments',
+                                params={'symbol': symbol, 'projection': projection})
     
     def get_instrument_cusip(self, cusip_id: str | int) -> dict:
         """
@@ -215,16 +610,7 @@ class Trader:
         :return: instrument
         :rtype: dict[]
         """
-        response = requests.get(f'{self.tokens.base_url}/marketdata/v1/instruments/{cusip_id}',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            timeout=self.timeout)
-
-        if response.status_code == 200:
-            data = response.json()
-            return data
-        
-        else:
-            self.log.error(response)
+        return self._cached_get('get_instrument_cusip', f'/marketdata/v1/instruments/{cusip_id}')
 
     def get_market_hours(self, symbols: list[str], date: dt.datetime | str = None) -> dict:
         """
@@ -237,19 +623,9 @@ class Trader:
         :rtype: dict[]
         """
         
-        response = requests.get(f'{self.tokens.base_url}/marketdata/v1/markets',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            params={'markets': symbols,
-                                    'date': (date)},
-                            timeout=self.timeout)
-
-        if response.status_code == 200:
-            data = response.json()
-            return data
-        
-        else:
-            self.log.error(response.json())
-            pass
+        return self._cached_get('get_market_hours', '/marketdata/v1/markets',
+                                params={'markets': symbols,
+                                        'date': (date)})
 
     def get_market_hours_by_id(self, market_id: str, date: dt.datetime):
         """
@@ -259,17 +635,7 @@ class Trader:
                      It will default to current day if not entered. Date format:YYYY-MM-DD
         :type date: datetime YYYY_MM-DD
         """
-        response = requests.get(f'{self.tokens.base_url}/marketdata/v1/markets/{market_id}',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            params={'date': (date)},timeout=self.timeout)
-
-        if response.status_code == 200:
-            data = response.json()
-            return data
-        
-        else:
-            self.log.error(response.json())
-            pass
+        return self._cached_get('get_market_hours_by_id', f'/marketdata/v1/markets/{market_id}', params={'date': (date)})
     
 
 
@@ -278,7 +644,8 @@ class Trader:
                           strike: int | None=None, range: str | None=None, toDate: dt.datetime | None=None,
                           fromDate: dt.datetime | None=None, volatility: int | None=None, underlyingPrice: int | None=None, 
                           interestRate: int | None=None, daysToExpiration: int | None=None, 
-                          expirationMonth: str | None=None, optionType: str | None=None, entitlement: str | None=None) -> dict:
+                          expirationMonth: str | None=None, optionType: str | None=None, entitlement: str | None=None,
+                          as_arrays: bool = False, typed: bool = False) -> dict:
         """
         Cancer Cancer Cancer Cancer!
         Get Option Chain data from a specific stock. Holy God so many args.
@@ -319,25 +686,30 @@ class Trader:
         :type optionType: str
         :param entitlement: Entitlement Only ifretail token, entitlement of client PP-PayingPro, NP-NonPro and PN-NonPayingPro [PN,NN,PP]
         :type entitlement: str
+        :param as_arrays: Return a flat market_arrays.OptionChainTable (one row per contract) instead of the nested dict.
+        :type as_arrays: bool
+        :param typed: Decode into a market_structs.OptionChain instead of dicts (needs msgspec), ignored with as_arrays.
+        :type typed: bool
         :return: Option Chain Data.
-        :rtype: dict[]
+        :rtype: dict[] | OptionChainTable | OptionChain
         """
 
-        response = requests.get(f'{self.tokens.base_url}/marketdata/v1/chains',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            params={'symbol': symbols, 'contractType': contractType, 'StrikeCount': strikeCount,
-                                    'inculdeUnderlyingQuotes': includeUnderlyingQuote, 'strategy': strategy, 'interval': interval,
-                                    'strike': strike, 'range': range, 'toDate': toDate, 'fromDate': fromDate, 'volatility': volatility,
-                                    'underlyingPrice': underlyingPrice, 'interestRate': interestRate, 'datsToExpiration': daysToExpiration, 
-                                    'expirationMonth': expirationMonth,'optionType': optionType, 'entitlement': entitlement},
-                            timeout=self.timeout)
+        response = self._request('GET', '/marketdata/v1/chains',
+                                 params={'symbol': symbols, 'contractType': contractType, 'StrikeCount': strikeCount,
+                                         'inculdeUnderlyingQuotes': includeUnderlyingQuote, 'strategy': strategy, 'interval': interval,
+                                         'strike': strike, 'range': range, 'toDate': toDate, 'fromDate': fromDate, 'volatility': volatility,
+                                         'underlyingPrice': underlyingPrice, 'interestRate': interestRate, 'datsToExpiration': daysToExpiration, 
+                                         'expirationMonth': expirationMonth,'optionType': optionType, 'entitlement': entitlement})
         
         if response.status_code == 200:
-            data = response.json()
+            if as_arrays:
+                from market_arrays import OptionChainTable
+                return OptionChainTable.from_json(self._json(response))
+            data = self._json(response, 'chain' if typed else None)
             return data
         
         else:
-            self.log.error(response.json())
+            self.log.error(self._json(response))
             pass
 
 
@@ -350,22 +722,12 @@ class Trader:
         :return: Option Chain Data.
         :rtype: dict[]
         """
-        response = requests.get(f'{self.tokens.base_url}/marketdata/v1/expirationchain',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            params={'symbol': symbol},
-                            timeout=self.timeout)
-        
-        if response.status_code == 200:
-            data = response.json()
-            return data
-        
-        else:
-            self.log.error(response.json())
-            pass
+        return self._cached_get('get_expiration_option_chain', '/marketdata/v1/expirationchain', params={'symbol': symbol})
 
     def get_price_history(self, symbol = str, periodType: str | None=None, period: int | None=None, frequencyType: str | None=None,
                           frequency: int | None=None, startDate: int | None=None, endDate: int | None=None, 
-                          needExtendedHoursData: bool | None=None, needPreviousClose: bool | None = None):
+                          needExtendedHoursData: bool | None=None, needPreviousClose: bool | None = None,
+                          as_arrays: bool = False, typed: bool = False):
         """
         Get Price History returns the price hsitroy of a given stock based of a date range. 
         :param symbol: The Equity symbol used to look up price history
@@ -389,24 +751,66 @@ class Trader:
         :type needExtendedHoursData: bool
         :param needPreviousClose: Get price information from prior close.
         :type needPreviousClose: bool
+        :param as_arrays: Return market_arrays.Candles (contiguous float64/int64 columns) instead of the dict.
+        :type as_arrays: bool
+        :param typed: Decode into a market_structs.PriceHistory instead of dicts (needs msgspec), ignored with as_arrays.
+        :type typed: bool
         :return: Price History Data.
-        :rtype: dict[]
+        :rtype: dict[] | Candles | PriceHistory
         """
         
-        response = requests.get(f'{self.tokens.base_url}/marketdata/v1/pricehistory',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            params=({'symbol': symbol, 'periodType': periodType, 'period': period, 'frequencyType':frequencyType,
-                                     'frequency':frequency, 'startDate': startDate, 'endDate':endDate, 'needExtendedHoursData':
-                                     needExtendedHoursData, 'needPreviousClose': needPreviousClose}))
+        response = self._request('GET', '/marketdata/v1/pricehistory',
+                                 params=({'symbol': symbol, 'periodType': periodType, 'period': period, 'frequencyType':frequencyType,
+                                          'frequency':frequency, 'startDate': startDate, 'endDate':endDate, 'needExtendedHoursData':
+                                          needExtendedHoursData, 'needPreviousClose': needPreviousClose}))
         
         if response.status_code == 200:
-            data = response.json()
+            if as_arrays:
+                from market_arrays import Candles
+                return Candles.from_json(self._json(response))
+            data = self._json(response, 'candles' if typed else None)
             return data
         
         else:
-            self.log.error(response.json())
+            self.log.error(self._json(response))
             pass
 
+    def get_candles(self, symbol: str, startDate, endDate, frequencyType: str = 'minute', frequency: int = 1,
+                    needExtendedHoursData: bool = False):
+        """
+        Price history served from the local history store. Only the date ranges that are not on disk yet are
+        fetched with get_price_history, weekends and market holidays are never fetched.
+        :param symbol: The Equity symbol used to look up price history
+        :type symbol: str
+        :param startDate: Start, ms since the UNIX epoch, a datetime or a date.
+        :type startDate: int | datetime | date
+        :param endDate: End (inclusive), ms since the UNIX epoch, a datetime or a date (the whole day).
+        :type endDate: int | datetime | date
+        :param frequencyType: minute, daily, weekly, monthly.
+        :type frequencyType: str
+        :param frequency: The time frequency duration. Minute vales are (1,5,10,15,30), all others value is 1.
+        :type frequency: int
+        :param needExtendedHoursData: Get Extended hours data (stored separately from regular hours).
+        :type needExtendedHoursData: bool
+        :return: Read-only structured numpy array (history_store.CANDLE_DTYPE), zero-copy view of the file on disk.
+        :rtype: np.ndarray
+        """
+        # Imported here so numpy is only needed by people using the history store.
+        from history_store import HistoryStore, PERIOD_TYPES
+        if self.history_store is None:
+            self.history_store = HistoryStore()
+        store = self.history_store
+
+        for start, end in store.missing_ranges(symbol, frequencyType, frequency, startDate, endDate, needExtendedHoursData):
+            data = self.get_price_history(symbol, periodType=PERIOD_TYPES[frequencyType], frequencyType=frequencyType,
+                                          frequency=frequency, startDate=start, endDate=end,
+                                          needExtendedHoursData=needExtendedHoursData)
+            if data is None:
+                continue
+            store.merge(symbol, frequencyType, frequency, data.get('candles', []), (start, end), needExtendedHoursData)
+
+        return store.read(symbol, frequencyType, frequency, startDate, endDate, needExtendedHoursData)
+
   # ---------- Trade Methods ---------- #
   # [WARNING] -- This section contains functions that execute stock trades, use caution when calling. 
 
@@ -415,7 +819,7 @@ class Trader:
                     status: str | None=None) -> dict:
         """
         Get set or all orders from a specific account.
-        :param accountNumner: hashed account number. 
+        :param accountNumner: hashed (or plain) account number.
         :type accountNumber: str
         :param maxResults: The max number of orders to retrieve. Default is 3000.
         :type maxResults: int
@@ -433,32 +837,36 @@ class Trader:
         :rtype: dict[]
         """
        
-        response = requests.get(f'{self.tokens.base_url}/accounts{accountHash}/orders',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            params=({'accountHash': accountHash, 'maxResults': maxResults, 'fromEnteredTime': fromEnteredTime,
-                                     'toEnteredTime': toEnteredTime, 'status': status}))
-        return response
+        response = self._request('GET', f'/trader/v1/accounts/{self.account_hash(accountHash)}/orders',
+                                 params=({'maxResults': maxResults, 'fromEnteredTime': fromEnteredTime,
+                                          'toEnteredTime': toEnteredTime, 'status': status}))
+        
+        if response.status_code == 200:
+            data = self._json(response)
+            return data
+        
+        else:
+            self.log.error(response)
         
-    def post_orders(self, accountHash: str, orderForm: dict):
+    def post_orders(self, accountHash: str, orderForm: dict | bytes):
         """
         Post Order sends and orderForm to execute a specified trade. 
-        :param accountHash: hashed account number. Trade will be executed on this Accounts!
+        For repeated orders see order_pipeline.OrderPipeline, it skips building and encoding the form every time.
+        :param accountHash: hashed (or plain) account number. Trade will be executed on this Accounts!
         :type accountHash: str
-        :param orderForm: dictonary schema that contains the trade information. 
-        :type orderForm: dict
+        :param orderForm: dictonary schema that contains the trade information, or the already encoded JSON body
+                          (e.g. OrderTemplate.render()).
+        :type orderForm: dict | bytes
         :return: Emtpy response code if successful. 
         :rtype: Request.response
         """
-        data =  requests.post(f'{self.tokens.base_url}/trader/v1/accounts/{accountHash}/orders',
-                             headers={"Accept": "application/json", 'Authorization': f'Bearer {self.tokens.access_token}',
-                                      "Content-Type": "application/json"},
-                             json=orderForm,
-                             timeout=self.timeout)
+        body = {'data': orderForm} if isinstance(orderForm, bytes) else {'json': orderForm}
+        return self._request('POST', f'/trader/v1/accounts/{self.account_hash(accountHash)}/orders', headers=JSON_HEADERS, **body)
          
     def get_order_by_id(self, accountHash: str, orderId: int):
         """
         Get a specific order by its ID, for a specific account.
-        :param accountHash: hashed account number. Trade will be executed on this Accounts!
+        :param accountHash: hashed (or plain) account number. Trade will be executed on this Accounts!
         :type accountHash: str
         :param orderId: The ID of the order being retrieved.
         :type orderId: int
@@ -466,68 +874,51 @@ class Trader:
         :rtype: dict
         """
         
-        response = requests.post(f'{self.tokens.base_url}/trader/v1/accounts/{accountHash}/orders/{orderId}',
-                             headers={"Accept": "application/json", 'Authorization': f'Bearer {self.tokens.access_token}',
-                                      "Content-Type": "application/json"},
-                             timeout=self.timeout)
+        response = self._request('GET', f'/trader/v1/accounts/{self.account_hash(accountHash)}/orders/{orderId}')
         
         if response.status_code == 200:
-            data = response.json()
+            data = self._json(response)
             return data
         
         else:
-            self.log.error(response.json())
+            self.log.error(self._json(response))
             pass
         
     def delete_order(self, accountHash: str, orderId: int):
         """
-        Cancel a specific order for a specific account
-        :param accountHash: hashed account number. Trade will be executed on this Accounts!
+        Cancel a specific order for a specific account. For many orders at once see order_actions.OrderActions.
+        :param accountHash: hashed (or plain) account number. Trade will be executed on this Accounts!
         :type accountHash: str
-        :param orderId: The ID of the order being retrieved.
+        :param orderId: The ID of the order being cancelled.
         :type orderId: int
-        :return: Dictonary of the submitted Order.
-        :rtype: dict
+        :return: Response, Schwab answers 200 with an empty body once the cancel is accepted.
+        :rtype: Request.response
         """
-        response = requests.post(f'{self.tokens.base_url}/trader/v1/accounts/{accountHash}/orders/{orderId}',
-                             headers={"Accept": "application/json", 'Authorization': f'Bearer {self.tokens.access_token}',
-                                      "Content-Type": "application/json"},
-                             timeout=self.timeout)
-        
-        if response.status_code == 200:
-            data = response.json()
-            return data
-        
-        else:
-            self.log.error(response.json())
-            pass
+        response = self._request('DELETE', f'/trader/v1/accounts/{self.account_hash(accountHash)}/orders/{orderId}',
+                                 headers=JSON_HEADERS)
+        if response.status_code != 200:
+            self.log.error(f"Cancel of order {orderId} failed: {response.status_code} {response.content[:200]!r}")
+        return response
 
-    def change_order(self, accountHash: str, orderId: str, orderForm: dict):
+    def change_order(self, accountHash: str, orderId: str, orderForm: dict | bytes):
         """
         Replace an existing order for an account. The existing order will be replaced by the new order. 
         Once replaced, the old order will be canceled and a new order will be created.
-        :param accountHash: hashed account number. Trade will be executed on this Accounts!
+        :param accountHash: hashed (or plain) account number. Trade will be executed on this Accounts!
         :type accountHash: str
         :param orderId: order id
         :type orderId: int
-        :param order: dictonary schema that contains the trade information. 
-        :type order: dict
-        :return: response of order change. 
-        :rtype: dict
+        :param order: dictonary schema that contains the trade information, or the already encoded JSON body.
+        :type order: dict | bytes
+        :return: Response, Schwab answers 201 with an empty body and the new order's url in the Location header.
+        :rtype: Request.response
         """
-        response = requests.put(f'{self.tokens.base_url}/trader/v1/accounts/{accountHash}/orders/{orderId}',
-                            headers={"Accept": "application/json", 'Authorization': f'Bearer {self.tokens.access_token}',
-                                     "Content-Type": "application/json"},
-                            json=orderForm,
-                            timeout=self.timeout)
-    
-        if response.status_code == 200:
-            data = response.json()
-            return data
-        
-        else:
-            self.log.error(response.json())
-            pass
+        body = {'data': orderForm} if isinstance(orderForm, bytes) else {'json': orderForm}
+        response = self._request('PUT', f'/trader/v1/accounts/{self.account_hash(accountHash)}/orders/{orderId}',
+                                 headers=JSON_HEADERS, **body)
+        if response.status_code not in (200, 201):
+            self.log.error(f"Replace of order {orderId} failed: {response.status_code} {response.content[:200]!r}")
+        return response
 
     def get_all_orders(self, fromEnteredTime: str, toEnteredTime: str, maxResults: int | None=None, status: str | None=None):
         """
@@ -548,17 +939,16 @@ class Trader:
         :rtype: list[dict] 
         """
 
-        response = requests.get(f'{self.tokens.base_url}/trader/v1/orders',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            params=({'maxResults':maxResults, 'fromEnteredTime':fromEnteredTime, 'toEnteredTime':toEnteredTime,
-                                     'status':status}))
+        response = self._request('GET', '/trader/v1/orders',
+                                 params=({'maxResults':maxResults, 'fromEnteredTime':fromEnteredTime, 'toEnteredTime':toEnteredTime,
+                                          'status':status}))
         
         if response.status_code == 200:
-            data = response.json()
+            data = self._json(response)
             return data
         
         else:
-            self.log.error(response.json())
+            self.log.error(self._json(response))
             pass
         
 
@@ -571,10 +961,11 @@ class Trader:
 # -------------Transactions and Util Methods---------- #
 # Following contains util and transaction history methods.
 
-    def get_all_transactions(self, accountHash:str, startDate: str, endDate: str, symbol: str | None=None):
+    def get_all_transactions(self, accountHash:str, startDate: str, endDate: str, symbol: str | None=None,
+                             types: str | None=None):
         """
         All transactions for a specific account. Maximum number of transactions in response is 3000. Maximum date range is 1 year.
-        :param accountNumber: The encrypted ID of the account.
+        :param accountNumber: The encrypted ID (or plain number) of the account.
         :type accountNumber: str
         :param startDate: Specifies that no transactions entered before this time should be returned.
         :type startDate: datetime [yyyy-MM-dd'T'HH:mm:ss.SSSZ]
@@ -585,51 +976,47 @@ class Trader:
         :type symbol: Available values : TRADE, RECEIVE_AND_DELIVER, DIVIDEND_OR_INTEREST, ACH_RECEIPT, ACH_DISBURSEMENT, 
                                          CASH_RECEIPT, CASH_DISBURSEMENT, ELECTRONIC_FUND, WIRE_OUT, WIRE_IN, JOURNAL, MEMORANDUM,
                                          MARGIN_CALL, MONEY_MARKET, SMA_ADJUSTMENT
+        :param types: Comma separated transaction types to return e.g. "TRADE,DIVIDEND_OR_INTEREST" (values listed above).
+        :type types: str
         :return: List of dictionaries containg transaction histroy for a specific account.
         :rtype: list[dict]
         """
-        response = requests.get(f'{self.tokens.base_url}/trader/v1/accounts/{self.tokens.account_hash}/transactions',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            params=({'accountHash':accountHash, 'startDate':startDate, 'endDate':endDate,
-                                     'symbol':symbol}))
+        response = self._request('GET', f'/trader/v1/accounts/{self.account_hash(accountHash)}/transactions',
+                                 params=({'startDate':startDate, 'endDate':endDate, 'symbol':symbol, 'types':types}))
         if response.status_code == 200:
-            data = response.json()
+            data = self._json(response)
             return data
         
         else:
-            self.log.error(response.json())
+            self.log.error(self._json(response))
             pass
 
     def get_transaction_by_id(self, accountHash: str, transactionId: int):
         """
         Get specific transaction information for a specific account
-        :param accountNumber: The encrypted ID of the account.
+        :param accountNumber: The encrypted ID (or plain number) of the account.
         :type accountNumber: str
         :param transactionId: The ID of the transaction being retrieved.
         :type accountNumber: int
         :return: Dictionary containg the transaction for a specific Id.
         :rtype: list[dict]
         """
-        response = requests.get(f'{self.tokens.base_url}/trader/v1/accounts/{self.tokens.account_hash}/transactions/{transactionId}',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            params=({'accountHash':accountHash, 'transactionId':transactionId}))
+        response = self._request('GET', f'/trader/v1/accounts/{self.account_hash(accountHash)}/transactions/{transactionId}')
         if response.status_code == 200:
-            data = response.json()
+            data = self._json(response)
             return data
         
         else:
-            self.log.error(response.json())
+            self.log.error(self._json(response))
             pass
 
     def get_user_preferences(self):
         """
         Get user preference information for the logged in user.
         :return: User Preferences and Streaming Info
-        :rtype: request.Response
+        :rtype: dict
         """
-        return requests.get(f'{self.tokens.base_url}/trader/v1/userPreference',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            timeout=self.timeout)
+        return self._cached_get('get_user_preferences', '/trader/v1/userPreference')
 
 
 # ----------- Trade Orders ---------- #